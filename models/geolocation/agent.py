@@ -4,9 +4,10 @@ import google.generativeai as genai
 from google.generativeai import GenerativeModel
 import time
 import random
+from contextlib import nullcontext
 from google.api_core.exceptions import RetryError, ServiceUnavailable
 
-from utils import parse_prediction, clean_brackets, run_vwa
+from utils import parse_prediction, clean_brackets, run_vwa, get_payload_size
 from prompt import *
 
 
@@ -36,10 +37,13 @@ def format_text(text, model_family='gpt'):
 
 '''Class for the agent'''
 class Agent:
-    def __init__(self, client, model, model_family):
+    def __init__(self, client, model, model_family, web_query_client=None, api_semaphore=None):
         self.client = client
         self.model = model # exact model, e.g., gpt-4o, gemini-2.0-flash, qwen-vl-plus, internvl2.5-latest
         self.model_family = model_family # model family, eg. gpt, gemini
+        self.web_query_client = web_query_client # resident web-query service (web_query.py), None to run vwa subprocesses
+        self.api_semaphore = api_semaphore if api_semaphore is not None else nullcontext() # bounds the concurrent model calls of all workers
+        self.call_stats = [] # payload size, tokens and latency of every model call
 
     def generate_action(self, valid_actions, init_node_id, curr_node_id):
         prompt = GENERATE_ACTION.format(initial_id=init_node_id, current_id=curr_node_id, actions=valid_actions)
@@ -82,10 +86,11 @@ class Agent:
     
     def call_vlm(self, prompt, max_tokens=400, temperature=0.7, context=None):
         api_style = model_family_to_api_style(self.model_family)
-        if api_style == 'gpt':
-            return self.call_gpt_base(prompt, self.model, max_tokens, temperature, context)
-        if api_style == 'gemini':
-            return self.call_gemini(prompt, self.model, max_tokens, temperature, context)
+        with self.api_semaphore:
+            if api_style == 'gpt':
+                return self.call_gpt_base(prompt, self.model, max_tokens, temperature, context)
+            if api_style == 'gemini':
+                return self.call_gemini(prompt, self.model, max_tokens, temperature, context)
         
     def call_gpt_base(self, prompt, model, max_tokens=400, temperature=0.7, context=None):
         message_content = [{"type": "text", "text": prompt}] 
@@ -94,6 +99,7 @@ class Agent:
         message_content = [c for c in message_content if c is not None]
 
         # print(f"Calling GPT base with content: {message_content}")
+        start_time = time.time()
         response = self.client.chat.completions.create(
             model=model,
             messages=[
@@ -105,6 +111,8 @@ class Agent:
             max_tokens=max_tokens,
             temperature=temperature
         )
+        usage = getattr(response, "usage", None)
+        self.record_call(message_content, start_time, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
         return (response.choices[0].message.content)
     
     def call_gemini(self, prompt, model, max_tokens=400, temperature=0.7, context=None, retries=3, backoff_base=2.0):
@@ -113,9 +121,12 @@ class Agent:
             content += context
         content = [c for c in content if c is not None]
         
+        start_time = time.time()
         for attempt in range(1, retries + 1):
             try:
                 response = self.client.generate_content(contents=content)
+                usage = getattr(response, "usage_metadata", None)
+                self.record_call(content, start_time, getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None))
                 return response.text
 
             # Typical transient Gemini transport errors
@@ -130,6 +141,23 @@ class Agent:
                 # Any other unexpected error
                 raise
 
+    def record_call(self, content, start_time, prompt_tokens=None, completion_tokens=None):
+        self.call_stats.append({
+            "payload_bytes": get_payload_size(content),
+            "num_images": sum(1 for c in content if isinstance(c, dict) and ("image_url" in c or "data" in c)),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": time.time() - start_time,
+        })
+
+    def get_call_summary(self):
+        """Totals of the model calls so far"""
+        summary = {"num_calls": len(self.call_stats), "payload_bytes": 0, "num_images": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0}
+        for stats in self.call_stats:
+            for key in ("payload_bytes", "num_images", "prompt_tokens", "completion_tokens", "latency"):
+                summary[key] += stats[key] or 0
+        return summary
+
     def parse(self, output, kind):
         if kind == 'action':
             reasoning_match = re.search(r"Reasoning Steps:\s*(.*?)(?=\nAction:)", output, re.DOTALL)
@@ -188,9 +216,16 @@ def do_web_query(A, image_messages, web_context, move_history, max_tries=2, max_
         print(f"Web Query: {web_query['intent']}")
 
         # Run VWA and get result
-        vwa_result, query_id = run_vwa(web_query, max_tries=max_tries, model_family=A.model_family)
+        if A.web_query_client is not None:
+            # the service reports failures (e.g., browser exceptions) as unsuccessful results
+            result = A.web_query_client.query(web_query, max_tries=max_tries)
+            vwa_result, query_id = result["answer"], result["query_id"]
+            success = result["success"]
+        else:
+            vwa_result, query_id = run_vwa(web_query, max_tries=max_tries, model_family=A.model_family)
+            success = is_vwa_success(vwa_result)
 
-        if is_vwa_success(vwa_result) and vwa_result != "":
+        if success and vwa_result != "":
             web_context.append(format_text(f"{web_query['intent']}: {vwa_result}", model_family=A.model_family))
             move_history.append(f"Querying Web: {web_query['intent']}")
             move_history.append(f"Web Query ID: {query_id}")
@@ -216,5 +251,7 @@ def is_vwa_success(vwa_result):
         "ERROR: No parsed_action found",
         "ERROR: Empty parsed_action",
         "ERROR: VWA subprocess timed out",
+        "ERROR: VWA query timed out",
+        "ERROR: Web query service unavailable",
     ]
     return not any(err.lower() in vwa_result.lower() for err in known_failures)
\ No newline at end of file
@@ -1,11 +1,14 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 import unicodedata
-from math import radians, sin, cos, sqrt, atan2
 import matplotlib.pyplot as plt
 import argparse
 
+from utils import calculate_distance_np, get_distance_levels, DISTANCE_THRESHOLDS, THRESHOLD_NAMES
+from result_store import ResultStore, flatten_result
+
 def load_exclude_ids(args) -> set[int]:
     """Return a set of standpoint_ids to ignore, based on CLI flags."""
     exclude = set()
@@ -28,22 +31,7 @@ def process_input_dir(input_dir):
                     data = json.load(f)
 
                 # Flatten structure for dataframe
-                result = {
-                    "standpoint_id": data.get("standpoint_id"),
-                    "gt_coords": data["ground_truth"].get("coords"),
-                    "gt_continent": data["ground_truth"].get("continent"),
-                    "gt_country": data["ground_truth"].get("country"),
-                    "gt_city": data["ground_truth"].get("city"),
-                    "gt_street": data["ground_truth"].get("street"),
-                    "gpt_continent": data["gpt_output"]["location"].get("continent"),
-                    "gpt_country": data["gpt_output"]["location"].get("country"),
-                    "gpt_city": data["gpt_output"]["location"].get("city"),
-                    "gpt_street": data["gpt_output"]["location"].get("street"),
-                    "gpt_reasoning": data["gpt_output"].get("reasoning"),
-                    "gpt_coords_lat": data["gpt_output"]["coords"].get("lattitude"),
-                    "gpt_coords_lon": data["gpt_output"]["coords"].get("longitude"),
-                    "num_adjacent_standpoints": data.get("num_adjacent_standpoints")
-                }
+                result = flatten_result(data)
                 results.append(result)
 
     results_df = pd.DataFrame(results)
@@ -93,28 +81,37 @@ def analyze_results(df, label="Overall"):
     # print(f"% Only continent and country correct: {pct_only_continent_country_correct:.2%}")
     # print(f"% Only continent, country, and city correct: {pct_only_continent_country_city_correct:.2%}")
     print(f"% All correct: {pct_all_correct:.2%}")
+    for level, name in enumerate(THRESHOLD_NAMES[:len(DISTANCE_THRESHOLDS)]):
+        print(f"% Within {name}: {(df['distance_level'] <= level).mean():.2%}")
+    print(f"Median distance: {df['gt_gpt_coords_haversine_dist'].median():.2f} km")
     print(f"Total number of results: {total}")
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input_dir', type=str, required=True, help='path to the input directory')
+    parser.add_argument('--input_dir', type=str, help='path to the input directory')
+    parser.add_argument('--store', type=str, help='path to the result store written by run.py, instead of --input_dir')
+    parser.add_argument('--model_family', type=str, help='only analyze this model family of the store')
+    parser.add_argument('--run_id', type=str, help='only analyze this run of the store')
     parser.add_argument('--exclude_ids', help='comma-separated list of standpoint_ids to drop')
     args = parser.parse_args()
 
-    if not os.path.isdir(args.input_dir):
+    if args.store is not None:
+        print(f"Loading result store: {args.store}")
+        input_dir = args.store
+        results_df = ResultStore(args.store).load(model_family=args.model_family, run_id=args.run_id)
+    elif args.input_dir is not None and os.path.isdir(args.input_dir):
+        print(f"Processing input directory: {args.input_dir}")
+        input_dir = args.input_dir
+        results_df = process_input_dir(input_dir)
+    else:
         raise ValueError(f"Invalid input directory: {args.input_dir}")
 
-    print(f"Processing input directory: {args.input_dir}")
-
-    input_dir = args.input_dir
     exclude_ids = load_exclude_ids(args)
-    results_df = process_input_dir(input_dir)
-
     if exclude_ids:
         print(f"Excluding {len(exclude_ids)} standpoint_ids: "
               f"{sorted(exclude_ids)[:10]}{'…' if len(exclude_ids)>10 else ''}")
-        results_df = results_df[~results_df['standpoint_id'].isin(exclude_ids)]
+        results_df = results_df[~results_df['standpoint_id'].astype(str).isin({str(x) for x in exclude_ids})]
 
     # Process continent/country/city/street
     results_df["gt_continent_norm"] = results_df["gt_continent"].apply(normalize_text)
@@ -135,16 +132,27 @@ def main():
     results_df["city_match"] = (results_df["gt_city_norm"] == results_df["gpt_city_norm"])
     results_df["street_match"] = (results_df["gt_street_norm"] == results_df["gpt_street_norm"])
 
-    # Process ground truth coords
-    results_df["gt_coords_lat"] = results_df["gt_coords"].apply(lambda x: float(x.split(",")[0]))
-    results_df["gt_coords_lon"] = results_df["gt_coords"].apply(lambda x: float(x.split(",")[1]))
-    # results_df["gt_gpt_coords_haversine_dist"] = results_df.apply(get_haversine_distance, axis=1)
+    # Process ground truth and predicted coords, unparsed predictions are NaN
+    gt_coords = results_df["gt_coords"].str.split(",", n=1, expand=True)
+    results_df["gt_coords_lat"] = pd.to_numeric(gt_coords[0], errors="coerce")
+    results_df["gt_coords_lon"] = pd.to_numeric(gt_coords[1], errors="coerce")
+    pred_lat = pd.to_numeric(results_df["gpt_coords_lat"], errors="coerce")
+    pred_lon = pd.to_numeric(results_df["gpt_coords_lon"], errors="coerce")
+
+    # Distances and threshold levels over whole columns
+    results_df["gt_gpt_coords_haversine_dist"] = calculate_distance_np(results_df["gt_coords_lat"], results_df["gt_coords_lon"], pred_lat, pred_lon)
+    results_df["distance_level"] = get_distance_levels(results_df["gt_gpt_coords_haversine_dist"])
+    results_df["distance_level_name"] = np.asarray(THRESHOLD_NAMES)[results_df["distance_level"]]
 
     # Save results to CSV
     results_df.to_csv(f"results_{input_dir.replace('/', '_')}.csv", index=False)
     results_df.head(30)
 
-    analyze_results(results_df, label=input_dir)
+    if "run_id" in results_df:
+        for (model_family, run_id), run_df in results_df.groupby(["model_family", "run_id"], observed=True):
+            analyze_results(run_df, label=f"{model_family}/{run_id}")
+    else:
+        analyze_results(results_df, label=input_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
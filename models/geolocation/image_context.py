@@ -0,0 +1,175 @@
+import math
+import base64
+from io import BytesIO
+
+from utils import get_payload_size
+from agent import model_family_to_api_style, format_text
+
+# Size of the downscaled views, the input size of OpenAI low detail images
+LOW_RES_SIZE = (512, 512)
+
+
+'''Estimate the prompt tokens of an image'''
+def estimate_image_tokens(width, height, model_family='gpt', detail='auto'):
+    if model_family_to_api_style(model_family) == 'gemini':
+        # 258 tokens for small images, otherwise per 768x768 tile
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+    # OpenAI: 85 base tokens, plus 170 per 512px tile after fitting in 2048x2048 and the short side in 768
+    if detail == 'low':
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+'''JPEG bytes of an image, read from its file when it is a cached JPEG to avoid re-encoding'''
+def get_jpeg_bytes(image):
+    filename = getattr(image, "filename", "")
+    if filename and image.format == "JPEG":
+        with open(filename, "rb") as f:
+            return f.read()
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+'''Class for an encoded view'''
+class EncodedImage:
+    def __init__(self, image, model_family='gpt'):
+        self.model_family = model_family
+        self.width, self.height = image.size
+        self.image = image
+        self.full = None
+        self.low = None
+        self.num_encoded = 0
+
+    def encode(self, image, detail):
+        data = get_jpeg_bytes(image)
+        self.num_encoded += 1
+        if model_family_to_api_style(self.model_family) == 'gemini':
+            # Blob part, sent as is instead of re-encoding a PIL image on every call
+            return {"mime_type": "image/jpeg", "data": data}
+        image_url = {"url": f"data:image/jpeg;base64,{base64.b64encode(data).decode('utf-8')}"}
+        if detail == 'low':
+            image_url["detail"] = "low"
+        return {"type": "image_url", "image_url": image_url}
+
+    def get_message(self, low_res=False):
+        """Message of the image, encoded on first use and then the same object on every call"""
+        if not low_res:
+            if self.full is None:
+                self.full = self.encode(self.image, 'auto')
+            return self.full
+        if self.low is None:
+            image = self.image.convert("RGB")
+            image.thumbnail(LOW_RES_SIZE)
+            self.low = self.encode(image, 'low')
+        return self.low
+
+    def get_tokens(self, low_res=False):
+        if low_res:
+            width, height = self.width, self.height
+            scale = min(1.0, LOW_RES_SIZE[0] / width, LOW_RES_SIZE[1] / height)
+            return estimate_image_tokens(int(width * scale), int(height * scale), self.model_family, 'low')
+        return estimate_image_tokens(self.width, self.height, self.model_family, 'auto')
+
+
+'''Class for the image context of the prompts'''
+class ImageContext:
+    """
+    Views gathered along a trajectory, as the image messages of the prompts.
+
+    Messages are grouped by standpoint, each group starting with the text added by `add_text`.
+    Each image is encoded once, so all prompts reference the same messages. With `max_image_tokens`, the
+    views of older standpoints are downscaled, then dropped (oldest first), until the estimated image tokens
+    fit the budget. The initial standpoint and the `keep_recent` latest ones always keep their full views.
+    Iterating the context yields the messages to send, so it can be used in place of a list of messages.
+    """
+
+    def __init__(self, model_family='gpt', max_image_tokens=None, keep_recent=1):
+        self.model_family = model_family
+        # labels are formatted by API style, e.g., qwen and internvl take OpenAI style messages
+        self.api_style = model_family_to_api_style(model_family)
+        self.max_image_tokens = max_image_tokens
+        self.keep_recent = keep_recent
+        self.groups = []
+        self.images = {}
+        self.messages = None
+        self.stats = {"full_image_tokens": 0, "image_tokens": 0, "downscaled": 0, "dropped": 0, "payload_bytes": 0}
+
+    def add_text(self, text):
+        """Start the messages of a new standpoint"""
+        self.groups.append({"text": format_text(text, model_family=self.api_style), "items": []})
+        self.messages = None
+
+    def add_image(self, image, label, key=None):
+        """Add a view with its label, `key` (e.g., coordinates and heading) identifies the same view across standpoints"""
+        if not self.groups:
+            self.groups.append({"text": None, "items": []})
+        key = key if key is not None else id(image)
+        if key not in self.images:
+            self.images[key] = EncodedImage(image, model_family=self.model_family)
+        self.groups[-1]["items"].append((format_text(label, model_family=self.api_style), self.images[key]))
+        self.messages = None
+
+    def get_levels(self):
+        """Level of each standpoint: 0 full views, 1 downscaled views, 2 dropped"""
+        levels = [0] * len(self.groups)
+        if self.max_image_tokens is None:
+            return levels
+
+        pinned = {0} | set(range(max(len(self.groups) - self.keep_recent, 0), len(self.groups)))
+        tokens = [[sum(image.get_tokens(low_res) for _, image in group["items"]) for low_res in (False, True)] + [0]
+                  for group in self.groups]
+        total = sum(t[0] for t in tokens)
+        for level in (1, 2):
+            for i in range(len(self.groups)):
+                if total <= self.max_image_tokens:
+                    return levels
+                if i in pinned:
+                    continue
+                total += tokens[i][level] - tokens[i][levels[i]]
+                levels[i] = level
+        return levels
+
+    def get_messages(self):
+        if self.messages is not None:
+            return self.messages
+
+        levels = self.get_levels()
+        messages = []
+        stats = {"full_image_tokens": 0, "image_tokens": 0, "downscaled": 0, "dropped": 0}
+        for group, level in zip(self.groups, levels):
+            if group["text"] is not None:
+                messages.append(group["text"])
+            for label, image in group["items"]:
+                stats["full_image_tokens"] += image.get_tokens()
+                if level == 2:
+                    stats["dropped"] += 1
+                    continue
+                messages.append(label)
+                messages.append(image.get_message(low_res=level == 1))
+                stats["image_tokens"] += image.get_tokens(low_res=level == 1)
+                stats["downscaled"] += level == 1
+            if level == 2:
+                messages.append(format_text("(The views of this standpoint are omitted.)", model_family=self.api_style))
+        stats["payload_bytes"] = get_payload_size(messages)
+
+        self.stats = stats
+        self.messages = messages
+        return messages
+
+    def get_stats(self):
+        self.get_messages()
+        return dict(self.stats, num_images=len(self.images), num_encoded=sum(image.num_encoded for image in self.images.values()))
+
+    def __iter__(self):
+        return iter(self.get_messages())
+
+    def __len__(self):
+        return len(self.get_messages())
@@ -2,39 +2,36 @@ from dotenv import load_dotenv
 import os
 import re
 
-from utils import get_street_view_from_api, encode_image
-from agent import Agent, model_family_to_api_style, format_text, is_confident, do_web_query
+from view_fetcher import get_default_fetcher, get_view_cache_dir, HEADINGS
+from agent import Agent, is_confident, do_web_query
+from image_context import ImageContext
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-'''Add new images to a running list of image messages'''
-def add_images(image_messages, coords, init_id, cache_dir_base, model_family='gpt'):
-    headings = [0, 90, 180, 270]
+'''Add new images to the running image context'''
+def add_images(image_messages, coords, init_id, cache_dir_base):
     directions = ["north", "east", "south", "west"]
-    api_style = model_family_to_api_style(model_family)
-
-    if api_style == 'gemini':
-        for deg, direction in zip(headings, directions):
-            image, _ = get_street_view_from_api(
-                GOOGLE_API_KEY, coords, heading=deg, size="600x400", cache_dir=cache_dir_base + f"/{init_id}/{coords}"
-            )
-            image_messages.append(f"This is the view facing {direction}.")
-            image_messages.append(image)  # image as a PIL.Image 
-    if api_style == 'gpt':
-        for deg, direction in zip(headings, directions):
-            image, _ = get_street_view_from_api(GOOGLE_API_KEY, coords, heading=deg, size="600x400", cache_dir=cache_dir_base + f"/{init_id}/{coords}")
-            b64 = encode_image(image)
-            image_messages.append({"type": "text", "text": f"This is the view facing {direction}."})
-            image_messages.append({
-                "type": "image_url",
-                "image_url": {"url":f"data:image/jpeg;base64,{b64}"},
-            })
+
+    # The four views are fetched in parallel
+    images = get_default_fetcher().get_views(coords, get_view_cache_dir(cache_dir_base, init_id, coords), headings=HEADINGS)
+    for deg, direction, image in zip(HEADINGS, directions, images):
+        image_messages.add_image(image, f"This is the view facing {direction}.", key=(coords, deg))
+
+
+'''Start fetching the views of the adjacent standpoints while the agent decides where to move'''
+def prefetch_adjacent(init_node, cache_dir_base):
+    fetcher = get_default_fetcher()
+    for adj_node in init_node.adjacent:
+        if adj_node.latitude is None or adj_node.longitude is None:
+            continue
+        coords = adj_node.get_coords()
+        fetcher.prefetch(coords, get_view_cache_dir(cache_dir_base, init_node.id, coords))
 
 
 '''Run the pipeline where the agent doesn't have to make an initial web query'''
-def run_optional(base_dir, init_node, A, iter_num=5):
-    image_messages = []
+def run_optional(base_dir, init_node, A, iter_num=5, max_image_tokens=None, prefetch_views=False):
+    image_messages = ImageContext(A.model_family, max_image_tokens=max_image_tokens)
     web_context = []
 
     move_history = []
@@ -44,8 +41,10 @@ def run_optional(base_dir, init_node, A, iter_num=5):
     init_coords = init_node.get_coords()
 
     # Get observations of initial standpoint
-    image_messages.append(format_text("This is the initial standpoint.", model_family=A.model_family))
-    add_images(image_messages, init_coords, init_node.id, base_dir, model_family=A.model_family)
+    image_messages.add_text("This is the initial standpoint.")
+    add_images(image_messages, init_coords, init_node.id, base_dir)
+    if prefetch_views:
+        prefetch_adjacent(init_node, base_dir)
 
     # Estimate confidence given all initial observations
     if is_confident(A, image_messages, web_context, move_history):
@@ -97,8 +96,8 @@ def run_optional(base_dir, init_node, A, iter_num=5):
                 curr_node = target_node
                 coords = curr_node.get_coords()
 
-                image_messages.append(format_text(f"This is a standpoint adjacent the initial. ID: {target_id}", model_family=A.model_family))
-                add_images(image_messages, coords, init_node.id, base_dir, model_family=A.model_family)
+                image_messages.add_text(f"This is a standpoint adjacent the initial. ID: {target_id}")
+                add_images(image_messages, coords, init_node.id, base_dir)
 
                 # Estimate confidence given all observations (including new images)
                 if is_confident(A, image_messages, web_context, move_history):
@@ -119,8 +118,8 @@ def run_optional(base_dir, init_node, A, iter_num=5):
 
 
 '''Agent is required to make a web query after initial observations'''
-def run_forced(base_dir, init_node, A, iter_num=5):
-    image_messages = []
+def run_forced(base_dir, init_node, A, iter_num=5, max_image_tokens=None, prefetch_views=False):
+    image_messages = ImageContext(A.model_family, max_image_tokens=max_image_tokens)
     web_context = []
 
     move_history = []
@@ -130,8 +129,10 @@ def run_forced(base_dir, init_node, A, iter_num=5):
     init_coords = init_node.get_coords()
 
     # Get observations of initial standpoint
-    image_messages.append(format_text("This is the initial standpoint.", model_family=A.model_family))
-    add_images(image_messages, init_coords, init_node.id, base_dir, model_family=A.model_family)
+    image_messages.add_text("This is the initial standpoint.")
+    add_images(image_messages, init_coords, init_node.id, base_dir)
+    if prefetch_views:
+        prefetch_adjacent(init_node, base_dir)
 
     # Estimate confidence given all initial observations
     is_confident(A, image_messages, web_context, move_history)
@@ -182,8 +183,8 @@ def run_forced(base_dir, init_node, A, iter_num=5):
                 curr_node = target_node
                 coords = curr_node.get_coords()
 
-                image_messages.append(format_text(f"This is a standpoint adjacent the initial. ID: {target_id}", model_family=A.model_family))
-                add_images(image_messages, coords, init_node.id, base_dir, model_family=A.model_family)
+                image_messages.add_text(f"This is a standpoint adjacent the initial. ID: {target_id}")
+                add_images(image_messages, coords, init_node.id, base_dir)
 
                 # Estimate confidence given all observations (including new images)
                 if is_confident(A, image_messages, web_context, move_history):
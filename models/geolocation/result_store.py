@@ -0,0 +1,159 @@
+import os
+import json
+import math
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Columns of a result, in the order they are stored
+SCHEMA = pa.schema([
+    ("standpoint_id", pa.string()),
+    ("gt_coords", pa.string()),
+    ("gt_continent", pa.string()),
+    ("gt_country", pa.string()),
+    ("gt_city", pa.string()),
+    ("gt_street", pa.string()),
+    ("gpt_continent", pa.string()),
+    ("gpt_country", pa.string()),
+    ("gpt_city", pa.string()),
+    ("gpt_street", pa.string()),
+    ("gpt_reasoning", pa.string()),
+    ("gpt_coords_lat", pa.string()),
+    ("gpt_coords_lon", pa.string()),
+    ("num_adjacent_standpoints", pa.int64()),
+    ("num_adjacent_visited", pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("model_family", pa.string()), ("run_id", pa.string())]), flavor="hive")
+
+
+'''Value of a string column, None for missing values (e.g., NaN of blank Excel cells)'''
+def to_str(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+'''Flatten a result.json into one row'''
+def flatten_result(data):
+    num_adjacent = data.get("num_adjacent_standpoints")
+    return {
+        "standpoint_id": to_str(data.get("standpoint_id")),
+        "gt_coords": to_str(data["ground_truth"].get("coords")),
+        "gt_continent": to_str(data["ground_truth"].get("continent")),
+        "gt_country": to_str(data["ground_truth"].get("country")),
+        "gt_city": to_str(data["ground_truth"].get("city")),
+        "gt_street": to_str(data["ground_truth"].get("street")),
+        "gpt_continent": to_str(data["gpt_output"]["location"].get("continent")),
+        "gpt_country": to_str(data["gpt_output"]["location"].get("country")),
+        "gpt_city": to_str(data["gpt_output"]["location"].get("city")),
+        "gpt_street": to_str(data["gpt_output"]["location"].get("street")),
+        "gpt_reasoning": to_str(data["gpt_output"].get("reasoning")),
+        "gpt_coords_lat": to_str(data["gpt_output"]["coords"].get("latitude")),
+        "gpt_coords_lon": to_str(data["gpt_output"]["coords"].get("longitude")),
+        "num_adjacent_standpoints": int(num_adjacent) if num_adjacent is not None else None,
+        "num_adjacent_visited": len(data.get("adjacent_standpoints_visited", [])),
+    }
+
+
+'''Class for the columnar store of the results of all runs'''
+class ResultStore:
+    """
+    Results as a Parquet dataset partitioned by model family and run ID, i.e.,
+    `<root>/model_family=<model_family>/run_id=<run_id>/*.parquet`.
+
+    Each result is appended as its own small file when the standpoint finishes, so concurrent workers
+    and interrupted runs never rewrite a shared file. `compact` merges the files of a finished run into one.
+    """
+
+    def __init__(self, root="interactive_views/results_store"):
+        self.root = root
+
+    def get_partition_dir(self, model_family, run_id):
+        return os.path.join(self.root, f"model_family={model_family}", f"run_id={run_id}")
+
+    def write_table(self, table, partition_dir, name):
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, f"{name}.parquet")
+        # written to a temporary file first, so readers never see a partial file
+        tmp_path = os.path.join(partition_dir, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def append(self, rows, model_family, run_id):
+        """Append the flattened results of a run (see `flatten_result`)"""
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not rows:
+            return None
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+        name = f"{rows[0]['standpoint_id']}" if len(rows) == 1 else f"part-{uuid.uuid4().hex[:8]}"
+        return self.write_table(table, self.get_partition_dir(model_family, run_id), name)
+
+    def compact(self, model_family, run_id):
+        """Merge the files of a run into a single file"""
+        partition_dir = self.get_partition_dir(model_family, run_id)
+        paths = sorted(os.path.join(partition_dir, f) for f in os.listdir(partition_dir) if f.endswith(".parquet"))
+        if len(paths) <= 1:
+            return
+        table = pa.concat_tables([pq.read_table(path, schema=SCHEMA) for path in paths])
+        self.write_table(table, partition_dir, f"compacted-{uuid.uuid4().hex[:8]}")
+        for path in paths:
+            os.remove(path)
+
+    def load(self, model_family=None, run_id=None, columns=None):
+        """Results as a DataFrame with "model_family" and "run_id" columns, optionally of one model family or run"""
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=SCHEMA.names + ["model_family", "run_id"])
+        dataset = ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, exclude_invalid_files=True)
+        filter = None
+        if model_family is not None:
+            filter = ds.field("model_family") == model_family
+        if run_id is not None:
+            run_filter = ds.field("run_id") == str(run_id)
+            filter = run_filter if filter is None else filter & run_filter
+        return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+    def get_standpoint_ids(self, model_family, run_id):
+        """IDs of the standpoints of a run already in the store"""
+        partition_dir = self.get_partition_dir(model_family, run_id)
+        if not os.path.isdir(partition_dir):
+            return set()
+        dataset = ds.dataset(partition_dir, format="parquet", schema=SCHEMA, exclude_invalid_files=True)
+        return set(dataset.to_table(columns=["standpoint_id"]).column("standpoint_id").to_pylist())
+
+    def import_run_dir(self, run_dir, model_family, run_id):
+        """
+        Add the result.json files of a run, stored as `<run_dir>/<id>/result.json`, whose standpoints are not in
+        the store yet (e.g., earlier runs, or results whose append failed). Returns the number of imported results.
+        """
+        stored_ids = self.get_standpoint_ids(model_family, run_id)
+        rows = []
+        for id in sorted(os.listdir(run_dir)):
+            path = os.path.join(run_dir, id, "result.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    row = flatten_result(json.load(f))
+                if row["standpoint_id"] not in stored_ids:
+                    rows.append(row)
+        self.append(rows, model_family, run_id)
+        return len(rows)
+
+    def import_result_dirs(self, output_dir):
+        """
+        Add the result.json files of all runs, stored as `<output_dir>/<model_family>/<run_id>/<id>/result.json`.
+        Standpoints already in the store are skipped.
+        """
+        imported = 0
+        for model_family in sorted(os.listdir(output_dir)):
+            family_dir = os.path.join(output_dir, model_family)
+            if not os.path.isdir(family_dir) or os.path.abspath(family_dir) == os.path.abspath(self.root):
+                continue
+            for run_id in sorted(os.listdir(family_dir)):
+                run_dir = os.path.join(family_dir, run_id)
+                if os.path.isdir(run_dir):
+                    imported += self.import_run_dir(run_dir, model_family, run_id)
+        return imported
@@ -6,17 +6,17 @@ from dotenv import load_dotenv
 import os
 import json
 import threading
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import uuid
 from datetime import datetime
-from functools import partial
 from datasets import load_dataset
 
-from utils import get_session_token, get_pano_meta
+from utils import SessionTokenCache, get_pano_meta
 from standpoint import StandpointNode
 from agent import Agent, format_text
 from pipeline import run_optional, run_forced
+from web_query import start_web_query_server, DEFAULT_PORT, DEFAULT_VWA_DIR
+from result_store import ResultStore, flatten_result
 
 
 load_dotenv()
@@ -30,20 +30,25 @@ def parse_args():
     parser.add_argument('--output_dir', type=str, default='interactive_views')
     parser.add_argument('--run_forced', type=bool, default=True)
     parser.add_argument('--data', type=str, default='filtered')
+    parser.add_argument('--web_query', type=str, default='service', choices=['service', 'subprocess'],
+                        help="Answer web queries with a resident service (web_query.py) or a vwa subprocess per query")
+    parser.add_argument('--web_query_port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--visualwebarena_dir', type=str, default=DEFAULT_VWA_DIR)
+    parser.add_argument('--num_workers', type=int, default=8, help="Standpoints processed in parallel")
+    parser.add_argument('--max_api_calls', type=int, default=8, help="Model API calls in flight across all workers")
+    parser.add_argument('--run_id', type=str, default=None, help="Run ID to resume, a new one by default")
+    parser.add_argument('--prefetch_views', action='store_true', help="Fetch the views of all adjacent standpoints while the agent decides where to move")
+    parser.add_argument('--max_image_tokens', type=int, default=None, help="Token budget of the views in each prompt, older views are downscaled or dropped beyond it")
     return parser.parse_args()
 
 
-def process_row(row, run_id):
-    # print(f"Process {multiprocessing.current_process().name} is processing {row[0]}")
-
-    args = parse_args()
-
-    if args.model_family == 'gpt':
+def create_client(model_family):
+    if model_family == 'gpt':
         client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         client_model = "gpt-4o"
         api_style = "gpt"
 
-    elif args.model_family == 'gemini':
+    elif model_family == 'gemini':
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
         generation_config = {
             "max_output_tokens": 400,
@@ -52,32 +57,50 @@ def process_row(row, run_id):
         }
         client_model = "gemini-2.0-flash"
         client = genai.GenerativeModel(model_name=client_model, generation_config=generation_config)
-        api_style = args.model_family
+        api_style = model_family
 
-    elif args.model_family == 'qwen': # qwen-vl-plus
+    elif model_family == 'qwen': # qwen-vl-plus
         client = OpenAI(api_key=os.getenv("QWEN_API_KEY"), base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
         client_model = "qwen-vl-plus"
         api_style = "gpt"
 
-    elif args.model_family == 'internvl': # internvl2.5-latest
+    elif model_family == 'internvl': # internvl2.5-latest
         client = OpenAI(api_key=os.getenv("INTERNVL_API_KEY"), base_url="https://chat.intern-ai.org.cn/api/v1/",)
         client_model = "internvl2.5-latest"
         api_style = "gpt"
 
     else:
-        raise ValueError(f"Unsupported model family: {args.model_family}")
+        raise ValueError(f"Unsupported model family: {model_family}")
+
+    return client, client_model
+
+
+# API client of each worker thread, created on its first standpoint
+worker_state = threading.local()
+
+def get_worker_client(model_family):
+    if getattr(worker_state, "client", None) is None:
+        worker_state.client, worker_state.client_model = create_client(model_family)
+    return worker_state.client, worker_state.client_model
 
-    session_token = get_session_token(GOOGLE_API_KEY)
 
+def get_results_path(base_dir, id):
+    return f"{base_dir}/{id}/result.json"
+
+
+def process_row(row, run_id, args, session_tokens, web_query_client=None, api_semaphore=None, result_store=None):
     id, init_coords, continent, country, city, street = row
 
     base_dir = f"{args.output_dir}/{args.model_family}/{run_id}"
     
     # Skip already processed standpoints -- comment out to re-process standpoints
-    results_path = f"{base_dir}/{id}/result.json"
+    results_path = get_results_path(base_dir, id)
     if os.path.exists(results_path):
         print(f"Skipping {id}: result.json already exists.")
-        return
+        return "skipped"
+
+    client, client_model = get_worker_client(args.model_family)
+    session_token = session_tokens.get()
 
     latitude, longitude = map(float, init_coords.split(","))
 
@@ -89,7 +112,7 @@ def process_row(row, run_id):
 
     if meta is None:
         # print(f"Standpoint ID: {id} - No metadata found.")
-        return
+        return "no_metadata"
     
     # Store the initial standpoint's adjacent nodes (if any)
     curr_node.store_adjacent(meta, session_token)
@@ -97,24 +120,24 @@ def process_row(row, run_id):
     # Skip if no adjacent nodes are found
     if curr_node.num_adjacent == 0:
         # print(f"Standpoint ID: {id} - No adjacent standpoints found.")
-        return
+        return "no_adjacent"
 
     print(f"Standpoint ID: {id}")
     # print(f'Ground Truth: {continent}, {country}, {city}, {street}\n')
 
     # Create the agent
-    agent = Agent(client, client_model, args.model_family)
+    agent = Agent(client, client_model, args.model_family, web_query_client=web_query_client, api_semaphore=api_semaphore)
 
     # Run the pipeline
     if args.run_forced:
-        image_messages, web_context, move_history, visited, success = run_forced(base_dir, curr_node, A=agent, iter_num=5)
+        image_messages, web_context, move_history, visited, success = run_forced(base_dir, curr_node, A=agent, iter_num=5, max_image_tokens=args.max_image_tokens, prefetch_views=args.prefetch_views)
     else:
-        image_messages, web_context, move_history, visited, success = run_optional(base_dir, curr_node, A=agent, iter_num=5)
+        image_messages, web_context, move_history, visited, success = run_optional(base_dir, curr_node, A=agent, iter_num=5, max_image_tokens=args.max_image_tokens, prefetch_views=args.prefetch_views)
 
     # Don't store results if the run fails
     if not success:
         print(f"Failed to run for standpoint ID: {id}")
-        return
+        return "failed"
 
     # Prepare images + web context for prediction
     full_context = list(image_messages)
@@ -154,18 +177,34 @@ def process_row(row, run_id):
             }
         },
         "num_adjacent_standpoints": curr_node.num_adjacent,
+        "metrics": {
+            "image_context": image_messages.get_stats(),
+            "api_calls": agent.get_call_summary(),
+            "api_call_stats": agent.call_stats,
+        },
     }
 
-    output_dir = f"{base_dir}/{id}"
-    os.makedirs(output_dir, exist_ok=True)
-    with open(os.path.join(output_dir, "result.json"), "w") as f:
+    # Checkpoint the standpoint, written to a temporary file first so an interrupted run never leaves a partial result.json
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    tmp_path = f"{results_path}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(result_data, f, indent=4)
+    os.replace(tmp_path, results_path)
+
+    # Add the result to the columnar store, a failure is logged since the result.json is imported at the end of the run
+    if result_store is not None:
+        try:
+            result_store.append(flatten_result(result_data), args.model_family, run_id)
+        except Exception as e:
+            print(f"Failed to add standpoint {id} to the result store: {e}")
+    return "done"
 
 
 def main():
     args = parse_args()
 
-    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Pass the run ID of an interrupted run to resume it
+    run_id = args.run_id if args.run_id is not None else datetime.now().strftime("%Y%m%d_%H%M%S")
     print(f"Run ID: {run_id}")
 
     if args.data == 'filtered':
@@ -178,15 +217,47 @@ def main():
     print(f"Sampled {len(sampled)} rows.")
     rows = list(sampled.itertuples(index=False, name=None))
 
-    # with ProcessPoolExecutor(max_workers=5) as pool:
-    #     process_func = partial(process_row, run_id=run_id)
-    #     print(f"Processing {len(rows)} rows in parallel...")
-    #     futures = list(pool.map(process_func, rows))
-
-    futures = []
-    for row in rows:
-        result = process_row(row, run_id)
-        futures.append(result)
+    # Keep the web agent and browser loaded across all standpoints
+    web_query_client, web_query_process = None, None
+    if args.web_query == 'service':
+        web_query_client, web_query_process = start_web_query_server(args.model_family, args.web_query_port, args.visualwebarena_dir)
+
+    # One Street View session for all workers, reused by later runs until it expires
+    os.makedirs(args.output_dir, exist_ok=True)
+    session_tokens = SessionTokenCache(GOOGLE_API_KEY, cache_path=os.path.join(args.output_dir, "session_token.json"))
+    api_semaphore = threading.BoundedSemaphore(args.max_api_calls)
+    result_store = ResultStore(os.path.join(args.output_dir, "results_store"))
+
+    print(f"Processing {len(rows)} rows with {args.num_workers} workers...")
+    stats = {}
+    try:
+        with ThreadPoolExecutor(max_workers=args.num_workers) as pool:
+            futures = {
+                pool.submit(process_row, row, run_id, args, session_tokens, web_query_client, api_semaphore, result_store): row[0]
+                for row in rows
+            }
+            for i, future in enumerate(as_completed(futures)):
+                try:
+                    status = future.result()
+                except Exception as e:
+                    # No result.json is written, so the standpoint is retried when the run is resumed
+                    print(f"Error for standpoint ID: {futures[future]}: {e!r}")
+                    status = "error"
+                stats[status] = stats.get(status, 0) + 1
+                if (i + 1) % 50 == 0:
+                    print(f"[{i + 1}/{len(rows)}] {stats}")
+        print(f"Finished run {run_id}: {stats}")
+        # Add the results whose append failed, in this run or an earlier attempt of it
+        run_dir = os.path.join(args.output_dir, args.model_family, run_id)
+        backfilled = result_store.import_run_dir(run_dir, args.model_family, run_id) if os.path.isdir(run_dir) else 0
+        if backfilled:
+            print(f"Added {backfilled} missing results to the result store")
+        # One file per run instead of one per standpoint, for faster analysis
+        if stats.get("done") or backfilled:
+            result_store.compact(args.model_family, run_id)
+    finally:
+        if web_query_process is not None:
+            web_query_process.terminate()
 
 
 if __name__ == "__main__":
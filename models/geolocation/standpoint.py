@@ -1,10 +1,4 @@
-from dotenv import load_dotenv
-import os
-
-from utils import get_pano_meta_from_id
-
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+from view_fetcher import get_default_fetcher
 
 
 '''Class for standpoint nodes (intial and adjacent)'''
@@ -21,13 +15,13 @@ class StandpointNode:
     def get_coords(self):
         return f'{self.latitude}, {self.longitude}'
     
-    # Get all adjacent standpoints (degree=1)
-    def store_adjacent(self, meta, session_token):
+    # Get all adjacent standpoints (degree=1), with the metadata requests of all links in parallel
+    def store_adjacent(self, meta, session_token, fetcher=None):
         links = meta.get('links', [])
+        fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        pano_metas = fetcher.get_pano_metas([link['panoId'] for link in links], session_token)
         
-        for link in links:
-            pano_meta = get_pano_meta_from_id(link['panoId'], GOOGLE_API_KEY, session_token=session_token)
-
+        for link, pano_meta in zip(links, pano_metas):
             if pano_meta is None:
                 # print(f"No metadata found for adjacent standpoint.")
                 continue
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# the geolocation modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utils
+from fake_street_view import FakeStreetViewServer
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server = FakeStreetViewServer(delay=0.2).start()
+    monkeypatch.setattr(utils, "STREET_VIEW_URL", f"{server.url}/streetview")
+    monkeypatch.setattr(utils, "TILE_API_URL", f"{server.url}/v1")
+    yield server
+    server.stop()
@@ -0,0 +1,101 @@
+"""Local stand-in for the Street View Static and tile APIs"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+
+def make_meta(index, num_panos):
+    """Panoramas along a street, each linked to its neighbours"""
+    links = [{"panoId": f"p{i}", "heading": 0.0 if i > index else 180.0} for i in (index - 1, index + 1) if 0 <= i < num_panos]
+    return {"panoId": f"p{index}", "lat": 40.0 + index * 1e-4, "lng": -73.0, "links": links}
+
+
+class FakeStreetViewServer:
+    """
+    Serves the panorama metadata of a street and a solid color view per heading, after `delay` seconds.
+    Records the requests and the highest number served concurrently.
+    """
+
+    def __init__(self, num_panos=5, delay=0.0):
+        self.metas = {f"p{i}": make_meta(i, num_panos) for i in range(num_panos)}
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_requests(self, path):
+        with self.lock:
+            return [query for request_path, query in self.requests if request_path == path]
+
+    def respond(self, path, query):
+        if path == "/v1/createSession":
+            return 200, "application/json", json.dumps({"session": "token", "expiry": str(int(time.time()) + 3600)}).encode()
+        if path == "/v1/streetview/metadata":
+            meta = self.metas.get(query.get("panoId", "p0"))
+            if meta is None:
+                return 404, "text/plain", b"not found"
+            return 200, "application/json", json.dumps(meta).encode()
+        if path == "/streetview":
+            heading = int(float(query["heading"]))
+            width, height = map(int, query["size"].split("x"))
+            buffer = BytesIO()
+            Image.new("RGB", (width, height), (heading % 256, 100, 200)).save(buffer, format="JPEG")
+            return 200, "image/jpeg", buffer.getvalue()
+        return 404, "text/plain", b"not found"
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with fake.lock:
+                    fake.requests.append((url.path, query))
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                try:
+                    time.sleep(fake.delay)
+                    status, content_type, body = fake.respond(url.path, query)
+                finally:
+                    with fake.lock:
+                        fake.active -= 1
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.handle_request()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.handle_request()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,18 @@
+from PIL import Image
+
+from image_context import ImageContext
+
+
+def test_qwen_labels_are_openai_text_messages():
+    context = ImageContext('qwen', max_image_tokens=900, keep_recent=1)
+    for i in range(3):
+        context.add_text(f"Standpoint {i}")
+        context.add_image(Image.new("RGB", (600, 400)), "This is the view facing north.", key=(i, 0))
+
+    messages = context.get_messages()
+
+    assert None not in messages
+    texts = [message["text"] for message in messages if message["type"] == "text"]
+    assert texts.count("This is the view facing north.") == 2
+    assert "(The views of this standpoint are omitted.)" in texts
+    assert [message["type"] for message in messages].count("image_url") == 2
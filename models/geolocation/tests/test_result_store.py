@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from result_store import ResultStore, flatten_result
+from utils import calculate_distance, calculate_distance_np, get_distance_levels, THRESHOLD_NAMES
+
+
+def make_result(id, pred_coords=("48.85", "2.35")):
+    return {
+        "standpoint_id": id,
+        "ground_truth": {"coords": "48.8566, 2.3522", "continent": "Europe", "country": "France", "city": "Paris", "street": "Rue de Rivoli"},
+        "adjacent_standpoints_visited": ["a", "b"],
+        "gpt_output": {
+            "full_output": "",
+            "reasoning": "Haussmann buildings",
+            "coords": {"latitude": pred_coords[0], "longitude": pred_coords[1]},
+            "location": {"continent": "Europe", "country": "France", "city": "Paris", "street": ""},
+        },
+        "num_adjacent_standpoints": 3,
+    }
+
+
+def test_append_compact_and_load_partitions(tmp_path):
+    store = ResultStore(str(tmp_path / "store"))
+    for id in range(3):
+        store.append(flatten_result(make_result(id)), "gpt", "20250101_000000")
+    store.append(flatten_result(make_result(7)), "gemini", "20250102_000000")
+
+    store.compact("gpt", "20250101_000000")
+    assert len(os.listdir(store.get_partition_dir("gpt", "20250101_000000"))) == 1
+
+    df = store.load()
+    assert sorted(zip(df["model_family"], df["standpoint_id"])) == [("gemini", "7"), ("gpt", "0"), ("gpt", "1"), ("gpt", "2")]
+    assert df["gpt_coords_lat"].tolist() == ["48.85"] * 4
+    assert df["num_adjacent_visited"].tolist() == [2] * 4
+
+    gpt_df = store.load(model_family="gpt", run_id="20250101_000000")
+    assert sorted(gpt_df["standpoint_id"]) == ["0", "1", "2"]
+
+
+def test_import_result_dirs(tmp_path):
+    output_dir = tmp_path / "interactive_views"
+    for id in ["4", "5"]:
+        os.makedirs(output_dir / "qwen" / "run1" / id)
+        with open(output_dir / "qwen" / "run1" / id / "result.json", "w") as f:
+            json.dump(make_result(id), f)
+
+    store = ResultStore(str(output_dir / "results_store"))
+    assert store.import_result_dirs(str(output_dir)) == 2
+    # already imported
+    assert store.import_result_dirs(str(output_dir)) == 0
+    assert sorted(store.load(run_id="run1")["standpoint_id"]) == ["4", "5"]
+
+
+def test_failed_append_is_backfilled(tmp_path, monkeypatch):
+    run_dir = tmp_path / "interactive_views" / "gpt" / "run1"
+    store = ResultStore(str(tmp_path / "interactive_views" / "results_store"))
+    append = store.append
+
+    def failing_append(rows, model_family, run_id):
+        if isinstance(rows, dict) and rows["standpoint_id"] == "1":
+            raise OSError("disk full")
+        return append(rows, model_family, run_id)
+
+    monkeypatch.setattr(store, "append", failing_append)
+    for id in ["0", "1", "2"]:
+        # as in run.py, the checkpoint is written before the append
+        os.makedirs(run_dir / id)
+        with open(run_dir / id / "result.json", "w") as f:
+            json.dump(make_result(id), f)
+        try:
+            store.append(flatten_result(make_result(id)), "gpt", "run1")
+        except OSError:
+            pass
+    monkeypatch.undo()
+    assert store.get_standpoint_ids("gpt", "run1") == {"0", "2"}
+
+    assert store.import_run_dir(str(run_dir), "gpt", "run1") == 1
+    assert sorted(store.load(run_id="run1")["standpoint_id"]) == ["0", "1", "2"]
+    assert store.import_result_dirs(str(tmp_path / "interactive_views")) == 0
+
+
+def test_vectorized_distances_match_scalar():
+    rng = np.random.default_rng(0)
+    lat1, lon1, lat2, lon2 = rng.uniform(-80, 80, (4, 500))
+
+    distances = calculate_distance_np(lat1, lon1, lat2, lon2)
+
+    np.testing.assert_allclose(distances, [calculate_distance(*x) for x in zip(lat1, lon1, lat2, lon2)], rtol=1e-9)
+    assert calculate_distance_np([np.nan], [0.0], [0.0], [0.0])[0] == np.inf
+    levels = get_distance_levels([0.5, 1.0, 30.0, 2500.0, 2500.1, np.inf])
+    assert [THRESHOLD_NAMES[level] for level in levels] == [
+        "street level (1km)", "street level (1km)", "region level (200km)",
+        "continent level (2500km)", "beyond continent level", "beyond continent level",
+    ]
+
+
+def test_missing_and_non_string_values_are_stored(tmp_path):
+    result = make_result(3, pred_coords=(48.85, None))
+    result["ground_truth"]["street"] = float("nan")
+    store = ResultStore(str(tmp_path / "store"))
+
+    store.append(flatten_result(result), "gpt", "run1")
+
+    row = store.load().iloc[0]
+    assert pd.isna(row["gt_street"])
+    assert row["gpt_coords_lat"] == "48.85"
+    assert pd.isna(row["gpt_coords_lon"])
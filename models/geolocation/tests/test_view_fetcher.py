@@ -0,0 +1,55 @@
+import os
+
+from utils import get_pano_meta
+from standpoint import StandpointNode
+from view_fetcher import ViewFetcher, HEADINGS
+
+
+def test_store_adjacent_fetches_links_in_parallel(fake_server):
+    fake_server.metas["p0"]["links"] = [{"panoId": pano_id} for pano_id in ["p3", "p1", "missing", "p2"]]
+    fetcher = ViewFetcher(api_key="key")
+    node = StandpointNode("p0", 40.0, -73.0)
+
+    node.store_adjacent(get_pano_meta(40.0, -73.0, "key", "token"), "token", fetcher=fetcher)
+    fetcher.close()
+
+    # in link order, without the panorama whose metadata is missing
+    assert [adj.id for adj in node.adjacent] == ["p3", "p1", "p2"]
+    assert [adj.latitude for adj in node.adjacent] == [fake_server.metas[i]["lat"] for i in ["p3", "p1", "p2"]]
+    assert node.num_adjacent == 3
+    assert fake_server.max_active > 1
+
+
+def test_get_views_fetches_headings_in_parallel_and_caches(fake_server, tmp_path):
+    fetcher = ViewFetcher(api_key="key")
+    cache_dir = str(tmp_path / "p0")
+
+    images = fetcher.get_views("40.0, -73.0", cache_dir)
+    assert fake_server.max_active > 1
+
+    # in heading order
+    assert [image.size for image in images] == [(600, 400)] * 4
+    assert all(abs(image.getpixel((0, 0))[0] - heading % 256) < 8 for image, heading in zip(images, HEADINGS))
+    assert sorted(os.listdir(cache_dir)) == ["east.jpg", "north.jpg", "south.jpg", "west.jpg"]
+    assert sorted(int(query["heading"]) for query in fake_server.get_requests("/streetview")) == HEADINGS
+
+    # served from the cache directory
+    fetcher.get_views("40.0, -73.0", cache_dir)
+    fetcher.close()
+    assert len(fake_server.get_requests("/streetview")) == 4
+
+
+def test_prefetch_is_not_fetched_again(fake_server, tmp_path):
+    fetcher = ViewFetcher(api_key="key")
+    cache_dirs = [str(tmp_path / f"p{i}") for i in range(3)]
+    for i, cache_dir in enumerate(cache_dirs):
+        fetcher.prefetch(f"40.000{i}, -73.0", cache_dir)
+
+    # one prefetched standpoint is visited while its views are still being fetched
+    images = fetcher.get_views("40.0001, -73.0", cache_dirs[1])
+
+    assert all(image is not None for image in images)
+    assert len(fake_server.get_requests("/streetview")) == 12
+    assert fetcher.stats == {"requested": 0, "prefetched": 12, "prefetch_hits": 4}
+    fetcher.close()
+    assert all(len(os.listdir(cache_dir)) == 4 for cache_dir in cache_dirs)
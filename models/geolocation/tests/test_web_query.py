@@ -0,0 +1,35 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from web_query import WebQueryClient, WebQueryServer
+
+
+class SlowService:
+    """Answers one query at a time, like `WebQueryService`"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def query(self, web_query, max_tries=2):
+        with self.lock:
+            time.sleep(self.delay)
+            return {"answer": web_query["intent"], "success": True, "query_id": None, "num_steps": 1,
+                    "elapsed": self.delay, "actions": []}
+
+
+def test_queued_queries_do_not_time_out():
+    server = WebQueryServer(SlowService(delay=0.3), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # each query fits the timeout, but not the time spent behind the other queries
+    client = WebQueryClient(port=server.server_address[1], capacity=1, query_timeout=0.5)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda i: client.query({"intent": str(i)}, max_tries=1), range(4)))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [result["answer"] for result in results] == ["0", "1", "2", "3"]
+    assert all(result["success"] for result in results)
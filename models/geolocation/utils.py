@@ -3,11 +3,29 @@ import os
 from PIL import Image
 from io import BytesIO
 import math
+import numpy as np
 import re
 import base64
 import json
 import uuid
+import time
+import threading
 import subprocess
+from requests.adapters import HTTPAdapter
+
+# Google endpoints, overridden to point at a local server in tests
+STREET_VIEW_URL = "https://maps.googleapis.com/maps/api/streetview"
+TILE_API_URL = "https://tile.googleapis.com/v1"
+
+'''HTTP session shared by all requests, keeping connections to the Google APIs open'''
+def create_http_session(pool_size=32):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+http_session = create_http_session()
 
 def get_street_view_from_api(api_key:str, location:str, heading=0, pitch=0, fov=90, size="600x400", cache_dir=None):
     """
@@ -35,7 +53,6 @@ def get_street_view_from_api(api_key:str, location:str, heading=0, pitch=0, fov=
         if os.path.exists(cache_path):
             return Image.open(cache_path), True
     
-    base_url = "https://maps.googleapis.com/maps/api/streetview"
     params = {
         "size": size,
         "location": location,
@@ -45,36 +62,79 @@ def get_street_view_from_api(api_key:str, location:str, heading=0, pitch=0, fov=
         "key": api_key
     }
     
-    response = requests.get(base_url, params=params)
+    response = http_session.get(STREET_VIEW_URL, params=params)
     
     if response.status_code == 200:
         # Load image from response content
         image = Image.open(BytesIO(response.content))
         if cache_dir is not None:
-            image.save(cache_path)
+            # Store the JPEG as received, through a temporary file since views can be fetched concurrently
+            tmp_path = f"{cache_path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(response.content)
+            os.replace(tmp_path, cache_path)
+            # backed by the file, so its JPEG bytes are reused instead of re-encoding it
+            image = Image.open(cache_path)
         return image, False
     else:
         print("Error fetching Street View image:", response.status_code, response.text)
         return None, False
     
-def get_session_token(api_key:str):
-    url = "https://tile.googleapis.com/v1/createSession"
+def create_session(api_key:str):
+    url = f"{TILE_API_URL}/createSession"
     headers = {"Content-Type": "application/json"}
     payload = {
         "mapType": "streetview",
         "language": "en-US",
         "region": "US"
     }
-    response = requests.post(f"{url}?key={api_key}", json=payload, headers=headers)
+    response = http_session.post(f"{url}?key={api_key}", json=payload, headers=headers)
     if response.status_code == 200:
-        return response.json()["session"]
+        return response.json()
     else:
         print("Error fetching session token:", response.status_code, response.text)
         return None
+
+def get_session_token(api_key:str):
+    session = create_session(api_key)
+    return session["session"] if session is not None else None
+
+'''Session token shared by all workers, renewed when it expires'''
+class SessionTokenCache:
+    def __init__(self, api_key:str, cache_path=None, ttl=12 * 3600, margin=600):
+        self.api_key = api_key
+        self.cache_path = cache_path # JSON file to share the token across runs, None to keep it in memory
+        self.ttl = ttl # lifetime in seconds when the API does not return an expiry
+        self.margin = margin # renew this many seconds before the expiry
+        self.lock = threading.Lock()
+        self.token = None
+        self.expiry = 0.0
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as f:
+                    cached = json.load(f)
+                self.token, self.expiry = cached["session"], float(cached["expiry"])
+            except (json.JSONDecodeError, KeyError, ValueError):
+                pass
+
+    def get(self):
+        with self.lock:
+            if self.token is None or time.time() >= self.expiry - self.margin:
+                session = create_session(self.api_key)
+                if session is None:
+                    return None
+                self.token = session["session"]
+                self.expiry = float(session.get("expiry", time.time() + self.ttl))
+                if self.cache_path is not None:
+                    tmp_path = f"{self.cache_path}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump({"session": self.token, "expiry": self.expiry}, f)
+                    os.replace(tmp_path, self.cache_path)
+            return self.token
     
 def get_pano_meta(latitute, longitude, api_key:str, session_token:str, radius:float=50):
-    url = "https://tile.googleapis.com/v1/streetview/metadata"
-    response = requests.get(f"{url}?session={session_token}&key={api_key}&lat={latitute}&lng={longitude}&radius={radius}")
+    url = f"{TILE_API_URL}/streetview/metadata"
+    response = http_session.get(f"{url}?session={session_token}&key={api_key}&lat={latitute}&lng={longitude}&radius={radius}")
     if response.status_code == 200:
         return response.json()
     else:
@@ -82,8 +142,8 @@ def get_pano_meta(latitute, longitude, api_key:str, session_token:str, radius:fl
         return None
 
 def get_pano_meta_from_id(pano_id, api_key:str, session_token:str):
-    url = "https://tile.googleapis.com/v1/streetview/metadata"
-    response = requests.get(f"{url}?session={session_token}&key={api_key}&panoId={pano_id}")
+    url = f"{TILE_API_URL}/streetview/metadata"
+    response = http_session.get(f"{url}?session={session_token}&key={api_key}&panoId={pano_id}")
     if response.status_code == 200:
         return response.json()
     else:
@@ -125,6 +185,34 @@ def calculate_distance(lat1, lon1, lat2, lon2):
 
     return distance
 
+def calculate_distance_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized `calculate_distance` over arrays of coordinates.
+
+    Returns:
+        np.ndarray: Distances in kilometers, inf where a coordinate is NaN (e.g., an unparsed prediction).
+    """
+    R = 6371.0  # Earth's radius in kilometers
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    distance = R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return np.where(np.isnan(distance), np.inf, distance)
+
+DISTANCE_THRESHOLDS = [1, 25, 200, 750, 2500]  # Thresholds in kilometers
+THRESHOLD_NAMES = [
+    "street level (1km)",
+    "city level (25km)",
+    "region level (200km)",
+    "country level (750km)",
+    "continent level (2500km)",
+    "beyond continent level"
+]
+
+def get_distance_levels(distances):
+    """Index in `THRESHOLD_NAMES` of the smallest threshold each distance is within"""
+    return np.searchsorted(DISTANCE_THRESHOLDS, np.asarray(distances, dtype=np.float64), side="left")
+
 """Parse the model output"""
 def parse_prediction(output):
     reasoning = ""
@@ -170,8 +258,31 @@ def encode_image(image):
     image.save(buffer, format="JPEG")
     return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
+'''Total size of the text and images of a prompt, in bytes'''
+def get_payload_size(content):
+    size = 0
+    for c in content:
+        if isinstance(c, str):
+            size += len(c.encode("utf-8"))
+        elif isinstance(c, dict) and c.get("type") == "text":
+            size += len(c["text"].encode("utf-8"))
+        elif isinstance(c, dict) and c.get("type") == "image_url":
+            size += len(c["image_url"]["url"])
+        elif isinstance(c, dict) and "data" in c:
+            size += len(c["data"])
+    return size
+
+# The raw and generated task configs of `run_vwa` have fixed names per model family
+vwa_lock = threading.Lock()
+
 '''Run VisualWebArena for web search'''
 def run_vwa(web_query, max_tries=2, model_family="gpt"):
+    # concurrent workers take turns, so no query runs the task config written by another worker
+    with vwa_lock:
+        return run_vwa_task(web_query, max_tries, model_family)
+
+'''Run a web search task with the generate_test_data.py and run.py subprocesses of VisualWebArena'''
+def run_vwa_task(web_query, max_tries=2, model_family="gpt"):
     visualwebarena_dir = os.path.abspath("../../../visualwebarena")
     env = os.environ.copy()
     env["PYTHONPATH"] = visualwebarena_dir
@@ -264,7 +375,11 @@ def extract_parsed_answer_from_html(html_path):
     if not match:
         return "ERROR: No parsed_action found", False
 
-    answer = match.group(1).strip()
+    return check_vwa_answer(match.group(1))
+
+'''Check the answer of the vwa stop action'''
+def check_vwa_answer(answer):
+    answer = answer.strip()
 
     # Treat empty parsed_action as failure
     if answer == "":
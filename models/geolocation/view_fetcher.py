@@ -0,0 +1,89 @@
+from dotenv import load_dotenv
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import get_street_view_from_api, get_pano_meta_from_id
+
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+HEADINGS = [0, 90, 180, 270]
+
+
+'''Cache directory of the views of a standpoint'''
+def get_view_cache_dir(base_dir, init_id, coords):
+    return base_dir + f"/{init_id}/{coords}"
+
+
+'''Class for concurrent Street View requests'''
+class ViewFetcher:
+    """
+    Fetches the views and panorama metadata of standpoints on a shared thread pool.
+
+    Views are requested concurrently and stored in their cache directory by `get_street_view_from_api`.
+    A view already being fetched (e.g., prefetched while the agent decides on its move) is not requested again:
+    `get_views` waits for the pending request, and reads the cache directory once it is done.
+    """
+
+    def __init__(self, api_key=GOOGLE_API_KEY, max_workers=16, size="600x400"):
+        self.api_key = api_key
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # reentrant, the callback releasing a request runs in `submit` when the request is already done
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.prefetched = set()
+        self.stats = {"requested": 0, "prefetched": 0, "prefetch_hits": 0}
+
+    def submit(self, coords, heading, cache_dir, prefetch=False):
+        key = (cache_dir, heading)
+        with self.lock:
+            future = self.pending.get(key)
+            if not prefetch and (key in self.prefetched):
+                self.prefetched.discard(key)
+                self.stats["prefetch_hits"] += 1
+            if future is None:
+                future = self.executor.submit(
+                    get_street_view_from_api, self.api_key, coords, heading=heading, size=self.size, cache_dir=cache_dir
+                )
+                self.pending[key] = future
+                future.add_done_callback(lambda _: self.release(key))
+                self.stats["prefetched" if prefetch else "requested"] += 1
+                if prefetch:
+                    self.prefetched.add(key)
+        return future
+
+    def release(self, key):
+        # later requests read the cache directory
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def get_views(self, coords, cache_dir, headings=HEADINGS):
+        """Images of a standpoint facing each heading (None where the request failed)"""
+        futures = [self.submit(coords, heading, cache_dir) for heading in headings]
+        return [future.result()[0] for future in futures]
+
+    def prefetch(self, coords, cache_dir, headings=HEADINGS):
+        """Start fetching the views of a standpoint without waiting for them"""
+        for heading in headings:
+            self.submit(coords, heading, cache_dir, prefetch=True)
+
+    def get_pano_metas(self, pano_ids, session_token):
+        """Metadata of each panorama, in the order of `pano_ids` (None where the request failed)"""
+        return list(self.executor.map(lambda pano_id: get_pano_meta_from_id(pano_id, self.api_key, session_token=session_token), pano_ids))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+default_fetcher = None
+default_fetcher_lock = threading.Lock()
+
+'''Fetcher shared by all standpoints of the process'''
+def get_default_fetcher():
+    global default_fetcher
+    with default_fetcher_lock:
+        if default_fetcher is None:
+            default_fetcher = ViewFetcher()
+        return default_fetcher
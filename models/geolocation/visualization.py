@@ -2,22 +2,10 @@ import os
 import json
 import streamlit as st
 from PIL import Image
-from utils import calculate_distance
-
-thresholds = [1, 25, 200, 750, 2500]  # Thresholds in kilometers
-threshold_names = [
-    "street level (1km)",
-    "city level (25km)",
-    "region level (200km)",
-    "country level (750km)",
-    "continent level (2500km)"
-]
+from utils import calculate_distance, get_distance_levels, THRESHOLD_NAMES
 
 def determine_threshold(distance):
-    for i, threshold in enumerate(thresholds):
-        if distance <= threshold:
-            return threshold_names[i]
-    return "beyond continent level"
+    return THRESHOLD_NAMES[int(get_distance_levels(distance))]
 
 def visualize(result_dir, mode):
     output_path = os.path.join(result_dir, "result.json")
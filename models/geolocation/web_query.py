@@ -0,0 +1,371 @@
+"""
+Resident web-query service on VisualWebArena.
+
+`run_vwa` answers every web query with two new Python processes (test data generation and `run.py`), each
+importing the agent and launching Chromium, and reads the answer back from `render_0.html`.
+`WebQueryService` instead keeps the browser env and the agent loaded and answers queries in-process with a
+structured result. The VisualWebArena packages clash with the modules of this directory (both have an
+`agent` module), so the service runs in its own process started with `start_web_query_server`, and the
+pipeline sends it queries over a local socket with `WebQueryClient`:
+
+    python web_query.py --model_family gpt --port 8765
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import socketserver
+
+from utils import check_vwa_answer
+
+DEFAULT_VWA_DIR = "../../../visualwebarena"
+DEFAULT_PORT = 8765
+
+
+def build_vwa_task(web_query, start_url, storage_state):
+    """VisualWebArena config of a web query on Wikipedia, as written by `run_vwa`"""
+    return {
+        "sites": ["wikipedia"],
+        "task_id": 0,
+        "require_login": True,
+        "storage_state": storage_state,
+        "start_url": start_url,
+        "geolocation": None,
+        "intent_template": web_query["intent_template"],
+        "intent": web_query["intent"],
+        "image": None,
+        "instantiation_dict": {"element": web_query["element"]},
+        "require_reset": False,
+        "viewport_size": {"width": 1280},
+        "eval": {
+            "eval_types": ["string_match"],
+            "reference_answers": {"fuzzy_match": ["N/A"]},
+            "string_note": web_query["string_note"],
+        },
+        "intent_template_id": 0,
+        "reasoning_difficulty": "easy",
+        "visual_difficulty": "easy",
+        "comments": "",
+        "overall_difficulty": "easy"
+    }
+
+
+def error_result(answer, query_id=None):
+    return {"answer": answer, "success": False, "query_id": query_id, "num_steps": 0, "elapsed": 0.0, "actions": []}
+
+
+'''Class for the resident web-query service'''
+class WebQueryService:
+    """
+    Browser env and agent of VisualWebArena kept loaded between web queries.
+
+    Same agent and settings as the `run.py` call of `run_vwa` (Set-of-Mark observations, gpt-4o by default).
+    Must run with the VisualWebArena checkout as working directory, see `start_web_query_server`.
+    Queries are answered one at a time since they share the browser.
+    """
+
+    def __init__(self, visualwebarena_dir=DEFAULT_VWA_DIR, model="gpt-4o", max_steps=30, timeout=240,
+                 instruction_path="agent/prompts/jsons/p_som_cot_id_actree_3s.json",
+                 captioning_model="Salesforce/blip2-flan-t5-xl"):
+        self.visualwebarena_dir = os.path.abspath(visualwebarena_dir)
+        self.model = model
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.instruction_path = instruction_path
+        self.captioning_model = captioning_model
+        self.lock = threading.Lock()
+        self.env = None
+        self.agent = None
+        self.task_dir = tempfile.mkdtemp(prefix="geo_web_query_")
+        self.stats = {"queries": 0, "failed": 0, "total_time": 0.0}
+
+    def start(self):
+        """Load the agent and launch the browser, once"""
+        if self.env is not None:
+            return
+        if self.visualwebarena_dir not in sys.path:
+            sys.path.insert(0, self.visualwebarena_dir)
+        os.environ.setdefault("DATASET", "visualwebarena")
+
+        from agent import construct_agent
+        from browser_env import ScriptBrowserEnv
+        from browser_env.auto_login import renew_comb
+        from browser_env.env_config import WIKIPEDIA
+
+        vwa_args = argparse.Namespace(
+            agent_type="prompt", instruction_path=self.instruction_path, provider="openai", model=self.model,
+            mode="chat", temperature=1.0, top_p=0.9, context_length=0, max_tokens=384, stop_token=None,
+            max_retry=1, max_obs_length=3840, action_set_tag="som", observation_type="image_som",
+        )
+        self.agent = construct_agent(vwa_args)
+
+        caption_image_fn = None
+        if self.captioning_model is not None:
+            import torch
+            from evaluation_harness import image_utils
+            device = torch.device("cuda") if torch.cuda.is_available() else "cpu"
+            dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+            caption_image_fn = image_utils.get_captioning_fn(device, dtype, self.captioning_model)
+
+        env_kwargs = {}
+        if "reuse_browser" in ScriptBrowserEnv.__init__.__code__.co_varnames:
+            # keep one Chromium process and only open a new context per query
+            env_kwargs["reuse_browser"] = True
+        self.env = ScriptBrowserEnv(
+            headless=True,
+            observation_type="image_som",
+            current_viewport_only=True,
+            viewport_size={"width": 1280, "height": 2048},
+            sleep_after_execution=2.5,
+            captioning_fn=caption_image_fn,
+            **env_kwargs,
+        )
+
+        # the storage state is renewed once for the service instead of once per query
+        renew_comb(["wikipedia"], auth_folder=self.task_dir)
+        self.storage_state = os.path.join(self.task_dir, "wikipedia_state.json")
+        self.start_url = WIKIPEDIA
+
+    def close(self):
+        if self.env is not None:
+            self.env.close()
+            self.env = None
+
+    def early_stop(self, trajectory, parsing_failure=3, repeating_action=5):
+        """Same stopping rules as `run.py`"""
+        from browser_env import ActionTypes
+        from browser_env.actions import is_equivalent
+
+        if (len(trajectory) - 1) / 2 >= self.max_steps:
+            return True, f"Reach max steps {self.max_steps}"
+
+        action_seq = trajectory[1::2]
+        last_k_actions = action_seq[-parsing_failure:]
+        if len(last_k_actions) >= parsing_failure and all(a["action_type"] == ActionTypes.NONE for a in last_k_actions):
+            return True, f"Failed to parse actions for {parsing_failure} times"
+
+        if not action_seq:
+            return False, ""
+        last_action = action_seq[-1]
+        if last_action["action_type"] != ActionTypes.TYPE:
+            last_k_actions = action_seq[-repeating_action:]
+            if len(last_k_actions) >= repeating_action and all(is_equivalent(a, last_action) for a in last_k_actions):
+                return True, f"Same action for {repeating_action} times"
+        elif sum(is_equivalent(a, last_action) for a in action_seq) >= repeating_action:
+            return True, f"Same typing action for {repeating_action} times"
+        return False, ""
+
+    def run_episode(self, config_file, intent):
+        """Run the agent on one web query, returns the answer of its stop action and the actions taken"""
+        from browser_env import ActionTypes, create_stop_action
+        from browser_env.helper_functions import get_action_description
+
+        start_time = time.time()
+        self.agent.reset(config_file)
+        obs, info = self.env.reset(options={"config_file": config_file})
+        state_info = {"observation": obs, "info": info}
+        trajectory = [state_info]
+        meta_data = {"action_history": ["None"]}
+
+        while True:
+            early_stop_flag, stop_info = self.early_stop(trajectory)
+            if early_stop_flag:
+                action = create_stop_action(f"Early stop: {stop_info}")
+            elif time.time() - start_time > self.timeout:
+                action = create_stop_action("ERROR: VWA query timed out")
+            else:
+                try:
+                    action = self.agent.next_action(trajectory, intent, images=[], meta_data=meta_data)
+                except ValueError as e:
+                    action = create_stop_action(f"ERROR: {str(e)}")
+            trajectory.append(action)
+
+            action_str = get_action_description(
+                action,
+                state_info["info"]["observation_metadata"],
+                action_set_tag="som",
+                prompt_constructor=self.agent.prompt_constructor,
+            )
+            meta_data["action_history"].append(action_str)
+
+            if action["action_type"] == ActionTypes.STOP:
+                return action["answer"], meta_data["action_history"][1:]
+
+            obs, _, terminated, _, info = self.env.step(action)
+            state_info = {"observation": obs, "info": info}
+            trajectory.append(state_info)
+            if terminated:
+                return "", meta_data["action_history"][1:]
+
+    def query(self, web_query, max_tries=2):
+        """
+        Answer a web query generated by `Agent.generate_web_query`.
+
+        Parameters:
+            web_query (dict): "intent_template", "intent", "element" and "string_note" of the query
+            max_tries (int): attempts until the agent stops with an answer
+        Returns:
+            dict: "answer", "success", "query_id", "num_steps", "elapsed" (seconds) and "actions" of the last attempt
+        """
+        with self.lock:
+            self.start()
+            start_time = time.time()
+            for attempt in range(max_tries):
+                query_id = uuid.uuid4().hex[:8]
+                config_file = os.path.join(self.task_dir, f"geo_query_{query_id}.json")
+                with open(config_file, "w") as f:
+                    json.dump(build_vwa_task(web_query, self.start_url, self.storage_state), f, indent=2)
+
+                try:
+                    answer, actions = self.run_episode(config_file, web_query["intent"])
+                    answer, success = check_vwa_answer(answer)
+                except Exception as e:
+                    answer, actions, success = f"ERROR: {str(e)}", [], False
+                finally:
+                    os.remove(config_file)
+
+                if success:
+                    break
+                print(f"[VWA Retry {attempt+1}] Failed with: {answer}")
+
+            elapsed = time.time() - start_time
+            self.stats["queries"] += 1
+            self.stats["failed"] += 0 if success else 1
+            self.stats["total_time"] += elapsed
+            return {"answer": answer, "success": success, "query_id": query_id, "num_steps": len(actions),
+                    "elapsed": elapsed, "actions": actions}
+
+
+class WebQueryHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line: {"web_query": {...}, "max_tries": 2}, answered with the result as one JSON line"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.service.query(request["web_query"], max_tries=request.get("max_tries", 2))
+            except Exception as e:
+                result = error_result(f"ERROR: {str(e)}")
+            self.wfile.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class WebQueryServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, service, host="127.0.0.1", port=DEFAULT_PORT):
+        super().__init__((host, port), WebQueryHandler)
+        self.service = service
+
+
+'''Class for the client of a web-query server'''
+class WebQueryClient:
+    """
+    Sends web queries to a `WebQueryServer`, with the same `query` as `WebQueryService`.
+
+    The service answers `capacity` queries at a time, so the client keeps at most that many in flight and the
+    other workers wait for their turn here. The socket timeout then only covers the query itself, i.e.,
+    `max_tries` attempts of up to `query_timeout` seconds each, never the time spent waiting behind other queries.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, capacity=1, query_timeout=300):
+        self.host = host
+        self.port = port
+        self.query_timeout = query_timeout
+        self.semaphore = threading.BoundedSemaphore(capacity)
+
+    def query(self, web_query, max_tries=2):
+        request = json.dumps({"web_query": web_query, "max_tries": max_tries}) + "\n"
+        with self.semaphore:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=max_tries * self.query_timeout) as sock:
+                    sock.sendall(request.encode("utf-8"))
+                    with sock.makefile("r", encoding="utf-8") as f:
+                        response = f.readline()
+                return json.loads(response)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[VWA ERROR] Web query service unavailable: {e}")
+                return error_result("ERROR: Web query service unavailable")
+
+    def is_ready(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+
+def start_web_query_server(model_family="gpt", port=DEFAULT_PORT, visualwebarena_dir=DEFAULT_VWA_DIR,
+                           timeout=240, startup_timeout=600):
+    """
+    Start the web-query server in a new process (unless one is already listening on `port`)
+    and wait until it accepts connections. `timeout` is the time limit of each attempt of a query (seconds).
+
+    Returns:
+        WebQueryClient: client of the server
+        subprocess.Popen: the server process, None if the server was already running
+    """
+    # one query at a time, see `WebQueryService.query`
+    client = WebQueryClient(port=port, capacity=1, query_timeout=timeout + 60)
+    if client.is_ready():
+        return client, None
+
+    visualwebarena_dir = os.path.abspath(visualwebarena_dir)
+    env = os.environ.copy()
+    env["PYTHONPATH"] = visualwebarena_dir
+    process = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__),
+        "--model_family", model_family,
+        "--port", str(port),
+        "--visualwebarena_dir", visualwebarena_dir,
+        "--timeout", str(timeout),
+    ], cwd=visualwebarena_dir, env=env)
+
+    deadline = time.time() + startup_timeout
+    while not client.is_ready():
+        if process.poll() is not None:
+            raise RuntimeError(f"Web query server exited with code {process.returncode}")
+        if time.time() > deadline:
+            process.terminate()
+            raise TimeoutError(f"Web query server not ready after {startup_timeout}s")
+        time.sleep(1)
+    return client, process
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_family', type=str, default='gpt')
+    parser.add_argument('--model', type=str, default='gpt-4o')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--visualwebarena_dir', type=str, default=DEFAULT_VWA_DIR)
+    parser.add_argument('--max_steps', type=int, default=30)
+    parser.add_argument('--timeout', type=int, default=240)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    os.chdir(args.visualwebarena_dir)
+
+    service = WebQueryService(".", model=args.model, max_steps=args.max_steps, timeout=args.timeout)
+    # load everything before accepting queries
+    service.start()
+    with WebQueryServer(service, args.host, args.port) as server:
+        print(f"Web query service ({args.model_family}) listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        finally:
+            service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+import math
 import re
 from collections import defaultdict
 from typing import Any, TypedDict, Union
@@ -17,7 +18,6 @@ from browser_env.constants import (
 
 from .utils import (
     AccessibilityTree,
-    AccessibilityTreeNode,
     BrowserConfig,
     BrowserInfo,
     DOMNode,
@@ -28,6 +28,14 @@ from .utils import (
 
 IN_VIEWPORT_RATIO_THRESHOLD = 0.6
 
+BROWSER_CONFIG_SCRIPT = """() => ({
+    win_top_bound: window.pageYOffset,
+    win_left_bound: window.pageXOffset,
+    win_width: window.screen.width,
+    win_height: window.screen.height,
+    device_pixel_ratio: window.devicePixelRatio,
+})"""
+
 
 class ObservationProcessor:
     def process(self, page: Page, client: CDPSession) -> Observation:
@@ -50,44 +58,61 @@ class TextObervationProcessor(ObservationProcessor):
         observation_type: str,
         current_viewport_only: bool,
         viewport_size: ViewportSize,
+        bounds_mode: str = "client_rect",
     ):
         self.observation_type = observation_type
         self.current_viewport_only = current_viewport_only
         self.viewport_size = viewport_size
+        # "client_rect": query getBoundingClientRect per node over CDP
+        # "snapshot": reuse the layout bounds of the DOM snapshot
+        if bounds_mode not in ["client_rect", "snapshot"]:
+            raise ValueError(f"Invalid bounds mode: {bounds_mode}")
+        self.bounds_mode = bounds_mode
         self.observation_tag = "text"
         self.meta_data = (
             create_empty_metadata()
         )  # use the store meta data of this observation type
 
+    @property
+    def needs_dom_tree(self) -> bool:
+        """Whether the observation is built from the DOM snapshot"""
+        if self.observation_type == "html":
+            return True
+        return self.bounds_mode == "snapshot"
+
     def fetch_browser_info(
         self,
         page: Page,
         client: CDPSession,
+        with_dom_tree: bool = True,
     ) -> BrowserInfo:
-        # extract domtree
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
-        )
-        # calibrate the bounds, in some cases, the bounds are scaled somehow
-        bounds = tree["documents"][0]["layout"]["bounds"]
-        b = bounds[0]
-        n = b[2] / self.viewport_size["width"]
-        bounds = [[x / n for x in bound] for bound in bounds]
-        tree["documents"][0]["layout"]["bounds"] = bounds
-
-        # extract browser info
-        win_top_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
+        tree = None
+        if with_dom_tree:
+            # extract domtree
+            tree = client.send(
+                "DOMSnapshot.captureSnapshot",
+                {
+                    "computedStyles": [],
+                    "includeDOMRects": True,
+                    "includePaintOrder": True,
+                },
+            )
+            # calibrate the bounds, in some cases, the bounds are scaled
+            bounds = tree["documents"][0]["layout"]["bounds"]
+            b = bounds[0]
+            n = b[2] / self.viewport_size["width"]
+            bounds = [[x / n for x in bound] for bound in bounds]
+            tree["documents"][0]["layout"]["bounds"] = bounds
+
+        # extract browser info in a single round trip
+        window = page.evaluate(BROWSER_CONFIG_SCRIPT)
+        win_top_bound = window["win_top_bound"]
+        win_left_bound = window["win_left_bound"]
+        win_width = window["win_width"]
+        win_height = window["win_height"]
         win_right_bound = win_left_bound + win_width
         win_lower_bound = win_top_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
+        device_pixel_ratio = window["device_pixel_ratio"]
         assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
 
         config: BrowserConfig = {
@@ -138,6 +163,59 @@ class TextObervationProcessor(ObservationProcessor):
         except Exception as e:
             return {"result": {"subtype": "error"}}
 
+    @staticmethod
+    def get_snapshot_bounds_array(
+        info: BrowserInfo,
+    ) -> npt.NDArray[np.float64]:
+        """Batched alternative to `get_bounding_client_rect`.
+
+        Join the layout arrays of the DOM snapshot to the node indices and
+        return an (n_nodes, 4) array with the same viewport-relative
+        [x, y, width, height] that getBoundingClientRect would return.
+        Rows are NaN for nodes that getBoundingClientRect cannot handle
+        (document, comments, doctype) and zero for nodes without a layout
+        object (e.g., display: none).
+        """
+        document = info["DOMTree"]["documents"][0]
+        layout = document["layout"]
+        config = info["config"]
+
+        # only elements (1) and text nodes (3) have client rects
+        node_types = np.asarray(document["nodes"]["nodeType"])
+        has_rect = (node_types == 1) | (node_types == 3)
+        node_bounds = np.full((len(node_types), 4), np.nan)
+        node_bounds[has_rect] = 0.0
+
+        layout_node_index = np.asarray(layout["nodeIndex"], dtype=np.int64)
+        layout_bounds = np.asarray(
+            layout["bounds"], dtype=np.float64
+        ).reshape(-1, 4)
+        keep = has_rect[layout_node_index]
+        layout_node_index = layout_node_index[keep]
+        layout_bounds = layout_bounds[keep]
+        # the snapshot bounds are absolute, client rects are relative to
+        # the viewport
+        layout_bounds[:, 0] -= config["win_left_bound"]
+        layout_bounds[:, 1] -= config["win_top_bound"]
+        node_bounds[layout_node_index] = layout_bounds
+        return node_bounds
+
+    @staticmethod
+    def get_snapshot_bounds(
+        info: BrowserInfo,
+    ) -> dict[int, list[float] | None]:
+        """`get_snapshot_bounds_array` keyed by backend node id, None for
+        nodes without a client rect"""
+        document = info["DOMTree"]["documents"][0]
+        backend_node_ids = document["nodes"]["backendNodeId"]
+        node_bounds = TextObervationProcessor.get_snapshot_bounds_array(info)
+        return {
+            backend_node_id: None if math.isnan(bound[0]) else bound
+            for backend_node_id, bound in zip(
+                backend_node_ids, node_bounds.tolist()
+            )
+        }
+
     @staticmethod
     def get_element_in_viewport_ratio(
         elem_left_bound: float,
@@ -170,6 +248,75 @@ class TextObervationProcessor(ObservationProcessor):
         ratio = overlap_width * overlap_height / width * height
         return ratio
 
+    @staticmethod
+    def get_in_viewport_mask(
+        bounds: npt.NDArray[np.float64],
+        config: BrowserConfig,
+    ) -> npt.NDArray[np.bool_]:
+        """Vectorized viewport check over an (n, 4) array of
+        [x, y, width, height].
+
+        A row is kept if it is visible (non-zero size) and its
+        `get_element_in_viewport_ratio` reaches IN_VIEWPORT_RATIO_THRESHOLD.
+        NaN rows (no bound) are never kept.
+        """
+        x, y, width, height = bounds.T
+        overlap_width = np.maximum(
+            0, np.minimum(x + width, config["win_width"]) - np.maximum(x, 0)
+        )
+        overlap_height = np.maximum(
+            0,
+            np.minimum(y + height, config["win_height"]) - np.maximum(y, 0),
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # same formula as get_element_in_viewport_ratio
+            ratio = overlap_width * overlap_height / width * height
+        visible = (width != 0) & (height != 0)
+        return visible & (ratio >= IN_VIEWPORT_RATIO_THRESHOLD)
+
+    @staticmethod
+    def prune_tree(
+        tree: list[dict[str, Any]],
+        keep: npt.NDArray[np.bool_],
+    ) -> list[dict[str, Any]]:
+        """Remove the nodes that are not kept from a DOM or accessibility
+        tree.
+
+        The children of a removed node are spliced into its closest kept
+        ancestor at the position of the removed node, so the output order
+        is unchanged. Every kept parent rebuilds its childIds once, which
+        makes the pass linear in the number of nodes even on very wide
+        nodes.
+        """
+        nodeid_to_cursor = {
+            node["nodeId"]: cursor for cursor, node in enumerate(tree)
+        }
+
+        def splice_children(child_ids: list[str]) -> list[str]:
+            # depth-first expansion of the removed children, in order
+            kept_child_ids = []
+            stack = child_ids[::-1]
+            while stack:
+                child_id = stack.pop()
+                child_cursor = nodeid_to_cursor.get(child_id)
+                if child_cursor is None or keep[child_cursor]:
+                    kept_child_ids.append(child_id)
+                else:
+                    stack.extend(tree[child_cursor]["childIds"][::-1])
+            return kept_child_ids
+
+        pruned_tree = []
+        for node, keep_node in zip(tree, keep):
+            if not keep_node:
+                continue
+            node["childIds"] = splice_children(node["childIds"])
+            for child_id in node["childIds"]:
+                if child_id in nodeid_to_cursor:
+                    child_cursor = nodeid_to_cursor[child_id]
+                    tree[child_cursor]["parentId"] = node["nodeId"]
+            pruned_tree.append(node)
+        return pruned_tree
+
     def fetch_page_html(
         self,
         info: BrowserInfo,
@@ -186,6 +333,16 @@ class TextObervationProcessor(ObservationProcessor):
         # make a dom tree that is easier to navigate
         dom_tree: DOMTree = []
         graph = defaultdict(list)
+        if self.bounds_mode == "snapshot":
+            # no CDP call per node, the bounds come from the snapshot layout
+            node_bounds = self.get_snapshot_bounds_array(info)
+            # the root is always inside the viewport
+            is_root = np.asarray(nodes["parentIndex"]) == -1
+            node_bounds[is_root] = [0.0, 0.0, 10.0, 10.0]
+            union_bounds = [
+                None if math.isnan(bound[0]) else bound
+                for bound in node_bounds.tolist()
+            ]
         for node_idx in range(len(nodes["nodeName"])):
             cur_node: DOMNode = {
                 "nodeId": "",
@@ -237,6 +394,8 @@ class TextObervationProcessor(ObservationProcessor):
             # get the bound
             if cur_node["parentId"] == "-1":
                 cur_node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
+            elif self.bounds_mode == "snapshot":
+                cur_node["union_bound"] = union_bounds[node_idx]
             else:
                 response = self.get_bounding_client_rect(
                     client, cur_node["backendNodeId"]
@@ -258,61 +417,15 @@ class TextObervationProcessor(ObservationProcessor):
 
         # remove the nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: DOMNode) -> None:
-                # update the node information in the accessibility tree
-                node_id = node["nodeId"]
-                parent_id = node["parentId"]
-                child_ids = node["childIds"]
-
-                # update the children of the parent node
-                assert dom_tree[int(parent_id)]["parentId"] != "[REMOVED]"
-                # remove the nodeid from parent
-                index = dom_tree[int(parent_id)]["childIds"].index(node_id)
-                dom_tree[int(parent_id)]["childIds"].pop(index)
-
-                # Insert children_nodeids in the same location
-                for child_id in child_ids:
-                    dom_tree[int(parent_id)]["childIds"].insert(
-                        index, child_id
-                    )
-                    index += 1
-
-                # update children node's parent
-                for child_id in child_ids:
-                    dom_tree[int(child_id)]["parentId"] = parent_id
-                # mark as removed
-                dom_tree[int(node_id)]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for cursor, node in enumerate(dom_tree):
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0.0 or height == 0.0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            dom_tree = [
-                node
-                for node in dom_tree
-                if node.get("parentId", "-1") != "[REMOVED]"
-            ]
+            if self.bounds_mode != "snapshot":
+                node_bounds = np.array(
+                    [node["union_bound"] or [np.nan] * 4 for node in dom_tree],
+                    dtype=np.float64,
+                ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(
+                node_bounds, info["config"]
+            )
+            dom_tree = self.prune_tree(dom_tree, in_viewport)
 
         return dom_tree
 
@@ -325,8 +438,9 @@ class TextObervationProcessor(ObservationProcessor):
             node["nodeId"]: idx for idx, node in enumerate(dom_tree)
         }
 
-        def dfs(node_cursor: int, depth: int) -> str:
-            tree_str = ""
+        lines: list[str] = []
+
+        def dfs(node_cursor: int, depth: int) -> None:
             node = dom_tree[node_cursor]
             indent = "\t" * depth
             valid_node = True
@@ -343,7 +457,7 @@ class TextObervationProcessor(ObservationProcessor):
                         "union_bound": node["union_bound"],
                         "text": node_str,
                     }
-                    tree_str += f"{indent}{node_str}\n"
+                    lines.append(f"{indent}{node_str}\n")
 
             except Exception as e:
                 valid_node = False
@@ -351,12 +465,10 @@ class TextObervationProcessor(ObservationProcessor):
             for child_ids in node["childIds"]:
                 child_cursor = nodeid_to_cursor[child_ids]
                 child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(child_cursor, child_depth)
-                tree_str += child_str
-
-            return tree_str
+                dfs(child_cursor, child_depth)
 
-        html = dfs(0, 0)
+        dfs(0, 0)
+        html = "".join(lines)
         return html, obs_nodes_info
 
     def fetch_page_accessibility_tree(
@@ -378,9 +490,10 @@ class TextObervationProcessor(ObservationProcessor):
                 seen_ids.add(node["nodeId"])
         accessibility_tree = _accessibility_tree
 
-        nodeid_to_cursor = {}
-        for cursor, node in enumerate(accessibility_tree):
-            nodeid_to_cursor[node["nodeId"]] = cursor
+        if self.bounds_mode == "snapshot":
+            snapshot_bounds = self.get_snapshot_bounds(info)
+
+        for node in accessibility_tree:
             # usually because the node is not visible etc
             if "backendDOMNodeId" not in node:
                 node["union_bound"] = None
@@ -389,6 +502,10 @@ class TextObervationProcessor(ObservationProcessor):
             if node["role"]["value"] == "RootWebArea":
                 # always inside the viewport
                 node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
+            elif self.bounds_mode == "snapshot":
+                node["union_bound"] = snapshot_bounds.get(
+                    node["backendDOMNodeId"]
+                )
             else:
                 response = self.get_bounding_client_rect(
                     client, backend_node_id
@@ -404,68 +521,19 @@ class TextObervationProcessor(ObservationProcessor):
 
         # filter nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: AccessibilityTreeNode) -> None:
-                # update the node information in the accessibility tree
-                nodeid = node["nodeId"]
-                node_cursor = nodeid_to_cursor[nodeid]
-                parent_nodeid = node["parentId"]
-                children_nodeids = node["childIds"]
-                parent_cursor = nodeid_to_cursor[parent_nodeid]
-                # update the children of the parent node
-                assert (
-                    accessibility_tree[parent_cursor].get("parentId", "Root")
-                    is not None
-                )
-                # remove the nodeid from parent's childIds
-                index = accessibility_tree[parent_cursor]["childIds"].index(
-                    nodeid
-                )
-                accessibility_tree[parent_cursor]["childIds"].pop(index)
-                # Insert children_nodeids in the same location
-                for child_nodeid in children_nodeids:
-                    accessibility_tree[parent_cursor]["childIds"].insert(
-                        index, child_nodeid
-                    )
-                    index += 1
-                # update children node's parent
-                for child_nodeid in children_nodeids:
-                    child_cursor = nodeid_to_cursor[child_nodeid]
-                    accessibility_tree[child_cursor][
-                        "parentId"
-                    ] = parent_nodeid
-                # mark as removed
-                accessibility_tree[node_cursor]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for node in accessibility_tree:
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0 or height == 0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            accessibility_tree = [
-                node
-                for node in accessibility_tree
-                if node.get("parentId", "Root") != "[REMOVED]"
-            ]
+            node_bounds = np.array(
+                [
+                    node["union_bound"] or [np.nan] * 4
+                    for node in accessibility_tree
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(
+                node_bounds, info["config"]
+            )
+            accessibility_tree = self.prune_tree(
+                accessibility_tree, in_viewport
+            )
 
         return accessibility_tree
 
@@ -601,10 +669,14 @@ class TextObervationProcessor(ObservationProcessor):
         try:
             page.wait_for_load_state("load", timeout=15000)
             page.wait_for_selector("#root *:not(script):not(style)", timeout=10000)
-            browser_info = self.fetch_browser_info(page, client)
+            browser_info = self.fetch_browser_info(
+                page, client, self.needs_dom_tree
+            )
         except Exception:
             page.wait_for_load_state("load", timeout=60000)
-            browser_info = self.fetch_browser_info(page, client)
+            browser_info = self.fetch_browser_info(
+                page, client, self.needs_dom_tree
+            )
 
         if self.observation_type == "html":
             dom_tree = self.fetch_page_html(
@@ -676,10 +748,14 @@ class ObservationHandler:
         image_observation_type: str,
         current_viewport_only: bool,
         viewport_size: ViewportSize,
+        bounds_mode: str = "client_rect",
     ) -> None:
         self.main_observation_type = main_observation_type
         self.text_processor = TextObervationProcessor(
-            text_observation_type, current_viewport_only, viewport_size
+            text_observation_type,
+            current_viewport_only,
+            viewport_size,
+            bounds_mode,
         )
         self.image_processor = ImageObservationProcessor(
             image_observation_type
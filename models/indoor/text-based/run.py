@@ -83,6 +83,17 @@ def config() -> argparse.Namespace:
         action="store_true",
         help="Only use the current viewport for the observation",
     )
+    parser.add_argument(
+        "--bounds_mode",
+        choices=["client_rect", "snapshot"],
+        default="client_rect",
+        help="Get element bounds with one CDP call per node (client_rect) or from the DOM snapshot in a single call (snapshot)",
+    )
+    parser.add_argument(
+        "--reuse_browser",
+        action="store_true",
+        help="Keep one Chromium process across tasks and only open a new browser context on each reset",
+    )
     parser.add_argument("--viewport_width", type=int, default=1280)
     parser.add_argument("--viewport_height", type=int, default=720)
     parser.add_argument("--save_trace_enabled", action="store_true")
@@ -238,6 +249,8 @@ def test(
         },
         save_trace_enabled=args.save_trace_enabled,
         sleep_after_execution=args.sleep_after_execution,
+        bounds_mode=args.bounds_mode,
+        reuse_browser=args.reuse_browser,
     )
 
     for config_file in config_file_list:
@@ -280,6 +293,7 @@ def test(
             agent.reset(config_file)
             trajectory: Trajectory = []
             obs, info = env.reset(options={"config_file": config_file})
+            logger.info(f"[Setup time]: {env.setup_time:.2f}s")
             state_info: StateInfo = {"observation": obs, "info": info}
             trajectory.append(state_info)
 
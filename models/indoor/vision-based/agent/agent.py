@@ -15,7 +15,7 @@ from browser_env.actions import (
     create_none_action,
     create_playwright_action,
 )
-from browser_env.utils import Observation, StateInfo
+from browser_env.utils import Observation, Screenshot, StateInfo
 from llms import (
     call_llm,
     generate_from_huggingface_completion,
@@ -133,9 +133,13 @@ class PromptAgent(Agent):
         if self.multimodal_inputs:
             if environment == "Web":
                 page_screenshot_arr = trajectory[-1]["web_observation"]["image"]
-                page_screenshot_img = Image.fromarray(
-                    page_screenshot_arr
-                )  # size = (viewport_width, viewport_width)
+                if isinstance(page_screenshot_arr, Screenshot):
+                    # the prompt reuses the encoded screenshot
+                    page_screenshot_img = page_screenshot_arr
+                else:
+                    page_screenshot_img = Image.fromarray(
+                        page_screenshot_arr
+                    )  # size = (viewport_width, viewport_width)
             else:
                 page_screenshot_arr = trajectory[-1]["embodied_observation"]
                 page_screenshot_img = Image.fromarray(
@@ -6,7 +6,7 @@ from PIL import Image
 
 from browser_env import Action, ActionParsingError, Trajectory
 from browser_env.env_config import URL_MAPPINGS
-from browser_env.utils import StateInfo, pil_to_b64, pil_to_vertex, pil_to_byte_string
+from browser_env.utils import StateInfo, Screenshot, pil_to_b64, pil_to_vertex, pil_to_byte_string
 from llms import lm_config
 from llms.tokenizers import Tokenizer
 from llms.utils import APIInput
@@ -291,7 +291,7 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
         self,
         trajectory: Trajectory,
         intent: str,
-        page_screenshot_img: Image.Image,
+        page_screenshot_img: Image.Image | Screenshot,
         environment: str,
         # images: list[Image.Image],
         meta_data: dict[str, Any] = {},
@@ -363,7 +363,7 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
         intro: str,
         examples: list[tuple[str, str, str]],
         current: str,
-        page_screenshot_img: Image.Image,
+        page_screenshot_img: Image.Image | Screenshot,
         # images: list[Image.Image],
     ) -> APIInput:
         """Return the require format for an API"""
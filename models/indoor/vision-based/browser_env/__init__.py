@@ -35,13 +35,14 @@ from .async_envs import AsyncScriptBrowserEnv
 from .envs import ScriptBrowserEnv, AI2ThorEnv
 from .processors import ObservationMetadata
 from .trajectory import Trajectory
-from .utils import DetachedPage, StateInfo
+from .utils import DetachedPage, Screenshot, StateInfo
 
 __all__ = [
     "ScriptBrowserEnv",
     "AI2ThorEnv",
     "AsyncScriptBrowserEnv",
     "DetachedPage",
+    "Screenshot",
     "StateInfo",
     "ObservationMetadata",
     "Action",
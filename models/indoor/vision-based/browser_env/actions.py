@@ -1416,10 +1416,19 @@ def execute_action(
 
 @beartype
 async def aexecute_action(
-    action: Action, page: APage, browser_ctx: ABrowserContext
+    action: Action,
+    page: APage,
+    browser_ctx: ABrowserContext,
+    obseration_processor: ObservationProcessor | None = None,
+    sleep_after_execution: float = 0.0,
 ) -> APage:
-    """Execute the async action on the ChromeDriver."""
+    """Execute the async action on the ChromeDriver.
+
+    Element id based actions need the `obseration_processor` that produced
+    the last observation, see `execute_action`.
+    """
     action_type = action["action_type"]
+    num_tabs_before = len(browser_ctx.pages)
     match action_type:
         case ActionTypes.NONE:
             pass
@@ -1436,10 +1445,12 @@ async def aexecute_action(
             )
         case ActionTypes.CLEAR:
             element_id = action["element_id"]
-            element_center = obseration_processor.get_element_center(element_id)  # type: ignore[attr-defined]
-            await execute_mouse_click(element_center[0], element_center[1], page)
-            await execute_key_press("Meta+A", page)
-            await execute_key_press('Backspace', page)
+            element_center = obseration_processor.get_element_center(element_id)  # type: ignore[union-attr]
+            await aexecute_mouse_click(
+                element_center[0], element_center[1], page
+            )
+            await aexecute_key_press("Meta+A", page)
+            await aexecute_key_press("Backspace", page)
         case ActionTypes.MOUSE_HOVER:
             await aexecute_mouse_hover(
                 action["coords"][0], action["coords"][1], page
@@ -1451,7 +1462,11 @@ async def aexecute_action(
             # check each kind of locator in order
             # TODO[shuyanzh]: order is temp now
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[union-attr]
+                await aexecute_mouse_click(
+                    element_center[0], element_center[1], page
+                )
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1469,7 +1484,11 @@ async def aexecute_action(
                 raise ValueError("No proper locator found for click action")
         case ActionTypes.HOVER:
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[union-attr]
+                await aexecute_mouse_hover(
+                    element_center[0], element_center[1], page
+                )
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1488,7 +1507,12 @@ async def aexecute_action(
                 )
         case ActionTypes.TYPE:
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[union-attr]
+                await aexecute_mouse_click(
+                    element_center[0], element_center[1], page
+                )
+                await aexecute_type(action["text"], page)
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1509,7 +1533,7 @@ async def aexecute_action(
                 )
 
         case ActionTypes.PAGE_FOCUS:
-            page = browser_ctx.pages[action["page_number"]]
+            page = browser_ctx.pages[int(action["page_number"])]
             await page.bring_to_front()
         case ActionTypes.NEW_TAB:
             page = await browser_ctx.new_page()
@@ -1546,11 +1570,18 @@ async def aexecute_action(
                 )
         case ActionTypes.UPLOAD:
             element_id = action["element_id"]
-            element_center = obseration_processor.get_element_center(element_id)  # type: ignore[attr-defined]
-            await aexecute_upload(element_center[0], element_center[1], action["text"], page)        
+            element_center = obseration_processor.get_element_center(element_id)  # type: ignore[union-attr]
+            await aexecute_upload(element_center[0], element_center[1], action["text"], page)
         case _:
             raise ValueError(f"Unknown action type: {action_type}")
 
+    await page.wait_for_timeout(int(sleep_after_execution * 1000))
+    num_tabs_now = len(browser_ctx.pages)
+    # if a new tab is opened by clicking, switch to the new tab
+    if num_tabs_now > num_tabs_before:
+        page = browser_ctx.pages[-1]
+        await page.bring_to_front()
+
     return page
 
 
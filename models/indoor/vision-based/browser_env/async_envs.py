@@ -2,19 +2,18 @@ import asyncio
 import json
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
-import numpy as np
-import numpy.typing as npt
 from beartype import beartype
 from gymnasium import Env
-from gymnasium.spaces import Box, Text
 from playwright.async_api import Page, ViewportSize, async_playwright
 
 from .actions import Action, aexecute_action, get_action_space
-from .utils import DetachedPage, png_bytes_to_numpy
+from .processors import ObservationHandler, ObservationMetadata
+from .utils import DetachedPage, Observation
 
 
-class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
+class AsyncScriptBrowserEnv(Env[dict[str, Observation], Action]):
     """
     The goal of this environment is to produce a prototype of a browser environment.
     In the end, we want to support a fully configurable browser environment with wide
@@ -31,13 +30,13 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         slow_mo: int = 0,
         timeout: int = 100000,
         viewport_size: ViewportSize = {"width": 1280, "height": 720},
+        observation_type: str = "image",
+        current_viewport_only: bool = False,
+        sleep_after_execution: float = 0.0,
+        captioning_fn=None,
+        bounds_mode: str = "client_rect",
+        screenshot_format: str = "array",
     ):
-        self.observation_space = Box(
-            0,
-            255,
-            (viewport_size["height"], viewport_size["width"], 4),
-            np.uint8,
-        )
         # TODO: make Space[Action] = ActionSpace
         self.action_space = get_action_space()  # type: ignore[assignment]
         self.headless = headless
@@ -45,6 +44,41 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         self.reset_finished = False
         self.timeout = timeout
         self.viewport_size = viewport_size
+        self.current_viewport_only = current_viewport_only
+        self.sleep_after_execution = sleep_after_execution
+
+        match observation_type:
+            case "html" | "accessibility_tree" | "accessibility_tree_with_captioner":
+                self.text_observation_type = observation_type
+                self.image_observation_type = ""
+                self.main_observation_type = "text"
+            case "image":
+                self.image_observation_type = observation_type
+                self.text_observation_type = ""  # type: ignore[assignment]
+                self.main_observation_type = "image"
+            case "image_som":
+                self.image_observation_type = observation_type
+                self.text_observation_type = observation_type  # type: ignore[assignment]
+                self.main_observation_type = "image"
+            case _:
+                raise ValueError(
+                    f"Unsupported observation type: {observation_type}"
+                )
+
+        self.observation_handler = ObservationHandler(
+            self.main_observation_type,
+            self.text_observation_type,
+            self.image_observation_type,
+            self.current_viewport_only,
+            self.viewport_size,
+            captioning_fn,
+            bounds_mode,
+            screenshot_format,
+        )
+
+        self.observation_space = (
+            self.observation_handler.get_observation_space()
+        )
 
     @beartype
     async def setup(self, config_file: Path | None = None) -> None:
@@ -63,15 +97,46 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         start_url = instance_config.get("start_url", None)
         geolocation = instance_config.get("geolocation", None)
 
+        # Use custom viewport size if specified in the config, otherwise use the default.
+        viewport_size = self.viewport_size.copy()
+        viewport_size.update(instance_config.get("viewport_size", {}))
+        self.observation_handler.viewport_size = viewport_size
+
         self.context = await self.browser.new_context(
-            viewport=self.viewport_size,
+            viewport=viewport_size,
             storage_state=storage_state,
             geolocation=geolocation,
             device_scale_factor=1,
         )
-        self.page = await self.context.new_page()
         if start_url:
-            await self.page.goto(start_url)
+            start_urls = start_url.split(" |AND| ")
+            for url in start_urls:
+                page = await self.context.new_page()
+                await self.enable_accessibility(page)
+                await page.goto(url)
+            # set the first page as the current page
+            self.page = self.context.pages[0]
+            await self.page.bring_to_front()
+        else:
+            self.page = await self.context.new_page()
+            await self.enable_accessibility(self.page)
+
+    async def enable_accessibility(self, page: Page) -> None:
+        if self.text_observation_type in [
+            "accessibility_tree",
+            "accessibility_tree_with_captioner",
+        ]:
+            client = await page.context.new_cdp_session(page)
+            await client.send("Accessibility.enable")
+            await client.detach()
+
+    async def _aget_obs(self) -> dict[str, Observation]:
+        obs = await self.observation_handler.aget_observation(self.page)
+        return obs
+
+    def _get_obs_metadata(self) -> dict[str, ObservationMetadata]:
+        metadata = self.observation_handler.get_observation_metadata()
+        return metadata
 
     @beartype
     async def areset(
@@ -79,7 +144,7 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         *,
         seed: int | None = None,
         options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
+    ) -> tuple[dict[str, Observation], dict[str, Any]]:
         """
         Reset the environment.
         :param options: options for the environment. The options are:
@@ -97,12 +162,18 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         else:
             await self.setup()
         self.reset_finished = True
-        content = await self.page.content()
-        screenshot = png_bytes_to_numpy(await self.page.screenshot())
-        return (
-            screenshot,
-            {"page": DetachedPage(self.page.url, content)},
-        )
+
+        await self.page.wait_for_timeout(int(self.sleep_after_execution * 1000))
+
+        observation = await self._aget_obs()
+        observation_metadata = self._get_obs_metadata()
+        info = {
+            "page": DetachedPage(self.page.url, ""),
+            "fail_error": "",
+            "observation_metadata": observation_metadata,
+        }
+
+        return (observation, info)
 
     @beartype
     def reset(
@@ -110,7 +181,7 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         *,
         seed: int | None = None,
         options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
+    ) -> tuple[dict[str, Observation], dict[str, Any]]:
         return asyncio.run(self.areset(seed=seed, options=options))
 
     async def aclose(self) -> None:
@@ -123,38 +194,42 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
     @beartype
     async def astep(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
+    ) -> tuple[dict[str, Observation], float, bool, bool, dict[str, Any]]:
         if not self.reset_finished:
             raise RuntimeError("Call reset first before calling step.")
         success = False
         fail_error = ""
         try:
-            self.page = await aexecute_action(action, self.page, self.context)
+            self.page = await aexecute_action(
+                action,
+                self.page,
+                self.context,
+                self.observation_handler.action_processor,
+                self.sleep_after_execution,
+            )
             success = True
         except Exception as e:
             fail_error = str(e)
 
-        try:
-            content = await self.page.content()
-            screenshot = png_bytes_to_numpy(await self.page.screenshot())
-        except:
-            await self.page.wait_for_load_state("load")
-            content = await self.page.content()
-            screenshot = png_bytes_to_numpy(await self.page.screenshot())
-
-        return (
-            screenshot,
-            float(success),
-            False,
-            False,
-            {
-                "page": DetachedPage(self.page.url, content),
-                "fail_error": fail_error,
-            },
+        observation = await self._aget_obs()
+        observation_metadata = self._get_obs_metadata()
+
+        info = {
+            "page": DetachedPage(self.page.url, await self.page.content()),
+            "fail_error": fail_error,
+            "observation_metadata": observation_metadata,
+        }
+        msg = (
+            observation,
+            float(success),  # reward
+            False,  # terminated
+            False,  # truncated
+            info,
         )
+        return msg
 
     @beartype
     def step(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
+    ) -> tuple[dict[str, Observation], float, bool, bool, dict[str, Any]]:
         return asyncio.run(self.astep(action), debug=True)
@@ -12,6 +12,7 @@ from browser_env import (
     Action,
     ActionTypes,
     ObservationMetadata,
+    Screenshot,
     StateInfo,
     action2str,
 )
@@ -198,13 +199,18 @@ class RenderHelper(object):
         if render_screenshot:
             # image observation
             img_obs = observation["image"]
-            image = Image.fromarray(img_obs)
-            byte_io = io.BytesIO()
-            image.save(byte_io, format="PNG")
-            byte_io.seek(0)
-            image_bytes = base64.b64encode(byte_io.read())
-            image_str = image_bytes.decode("utf-8")
-            new_content += f"<img src='data:image/png;base64,{image_str}' style='width:50vw; height:auto;'/>\n"
+            if isinstance(img_obs, Screenshot):
+                # embed the encoded screenshot as it is
+                image_src = img_obs.to_b64()
+            else:
+                image = Image.fromarray(img_obs)
+                byte_io = io.BytesIO()
+                image.save(byte_io, format="PNG")
+                byte_io.seek(0)
+                image_bytes = base64.b64encode(byte_io.read())
+                image_str = image_bytes.decode("utf-8")
+                image_src = f"data:image/png;base64,{image_str}"
+            new_content += f"<img src='{image_src}' style='width:50vw; height:auto;'/>\n"
 
         # meta data
         new_content += f"<div class='prev_action' style='background-color:pink'>{meta_data['action_history'][-1]}</div>\n"
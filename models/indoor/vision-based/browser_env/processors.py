@@ -1,20 +1,25 @@
+import asyncio
+import base64
+import functools
 import json
+import math
 import pkgutil
 import re
 from collections import defaultdict
 from dataclasses import dataclass
-from io import BytesIO, StringIO
+from io import BytesIO
 from typing import Any, Optional, TypedDict, Union
 from urllib.parse import urljoin, urlparse
 
 import matplotlib.pyplot as plt
 import numpy as np
 import numpy.typing as npt
-import pandas as pd
 import playwright
 import requests
 from gymnasium import spaces
 from PIL import Image, ImageDraw, ImageFont
+from playwright.async_api import CDPSession as ACDPSession
+from playwright.async_api import Page as APage
 from playwright.sync_api import CDPSession, Page, ViewportSize
 
 from browser_env.constants import (
@@ -36,6 +41,7 @@ from .utils import (
     DOMNode,
     DOMTree,
     Observation,
+    Screenshot,
     png_bytes_to_numpy,
 )
 
@@ -50,10 +56,360 @@ def remove_unicode(input_string):
     return cleaned_string
 
 
+SNAPSHOT_PARAMS = {
+    "computedStyles": [],
+    "includeDOMRects": True,
+    "includePaintOrder": True,
+}
+
+
+# window config of the page, read in a single round trip
+BROWSER_CONFIG_SCRIPT = """() => ({
+    win_upper_bound: window.pageYOffset,
+    win_left_bound: window.pageXOffset,
+    win_width: window.screen.width,
+    win_height: window.screen.height,
+    device_pixel_ratio: window.devicePixelRatio,
+})"""
+
+
+def build_browser_info(
+    tree: dict[str, Any] | None,
+    viewport_size: ViewportSize,
+    win_upper_bound: float,
+    win_left_bound: float,
+    win_width: int,
+    win_height: int,
+    device_pixel_ratio: float,
+) -> BrowserInfo:
+    """Bundle a DOM snapshot with the window config of the page, `tree` is
+    None if the snapshot is not captured"""
+    if tree is not None:
+        # calibrate the bounds, in some cases, the bounds are scaled somehow
+        bounds = tree["documents"][0]["layout"]["bounds"]
+        b = bounds[0]
+        n = b[2] / viewport_size["width"]
+        bounds = [[x / n for x in bound] for bound in bounds]
+        tree["documents"][0]["layout"]["bounds"] = bounds
+        # add union bound placeholder
+        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
+
+    # extract browser info
+    win_right_bound = win_left_bound + win_width
+    win_lower_bound = win_upper_bound + win_height
+    assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
+
+    config: BrowserConfig = {
+        "win_upper_bound": win_upper_bound,
+        "win_left_bound": win_left_bound,
+        "win_width": win_width,
+        "win_height": win_height,
+        "win_right_bound": win_right_bound,
+        "win_lower_bound": win_lower_bound,
+        "device_pixel_ratio": device_pixel_ratio,
+    }
+
+    # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
+    info: BrowserInfo = {"DOMTree": tree, "config": config}
+
+    return info
+
+
+def fetch_browser_info(
+    page: Page, viewport_size: ViewportSize, with_dom_tree: bool = True
+) -> BrowserInfo:
+    tree = None
+    if with_dom_tree:
+        # extract domtree
+        client = page.context.new_cdp_session(page)
+        tree = client.send("DOMSnapshot.captureSnapshot", SNAPSHOT_PARAMS)
+        client.detach()
+    config = page.evaluate(BROWSER_CONFIG_SCRIPT)
+    return build_browser_info(tree, viewport_size, **config)
+
+
+async def afetch_browser_info(
+    page: APage, viewport_size: ViewportSize, with_dom_tree: bool = True
+) -> BrowserInfo:
+    tree = None
+    if with_dom_tree:
+        client = await page.context.new_cdp_session(page)
+        tree = await client.send("DOMSnapshot.captureSnapshot", SNAPSHOT_PARAMS)
+        await client.detach()
+    config = await page.evaluate(BROWSER_CONFIG_SCRIPT)
+    return build_browser_info(tree, viewport_size, **config)
+
+
+class BrowserInfoCache:
+    """Browser info of the current step, shared by the processors of an
+    `ObservationHandler` so that the page is probed once per step.
+
+    Outside of a step (`start_step` ... `end_step`) every fetch goes to the
+    page. An entry without the DOM snapshot is refetched when a processor
+    asks for the snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.active = False
+        self.page: Page | APage | None = None
+        self.info: BrowserInfo | None = None
+
+    def start_step(self) -> None:
+        self.active = True
+        self.page = None
+        self.info = None
+
+    def end_step(self) -> None:
+        self.active = False
+        self.page = None
+        self.info = None
+
+    def lookup(self, page: Page | APage, with_dom_tree: bool) -> BrowserInfo | None:
+        if not self.active or self.info is None or self.page is not page:
+            return None
+        if with_dom_tree and self.info["DOMTree"] is None:
+            return None
+        return self.info
+
+    def store(self, page: Page | APage, info: BrowserInfo) -> None:
+        if self.active:
+            self.page = page
+            self.info = info
+
+    def fetch(
+        self, page: Page, viewport_size: ViewportSize, with_dom_tree: bool
+    ) -> BrowserInfo:
+        info = self.lookup(page, with_dom_tree)
+        if info is None:
+            info = fetch_browser_info(page, viewport_size, with_dom_tree)
+            self.store(page, info)
+        return info
+
+    async def afetch(
+        self, page: APage, viewport_size: ViewportSize, with_dom_tree: bool
+    ) -> BrowserInfo:
+        info = self.lookup(page, with_dom_tree)
+        if info is None:
+            info = await afetch_browser_info(page, viewport_size, with_dom_tree)
+            self.store(page, info)
+        return info
+
+
+CLIENT_RECT_FUNCTION = """
+    function() {
+        if (this.nodeType == 3) {
+            var range = document.createRange();
+            range.selectNode(this);
+            var rect = range.getBoundingClientRect().toJSON();
+            range.detach();
+            return rect;
+        } else {
+            return this.getBoundingClientRect().toJSON();
+        }
+    }
+"""
+
+# resolves after two animation frames, so that Chromium has sent the
+# accessibility updates of the last action, or after 100ms on hidden pages
+FOCUS_AFTER_FRAMES_SCRIPT = """
+    new Promise(resolve => {
+        requestAnimationFrame(
+            () => requestAnimationFrame(() => resolve(document.activeElement))
+        );
+        setTimeout(() => resolve(document.activeElement), 100);
+    })
+"""
+
+# DOM events after which the cached accessibility tree is refetched
+STRUCTURAL_DOM_EVENTS = [
+    "DOM.documentUpdated",
+    "DOM.childNodeInserted",
+    "DOM.childNodeRemoved",
+    "DOM.childNodeCountUpdated",
+    "DOM.shadowRootPushed",
+    "DOM.shadowRootPopped",
+    "DOM.pseudoElementAdded",
+    "DOM.pseudoElementRemoved",
+    "DOM.distributedNodesUpdated",
+]
+
+
+class AccessibilityTreeTracker:
+    """Keeps the accessibility tree of a page up to date between steps.
+
+    A CDP session stays attached to the page and listens to DOM and
+    accessibility events. Without structural changes the cached tree is
+    reused and only the nodes touched by attribute, text or accessibility
+    updates are refetched with `Accessibility.getPartialAXTree`, together
+    with the focused element since typing into a field fires no DOM event.
+    Navigations, inserted or removed nodes and patches that do not line up
+    with the cached tree refetch the full tree.
+    """
+
+    # past this many changed nodes a full fetch is cheaper
+    max_patched_nodes = 50
+
+    def __init__(self, page: Page) -> None:
+        self.page = page
+        self.client = page.context.new_cdp_session(page)
+        self.url = ""
+        self.tree: AccessibilityTree = []
+        self.node_cursors: dict[str, int] = {}
+        # DOM events refer to nodeId, the accessibility tree to backendNodeId
+        self.backend_node_ids: dict[int, int] = {}
+        self.focused_backend_node_id: int | None = None
+        # (node_str, valid_node) by nodeId, see `parse_accessibility_tree`
+        self.rendered_nodes: dict[str, tuple[str, bool]] = {}
+        self.stale = True
+        self.dirty_backend_node_ids: set[int] = set()
+        self.updated_nodes: dict[str, AccessibilityTreeNode] = {}
+        self.stats = {"hits": 0, "misses": 0, "patched_nodes": 0}
+
+        for event in STRUCTURAL_DOM_EVENTS:
+            self.client.on(event, self.mark_stale)
+        self.client.on("DOM.setChildNodes", self.on_set_child_nodes)
+        self.client.on("DOM.attributeModified", self.on_node_modified)
+        self.client.on("DOM.attributeRemoved", self.on_node_modified)
+        self.client.on("DOM.characterDataModified", self.on_node_modified)
+        self.client.on("Accessibility.nodesUpdated", self.on_nodes_updated)
+        self.client.on("Accessibility.loadComplete", self.mark_stale)
+        self.client.send("DOM.enable")
+        self.client.send("Accessibility.enable")
+
+    def mark_stale(self, params: dict[str, Any] | None = None) -> None:
+        self.stale = True
+
+    def add_dom_nodes(self, nodes: list[dict[str, Any]]) -> None:
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            self.backend_node_ids[node["nodeId"]] = node["backendNodeId"]
+            for key in ["children", "shadowRoots", "pseudoElements"]:
+                stack.extend(node.get(key, []))
+            for key in ["contentDocument", "templateContent", "importedDocument"]:
+                if key in node:
+                    stack.append(node[key])
+
+    def on_set_child_nodes(self, params: dict[str, Any]) -> None:
+        self.add_dom_nodes(params["nodes"])
+
+    def on_node_modified(self, params: dict[str, Any]) -> None:
+        backend_node_id = self.backend_node_ids.get(params["nodeId"])
+        if backend_node_id is None:
+            self.stale = True
+        else:
+            self.dirty_backend_node_ids.add(backend_node_id)
+
+    def on_nodes_updated(self, params: dict[str, Any]) -> None:
+        for node in params["nodes"]:
+            self.updated_nodes[node["nodeId"]] = node
+
+    def get_focused_backend_node_id(self) -> int | None:
+        """Wait for the pending events and return the focused element"""
+        response = self.client.send(
+            "Runtime.evaluate",
+            {
+                "expression": FOCUS_AFTER_FRAMES_SCRIPT,
+                "awaitPromise": True,
+                "objectGroup": "accessibility-tree-tracker",
+            },
+        )
+        object_id = response["result"].get("objectId")
+        if object_id is None:
+            return None
+        try:
+            node = self.client.send("DOM.describeNode", {"objectId": object_id})
+        finally:
+            self.client.send(
+                "Runtime.releaseObjectGroup",
+                {"objectGroup": "accessibility-tree-tracker"},
+            )
+        return node["node"]["backendNodeId"]
+
+    def refresh(self) -> None:
+        # events from here on apply to the new tree
+        self.stale = False
+        self.dirty_backend_node_ids = set()
+        self.updated_nodes = {}
+        self.url = self.page.url
+        document = self.client.send("DOM.getDocument", {"depth": -1, "pierce": True})
+        self.backend_node_ids = {}
+        self.add_dom_nodes([document["root"]])
+        response = self.client.send("Accessibility.getFullAXTree", {})
+        self.tree = TextObervationProcessor.remove_repeated_nodes(response["nodes"])
+        self.node_cursors = {
+            node["nodeId"]: cursor for cursor, node in enumerate(self.tree)
+        }
+        self.rendered_nodes = {}
+
+    def patch(self) -> bool:
+        """Refetch the changed nodes, False if the full tree is needed"""
+        backend_node_ids = self.dirty_backend_node_ids
+        updated_nodes = self.updated_nodes
+        self.dirty_backend_node_ids = set()
+        self.updated_nodes = {}
+        if len(backend_node_ids) + len(updated_nodes) > self.max_patched_nodes:
+            return False
+
+        for backend_node_id in backend_node_ids:
+            try:
+                response = self.client.send(
+                    "Accessibility.getPartialAXTree",
+                    {"backendNodeId": backend_node_id, "fetchRelatives": True},
+                )
+            except Exception:
+                # e.g., the node has been removed in the meantime
+                return False
+            for node in response["nodes"]:
+                updated_nodes[node["nodeId"]] = node
+
+        # only the content of known nodes is patched, not the structure
+        for node_id, node in updated_nodes.items():
+            cursor = self.node_cursors.get(node_id)
+            if cursor is None or node.get("childIds") != self.tree[cursor].get(
+                "childIds"
+            ):
+                return False
+        for node_id, node in updated_nodes.items():
+            self.tree[self.node_cursors[node_id]] = node
+            self.rendered_nodes.pop(node_id, None)
+        self.stats["patched_nodes"] += len(updated_nodes)
+        return True
+
+    def fetch(self) -> AccessibilityTree:
+        """The current accessibility tree, the nodes are copies that can be
+        pruned without touching the cache"""
+        focused_backend_node_id = self.get_focused_backend_node_id()
+        for backend_node_id in [
+            focused_backend_node_id,
+            self.focused_backend_node_id,
+        ]:
+            if backend_node_id is not None:
+                self.dirty_backend_node_ids.add(backend_node_id)
+        self.focused_backend_node_id = focused_backend_node_id
+
+        if self.stale or self.page.url != self.url or not self.patch():
+            self.refresh()
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return [dict(node, childIds=list(node["childIds"])) for node in self.tree]
+
+    def close(self) -> None:
+        try:
+            self.client.detach()
+        except Exception:
+            # the page is already closed
+            pass
+
+
 class ObservationProcessor:
     def process(self, page: Page) -> Observation:
         raise NotImplementedError
 
+    async def aprocess(self, page: APage) -> Observation:
+        raise NotImplementedError
+
 
 class ObservationMetadata(TypedDict):
     obs_nodes_info: dict[str, Any]
@@ -87,10 +443,27 @@ class TextObervationProcessor(ObservationProcessor):
         current_viewport_only: bool,
         viewport_size: ViewportSize,
         captioning_fn=None,
+        bounds_mode: str = "client_rect",
+        accessibility_tree_mode: str = "full",
     ):
         self.observation_type = observation_type
         self.current_viewport_only = current_viewport_only
         self.viewport_size = viewport_size
+        # "client_rect": query getBoundingClientRect per node over CDP
+        # "snapshot": reuse the layout bounds of the DOM snapshot
+        if bounds_mode not in ["client_rect", "snapshot"]:
+            raise ValueError(f"Invalid bounds mode: {bounds_mode}")
+        self.bounds_mode = bounds_mode
+        # "full": fetch the whole accessibility tree on every observation
+        # "incremental": patch a cached tree, see `AccessibilityTreeTracker`
+        if accessibility_tree_mode not in ["full", "incremental"]:
+            raise ValueError(
+                f"Invalid accessibility tree mode: {accessibility_tree_mode}"
+            )
+        self.accessibility_tree_mode = accessibility_tree_mode
+        self.accessibility_tree_tracker: AccessibilityTreeTracker | None = None
+        # shared with the other processors by `ObservationHandler`
+        self.browser_info_cache: BrowserInfoCache | None = None
         self.observation_tag = "text"
         self.meta_data = (
             create_empty_metadata()
@@ -104,56 +477,38 @@ class TextObervationProcessor(ObservationProcessor):
             # Cache captions.
             self.url2caption = {}
 
+    @property
+    def needs_dom_tree(self) -> bool:
+        """Whether the observation is built from the DOM snapshot"""
+        if self.observation_type == "html":
+            return True
+        if self.observation_type in [
+            "accessibility_tree",
+            "accessibility_tree_with_captioner",
+        ]:
+            return self.bounds_mode == "snapshot"
+        return False
+
     def fetch_browser_info(
         self,
         page: Page,
+        with_dom_tree: bool = True,
     ) -> BrowserInfo:
-        # extract domtree
-        client = page.context.new_cdp_session(page)
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
-        )
-        client.detach()
-
-        # calibrate the bounds, in some cases, the bounds are scaled somehow
-        bounds = tree["documents"][0]["layout"]["bounds"]
-        b = bounds[0]
-        n = b[2] / self.viewport_size["width"]
-        bounds = [[x / n for x in bound] for bound in bounds]
-        tree["documents"][0]["layout"]["bounds"] = bounds
-        # add union bound placeholder
-        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
-
-        # extract browser info
-        win_upper_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
-        win_right_bound = win_left_bound + win_width
-        win_lower_bound = win_upper_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
-        assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
-
-        config: BrowserConfig = {
-            "win_upper_bound": win_upper_bound,
-            "win_left_bound": win_left_bound,
-            "win_width": win_width,
-            "win_height": win_height,
-            "win_right_bound": win_right_bound,
-            "win_lower_bound": win_lower_bound,
-            "device_pixel_ratio": device_pixel_ratio,
-        }
+        if self.browser_info_cache is not None:
+            return self.browser_info_cache.fetch(
+                page, self.viewport_size, with_dom_tree
+            )
+        return fetch_browser_info(page, self.viewport_size, with_dom_tree)
 
-        # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
-        info: BrowserInfo = {"DOMTree": tree, "config": config}
+    async def afetch_browser_info(
+        self, page: APage, with_dom_tree: bool = True
+    ) -> BrowserInfo:
+        if self.browser_info_cache is not None:
+            return await self.browser_info_cache.afetch(
+                page, self.viewport_size, with_dom_tree
+            )
+        return await afetch_browser_info(page, self.viewport_size, with_dom_tree)
 
-        return info
-    
     @staticmethod
     def get_bounding_client_rect(
         client: CDPSession, backend_node_id: str
@@ -167,19 +522,28 @@ class TextObervationProcessor(ObservationProcessor):
                 "Runtime.callFunctionOn",
                 {
                     "objectId": remote_object_id,
-                    "functionDeclaration": """
-                        function() {
-                            if (this.nodeType == 3) {
-                                var range = document.createRange();
-                                range.selectNode(this);
-                                var rect = range.getBoundingClientRect().toJSON();
-                                range.detach();
-                                return rect;
-                            } else {
-                                return this.getBoundingClientRect().toJSON();
-                            }
-                        }
-                    """,
+                    "functionDeclaration": CLIENT_RECT_FUNCTION,
+                    "returnByValue": True,
+                },
+            )
+            return response
+        except Exception as e:
+            return {"result": {"subtype": "error"}}
+
+    @staticmethod
+    async def aget_bounding_client_rect(
+        client: ACDPSession, backend_node_id: str
+    ) -> dict[str, Any]:
+        try:
+            remote_object = await client.send(
+                "DOM.resolveNode", {"backendNodeId": int(backend_node_id)}
+            )
+            remote_object_id = remote_object["object"]["objectId"]
+            response = await client.send(
+                "Runtime.callFunctionOn",
+                {
+                    "objectId": remote_object_id,
+                    "functionDeclaration": CLIENT_RECT_FUNCTION,
                     "returnByValue": True,
                 },
             )
@@ -187,6 +551,62 @@ class TextObervationProcessor(ObservationProcessor):
         except Exception as e:
             return {"result": {"subtype": "error"}}
 
+    @staticmethod
+    def parse_client_rect(response: dict[str, Any]) -> list[float] | None:
+        """[x, y, width, height] of a `get_bounding_client_rect` response"""
+        if response.get("result", {}).get("subtype", "") == "error":
+            return None
+        x = response["result"]["value"]["x"]
+        y = response["result"]["value"]["y"]
+        width = response["result"]["value"]["width"]
+        height = response["result"]["value"]["height"]
+        return [x, y, width, height]
+
+    @staticmethod
+    def get_snapshot_bounds_array(info: BrowserInfo) -> npt.NDArray[np.float64]:
+        """Batched alternative to `get_bounding_client_rect`.
+
+        Join the layout arrays of the DOM snapshot to the node indices and
+        return an (n_nodes, 4) array with the same viewport-relative
+        [x, y, width, height] that getBoundingClientRect would return.
+        Rows are NaN for nodes that getBoundingClientRect cannot handle
+        (document, comments, doctype) and zero for nodes without a layout
+        object (e.g., display: none).
+        """
+        document = info["DOMTree"]["documents"][0]
+        layout = document["layout"]
+        config = info["config"]
+
+        # only elements (1) and text nodes (3) have client rects
+        node_types = np.asarray(document["nodes"]["nodeType"])
+        has_rect = (node_types == 1) | (node_types == 3)
+        node_bounds = np.full((len(node_types), 4), np.nan)
+        node_bounds[has_rect] = 0.0
+
+        layout_node_index = np.asarray(layout["nodeIndex"], dtype=np.int64)
+        layout_bounds = np.asarray(layout["bounds"], dtype=np.float64).reshape(
+            -1, 4
+        )
+        keep = has_rect[layout_node_index]
+        layout_node_index = layout_node_index[keep]
+        layout_bounds = layout_bounds[keep]
+        # the snapshot bounds are absolute, client rects are relative to the viewport
+        layout_bounds[:, 0] -= config["win_left_bound"]
+        layout_bounds[:, 1] -= config["win_upper_bound"]
+        node_bounds[layout_node_index] = layout_bounds
+        return node_bounds
+
+    @staticmethod
+    def get_snapshot_bounds(info: BrowserInfo) -> dict[int, list[float] | None]:
+        """`get_snapshot_bounds_array` keyed by backend node id, None for
+        nodes without a client rect"""
+        backend_node_ids = info["DOMTree"]["documents"][0]["nodes"]["backendNodeId"]
+        node_bounds = TextObervationProcessor.get_snapshot_bounds_array(info)
+        return {
+            backend_node_id: None if math.isnan(bound[0]) else bound
+            for backend_node_id, bound in zip(backend_node_ids, node_bounds.tolist())
+        }
+
     @staticmethod
     def get_element_in_viewport_ratio(
         elem_left_bound: float,
@@ -218,12 +638,133 @@ class TextObervationProcessor(ObservationProcessor):
         ratio = overlap_width * overlap_height / width * height
         return ratio
 
+    @staticmethod
+    def get_in_viewport_mask(
+        bounds: npt.NDArray[np.float64],
+        config: BrowserConfig,
+    ) -> npt.NDArray[np.bool_]:
+        """Vectorized viewport check over an (n, 4) array of [x, y, width, height].
+
+        A row is kept if it is visible (non-zero size) and its
+        `get_element_in_viewport_ratio` reaches IN_VIEWPORT_RATIO_THRESHOLD.
+        NaN rows (no bound) are never kept.
+        """
+        x, y, width, height = bounds.T
+        overlap_width = np.maximum(
+            0, np.minimum(x + width, config["win_width"]) - np.maximum(x, 0)
+        )
+        overlap_height = np.maximum(
+            0, np.minimum(y + height, config["win_height"]) - np.maximum(y, 0)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # same formula as get_element_in_viewport_ratio
+            ratio = overlap_width * overlap_height / width * height
+        visible = (width != 0) & (height != 0)
+        return visible & (ratio >= IN_VIEWPORT_RATIO_THRESHOLD)
+
+    @staticmethod
+    def prune_tree(
+        tree: list[dict[str, Any]],
+        keep: npt.NDArray[np.bool_],
+    ) -> list[dict[str, Any]]:
+        """Remove the nodes that are not kept from a DOM or accessibility tree.
+
+        The children of a removed node are spliced into its closest kept
+        ancestor at the position of the removed node, so the output order is
+        unchanged. Every kept parent rebuilds its childIds once, which makes
+        the pass linear in the number of nodes even on very wide nodes.
+        """
+        nodeid_to_cursor = {node["nodeId"]: cursor for cursor, node in enumerate(tree)}
+
+        def splice_children(child_ids: list[str]) -> list[str]:
+            # depth-first expansion of the removed children, in order
+            kept_child_ids = []
+            stack = child_ids[::-1]
+            while stack:
+                child_id = stack.pop()
+                child_cursor = nodeid_to_cursor.get(child_id)
+                if child_cursor is None or keep[child_cursor]:
+                    kept_child_ids.append(child_id)
+                else:
+                    stack.extend(tree[child_cursor]["childIds"][::-1])
+            return kept_child_ids
+
+        pruned_tree = []
+        for node, keep_node in zip(tree, keep):
+            if not keep_node:
+                continue
+            node["childIds"] = splice_children(node["childIds"])
+            for child_id in node["childIds"]:
+                if child_id in nodeid_to_cursor:
+                    tree[nodeid_to_cursor[child_id]]["parentId"] = node["nodeId"]
+            pruned_tree.append(node)
+        return pruned_tree
+
     def fetch_page_html(
         self,
         info: BrowserInfo,
         page: Page,
         current_viewport_only: bool,
     ) -> DOMTree:
+        client_rects = None
+        if self.bounds_mode != "snapshot":
+            nodes = info["DOMTree"]["documents"][0]["nodes"]
+            client = page.context.new_cdp_session(page)
+            client_rects = [
+                # the root is always inside the viewport, see build_dom_tree
+                None
+                if parent_idx == -1
+                else self.parse_client_rect(
+                    self.get_bounding_client_rect(client, str(backend_node_id))
+                )
+                for backend_node_id, parent_idx in zip(
+                    nodes["backendNodeId"], nodes["parentIndex"]
+                )
+            ]
+            client.detach()
+        return self.build_dom_tree(info, client_rects, current_viewport_only)
+
+    async def afetch_page_html(
+        self,
+        info: BrowserInfo,
+        page: APage,
+        current_viewport_only: bool,
+    ) -> DOMTree:
+        client_rects = None
+        if self.bounds_mode != "snapshot":
+            nodes = info["DOMTree"]["documents"][0]["nodes"]
+            client = await page.context.new_cdp_session(page)
+
+            async def get_client_rect(
+                backend_node_id: int, parent_idx: int
+            ) -> list[float] | None:
+                if parent_idx == -1:
+                    return None
+                response = await self.aget_bounding_client_rect(
+                    client, str(backend_node_id)
+                )
+                return self.parse_client_rect(response)
+
+            # the CDP requests are pipelined over the session
+            client_rects = await asyncio.gather(
+                *[
+                    get_client_rect(backend_node_id, parent_idx)
+                    for backend_node_id, parent_idx in zip(
+                        nodes["backendNodeId"], nodes["parentIndex"]
+                    )
+                ]
+            )
+            await client.detach()
+        return self.build_dom_tree(info, client_rects, current_viewport_only)
+
+    def build_dom_tree(
+        self,
+        info: BrowserInfo,
+        client_rects: list[list[float] | None] | None,
+        current_viewport_only: bool,
+    ) -> DOMTree:
+        """Build the DOM tree from the snapshot. The bounds come from
+        `client_rects`, one per snapshot node, unless in snapshot mode."""
         # adopted from [natbot](https://github.com/nat/natbot)
         tree = info["DOMTree"]
         strings = tree["strings"]
@@ -233,7 +774,18 @@ class TextObervationProcessor(ObservationProcessor):
         # make a dom tree that is easier to navigate
         dom_tree: DOMTree = []
         graph = defaultdict(list)
-        client = page.context.new_cdp_session(page)
+        if self.bounds_mode == "snapshot":
+            # no CDP call per node, the bounds come from the snapshot layout
+            node_bounds = self.get_snapshot_bounds_array(info)
+            # the root is always inside the viewport
+            is_root = np.asarray(nodes["parentIndex"]) == -1
+            node_bounds[is_root] = [0.0, 0.0, 10.0, 10.0]
+            union_bounds = [
+                None if math.isnan(bound[0]) else bound
+                for bound in node_bounds.tolist()
+            ]
+        else:
+            union_bounds = client_rects
         for node_idx in range(len(nodes["nodeName"])):
             cur_node: DOMNode = {
                 "nodeId": "",
@@ -284,78 +836,23 @@ class TextObervationProcessor(ObservationProcessor):
             if cur_node["parentId"] == "-1":
                 cur_node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
             else:
-                response = self.get_bounding_client_rect(
-                    client, cur_node["backendNodeId"]
-                )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    cur_node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    cur_node["union_bound"] = [x, y, width, height]
+                cur_node["union_bound"] = union_bounds[node_idx]
 
             dom_tree.append(cur_node)
 
-        client.detach()
         # add parent children index to the node
         for parent_id, child_ids in graph.items():
             dom_tree[int(parent_id)]["childIds"] = child_ids
 
         # remove the nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: DOMNode) -> None:
-                # update the node information in the accessibility tree
-                node_id = node["nodeId"]
-                parent_id = node["parentId"]
-                child_ids = node["childIds"]
-
-                # update the children of the parent node
-                assert dom_tree[int(parent_id)]["parentId"] != "[REMOVED]"
-                # remove the nodeid from parent
-                index = dom_tree[int(parent_id)]["childIds"].index(node_id)
-                dom_tree[int(parent_id)]["childIds"].pop(index)
-
-                # Insert children_nodeids in the same location
-                for child_id in child_ids:
-                    dom_tree[int(parent_id)]["childIds"].insert(index, child_id)
-                    index += 1
-
-                # update children node's parent
-                for child_id in child_ids:
-                    dom_tree[int(child_id)]["parentId"] = parent_id
-                # mark as removed
-                dom_tree[int(node_id)]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for cursor, node in enumerate(dom_tree):
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0.0 or height == 0.0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            dom_tree = [
-                node for node in dom_tree if node.get("parentId", "-1") != "[REMOVED]"
-            ]
+            if self.bounds_mode != "snapshot":
+                node_bounds = np.array(
+                    [node["union_bound"] or [np.nan] * 4 for node in dom_tree],
+                    dtype=np.float64,
+                ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(node_bounds, info["config"])
+            dom_tree = self.prune_tree(dom_tree, in_viewport)
 
         return dom_tree
 
@@ -366,8 +863,9 @@ class TextObervationProcessor(ObservationProcessor):
         obs_nodes_info = {}
         nodeid_to_cursor = {node["nodeId"]: idx for idx, node in enumerate(dom_tree)}
 
-        def dfs(node_cursor: int, depth: int) -> str:
-            tree_str = ""
+        lines: list[str] = []
+
+        def dfs(node_cursor: int, depth: int) -> None:
             node = dom_tree[node_cursor]
             indent = "\t" * depth
             valid_node = True
@@ -384,7 +882,7 @@ class TextObervationProcessor(ObservationProcessor):
                         "union_bound": node["union_bound"],
                         "text": node_str,
                     }
-                    tree_str += f"{indent}{node_str}\n"
+                    lines.append(f"{indent}{node_str}\n")
 
             except Exception as e:
                 valid_node = False
@@ -392,25 +890,16 @@ class TextObervationProcessor(ObservationProcessor):
             for child_ids in node["childIds"]:
                 child_cursor = nodeid_to_cursor[child_ids]
                 child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(child_cursor, child_depth)
-                tree_str += child_str
+                dfs(child_cursor, child_depth)
 
-            return tree_str
-
-        html = dfs(0, 0)
+        dfs(0, 0)
+        html = "".join(lines)
         return html, obs_nodes_info
 
-    def fetch_page_accessibility_tree(
-        self,
-        page: Page,
-        info: BrowserInfo,
-        current_viewport_only: bool,
+    @staticmethod
+    def remove_repeated_nodes(
+        accessibility_tree: AccessibilityTree,
     ) -> AccessibilityTree:
-        client = page.context.new_cdp_session(page)
-        accessibility_tree: AccessibilityTree = client.send(
-            "Accessibility.getFullAXTree", {}
-        )["nodes"]
-
         # a few nodes are repeated in the accessibility tree
         seen_ids = set()
         _accessibility_tree = []
@@ -418,102 +907,204 @@ class TextObervationProcessor(ObservationProcessor):
             if node["nodeId"] not in seen_ids:
                 _accessibility_tree.append(node)
                 seen_ids.add(node["nodeId"])
-        accessibility_tree = _accessibility_tree
+        return _accessibility_tree
 
-        nodeid_to_cursor = {}
-        for cursor, node in enumerate(accessibility_tree):
-            nodeid_to_cursor[node["nodeId"]] = cursor
+    @staticmethod
+    def get_client_rect_node_ids(
+        accessibility_tree: AccessibilityTree,
+    ) -> list[str]:
+        """Backend node ids whose bounds are queried with
+        `get_bounding_client_rect`"""
+        return [
+            str(node["backendDOMNodeId"])
+            for node in accessibility_tree
+            # usually because the node is not visible etc
+            if "backendDOMNodeId" in node
+            and node["role"]["value"] != "RootWebArea"
+        ]
+
+    def get_accessibility_tree_tracker(self, page: Page) -> AccessibilityTreeTracker:
+        tracker = self.accessibility_tree_tracker
+        if tracker is None or tracker.page is not page:
+            if tracker is not None:
+                tracker.close()
+            tracker = AccessibilityTreeTracker(page)
+            self.accessibility_tree_tracker = tracker
+        return tracker
+
+    @property
+    def rendered_nodes(self) -> dict[str, tuple[str, bool]] | None:
+        """Rendered lines that are still valid for the next observation"""
+        if self.accessibility_tree_tracker is None:
+            return None
+        return self.accessibility_tree_tracker.rendered_nodes
+
+    def fetch_page_accessibility_tree(
+        self,
+        page: Page,
+        info: BrowserInfo,
+        current_viewport_only: bool,
+    ) -> AccessibilityTree:
+        if self.accessibility_tree_mode == "incremental":
+            tracker = self.get_accessibility_tree_tracker(page)
+            try:
+                accessibility_tree = tracker.fetch()
+            except Exception:
+                # e.g., the session was detached, start over once
+                tracker.close()
+                self.accessibility_tree_tracker = None
+                tracker = self.get_accessibility_tree_tracker(page)
+                accessibility_tree = tracker.fetch()
+            client = tracker.client
+        else:
+            client = page.context.new_cdp_session(page)
+            accessibility_tree = self.remove_repeated_nodes(
+                client.send("Accessibility.getFullAXTree", {})["nodes"]
+            )
+        client_rects = {}
+        if self.bounds_mode != "snapshot":
+            for backend_node_id in self.get_client_rect_node_ids(
+                accessibility_tree
+            ):
+                response = self.get_bounding_client_rect(
+                    client, backend_node_id
+                )
+                client_rects[backend_node_id] = self.parse_client_rect(response)
+        if self.accessibility_tree_mode != "incremental":
+            client.detach()
+        return self.build_accessibility_tree(
+            accessibility_tree, info, client_rects, current_viewport_only
+        )
+
+    async def afetch_page_accessibility_tree(
+        self,
+        page: APage,
+        info: BrowserInfo,
+        current_viewport_only: bool,
+    ) -> AccessibilityTree:
+        client = await page.context.new_cdp_session(page)
+        response = await client.send("Accessibility.getFullAXTree", {})
+        accessibility_tree = self.remove_repeated_nodes(response["nodes"])
+        client_rects = {}
+        if self.bounds_mode != "snapshot":
+            backend_node_ids = self.get_client_rect_node_ids(
+                accessibility_tree
+            )
+            # the CDP requests are pipelined over the session
+            responses = await asyncio.gather(
+                *[
+                    self.aget_bounding_client_rect(client, backend_node_id)
+                    for backend_node_id in backend_node_ids
+                ]
+            )
+            for backend_node_id, response in zip(backend_node_ids, responses):
+                client_rects[backend_node_id] = self.parse_client_rect(response)
+        await client.detach()
+        return self.build_accessibility_tree(
+            accessibility_tree, info, client_rects, current_viewport_only
+        )
+
+    def build_accessibility_tree(
+        self,
+        accessibility_tree: AccessibilityTree,
+        info: BrowserInfo,
+        client_rects: dict[str, list[float] | None],
+        current_viewport_only: bool,
+    ) -> AccessibilityTree:
+        """Attach the bounds to the accessibility tree nodes. The bounds
+        come from `client_rects` unless in snapshot mode."""
+        if self.bounds_mode == "snapshot":
+            snapshot_bounds = self.get_snapshot_bounds(info)
+
+        for node in accessibility_tree:
             # usually because the node is not visible etc
             if "backendDOMNodeId" not in node:
                 node["union_bound"] = None
                 continue
-            backend_node_id = str(node["backendDOMNodeId"])
             if node["role"]["value"] == "RootWebArea":
                 # always inside the viewport
                 node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
-            else:
-                response = self.get_bounding_client_rect(
-                    client,
-                    backend_node_id
+            elif self.bounds_mode == "snapshot":
+                node["union_bound"] = snapshot_bounds.get(
+                    node["backendDOMNodeId"]
                 )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    node["union_bound"] = [x, y, width, height]
+            else:
+                node["union_bound"] = client_rects[
+                    str(node["backendDOMNodeId"])
+                ]
 
-        client.detach()
         # filter nodes that are not in the current viewport
         if current_viewport_only:
+            node_bounds = np.array(
+                [node["union_bound"] or [np.nan] * 4 for node in accessibility_tree],
+                dtype=np.float64,
+            ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(node_bounds, info["config"])
+            accessibility_tree = self.prune_tree(accessibility_tree, in_viewport)
 
-            def remove_node_in_graph(node: AccessibilityTreeNode) -> None:
-                # update the node information in the accessibility tree
-                nodeid = node["nodeId"]
-                node_cursor = nodeid_to_cursor[nodeid]
-                parent_nodeid = node["parentId"]
-                children_nodeids = node["childIds"]
-                parent_cursor = nodeid_to_cursor[parent_nodeid]
-                # update the children of the parent node
-                assert (
-                    accessibility_tree[parent_cursor].get("parentId", "Root")
-                    is not None
-                )
-                # remove the nodeid from parent's childIds
-                index = accessibility_tree[parent_cursor]["childIds"].index(nodeid)
-                accessibility_tree[parent_cursor]["childIds"].pop(index)
-                # Insert children_nodeids in the same location
-                for child_nodeid in children_nodeids:
-                    accessibility_tree[parent_cursor]["childIds"].insert(
-                        index, child_nodeid
-                    )
-                    index += 1
-                # update children node's parent
-                for child_nodeid in children_nodeids:
-                    child_cursor = nodeid_to_cursor[child_nodeid]
-                    accessibility_tree[child_cursor]["parentId"] = parent_nodeid
-                # mark as removed
-                accessibility_tree[node_cursor]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for node in accessibility_tree:
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
+        return accessibility_tree
 
-                [x, y, width, height] = node["union_bound"]
+    @staticmethod
+    def render_accessibility_tree_node(
+        node: AccessibilityTreeNode, obs_node_id: str
+    ) -> tuple[str, bool]:
+        """The line of a node in the observation and whether the node is
+        kept, see `parse_accessibility_tree`"""
+        valid_node = True
+        try:
+            role = node["role"]["value"]
+            name = node["name"]["value"]
+            node_str = f"[{obs_node_id}] {role} {repr(name)}"
+            properties = []
+            for property in node.get("properties", []):
+                try:
+                    if property["name"] in IGNORED_ACTREE_PROPERTIES:
+                        continue
+                    properties.append(
+                        f'{property["name"]}: {property["value"]["value"]}'
+                    )
+                except KeyError:
+                    pass
 
-                # invisible node
-                if width == 0 or height == 0:
-                    remove_node_in_graph(node)
-                    continue
+            if properties:
+                node_str += " " + " ".join(properties)
 
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
+            # check valid
+            if not node_str.strip():
+                valid_node = False
 
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
+            # empty generic node
+            if not name.strip():
+                if not properties:
+                    if role in [
+                        "generic",
+                        "img",
+                        "list",
+                        "strong",
+                        "paragraph",
+                        "banner",
+                        "navigation",
+                        "Section",
+                        "LabelText",
+                        "Legend",
+                        "listitem",
+                    ]:
+                        valid_node = False
+                elif role in ["listitem"]:
+                    valid_node = False
 
-            accessibility_tree = [
-                node
-                for node in accessibility_tree
-                if node.get("parentId", "Root") != "[REMOVED]"
-            ]
+        except Exception as e:
+            return "", False
 
-        return accessibility_tree
+        return node_str, valid_node
 
     @staticmethod
     def parse_accessibility_tree(
         accessibility_tree: AccessibilityTree,
+        rendered_nodes: dict[str, tuple[str, bool]] | None = None,
     ) -> tuple[str, dict[str, Any]]:
-        """Parse the accessibility tree into a string text"""
+        """Parse the accessibility tree into a string text. The lines in
+        `rendered_nodes` are reused and the new ones are added to it."""
         node_id_to_idx = {}
         for idx, node in enumerate(accessibility_tree):
             node_id_to_idx[node["nodeId"]] = idx
@@ -524,59 +1115,27 @@ class TextObervationProcessor(ObservationProcessor):
             tree_str = ""
             node = accessibility_tree[idx]
             indent = "\t" * depth
-            valid_node = True
-            try:
-                role = node["role"]["value"]
-                name = node["name"]["value"]
-                node_str = f"[{obs_node_id}] {role} {repr(name)}"
-                properties = []
-                for property in node.get("properties", []):
-                    try:
-                        if property["name"] in IGNORED_ACTREE_PROPERTIES:
-                            continue
-                        properties.append(
-                            f'{property["name"]}: {property["value"]["value"]}'
-                        )
-                    except KeyError:
-                        pass
-
-                if properties:
-                    node_str += " " + " ".join(properties)
-
-                # check valid
-                if not node_str.strip():
-                    valid_node = False
-
-                # empty generic node
-                if not name.strip():
-                    if not properties:
-                        if role in [
-                            "generic",
-                            "img",
-                            "list",
-                            "strong",
-                            "paragraph",
-                            "banner",
-                            "navigation",
-                            "Section",
-                            "LabelText",
-                            "Legend",
-                            "listitem",
-                        ]:
-                            valid_node = False
-                    elif role in ["listitem"]:
-                        valid_node = False
+            if rendered_nodes is not None and obs_node_id in rendered_nodes:
+                node_str, valid_node = rendered_nodes[obs_node_id]
+            else:
+                node_str, valid_node = (
+                    TextObervationProcessor.render_accessibility_tree_node(
+                        node, obs_node_id
+                    )
+                )
+                if rendered_nodes is not None:
+                    rendered_nodes[obs_node_id] = (node_str, valid_node)
 
-                if valid_node:
-                    tree_str += f"{indent}{node_str}"
+            if valid_node:
+                tree_str += f"{indent}{node_str}"
+                try:
                     obs_nodes_info[obs_node_id] = {
                         "backend_id": node["backendDOMNodeId"],
                         "union_bound": node["union_bound"],
                         "text": node_str,
                     }
-
-            except Exception as e:
-                valid_node = False
+                except Exception as e:
+                    valid_node = False
 
             for _, child_node_id in enumerate(node["childIds"]):
                 if child_node_id not in node_id_to_idx:
@@ -618,19 +1177,73 @@ class TextObervationProcessor(ObservationProcessor):
 
         return "\n".join(clean_lines)
 
+    def caption_image_urls(self, image_urls: list[str]) -> None:
+        """Caption the images and cache the captions in `url2caption`"""
+        # Run image captioning on image_url pixels. This is for models which use captioning as a baseline.
+        if len(image_urls) > 0:
+            image_pixels = []
+            valid_urls = []
+            for url in image_urls:
+                if "data:image/svg" in url:
+                    continue
+                else:
+                    try:
+                        image = Image.open(requests.get(url, stream=True).raw)
+                        image_pixels.append(image)
+                        valid_urls.append(url)
+                    except Exception as e:
+                        print("L616 WARNING: ", e)
+
+            # Caption images.
+            if image_pixels:
+                # Run in batches of 4.
+                bs = 4
+                captions = []
+                for i in range(0, len(image_pixels), bs):
+                    try:
+                        captions.extend(
+                            self.captioning_fn(image_pixels[i : i + bs])
+                        )
+                    except Exception as e:
+                        print("L628 WARNING: ", e)
+                        captions.extend([""] * len(image_pixels[i : i + bs]))
+                assert len(valid_urls) == len(
+                    captions
+                ), f"len(images)={len(valid_urls)}, len(captions)={len(captions)}"
+                for image_url, caption in zip(valid_urls, captions):
+                    self.url2caption[image_url] = remove_unicode(
+                        caption.strip()
+                    )
+
+    def caption_image_page(self, url: str) -> str:
+        # Load image from current url and run captioning on it.
+        if url not in self.url2caption and self.captioning_fn is not None:
+            try:
+                image = Image.open(requests.get(url, stream=True).raw)
+                caption = self.captioning_fn([image])[0].strip()
+                self.url2caption[url] = remove_unicode(caption)
+            except Exception as e:
+                print("L579 WARNING: ", e)
+        return self.url2caption.get(url, "Image")
+
+    def get_captioned_alt(self, original_alt: str, image_url: str) -> str:
+        updated_alt = original_alt
+
+        if image_url in self.url2caption:
+            if self.url2caption[image_url] not in updated_alt:
+                updated_alt = f"{updated_alt}, description: {self.url2caption[image_url]}"
+        elif "data:image/svg" not in image_url:
+            print(f"WARNING: {image_url} not in self.url2caption")
+
+        if "url:" not in updated_alt:
+            updated_alt = f"{updated_alt}, url: {image_url}"
+        return updated_alt
+
     def fetch_image_related(self, page: Page, browser_info: BrowserInfo) -> str:
         # Check if the current page is an image url
         if page.url.endswith((".jpg", ".jpeg", ".png")):
             print("NOTE: We are on an image page!!!")
-            # Load image from current url and run captioning on it.
-            if page.url not in self.url2caption and self.captioning_fn is not None:
-                try:
-                    image = Image.open(requests.get(page.url, stream=True).raw)
-                    caption = self.captioning_fn([image])[0].strip()
-                    self.url2caption[page.url] = remove_unicode(caption)
-                except Exception as e:
-                    print("L579 WARNING: ", e)
-            content = self.url2caption.get(page.url, "Image")
+            content = self.caption_image_page(page.url)
 
         else:
             if self.captioning_fn is not None:
@@ -646,43 +1259,8 @@ class TextObervationProcessor(ObservationProcessor):
                     except Exception as e:
                         print("L604 WARNING: ", e)
 
-                # Run image captioning on image_url pixels. This is for models which use captioning as a baseline.
-                if len(image_urls) > 0:
-                    image_pixels = []
-                    valid_urls = []
-                    for url in image_urls:
-                        if "data:image/svg" in url:
-                            continue
-                        else:
-                            try:
-                                image = Image.open(requests.get(url, stream=True).raw)
-                                image_pixels.append(image)
-                                valid_urls.append(url)
-                            except Exception as e:
-                                print("L616 WARNING: ", e)
-
-                    # Caption images.
-                    if image_pixels:
-                        # Run in batches of 4.
-                        bs = 4
-                        captions = []
-                        for i in range(0, len(image_pixels), bs):
-                            try:
-                                captions.extend(
-                                    self.captioning_fn(image_pixels[i : i + bs])
-                                )
-                            except Exception as e:
-                                print("L628 WARNING: ", e)
-                                captions.extend([""] * len(image_pixels[i : i + bs]))
-                        assert len(valid_urls) == len(
-                            captions
-                        ), f"len(images)={len(valid_urls)}, len(captions)={len(captions)}"
-                        for image_url, caption in zip(valid_urls, captions):
-                            self.url2caption[image_url] = remove_unicode(
-                                caption.strip()
-                            )
-
-                image_idx = 0
+                self.caption_image_urls(image_urls)
+
                 for image in images:
                     try:
                         original_alt = image.get_attribute("alt") or ""
@@ -690,24 +1268,69 @@ class TextObervationProcessor(ObservationProcessor):
                         if not image_url.startswith(("http://", "https://", "www.")):
                             image_url = urljoin(page.url, image_url)
 
-                        updated_alt = original_alt
+                        updated_alt = self.get_captioned_alt(original_alt, image_url)
+                        safe_updated_alt = json.dumps(updated_alt)
+                        image.evaluate(f"node => node.alt = {safe_updated_alt}")
+                    except Exception as e:
+                        print("L653 WARNING:", e)
 
-                        if image_url in self.url2caption:
-                            if self.url2caption[image_url] not in updated_alt:
-                                updated_alt = f"{updated_alt}, description: {self.url2caption[image_url]}"
-                        elif "data:image/svg" not in image_url:
-                            print(f"WARNING: {image_url} not in self.url2caption")
+            if self.observation_type == "accessibility_tree_with_captioner":
+                frame_ax_trees = self.fetch_page_accessibility_tree(
+                    page,
+                    browser_info,
+                    current_viewport_only=self.current_viewport_only
+                )
+                content, obs_nodes_info = self.parse_accessibility_tree(
+                    frame_ax_trees, self.rendered_nodes
+                )
+                content = self.clean_accesibility_tree(content)
+                self.obs_nodes_info = obs_nodes_info
+                self.meta_data["obs_nodes_info"] = obs_nodes_info
+            else:
+                content = ""  # Not used for SoM
 
-                        if "url:" not in updated_alt:
-                            updated_alt = f"{updated_alt}, url: {image_url}"
+        return content
 
+    async def afetch_image_related(
+        self, page: APage, browser_info: BrowserInfo
+    ) -> str:
+        # Check if the current page is an image url
+        if page.url.endswith((".jpg", ".jpeg", ".png")):
+            print("NOTE: We are on an image page!!!")
+            # the captioning model blocks, keep the event loop free
+            content = await asyncio.to_thread(self.caption_image_page, page.url)
+
+        else:
+            if self.captioning_fn is not None:
+                images = await page.query_selector_all("img")
+                image_urls = []
+                for image in images:
+                    try:
+                        image_url = await image.get_attribute("src")
+                        if not image_url.startswith(("http://", "https://", "www.")):
+                            image_url = urljoin(page.url, image_url)
+                        if image_url not in self.url2caption:
+                            image_urls.append(image_url)
+                    except Exception as e:
+                        print("L604 WARNING: ", e)
+
+                await asyncio.to_thread(self.caption_image_urls, image_urls)
+
+                for image in images:
+                    try:
+                        original_alt = await image.get_attribute("alt") or ""
+                        image_url = await image.get_attribute("src")
+                        if not image_url.startswith(("http://", "https://", "www.")):
+                            image_url = urljoin(page.url, image_url)
+
+                        updated_alt = self.get_captioned_alt(original_alt, image_url)
                         safe_updated_alt = json.dumps(updated_alt)
-                        image.evaluate(f"node => node.alt = {safe_updated_alt}")
+                        await image.evaluate(f"node => node.alt = {safe_updated_alt}")
                     except Exception as e:
                         print("L653 WARNING:", e)
 
             if self.observation_type == "accessibility_tree_with_captioner":
-                frame_ax_trees = self.fetch_page_accessibility_tree(
+                frame_ax_trees = await self.afetch_page_accessibility_tree(
                     page,
                     browser_info,
                     current_viewport_only=self.current_viewport_only
@@ -738,10 +1361,10 @@ class TextObervationProcessor(ObservationProcessor):
 
         try:
             page.wait_for_load_state("load", timeout=15000)
-            browser_info = self.fetch_browser_info(page)
+            browser_info = self.fetch_browser_info(page, self.needs_dom_tree)
         except Exception:
             page.wait_for_load_state("load", timeout=60000)
-            browser_info = self.fetch_browser_info(page)
+            browser_info = self.fetch_browser_info(page, self.needs_dom_tree)
 
         if self.observation_type == "html":
             dom_tree = self.fetch_page_html(
@@ -759,7 +1382,9 @@ class TextObervationProcessor(ObservationProcessor):
                 browser_info,
                 self.current_viewport_only,
             )
-            content, obs_nodes_info = self.parse_accessibility_tree(accessibility_tree)
+            content, obs_nodes_info = self.parse_accessibility_tree(
+                accessibility_tree, self.rendered_nodes
+            )
             content = self.clean_accesibility_tree(content)
             self.obs_nodes_info = obs_nodes_info
             self.meta_data["obs_nodes_info"] = obs_nodes_info
@@ -784,6 +1409,73 @@ class TextObervationProcessor(ObservationProcessor):
 
         return content
 
+    async def aprocess(self, page: APage) -> str:
+        # get the tab info
+        open_tabs = page.context.pages
+        try:
+            tab_titles = [await tab.title() for tab in open_tabs]
+            current_tab_idx = open_tabs.index(page)
+            for idx in range(len(open_tabs)):
+                if idx == current_tab_idx:
+                    tab_titles[idx] = f"Tab {idx} (current): {tab_titles[idx]}"
+                else:
+                    tab_titles[idx] = f"Tab {idx}: {tab_titles[idx]}"
+            tab_title_str = " | ".join(tab_titles)
+        except Exception:
+            tab_title_str = " | ".join([f"Tab {idx}" for idx in range(len(open_tabs))])
+
+        try:
+            await page.wait_for_load_state("load", timeout=15000)
+            browser_info = await self.afetch_browser_info(
+                page, self.needs_dom_tree
+            )
+        except Exception:
+            await page.wait_for_load_state("load", timeout=60000)
+            browser_info = await self.afetch_browser_info(
+                page, self.needs_dom_tree
+            )
+
+        if self.observation_type == "html":
+            dom_tree = await self.afetch_page_html(
+                browser_info,
+                page,
+                self.current_viewport_only,
+            )
+            content, obs_nodes_info = self.parse_html(dom_tree)
+            self.obs_nodes_info = obs_nodes_info
+            self.meta_data["obs_nodes_info"] = obs_nodes_info
+
+        elif self.observation_type == "accessibility_tree":
+            accessibility_tree = await self.afetch_page_accessibility_tree(
+                page,
+                browser_info,
+                self.current_viewport_only,
+            )
+            content, obs_nodes_info = self.parse_accessibility_tree(accessibility_tree)
+            content = self.clean_accesibility_tree(content)
+            self.obs_nodes_info = obs_nodes_info
+            self.meta_data["obs_nodes_info"] = obs_nodes_info
+
+        elif self.observation_type in [
+            "accessibility_tree_with_captioner",
+            "image_som",
+        ]:
+            content = await self.afetch_image_related(
+                page,
+                browser_info,
+            )
+
+        elif self.observation_type == "":
+            content = ""
+
+        else:
+            raise ValueError(f"Invalid observation type: {self.observation_type}")
+
+        self.browser_config = browser_info["config"]
+        content = f"{tab_title_str}\n\n{content}"
+
+        return content
+
     def get_element_center(self, element_id: str) -> tuple[float, float]:
         node_info = self.obs_nodes_info[element_id]
         node_bound = node_info["union_bound"]
@@ -796,75 +1488,178 @@ class TextObervationProcessor(ObservationProcessor):
         )
 
 
+# pandas.read_csv used to parse these values of the SoM payload as missing,
+# keep dropping them so that the SoM prompts do not change
+SOM_NA_VALUES = frozenset(
+    [
+        "",
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "-nan",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "None",
+        "n/a",
+        "nan",
+        "null",
+    ]
+)
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """Load a TTF font once per process"""
+    return ImageFont.truetype(font_path, font_size)
+
+
+def get_som_text(element: str, alt: str, text_content: str) -> str:
+    """Text of a SoM element in the prompt, the alt text of images and the
+    text content"""
+    content = ""
+    # Add image alt-text to the text representation.
+    if element == "IMG" and alt not in SOM_NA_VALUES:
+        content += alt
+    # Add HTML textContent (if any) to the text representation.
+    if text_content not in SOM_NA_VALUES:
+        # Limit to 200 characters to avoid having too much text
+        content += text_content.strip().replace("\n", "").replace("\t", "")[:200]
+    return content
+
+
+class LabelGrid:
+    """Uniform grid over the placed SoM labels.
+
+    A label is stored in every cell that a new label has to cover to
+    overlap with it, so an overlap test only compares the labels of the
+    cells under the new label instead of every label placed so far.
+    """
+
+    def __init__(self, padding: float, cell_size: float = 64.0) -> None:
+        self.padding = padding
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[list[float]]] = defaultdict(list)
+
+    def cell_range(self, low: float, high: float) -> range:
+        return range(
+            math.floor(low / self.cell_size), math.floor(high / self.cell_size) + 1
+        )
+
+    def add(self, rect: list[float]) -> None:
+        # the overlap test shrinks the placed label by the padding
+        x1, x2 = sorted([rect[0] + self.padding, rect[2] - self.padding])
+        y1, y2 = sorted([rect[1] + self.padding, rect[3] - self.padding])
+        for i in self.cell_range(x1, x2):
+            for j in self.cell_range(y1, y2):
+                self.cells[i, j].append(rect)
+
+    def overlaps(self, rect: list[float]) -> bool:
+        for i in self.cell_range(rect[0], rect[2]):
+            for j in self.cell_range(rect[1], rect[3]):
+                for other in self.cells.get((i, j), []):
+                    if ImageObservationProcessor.rectangles_overlap(
+                        rect, other, self.padding
+                    ):
+                        return True
+        return False
+
+
+PAGE_BBOXES_SCRIPT = """
+(() => {
+    const interactableSelectors = [
+        'a[href]:not(:has(img))', 'a[href] img', 'button', 'input:not([type="hidden"])', 'textarea', 'select',
+        '[tabindex]:not([tabindex="-1"])', '[contenteditable="true"]', '[role="button"]', '[role="link"]',
+        '[role="checkbox"]', '[role="menuitem"]', '[role="tab"]', '[draggable="true"]',
+        '.btn', 'a[href="/notifications"]', 'a[href="/submit"]', '.fa.fa-star.is-rating-item', 'input[type="checkbox"]'
+
+    ];
+
+    const textSelectors = ['p', 'span', 'div:not(:has(*))', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'article'];
+    const modifiedTextSelectors = textSelectors.map(selector =>
+        `:not(${interactableSelectors.join(', ')}):not(style) > ${selector}`
+    );
+
+    const combinedSelectors = [...interactableSelectors, ...modifiedTextSelectors];
+    const elements = document.querySelectorAll(combinedSelectors.join(', '));
+
+    const pixelRatio = window.devicePixelRatio;
+    const bboxes = {
+        ID: [], Element: [], Bounds: [], Alt: [], Class: [], Id: [], TextContent: [], Interactable: []
+    };
+    let counter = 1;
+
+    elements.forEach(element => {
+        const rect = element.getBoundingClientRect();
+        if (rect.width === 0 || rect.height === 0) return;
+        // double quotes were dropped by the former CSV payload, keep the text as is
+        const altText = (element.getAttribute('alt') || '').replace(/"/g, '');
+        const textContent = (element.textContent || '').replace(/"/g, '');
+
+        // Determine if the element is interactable
+        const isInteractable = interactableSelectors.some(selector => element.matches(selector));
+
+        bboxes.ID.push(counter);
+        bboxes.Element.push(element.tagName);
+        // Top, Right, Bottom, Left, Width, Height
+        bboxes.Bounds.push([
+            (rect.top + window.scrollY) * pixelRatio, (rect.right + window.scrollX) * pixelRatio,
+            (rect.bottom + window.scrollY) * pixelRatio, (rect.left + window.scrollX) * pixelRatio,
+            rect.width * pixelRatio, rect.height * pixelRatio
+        ]);
+        bboxes.Alt.push(altText);
+        bboxes.Class.push(String(element.className || ''));
+        bboxes.Id.push(element.id || '');
+        bboxes.TextContent.push(textContent);
+        bboxes.Interactable.push(isInteractable);
+        counter++;
+    });
+
+    // a single string is cheaper to transfer than a nested object
+    return JSON.stringify(bboxes);
+})();
+"""
+
+
 class ImageObservationProcessor(ObservationProcessor):
     def __init__(
         self,
         observation_type: str,
         viewport_size: Optional[ViewportSize] = None,
+        screenshot_format: str = "array",
+        screenshot_quality: int = 90,
     ):
         self.observation_type = observation_type
         self.observation_tag = "image"
         self.viewport_size = viewport_size
+        # "array": decode the screenshot into a numpy array
+        # "png" | "jpeg" | "webp": keep the encoded bytes in a `Screenshot`
+        if screenshot_format not in ["array", "png", "jpeg", "webp"]:
+            raise ValueError(f"Invalid screenshot format: {screenshot_format}")
+        self.screenshot_format = screenshot_format
+        self.screenshot_quality = screenshot_quality
+        # shared with the other processors by `ObservationHandler`
+        self.browser_info_cache: BrowserInfoCache | None = None
         self.meta_data = create_empty_metadata()
 
-    def get_page_bboxes(self, page: Page) -> list[list[float]]:
-        """JavaScript code to return bounding boxes and other metadata from HTML elements."""
-        js_script = """
-        (() => {
-            const interactableSelectors = [
-                'a[href]:not(:has(img))', 'a[href] img', 'button', 'input:not([type="hidden"])', 'textarea', 'select',
-                '[tabindex]:not([tabindex="-1"])', '[contenteditable="true"]', '[role="button"]', '[role="link"]',
-                '[role="checkbox"]', '[role="menuitem"]', '[role="tab"]', '[draggable="true"]',
-                '.btn', 'a[href="/notifications"]', 'a[href="/submit"]', '.fa.fa-star.is-rating-item', 'input[type="checkbox"]'
-
-            ];
-
-            const textSelectors = ['p', 'span', 'div:not(:has(*))', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'article'];
-            const modifiedTextSelectors = textSelectors.map(selector =>
-                `:not(${interactableSelectors.join(', ')}):not(style) > ${selector}`
-            );
-
-            const combinedSelectors = [...interactableSelectors, ...modifiedTextSelectors];
-            const elements = document.querySelectorAll(combinedSelectors.join(', '));
-
-            const pixelRatio = window.devicePixelRatio;
-            let csvContent = "ID,Element,Top,Right,Bottom,Left,Width,Height,Alt,Class,Id,TextContent,Interactable\\n";
-            let counter = 1;
-
-            elements.forEach(element => {
-                const rect = element.getBoundingClientRect();
-                if (rect.width === 0 || rect.height === 0) return;
-                let altText = element.getAttribute('alt') || '';
-                altText = altText.replace(/"/g, ''); // Escape double quotes in alt text
-                const classList = element.className || '';
-                const id = element.id || '';
-                let textContent = element.textContent || '';
-                textContent = textContent.replace(/"/g, ''); // Escape double quotes in textContent
-
-                // Determine if the element is interactable
-                const isInteractable = interactableSelectors.some(selector => element.matches(selector));
-
-                const dataString = [
-                    counter, element.tagName, (rect.top + window.scrollY) * pixelRatio,
-                    (rect.right + window.scrollX) * pixelRatio, (rect.bottom + window.scrollY) * pixelRatio,
-                    (rect.left + window.scrollX) * pixelRatio, rect.width * pixelRatio, rect.height * pixelRatio,
-                    altText, classList, id, textContent, isInteractable
-                ].map(value => `"${value}"`).join(",");
-
-                csvContent += dataString + "\\n";
-                counter++;
-            });
-
-            return csvContent;
-        })();
-        """
-        # Save the bbox as a CSV
-        csv_content = page.evaluate(js_script)
-        return csv_content
+    def get_page_bboxes(self, page: Page) -> dict[str, list[Any]]:
+        """Return bounding boxes and other metadata from HTML elements, one
+        list per column"""
+        return json.loads(page.evaluate(PAGE_BBOXES_SCRIPT))
+
+    async def aget_page_bboxes(self, page: APage) -> dict[str, list[Any]]:
+        return json.loads(await page.evaluate(PAGE_BBOXES_SCRIPT))
 
     def draw_bounding_boxes(
         self,
-        data_string,
+        bboxes,
         screenshot_img,
         viewport_size=None,
         add_ids=True,
@@ -876,26 +1671,40 @@ class ImageObservationProcessor(ObservationProcessor):
         plot_ids=None,
     ):
         """
+        bboxes: The columns returned by `get_page_bboxes`.
         min_width and min_height: Minimum dimensions of the bounding box to be plotted.
         """
-        # Read CSV data
-        df = pd.read_csv(StringIO(data_string), delimiter=",", quotechar='"')
-        df["Area"] = df["Width"] * df["Height"]
+        bounds = np.asarray(bboxes["Bounds"], dtype=np.float64).reshape(-1, 6)
+        top, right, bottom, left, width, height = bounds.T
         # Remove bounding boxes that are clipped.
         b_x, b_y = (
             self.browser_config["win_left_bound"],
             self.browser_config["win_upper_bound"],
         )
+        keep = np.ones(len(bounds), dtype=bool)
         if viewport_size is not None:
-            df = df[
-                (df["Bottom"] - b_y >= 0)
-                & (df["Top"] - b_y <= viewport_size["height"])
-                & (df["Right"] - b_x >= 0)
-                & (df["Left"] - b_x <= viewport_size["width"])
-            ]
+            keep = (
+                (bottom - b_y >= 0)
+                & (top - b_y <= viewport_size["height"])
+                & (right - b_x >= 0)
+                & (left - b_x <= viewport_size["width"])
+            )
             viewport_area = viewport_size["width"] * viewport_size["height"]
             # Filter out bounding boxes that too large (more than 80% of the viewport)
-            df = df[df["Area"] <= 0.8 * viewport_area]
+            keep &= width * height <= 0.8 * viewport_area
+        rows = np.flatnonzero(keep)
+
+        interactable = np.asarray(bboxes["Interactable"], dtype=bool)[rows]
+        # the labelled boxes are numbered in page order
+        labelled = interactable.copy()
+        if plot_ids is not None:
+            labelled &= np.array(
+                [bboxes["ID"][row] in plot_ids for row in rows], dtype=bool
+            )
+        left, right = left[rows] - b_x, right[rows] - b_x
+        top, bottom = top[rows] - b_y, bottom[rows] - b_y
+        width, height = width[rows], height[rows]
+        drawn = labelled & (width >= min_width) & (height >= min_height)
 
         # Open the screenshot image
         img = screenshot_img.copy()
@@ -904,188 +1713,143 @@ class ImageObservationProcessor(ObservationProcessor):
         # Load a TTF font with a larger size
         font_path = "media/SourceCodePro-SemiBold.ttf"
         font_size, padding = 16, 2
-        font = ImageFont.truetype(font_path, font_size)
+        font = load_font(font_path, font_size)
+
+        if add_ids:
+            unique_ids = np.cumsum(labelled)
+            text_width = np.array(
+                [
+                    draw.textlength(str(unique_id), font=font) if is_drawn else 0.0
+                    for unique_id, is_drawn in zip(unique_ids, drawn)
+                ]
+            )
+            text_height = font_size  # Assume the text is one line
+            # Calculate the possible text positions, in the order they are tried
+            right_label = right - font_size - 2 * padding
+            text_x = np.stack(
+                [
+                    left - font_size,  # Top-left corner
+                    left,  # A little to the right of the top-left corner
+                    right,  # Top-right corner
+                    right_label,  # A little to the left of the top-right corner
+                    left - font_size,  # Bottom-left corner
+                    left,  # A little to the right of the bottom-left corner
+                    right_label,  # A little to the left of the bottom-right corner
+                    left,  # A little to the right of the bottom-left corner
+                    right_label,  # A little to the left of the bottom-right corner
+                ],
+                axis=1,
+            )
+            text_y = np.stack([top - font_size] * 4 + [bottom] * 5, axis=1)
+            text_rectangles = np.stack(
+                [
+                    text_x - padding,
+                    text_y - padding,
+                    text_x + text_width[:, None] + padding,
+                    text_y + text_height + padding,
+                ],
+                axis=2,
+            )
+            if viewport_size is not None:
+                # Check if the text rectangles are within the viewport
+                in_viewport = (
+                    (text_rectangles[..., 0] >= 0)
+                    & (text_rectangles[..., 1] >= 0)
+                    & (text_rectangles[..., 2] <= viewport_size["width"])
+                    & (text_rectangles[..., 3] <= viewport_size["height"])
+                )
 
         # Create a color cycle using one of the categorical color palettes in matplotlib
         color_cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
-        bbox_id2visid = {}
-        bbox_id2desc = {}
         index = 0
         id2center = {}
-        existing_text_rectangles = []
+        existing_text_rectangles = LabelGrid(padding * 2)
         text_to_draw = []
         # Provide [id] textContent inputs to the model as text.
         text_content_elements = []
         text_content_text = set()  # Store text of interactable elements
+        element_count = defaultdict(int)  # count of each element string
 
-        # Iterate through each row in the CSV and draw bounding boxes
-        for _, row in df.iterrows():
-            if not row["Interactable"]:
-                content = ""
-                # Add image alt-text to the text representation.
-                if row["Element"] == "IMG" and pd.notna(row["Alt"]):
-                    content += row["Alt"]
-                # Add HTML textContent (if any) to the text representation.
-                if pd.notna(row["TextContent"]):
-                    content += (
-                        row["TextContent"].strip().replace("\n", "").replace("\t", "")
-                    )[
-                        :200
-                    ]  # Limit to 200 characters to avoid having too much text
-
+        for i, row in enumerate(rows.tolist()):
+            content = get_som_text(
+                bboxes["Element"][row], bboxes["Alt"][row], bboxes["TextContent"][row]
+            )
+            if not interactable[i]:
                 # Check if the text is a CSS selector
                 if content and not (content.startswith(".") and "{" in content):
                     # Add elements which are not interactable as StaticText
                     if content not in text_content_text:
-                        text_content_elements.append(f"[] [StaticText] [{content}]")
+                        element = f"[] [StaticText] [{content}]"
+                        text_content_elements.append(element)
+                        element_count[element.strip()] += 1
                         text_content_text.add(content)
                 continue
 
-            if (plot_ids is not None) and (row["ID"] not in plot_ids):
+            if not labelled[i]:
                 continue
 
             unique_id = str(index + 1)
-            bbox_id2visid[row["ID"]] = (
-                unique_id  # map the bounding box ID to the unique character ID
-            )
-            top, right, bottom, left, width, height = (
-                row["Top"],
-                row["Right"],
-                row["Bottom"],
-                row["Left"],
-                row["Width"],
-                row["Height"],
-            )
-            left, right, top, bottom = left - b_x, right - b_x, top - b_y, bottom - b_y
             id2center[unique_id] = (
-                (left + right) / 2,
-                (bottom + top) / 2,
-                width,
-                height,
+                float((left[i] + right[i]) / 2),
+                float((bottom[i] + top[i]) / 2),
+                float(width[i]),
+                float(height[i]),
             )
 
-            if width >= min_width and height >= min_height:
+            if drawn[i]:
                 # Get the next color in the cycle
                 color = bbox_color or color_cycle[index % len(color_cycle)]
                 draw.rectangle(
                     [
-                        left - bbox_padding,
-                        top - bbox_padding,
-                        right + bbox_padding,
-                        bottom + bbox_padding,
+                        left[i] - bbox_padding,
+                        top[i] - bbox_padding,
+                        right[i] + bbox_padding,
+                        bottom[i] + bbox_padding,
                     ],
                     outline=color,
                     width=bbox_border,
                 )
-                bbox_id2desc[row["ID"]] = color
 
                 # Draw the text on top of the rectangle
                 if add_ids:
-                    # Calculate list of possible text positions
-                    text_positions = [
-                        (left - font_size, top - font_size),  # Top-left corner
-                        (
-                            left,
-                            top - font_size,
-                        ),  # A little to the right of the top-left corner
-                        (right, top - font_size),  # Top-right corner
-                        (
-                            right - font_size - 2 * padding,
-                            top - font_size,
-                        ),  # A little to the left of the top-right corner
-                        (left - font_size, bottom),  # Bottom-left corner
-                        (
-                            left,
-                            bottom,
-                        ),  # A little to the right of the bottom-left corner
-                        (
-                            right - font_size - 2 * padding,
-                            bottom,
-                        ),  # A little to the left of the bottom-right corner
-                        (
-                            left,
-                            bottom,
-                        ),  # A little to the right of the bottom-left corner
-                        (
-                            right - font_size - 2 * padding,
-                            bottom,
-                        ),  # A little to the left of the bottom-right corner
-                    ]
-                    text_width = draw.textlength(unique_id, font=font)
-                    text_height = font_size  # Assume the text is one line
-
                     if viewport_size is not None:
-                        for text_position in text_positions:
-                            new_text_rectangle = [
-                                text_position[0] - padding,
-                                text_position[1] - padding,
-                                text_position[0] + text_width + padding,
-                                text_position[1] + text_height + padding,
-                            ]
-
-                            # Check if the new text rectangle is within the viewport
-                            if (
-                                new_text_rectangle[0] >= 0
-                                and new_text_rectangle[1] >= 0
-                                and new_text_rectangle[2] <= viewport_size["width"]
-                                and new_text_rectangle[3] <= viewport_size["height"]
+                        # take the first position in the viewport that does not
+                        # overlap with a placed label, else the last position
+                        for k in range(text_rectangles.shape[1]):
+                            new_text_rectangle = text_rectangles[i, k].tolist()
+                            if in_viewport[
+                                i, k
+                            ] and not existing_text_rectangles.overlaps(
+                                new_text_rectangle
                             ):
-                                # If the rectangle is within the viewport, check for overlaps
-                                overlaps = False
-                                for existing_rectangle in existing_text_rectangles:
-                                    if self.rectangles_overlap(
-                                        new_text_rectangle,
-                                        existing_rectangle,
-                                        padding * 2,
-                                    ):
-                                        overlaps = True
-                                        break
-
-                                if not overlaps:
-                                    break
-                            else:
-                                # If the rectangle is outside the viewport, try the next position
-                                continue
+                                break
+                        text_position = (text_x[i, k], text_y[i, k])
                     else:
                         # If none of the corners work, move the text rectangle by a fixed amount
-                        text_position = (
-                            text_positions[0][0] + padding,
-                            text_positions[0][1],
-                        )
+                        text_position = (text_x[i, 0] + padding, text_y[i, 0])
                         new_text_rectangle = [
                             text_position[0] - padding,
                             text_position[1] - padding,
-                            text_position[0] + text_width + padding,
+                            text_position[0] + text_width[i] + padding,
                             text_position[1] + text_height + padding,
                         ]
 
-                    existing_text_rectangles.append(new_text_rectangle)
+                    existing_text_rectangles.add(new_text_rectangle)
                     text_to_draw.append(
                         (new_text_rectangle, text_position, unique_id, color)
                     )
 
-                    content = ""
-                    if row["Element"] == "IMG" and pd.notna(row["Alt"]):
-                        content += row["Alt"]
-                    if pd.notna(row["TextContent"]):
-                        content += (
-                            row["TextContent"]
-                            .strip()
-                            .replace("\n", "")
-                            .replace("\t", "")
-                        )[
-                            :200
-                        ]  # Limit to 200 characters
-                    text_content_elements.append(
-                        f"[{unique_id}] [{row['Element']}] [{content}]"
-                    )
-                    if content in text_content_text:
+                    element = f"[{unique_id}] [{bboxes['Element'][row]}] [{content}]"
+                    text_content_elements.append(element)
+                    element_count[element.strip()] += 1
+                    if content in text_content_text and element_count[content]:
                         # Remove text_content_elements with content
                         text_content_elements = [
                             element
                             for element in text_content_elements
                             if element.strip() != content
                         ]
+                        element_count[content] = 0
                     text_content_text.add(content)
 
             index += 1
@@ -1098,7 +1862,8 @@ class ImageObservationProcessor(ObservationProcessor):
         content_str = "\n".join(text_content_elements)
         return img, id2center, content_str
 
-    def rectangles_overlap(self, rect1, rect2, padding):
+    @staticmethod
+    def rectangles_overlap(rect1, rect2, padding):
         """
         Check if two rectangles overlap.
         Each rectangle is represented as a list [x1, y1, x2, y2].
@@ -1110,7 +1875,70 @@ class ImageObservationProcessor(ObservationProcessor):
             or rect1[3] < rect2[1] + padding
         )
 
-    def process(self, page: Page) -> npt.NDArray[np.uint8]:
+    def capture_screenshot(self, page: Page, format: str) -> bytes:
+        if format == "webp":
+            # Playwright only encodes PNG and JPEG
+            client = page.context.new_cdp_session(page)
+            response = client.send(
+                "Page.captureScreenshot",
+                {"format": "webp", "quality": self.screenshot_quality},
+            )
+            client.detach()
+            return base64.b64decode(response["data"])
+        if format == "jpeg":
+            return page.screenshot(type="jpeg", quality=self.screenshot_quality)
+        return page.screenshot()
+
+    async def acapture_screenshot(self, page: APage, format: str) -> bytes:
+        if format == "webp":
+            client = await page.context.new_cdp_session(page)
+            response = await client.send(
+                "Page.captureScreenshot",
+                {"format": "webp", "quality": self.screenshot_quality},
+            )
+            await client.detach()
+            return base64.b64decode(response["data"])
+        if format == "jpeg":
+            return await page.screenshot(
+                type="jpeg", quality=self.screenshot_quality
+            )
+        return await page.screenshot()
+
+    @property
+    def capture_format(self) -> str:
+        """Format requested from the browser. SoM screenshots are drawn on,
+        so they are captured losslessly and encoded once after drawing."""
+        if self.observation_type == "image_som" or self.screenshot_format == "array":
+            return "png"
+        return self.screenshot_format
+
+    def to_observation(
+        self, screenshot_bytes: bytes
+    ) -> npt.NDArray[np.uint8] | Screenshot:
+        if self.screenshot_format == "array":
+            return png_bytes_to_numpy(screenshot_bytes)
+        return Screenshot(screenshot_bytes, self.screenshot_format)
+
+    def draw_som(
+        self, screenshot_bytes: bytes, som_bboxes: dict[str, list[Any]]
+    ) -> tuple[npt.NDArray[np.uint8] | Screenshot, str]:
+        screenshot_img = Image.open(BytesIO(screenshot_bytes))
+        bbox_img, id2center, content_str = self.draw_bounding_boxes(
+            som_bboxes,
+            screenshot_img,
+            viewport_size=self.viewport_size,
+        )
+        self.som_id_info = id2center
+        self.meta_data["obs_nodes_info"] = id2center
+        if self.screenshot_format == "array":
+            screenshot_som = np.array(bbox_img)
+        else:
+            screenshot_som = Screenshot.from_image(
+                bbox_img, self.screenshot_format, self.screenshot_quality
+            )
+        return screenshot_som, content_str
+
+    def process(self, page: Page) -> npt.NDArray[np.uint8] | Screenshot:
         try:
             page.wait_for_load_state("load", timeout=15000)
             browser_info = self.fetch_browser_info(page)
@@ -1123,85 +1951,74 @@ class ImageObservationProcessor(ObservationProcessor):
         if self.observation_type == "image_som":
             # Produce the SoM image, with bounding boxes
             try:
-                screenshot_bytes = page.screenshot()
+                screenshot_bytes = self.capture_screenshot(page, self.capture_format)
                 som_bboxes = self.get_page_bboxes(page)
-                screenshot_img = Image.open(BytesIO(screenshot_bytes))
-                bbox_img, id2center, content_str = self.draw_bounding_boxes(
-                    som_bboxes,
-                    screenshot_img,
-                    viewport_size=self.viewport_size,
-                )
-                self.som_id_info = id2center
-                self.meta_data["obs_nodes_info"] = id2center
-                screenshot_som = np.array(bbox_img)
-                return screenshot_som, content_str
+                return self.draw_som(screenshot_bytes, som_bboxes)
             except:
                 page.wait_for_event("load")
-                screenshot_bytes = page.screenshot()
+                screenshot_bytes = self.capture_screenshot(page, self.capture_format)
                 som_bboxes = self.get_page_bboxes(page)
-                screenshot_img = Image.open(BytesIO(screenshot_bytes))
-                bbox_img, id2center, content_str = self.draw_bounding_boxes(
-                    som_bboxes,
-                    screenshot_img,
-                    viewport_size=self.viewport_size,
-                )
-                self.som_id_info = id2center
-                self.meta_data["obs_nodes_info"] = id2center
-                screenshot_som = np.array(bbox_img)
-                return screenshot_som, content_str
+                return self.draw_som(screenshot_bytes, som_bboxes)
         else:
             try:
-                screenshot = png_bytes_to_numpy(page.screenshot())
+                screenshot_bytes = self.capture_screenshot(page, self.capture_format)
             except:
                 page.wait_for_event("load")
-                screenshot = png_bytes_to_numpy(page.screenshot())
-            return screenshot, ""
+                screenshot_bytes = self.capture_screenshot(page, self.capture_format)
+            return self.to_observation(screenshot_bytes), ""
 
-    def fetch_browser_info(self, page: Page) -> BrowserInfo:
-        client = page.context.new_cdp_session(page)
-        # extract domtree
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
-        )
-        client.detach()
-        # calibrate the bounds, in some cases, the bounds are scaled somehow
-        bounds = tree["documents"][0]["layout"]["bounds"]
-        b = bounds[0]
-        n = b[2] / self.viewport_size["width"]
-        bounds = [[x / n for x in bound] for bound in bounds]
-        tree["documents"][0]["layout"]["bounds"] = bounds
-        # add union bound placeholder
-        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
+    async def aprocess(self, page: APage) -> npt.NDArray[np.uint8] | Screenshot:
+        try:
+            await page.wait_for_load_state("load", timeout=15000)
+            browser_info = await self.afetch_browser_info(page)
+        except Exception:
+            await page.wait_for_load_state("load", timeout=60000)
+            browser_info = await self.afetch_browser_info(page)
 
-        # extract browser info
-        win_upper_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
-        win_right_bound = win_left_bound + win_width
-        win_lower_bound = win_upper_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
-        assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
-
-        config: BrowserConfig = {
-            "win_upper_bound": win_upper_bound,
-            "win_left_bound": win_left_bound,
-            "win_width": win_width,
-            "win_height": win_height,
-            "win_right_bound": win_right_bound,
-            "win_lower_bound": win_lower_bound,
-            "device_pixel_ratio": device_pixel_ratio,
-        }
+        self.browser_config = browser_info["config"]
 
-        # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
-        info: BrowserInfo = {"DOMTree": tree, "config": config}
+        if self.observation_type == "image_som":
+            # Produce the SoM image, with bounding boxes
+            try:
+                screenshot_bytes = await self.acapture_screenshot(
+                    page, self.capture_format
+                )
+                som_bboxes = await self.aget_page_bboxes(page)
+            except:
+                await page.wait_for_event("load")
+                screenshot_bytes = await self.acapture_screenshot(
+                    page, self.capture_format
+                )
+                som_bboxes = await self.aget_page_bboxes(page)
+            return self.draw_som(screenshot_bytes, som_bboxes)
+        else:
+            try:
+                screenshot_bytes = await self.acapture_screenshot(
+                    page, self.capture_format
+                )
+            except:
+                await page.wait_for_event("load")
+                screenshot_bytes = await self.acapture_screenshot(
+                    page, self.capture_format
+                )
+            return self.to_observation(screenshot_bytes), ""
 
-        return info
+    def fetch_browser_info(self, page: Page) -> BrowserInfo:
+        # only the window config is used, skip the DOM snapshot
+        if self.browser_info_cache is not None:
+            return self.browser_info_cache.fetch(
+                page, self.viewport_size, with_dom_tree=False
+            )
+        return fetch_browser_info(page, self.viewport_size, with_dom_tree=False)
+
+    async def afetch_browser_info(self, page: APage) -> BrowserInfo:
+        if self.browser_info_cache is not None:
+            return await self.browser_info_cache.afetch(
+                page, self.viewport_size, with_dom_tree=False
+            )
+        return await afetch_browser_info(
+            page, self.viewport_size, with_dom_tree=False
+        )
 
     def get_element_center(self, element_id: str) -> tuple[float, float]:
         if not self.observation_type == "image_som":
@@ -1228,6 +2045,9 @@ class ObservationHandler:
         current_viewport_only: bool,
         viewport_size: ViewportSize,
         captioning_fn=None,
+        bounds_mode: str = "client_rect",
+        screenshot_format: str = "array",
+        accessibility_tree_mode: str = "full",
     ) -> None:
         self.main_observation_type = main_observation_type
         self.text_processor = TextObervationProcessor(
@@ -1235,11 +2055,17 @@ class ObservationHandler:
             current_viewport_only,
             viewport_size,
             captioning_fn,
+            bounds_mode,
+            accessibility_tree_mode,
         )
         self.image_processor = ImageObservationProcessor(
-            image_observation_type, viewport_size
+            image_observation_type, viewport_size, screenshot_format
         )
         self.viewport_size = viewport_size
+        # both processors probe the same page in a step
+        self.browser_info_cache = BrowserInfoCache()
+        self.text_processor.browser_info_cache = self.browser_info_cache
+        self.image_processor.browser_info_cache = self.browser_info_cache
 
     def get_observation_space(self) -> spaces.Dict:
         text_space = spaces.Text(
@@ -1265,8 +2091,23 @@ class ObservationHandler:
         return spaces.Dict({"text": text_space, "image": image_space})
 
     def get_observation(self, page: Page) -> dict[str, Observation]:
-        text_obs = self.text_processor.process(page)
-        image_obs, content_str = self.image_processor.process(page)
+        self.browser_info_cache.start_step()
+        try:
+            text_obs = self.text_processor.process(page)
+            image_obs, content_str = self.image_processor.process(page)
+        finally:
+            self.browser_info_cache.end_step()
+        if content_str != "":
+            text_obs = content_str
+        return {"text": text_obs, "image": image_obs}
+
+    async def aget_observation(self, page: APage) -> dict[str, Observation]:
+        self.browser_info_cache.start_step()
+        try:
+            text_obs = await self.text_processor.aprocess(page)
+            image_obs, content_str = await self.image_processor.aprocess(page)
+        finally:
+            self.browser_info_cache.end_step()
         if content_str != "":
             text_obs = content_str
         return {"text": text_obs, "image": image_obs}
@@ -32,6 +32,56 @@ def png_bytes_to_numpy(png: bytes) -> npt.NDArray[np.uint8]:
     """
     return np.array(Image.open(BytesIO(png)))
 
+class Screenshot:
+    """An encoded page screenshot with a lazily decoded array.
+
+    The encoded bytes are sent as they are to the LLM and to the render
+    log. The array is only decoded when a consumer needs the pixels, e.g.,
+    `np.asarray(screenshot)` or `screenshot.array`.
+    """
+
+    def __init__(self, data: bytes, format: str = "png") -> None:
+        self.data = data
+        self.format = format  # png, jpeg or webp
+        self._array: npt.NDArray[np.uint8] | None = None
+
+    @classmethod
+    def from_image(
+        cls, image: Image.Image, format: str = "png", quality: int = 90
+    ) -> "Screenshot":
+        with BytesIO() as image_buffer:
+            if format == "png":
+                image.save(image_buffer, format="PNG")
+            else:
+                image.save(image_buffer, format=format.upper(), quality=quality)
+            return cls(image_buffer.getvalue(), format)
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def array(self) -> npt.NDArray[np.uint8]:
+        if self._array is None:
+            self._array = np.array(Image.open(BytesIO(self.data)))
+        return self._array
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.array.shape
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> npt.NDArray[Any]:
+        return np.asarray(self.array, dtype=dtype)
+
+    def to_image(self) -> Image.Image:
+        return Image.open(BytesIO(self.data))
+
+    def to_b64(self) -> str:
+        """Data URL of the encoded bytes"""
+        img_b64 = base64.b64encode(self.data).decode("utf-8")
+        return f"data:{self.mime_type};base64,{img_b64}"
+
+
 def pil_to_byte_string(pil_image):
     """Converts a PIL Image to a byte string (JPEG format)."""
     byte_stream = io.BytesIO()
@@ -39,7 +89,10 @@ def pil_to_byte_string(pil_image):
     return byte_stream.getvalue()
   
     
-def pil_to_b64(img: Image.Image) -> str:
+def pil_to_b64(img: Image.Image | Screenshot) -> str:
+    if isinstance(img, Screenshot):
+        # already encoded by the browser
+        return img.to_b64()
     with BytesIO() as image_buffer:
         img.save(image_buffer, format="PNG")
         byte_data = image_buffer.getvalue()
@@ -48,7 +101,9 @@ def pil_to_b64(img: Image.Image) -> str:
     return img_b64
 
 
-def pil_to_vertex(img: Image.Image) -> str:
+def pil_to_vertex(img: Image.Image | Screenshot) -> str:
+    if isinstance(img, Screenshot):
+        return VertexImage.from_bytes(img.data)
     with BytesIO() as image_buffer:
         img.save(image_buffer, format="PNG")
         byte_data = image_buffer.getvalue()
@@ -98,14 +153,14 @@ class BrowserConfig(TypedDict):
 
 
 class BrowserInfo(TypedDict):
-    DOMTree: dict[str, Any]
+    DOMTree: dict[str, Any] | None  # None if the snapshot is skipped
     config: BrowserConfig
 
 
 AccessibilityTree = list[AccessibilityTreeNode]
 DOMTree = list[DOMNode]
 
-Observation = str | npt.NDArray[np.uint8]
+Observation = str | npt.NDArray[np.uint8] | Screenshot
 
 
 class StateInfo(TypedDict):
@@ -97,12 +97,41 @@ def config() -> argparse.Namespace:
         action="store_true",
         help="Only use the current viewport for the observation",
     )
+    parser.add_argument(
+        "--bounds_mode",
+        choices=["client_rect", "snapshot"],
+        default="client_rect",
+        help="Get element bounds with one CDP call per node (client_rect) or from the DOM snapshot in a single call (snapshot)",
+    )
+    parser.add_argument(
+        "--screenshot_format",
+        choices=["array", "png", "jpeg", "webp"],
+        default="array",
+        help="Decode screenshots into arrays (array), or keep the encoded browser screenshot and reuse it for the prompt and the render log (png, jpeg, webp)",
+    )
+    parser.add_argument(
+        "--accessibility_tree_mode",
+        choices=["full", "incremental"],
+        default="full",
+        help="Fetch the whole accessibility tree on every step (full), or keep it in sync with DOM and accessibility events and only refetch the changed nodes (incremental)",
+    )
+    parser.add_argument(
+        "--reuse_browser",
+        action="store_true",
+        help="Keep one Chromium process across tasks and only open a new browser context on each reset",
+    )
     parser.add_argument("--viewport_width", type=int, default=1280)
     parser.add_argument("--viewport_height", type=int, default=2048)
     parser.add_argument("--save_trace_enabled", action="store_true")
     parser.add_argument("--sleep_after_execution", type=float, default=0.0)
 
     parser.add_argument("--max_steps", type=int, default=30)
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=4,
+        help="Number of browser environments run at the same time by run_parallel.py",
+    )
 
     # agent config
     parser.add_argument("--agent_type", type=str, default="prompt")
@@ -315,6 +344,10 @@ def test(
         },
         save_trace_enabled=args.save_trace_enabled,
         sleep_after_execution=args.sleep_after_execution,
+        bounds_mode=args.bounds_mode,
+        screenshot_format=args.screenshot_format,
+        reuse_browser=args.reuse_browser,
+        accessibility_tree_mode=args.accessibility_tree_mode,
         # NOTE: captioning_fn here is used for LLM + captioning baselines.
         # This can be different from the captioning model used for evals.
         captioning_fn=caption_image_fn,
@@ -362,6 +395,7 @@ def test(
             agent.reset(config_file)
             trajectory: Trajectory = []
             obs, info = env.reset(options={"config_file": config_file})
+            logger.info(f"[Setup time]: {env.setup_time:.2f}s")
             state_info: StateInfo = {"observation": obs, "info": info}
             trajectory.append(state_info)
 
@@ -0,0 +1,284 @@
+"""Run the end-to-end evaluation with several browser environments at once.
+
+Each worker owns an `AsyncScriptBrowserEnv` and a prompt agent, and pulls
+task config files from a shared queue, so at most `--num_workers` browser
+contexts are alive at the same time. LLM calls run in a thread, which lets
+the event loop drive the other browsers while a worker waits for the model.
+Results are written in the same layout as `run.py`: one render_{task_id}.html
+per task in `--result_dir`, the error.txt file and the [Result] log lines.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import tempfile
+import traceback
+from pathlib import Path
+from typing import Any
+
+import openai
+
+from agent import PromptAgent, construct_agent
+from browser_env import (
+    ActionTypes,
+    AsyncScriptBrowserEnv,
+    StateInfo,
+    Trajectory,
+    create_stop_action,
+)
+from browser_env.auto_login import get_site_comb_from_filepath
+from browser_env.helper_functions import (
+    RenderHelper,
+    get_action_description,
+)
+from evaluation_harness import evaluator_router
+from evaluation_harness.helper_functions import PseudoPage
+from run import (
+    config,
+    dump_config,
+    early_stop,
+    get_unfinished,
+    logger,
+    prepare,
+)
+
+
+class SyncPage(PseudoPage):
+    """Synchronous view of an async page for the evaluators.
+
+    The evaluators run in a worker thread and every call that returns an
+    awaitable is scheduled on the event loop that owns the page.
+    """
+
+    def __init__(self, original_page: Any, loop: asyncio.AbstractEventLoop):
+        self.original_page = original_page
+        self.loop = loop
+
+    @property
+    def url(self) -> str:  # type: ignore[override]
+        return self.original_page.url
+
+    def _wrap(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        if type(value).__module__.startswith("playwright.async_api"):
+            return SyncPage(value, self.loop)
+        return value
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self.original_page, attr)
+        if not callable(value):
+            return self._wrap(value)
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            result = value(*args, **kwargs)
+            if inspect.isawaitable(result):
+
+                async def wait() -> Any:
+                    return await result
+
+                result = asyncio.run_coroutine_threadsafe(
+                    wait(), self.loop
+                ).result()
+            return self._wrap(result)
+
+        return call
+
+
+async def renew_cookie(config_file: str) -> str:
+    """Log in again for the sites of the task and return the updated
+    config file, see `run.test`"""
+    with open(config_file) as f:
+        _c = json.load(f)
+    if not _c["storage_state"]:
+        return config_file
+
+    cookie_file_name = os.path.basename(_c["storage_state"])
+    comb = get_site_comb_from_filepath(cookie_file_name)
+    temp_dir = tempfile.mkdtemp()
+    # subprocess to renew the cookie
+    process = await asyncio.create_subprocess_exec(
+        "python",
+        "browser_env/auto_login.py",
+        "--auth_folder",
+        temp_dir,
+        "--site_list",
+        *comb,
+    )
+    await process.wait()
+    _c["storage_state"] = f"{temp_dir}/{cookie_file_name}"
+    assert os.path.exists(_c["storage_state"])
+    # update the config file
+    config_file = f"{temp_dir}/{os.path.basename(config_file)}"
+    with open(config_file, "w") as f:
+        json.dump(_c, f)
+    return config_file
+
+
+def make_state_info(obs: Any, info: dict[str, Any]) -> StateInfo:
+    return {"web_observation": obs, "web_info": info, "environment": "Web"}
+
+
+async def run_task(
+    args: argparse.Namespace,
+    agent: Any,
+    env: AsyncScriptBrowserEnv,
+    config_file: str,
+) -> float:
+    max_steps = args.max_steps
+    early_stop_thresholds = {
+        "parsing_failure": args.parsing_failure_th,
+        "repeating_action": args.repeating_action_failure_th,
+    }
+    render_helper = RenderHelper(
+        config_file, args.result_dir, args.action_set_tag
+    )
+    try:
+        with open(config_file) as f:
+            intent = json.load(f)["intent"]
+        config_file = await renew_cookie(config_file)
+
+        logger.info(f"[Config file]: {config_file}")
+        logger.info(f"[Intent]: {intent}")
+
+        agent.reset(config_file)
+        trajectory: Trajectory = []
+        obs, info = await env.areset(options={"config_file": config_file})
+        state_info = make_state_info(obs, info)
+        trajectory.append(state_info)
+
+        meta_data = {"action_history": ["None"]}
+        while True:
+            early_stop_flag, stop_info = early_stop(
+                trajectory, max_steps, early_stop_thresholds
+            )
+
+            if early_stop_flag:
+                action = create_stop_action(f"Early stop: {stop_info}")
+            else:
+                try:
+                    action = await asyncio.to_thread(
+                        agent.next_action,
+                        trajectory,
+                        intent,
+                        environment="Web",
+                        meta_data=meta_data,
+                    )
+                except ValueError as e:
+                    # get the error message
+                    action = create_stop_action(f"ERROR: {str(e)}")
+
+            trajectory.append(action)
+
+            action_str = get_action_description(
+                action,
+                state_info["web_info"]["observation_metadata"],
+                action_set_tag=args.action_set_tag,
+                prompt_constructor=agent.prompt_constructor
+                if isinstance(agent, PromptAgent)
+                else None,
+            )
+            render_helper.render(
+                action, state_info, meta_data, args.render_screenshot
+            )
+            meta_data["action_history"].append(action_str)
+
+            if action["action_type"] == ActionTypes.STOP:
+                break
+
+            obs, _, terminated, _, info = await env.astep(action)
+            state_info = make_state_info(obs, info)
+            trajectory.append(state_info)
+
+            if terminated:
+                # add a action place holder
+                trajectory.append(create_stop_action(""))
+                break
+
+        evaluator = evaluator_router(config_file)
+        score = await asyncio.to_thread(
+            evaluator,
+            trajectory=trajectory,
+            config_file=config_file,
+            page=SyncPage(env.page, asyncio.get_running_loop()),
+        )
+
+        if score == 1:
+            logger.info(f"[Result] (PASS) {config_file}")
+        else:
+            logger.info(f"[Result] (FAIL) {config_file}")
+        return score
+    finally:
+        render_helper.close()
+
+
+async def worker(
+    args: argparse.Namespace,
+    queue: asyncio.Queue[str],
+    scores: list[float],
+) -> None:
+    agent = construct_agent(args)
+    env = AsyncScriptBrowserEnv(
+        headless=not args.render,
+        slow_mo=args.slow_mo,
+        observation_type=args.observation_type,
+        current_viewport_only=args.current_viewport_only,
+        viewport_size={
+            "width": args.viewport_width,
+            "height": args.viewport_height,
+        },
+        sleep_after_execution=args.sleep_after_execution,
+        bounds_mode=args.bounds_mode,
+        screenshot_format=args.screenshot_format,
+    )
+    while not queue.empty():
+        config_file = queue.get_nowait()
+        try:
+            scores.append(await run_task(args, agent, env, config_file))
+        except openai.OpenAIError as e:
+            logger.info(f"[OpenAI Error] {repr(e)}")
+        except Exception as e:
+            logger.info(f"[Unhandled Error] {repr(e)}]")
+            # write to error file
+            with open(Path(args.result_dir) / "error.txt", "a") as f:
+                f.write(f"[Config file]: {config_file}\n")
+                f.write(f"[Unhandled Error] {repr(e)}\n")
+                f.write(traceback.format_exc())  # write stack trace to file
+    await env.aclose()
+
+
+async def test(args: argparse.Namespace, config_file_list: list[str]) -> None:
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for config_file in config_file_list:
+        queue.put_nowait(config_file)
+    scores: list[float] = []
+    num_workers = min(args.num_workers, len(config_file_list))
+    await asyncio.gather(
+        *[worker(args, queue, scores) for _ in range(num_workers)]
+    )
+    if len(scores):
+        logger.info(f"Average score: {sum(scores) / len(scores)}")
+
+
+if __name__ == "__main__":
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    args = config()
+    args.sleep_after_execution = 2.5
+    prepare(args)
+
+    test_file_list = []
+    for i in range(args.test_start_idx, args.test_end_idx):
+        test_file_list.append(
+            os.path.join(args.test_config_base_dir, f"{i}.json")
+        )
+    test_file_list = get_unfinished(test_file_list, args.result_dir)
+    print(f"Total {len(test_file_list)} tasks left")
+    args.render = False
+    args.render_screenshot = True
+
+    args.current_viewport_only = True
+    dump_config(args)
+
+    asyncio.run(test(args, test_file_list))
@@ -0,0 +1,126 @@
+"""Benchmark the per-node CDP bounds against the batched DOM snapshot bounds.
+
+Loads saved pages (e.g., `page.content()` dumps or the html of a render
+log), builds the text observation with both bounds modes and reports the
+per-observation latency and the largest deviation of `union_bound`.
+
+Example:
+
+    python scripts/benchmark_bounds.py --pages "saved_pages/*.html"
+"""
+
+import argparse
+import glob
+import time
+from pathlib import Path
+
+from playwright.sync_api import sync_playwright
+
+from browser_env.processors import TextObervationProcessor
+
+
+def config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--pages", type=str, required=True, help="Glob of saved html pages"
+    )
+    parser.add_argument(
+        "--observation_type",
+        choices=["accessibility_tree", "html"],
+        default="accessibility_tree",
+    )
+    parser.add_argument("--current_viewport_only", action="store_true")
+    parser.add_argument("--viewport_width", type=int, default=1280)
+    parser.add_argument("--viewport_height", type=int, default=720)
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+def fetch_tree(
+    processor: TextObervationProcessor, page, current_viewport_only: bool
+) -> list[dict]:
+    info = processor.fetch_browser_info(page)
+    if processor.observation_type == "html":
+        return processor.fetch_page_html(info, page, current_viewport_only)
+    return processor.fetch_page_accessibility_tree(
+        page, info, current_viewport_only
+    )
+
+
+def max_bound_diff(tree_a: list[dict], tree_b: list[dict]) -> tuple[float, int]:
+    """Largest absolute coordinate difference and number of nodes whose
+    bounds disagree on being available at all"""
+    bounds_b = {node["nodeId"]: node["union_bound"] for node in tree_b}
+    max_diff, mismatches = 0.0, 0
+    for node in tree_a:
+        bound_a = node["union_bound"]
+        bound_b = bounds_b.get(node["nodeId"])
+        if bound_a is None or bound_b is None:
+            mismatches += int(bound_a is not bound_b)
+            continue
+        max_diff = max(
+            max_diff, max(abs(a - b) for a, b in zip(bound_a, bound_b))
+        )
+    return max_diff, mismatches
+
+
+def main() -> None:
+    args = config()
+    viewport_size = {"width": args.viewport_width, "height": args.viewport_height}
+    processors = {
+        mode: TextObervationProcessor(
+            args.observation_type,
+            args.current_viewport_only,
+            viewport_size,
+            bounds_mode=mode,
+        )
+        for mode in ["client_rect", "snapshot"]
+    }
+    page_files = sorted(glob.glob(args.pages))
+    speedups = []
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        context = browser.new_context(
+            viewport=viewport_size, device_scale_factor=1
+        )
+        page = context.new_page()
+        for page_file in page_files:
+            page.goto(Path(page_file).resolve().as_uri())
+            client = page.context.new_cdp_session(page)
+            client.send("Accessibility.enable")
+
+            latency = {}
+            trees = {}
+            for mode, processor in processors.items():
+                start = time.perf_counter()
+                for _ in range(args.repeats):
+                    trees[mode] = fetch_tree(
+                        processor, page, args.current_viewport_only
+                    )
+                latency[mode] = (time.perf_counter() - start) / args.repeats
+            client.detach()
+
+            max_diff, mismatches = max_bound_diff(
+                trees["client_rect"], trees["snapshot"]
+            )
+            speedup = latency["client_rect"] / latency["snapshot"]
+            speedups.append(speedup)
+            print(
+                f"{page_file}: nodes={len(trees['client_rect'])} "
+                f"client_rect={latency['client_rect'] * 1000:.1f}ms "
+                f"snapshot={latency['snapshot'] * 1000:.1f}ms "
+                f"speedup={speedup:.1f}x "
+                f"max_diff={max_diff:.2f}px mismatches={mismatches}"
+            )
+        browser.close()
+
+    if speedups:
+        print(
+            f"Mean per-observation speedup over {len(speedups)} pages: "
+            f"{sum(speedups) / len(speedups):.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
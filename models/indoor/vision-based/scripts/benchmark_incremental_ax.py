@@ -0,0 +1,123 @@
+"""Benchmark the incremental accessibility tree against the full fetch.
+
+Replays recorded trajectories, e.g., shopping and map tasks, and after every
+step builds the text observation with both accessibility tree modes on the
+same page. Reports the per-observation latency, the cache hit rate of the
+incremental mode and the number of observations that differ from the full
+fetch.
+
+A trajectory file is a JSON object with the task config file and the actions
+in the id based format, as printed in the render logs:
+
+    {"config_file": "config_files/test_shopping/0.json",
+     "actions": ["scroll [down]", "type [1580] [shoes] [1]", "click [2030]"]}
+
+Example:
+
+    python scripts/benchmark_incremental_ax.py --trajectories "trajectories/*.json"
+"""
+
+import argparse
+import glob
+import json
+import statistics
+import time
+
+from browser_env import ScriptBrowserEnv, create_id_based_action
+from browser_env.processors import TextObervationProcessor
+
+
+def config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--trajectories",
+        type=str,
+        required=True,
+        help="Glob of recorded trajectory files",
+    )
+    parser.add_argument("--current_viewport_only", action="store_true")
+    parser.add_argument("--viewport_width", type=int, default=1280)
+    parser.add_argument("--viewport_height", type=int, default=720)
+    parser.add_argument("--sleep_after_execution", type=float, default=2.5)
+    return parser.parse_args()
+
+
+def timed_process(
+    processor: TextObervationProcessor, page
+) -> tuple[str, float]:
+    start = time.perf_counter()
+    content = processor.process(page)
+    return content, time.perf_counter() - start
+
+
+def main() -> None:
+    args = config()
+    viewport_size = {"width": args.viewport_width, "height": args.viewport_height}
+    env = ScriptBrowserEnv(
+        headless=True,
+        observation_type="accessibility_tree",
+        current_viewport_only=args.current_viewport_only,
+        viewport_size=viewport_size,
+        sleep_after_execution=args.sleep_after_execution,
+    )
+    latency: dict[str, list[float]] = {"full": [], "incremental": []}
+    hits, misses, mismatches = 0, 0, 0
+
+    for trajectory_file in sorted(glob.glob(args.trajectories)):
+        with open(trajectory_file) as f:
+            trajectory = json.load(f)
+        processors = {
+            mode: TextObervationProcessor(
+                "accessibility_tree",
+                args.current_viewport_only,
+                viewport_size,
+                accessibility_tree_mode=mode,
+            )
+            for mode in ["full", "incremental"]
+        }
+        env.reset(options={"config_file": trajectory["config_file"]})
+        trajectory_latency: dict[str, list[float]] = {
+            "full": [],
+            "incremental": [],
+        }
+        trajectory_mismatches = 0
+        for action_str in [None] + trajectory["actions"]:
+            if action_str is not None:
+                env.step(create_id_based_action(action_str))
+            contents = {}
+            for mode, processor in processors.items():
+                contents[mode], duration = timed_process(processor, env.page)
+                trajectory_latency[mode].append(duration)
+            trajectory_mismatches += int(
+                contents["full"] != contents["incremental"]
+            )
+
+        stats = processors["incremental"].accessibility_tree_tracker.stats
+        hits += stats["hits"]
+        misses += stats["misses"]
+        mismatches += trajectory_mismatches
+        for mode in latency:
+            latency[mode].extend(trajectory_latency[mode])
+        print(
+            f"{trajectory_file}: steps={len(trajectory_latency['full'])} "
+            f"full={statistics.median(trajectory_latency['full']) * 1000:.1f}ms "
+            f"incremental={statistics.median(trajectory_latency['incremental']) * 1000:.1f}ms "
+            f"hit_rate={stats['hits'] / (stats['hits'] + stats['misses']):.2f} "
+            f"patched_nodes={stats['patched_nodes']} "
+            f"mismatches={trajectory_mismatches}"
+        )
+    env.close()
+
+    if latency["full"]:
+        saved = sum(latency["full"]) - sum(latency["incremental"])
+        print(
+            f"Hit rate over {hits + misses} observations: "
+            f"{hits / (hits + misses):.2f}, "
+            f"latency saved: {saved / len(latency['full']) * 1000:.1f}ms "
+            f"per observation ({saved:.1f}s total), "
+            f"mismatches: {mismatches}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+import asyncio
+import copy
+import io
+import random
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from browser_env import ScriptBrowserEnv, Screenshot
+from browser_env.constants import IN_VIEWPORT_RATIO_THRESHOLD
+from browser_env.processors import (
+    ImageObservationProcessor,
+    LabelGrid,
+    ObservationHandler,
+    TextObervationProcessor,
+)
+from browser_env.utils import pil_to_b64
+
+HTML = """
+<html>
+  <body style="margin: 0">
+    <h1 style="height: 40px; margin: 0">Title</h1>
+    <button style="position: absolute; left: 30px; top: 60px; width: 80px; height: 20px">Click</button>
+    <a href="#" style="display: none">Hidden</a>
+    <div style="height: 3000px"><p>Far below</p></div>
+  </body>
+</html>
+"""
+
+WIDE_HTML = """
+<html>
+  <body style="margin: 0">
+    <ul>
+      %s
+    </ul>
+  </body>
+</html>
+""" % "\n".join(
+    f'<li style="height: 20px"><a href="#{i}">Product {i}</a></li>'
+    for i in range(2000)
+)
+
+
+def make_browser_info() -> dict:
+    """A minimal DOMSnapshot of
+    <html><body><!-- c --><p>text</p><span hidden></span></body></html>
+    """
+    return {
+        "DOMTree": {
+            "strings": [
+                "#document",
+                "HTML",
+                "BODY",
+                "#comment",
+                "P",
+                "#text",
+                "SPAN",
+                "text",
+                "hidden",
+                "",
+            ],
+            "documents": [
+                {
+                    "nodes": {
+                        # document, html, body, comment, p, text, hidden span
+                        "backendNodeId": [1, 2, 3, 4, 5, 6, 7],
+                        "nodeType": [9, 1, 1, 8, 1, 3, 1],
+                        "parentIndex": [-1, 0, 1, 2, 2, 4, 2],
+                        "nodeName": [0, 1, 2, 3, 4, 5, 6],
+                        "nodeValue": [-1, -1, -1, 9, -1, 7, -1],
+                        "attributes": [[], [], [], [], [], [], [8, 9]],
+                    },
+                    "layout": {
+                        "nodeIndex": [0, 1, 2, 4, 5],
+                        "bounds": [
+                            [0, 0, 1280, 3000],
+                            [0, 0, 1280, 3000],
+                            [8, 8, 1264, 2984],
+                            [8, 108, 200, 20],
+                            [8, 110, 50, 16],
+                        ],
+                    },
+                }
+            ],
+        },
+        "config": {
+            "win_upper_bound": 100,
+            "win_left_bound": 0,
+            "win_width": 1280,
+            "win_height": 720,
+            "win_right_bound": 1280,
+            "win_lower_bound": 820,
+            "device_pixel_ratio": 1.0,
+        },
+    }
+
+
+def test_get_snapshot_bounds() -> None:
+    bounds = TextObervationProcessor.get_snapshot_bounds(make_browser_info())
+    # non element / text nodes have no client rect
+    assert bounds[1] is None
+    assert bounds[4] is None
+    # bounds are shifted into the viewport
+    assert bounds[3] == [8, -92, 1264, 2984]
+    assert bounds[5] == [8, 8, 200, 20]
+    assert bounds[6] == [8, 10, 50, 16]
+    # no layout object, e.g., display: none
+    assert bounds[7] == [0.0, 0.0, 0.0, 0.0]
+
+
+def test_get_snapshot_bounds_array() -> None:
+    bounds = TextObervationProcessor.get_snapshot_bounds_array(
+        make_browser_info()
+    )
+    assert bounds.shape == (7, 4)
+    assert np.isnan(bounds[[0, 3]]).all()
+    assert np.array_equal(bounds[4], [8, 8, 200, 20])
+    assert np.array_equal(bounds[6], [0, 0, 0, 0])
+
+
+def test_get_in_viewport_mask() -> None:
+    config = make_browser_info()["config"]
+    bounds = np.array(
+        [
+            [0, 0, 100, 100],  # inside
+            [0, 800, 100, 100],  # below the viewport
+            [10, 10, 0, 20],  # empty
+            [np.nan] * 4,  # no bound
+        ]
+    )
+    mask = TextObervationProcessor.get_in_viewport_mask(bounds, config)
+    assert mask.tolist() == [True, False, False, False]
+    for bound, keep in zip(bounds[:2], mask):
+        ratio = TextObervationProcessor.get_element_in_viewport_ratio(
+            *bound, config=config
+        )
+        assert keep == (ratio >= IN_VIEWPORT_RATIO_THRESHOLD)
+
+
+def test_fetch_page_html_from_snapshot() -> None:
+    processor = TextObervationProcessor(
+        "html",
+        current_viewport_only=True,
+        viewport_size={"width": 1280, "height": 720},
+        bounds_mode="snapshot",
+    )
+    # no page: the snapshot mode must not make any CDP call
+    dom_tree = processor.fetch_page_html(
+        make_browser_info(), page=None, current_viewport_only=True
+    )
+    # the comment and the hidden span are dropped
+    assert [node["nodeName"] for node in dom_tree] == [
+        "#document",
+        "HTML",
+        "BODY",
+        "P",
+        "#text",
+    ]
+    assert dom_tree[2]["childIds"] == ["4"]
+    html, obs_nodes_info = processor.parse_html(dom_tree)
+    assert html == "[4] <#text> text\n"
+    assert obs_nodes_info["4"]["union_bound"] == [8, 10, 50, 16]
+
+
+def test_afetch_page_html_matches_sync() -> None:
+    processor = TextObervationProcessor(
+        "html",
+        current_viewport_only=True,
+        viewport_size={"width": 1280, "height": 720},
+        bounds_mode="snapshot",
+    )
+    for current_viewport_only in [False, True]:
+        expected = processor.fetch_page_html(
+            make_browser_info(), None, current_viewport_only
+        )
+        actual = asyncio.run(
+            processor.afetch_page_html(
+                make_browser_info(), None, current_viewport_only
+            )
+        )
+        assert actual == expected
+
+
+class RecordingPage:
+    """Records the CDP and evaluate round trips of a blank page"""
+
+    url = "about:blank"
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        page = self
+
+        class Client:
+            def send(self, method: str, params: Any = None) -> Any:
+                page.calls.append(method)
+                return make_browser_info()["DOMTree"]
+
+            def detach(self) -> None:
+                pass
+
+        class Context:
+            pages = [self]
+
+            def new_cdp_session(self, page: Any) -> Client:
+                return Client()
+
+        self.context = Context()
+
+    def title(self) -> str:
+        return ""
+
+    def wait_for_load_state(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def screenshot(self) -> bytes:
+        with io.BytesIO() as f:
+            Image.new("RGB", (1280, 720)).save(f, format="PNG")
+            return f.getvalue()
+
+    def evaluate(self, script: str) -> dict[str, float]:
+        self.calls.append("evaluate")
+        config = make_browser_info()["config"]
+        return {
+            key: config[key]
+            for key in [
+                "win_upper_bound",
+                "win_left_bound",
+                "win_width",
+                "win_height",
+                "device_pixel_ratio",
+            ]
+        }
+
+
+def test_browser_info_is_fetched_once_per_step() -> None:
+    handler = ObservationHandler(
+        "text",
+        "html",
+        "",
+        current_viewport_only=True,
+        viewport_size={"width": 1280, "height": 720},
+        bounds_mode="snapshot",
+    )
+    page = RecordingPage()
+    obs = handler.get_observation(page)  # type: ignore[arg-type]
+    assert obs["text"].endswith("[4] <#text> text\n")
+    # the image processor reuses the config of the text processor
+    assert page.calls == ["DOMSnapshot.captureSnapshot", "evaluate"]
+
+    # the cache only lives for one step
+    handler.text_processor.fetch_browser_info(page, with_dom_tree=False)
+    assert page.calls[2:] == ["evaluate"]
+    # processors that only need the config skip the snapshot
+    handler.text_processor.observation_type = ""
+    handler.get_observation(page)  # type: ignore[arg-type]
+    assert page.calls[3:] == ["evaluate"]
+
+
+def make_ax_node(
+    node_id: int, role: str, name: str, child_ids: list[int]
+) -> dict[str, Any]:
+    return {
+        "nodeId": str(node_id),
+        "backendDOMNodeId": node_id,
+        "role": {"value": role},
+        "name": {"value": name},
+        "childIds": [str(child_id) for child_id in child_ids],
+    }
+
+
+class EventPage:
+    """A page with a scripted accessibility tree that emits CDP events"""
+
+    url = "about:blank"
+
+    def __init__(self, nodes: list[dict[str, Any]]) -> None:
+        self.nodes = nodes
+        self.calls: list[str] = []
+        self.handlers: dict[str, list[Any]] = {}
+        page = self
+
+        class Client:
+            def on(self, event: str, handler: Any) -> None:
+                page.handlers.setdefault(event, []).append(handler)
+
+            def send(self, method: str, params: Any = None) -> Any:
+                page.calls.append(method)
+                if method == "Accessibility.getFullAXTree":
+                    return {"nodes": copy.deepcopy(page.nodes)}
+                if method == "Accessibility.getPartialAXTree":
+                    backend_node_id = params["backendNodeId"]
+                    return {
+                        "nodes": [
+                            copy.deepcopy(node)
+                            for node in page.nodes
+                            if node["backendDOMNodeId"] == backend_node_id
+                        ]
+                    }
+                if method == "DOM.getDocument":
+                    # DOM nodeId = backendNodeId + 10
+                    children = [
+                        {
+                            "nodeId": node["backendDOMNodeId"] + 10,
+                            "backendNodeId": node["backendDOMNodeId"],
+                        }
+                        for node in page.nodes[1:]
+                    ]
+                    root = {"nodeId": 11, "backendNodeId": 1}
+                    return {"root": dict(root, children=children)}
+                if method == "Runtime.evaluate":
+                    # nothing is focused
+                    return {"result": {"type": "object", "subtype": "null"}}
+                return {}
+
+            def detach(self) -> None:
+                pass
+
+        class Context:
+            def new_cdp_session(self, page: Any) -> Client:
+                return Client()
+
+        self.context = Context()
+
+    def emit(self, event: str, params: dict[str, Any]) -> None:
+        for handler in self.handlers.get(event, []):
+            handler(params)
+
+
+def test_incremental_accessibility_tree() -> None:
+    page = EventPage(
+        [
+            make_ax_node(1, "RootWebArea", "Shop", [2, 3]),
+            make_ax_node(2, "button", "Add to cart", []),
+            make_ax_node(3, "StaticText", "Far below", []),
+        ]
+    )
+    processor = TextObervationProcessor(
+        "accessibility_tree",
+        current_viewport_only=False,
+        viewport_size={"width": 1280, "height": 720},
+        bounds_mode="snapshot",
+        accessibility_tree_mode="incremental",
+    )
+    info = make_browser_info()
+
+    def observe() -> str:
+        tree = processor.fetch_page_accessibility_tree(
+            page, info, current_viewport_only=False  # type: ignore[arg-type]
+        )
+        content, _ = processor.parse_accessibility_tree(
+            tree, processor.rendered_nodes
+        )
+        # the same text as without the cached lines
+        assert content == processor.parse_accessibility_tree(tree)[0]
+        return content
+
+    assert observe() == (
+        "[1] RootWebArea 'Shop'\n"
+        "\t[2] button 'Add to cart'\n"
+        "\t[3] StaticText 'Far below'"
+    )
+    tracker = processor.accessibility_tree_tracker
+    assert tracker is not None
+
+    # without events, e.g., after a scroll, the cached tree is reused
+    page.calls.clear()
+    observe()
+    assert "Accessibility.getFullAXTree" not in page.calls
+
+    # an attribute change only refetches the changed node
+    page.nodes[1]["name"]["value"] = "Added"
+    page.emit("DOM.attributeModified", {"nodeId": 12, "name": "class"})
+    page.calls.clear()
+    assert "\t[2] button 'Added'\n" in observe()
+    assert "Accessibility.getFullAXTree" not in page.calls
+    assert page.calls.count("Accessibility.getPartialAXTree") == 1
+    assert tracker.rendered_nodes["2"] == ("[2] button 'Added'", True)
+
+    # inserted nodes refetch the full tree
+    page.nodes[0]["childIds"].append("4")
+    page.nodes.append(make_ax_node(4, "link", "Checkout", []))
+    page.emit("DOM.childNodeInserted", {"parentNodeId": 11})
+    assert observe().endswith("\t[4] link 'Checkout'")
+    assert tracker.stats == {"hits": 2, "misses": 2, "patched_nodes": 1}
+
+
+def test_screenshot_keeps_encoded_bytes() -> None:
+    processor = ImageObservationProcessor(
+        "image", {"width": 1280, "height": 720}, screenshot_format="png"
+    )
+    page = RecordingPage()
+    screenshot, _ = processor.process(page)  # type: ignore[arg-type]
+    assert isinstance(screenshot, Screenshot)
+    assert screenshot.data == page.screenshot()
+    assert pil_to_b64(screenshot).startswith("data:image/png;base64,")
+    # the array is only decoded on demand
+    assert screenshot._array is None
+    assert np.asarray(screenshot).shape == (720, 1280, 3)
+
+
+def test_snapshot_bounds_match_client_rect(
+    accessibility_tree_script_browser_env: ScriptBrowserEnv,
+) -> None:
+    env = accessibility_tree_script_browser_env
+    env.reset()
+    env.page.set_content(HTML)
+    env.page.mouse.wheel(0, 50)
+    env.page.wait_for_timeout(100)
+
+    processor = env.observation_handler.text_processor
+    info = processor.fetch_browser_info(env.page)
+    trees = {}
+    for bounds_mode in ["client_rect", "snapshot"]:
+        processor.bounds_mode = bounds_mode
+        trees[bounds_mode] = processor.fetch_page_accessibility_tree(
+            env.page, info, current_viewport_only=False
+        )
+
+    assert len(trees["client_rect"]) == len(trees["snapshot"])
+    for expected, actual in zip(trees["client_rect"], trees["snapshot"]):
+        assert expected["nodeId"] == actual["nodeId"]
+        if expected["union_bound"] is None:
+            assert actual["union_bound"] is None
+        else:
+            assert np.allclose(
+                expected["union_bound"], actual["union_bound"], atol=1.0
+            )
+
+
+def remove_nodes_reference(
+    tree: list[dict[str, Any]], keep: list[bool]
+) -> list[dict[str, Any]]:
+    """The original one-node-at-a-time removal, kept as the reference for
+    `TextObervationProcessor.prune_tree`"""
+    nodeid_to_cursor = {node["nodeId"]: i for i, node in enumerate(tree)}
+    for node, keep_node in zip(tree, keep):
+        if keep_node:
+            continue
+        parent = tree[nodeid_to_cursor[node["parentId"]]]
+        index = parent["childIds"].index(node["nodeId"])
+        parent["childIds"][index : index + 1] = node["childIds"]
+        for child_id in node["childIds"]:
+            tree[nodeid_to_cursor[child_id]]["parentId"] = node["parentId"]
+        node["parentId"] = "[REMOVED]"
+    return [node for node in tree if node.get("parentId") != "[REMOVED]"]
+
+
+def make_random_tree(
+    n: int, seed: int, wide: bool
+) -> tuple[list[dict[str, Any]], list[bool]]:
+    rng = random.Random(seed)
+    tree = [{"nodeId": "0", "parentId": "-1", "childIds": []}]
+    for i in range(1, n):
+        # a wide tree hangs most nodes on a handful of parents
+        parent = rng.randrange(min(i, 5)) if wide else rng.randrange(i)
+        tree.append({"nodeId": str(i), "parentId": str(parent), "childIds": []})
+        tree[parent]["childIds"].append(str(i))
+    # the accessibility tree is not in pre-order
+    tree = tree[:1] + rng.sample(tree[1:], n - 1)
+    keep = [True] + [rng.random() < 0.3 for _ in range(n - 1)]
+    return tree, keep
+
+
+def test_prune_tree_matches_reference() -> None:
+    for seed in range(20):
+        tree, keep = make_random_tree(500, seed, wide=seed % 2 == 0)
+        expected = remove_nodes_reference(copy.deepcopy(tree), keep)
+        actual = TextObervationProcessor.prune_tree(
+            copy.deepcopy(tree), np.array(keep)
+        )
+        assert actual == expected
+
+
+def test_prune_tree_on_wide_page(
+    accessibility_tree_script_browser_env: ScriptBrowserEnv,
+) -> None:
+    env = accessibility_tree_script_browser_env
+    env.reset()
+    env.page.set_content(WIDE_HTML)
+    env.page.mouse.wheel(0, 20000)
+    env.page.wait_for_timeout(100)
+
+    processor = env.observation_handler.text_processor
+    info = processor.fetch_browser_info(env.page)
+    processor.observation_type = "html"
+    for tree in [
+        processor.fetch_page_accessibility_tree(
+            env.page, info, current_viewport_only=False
+        ),
+        processor.fetch_page_html(info, env.page, current_viewport_only=False),
+    ]:
+        bounds = np.array(
+            [node["union_bound"] or [np.nan] * 4 for node in tree]
+        ).reshape(-1, 4)
+        keep = processor.get_in_viewport_mask(bounds, info["config"])
+        expected = remove_nodes_reference(copy.deepcopy(tree), keep.tolist())
+        assert processor.prune_tree(tree, keep) == expected
+        # only a screenful of the list survives
+        assert 0 < len(expected) < len(tree) // 10
+
+
+def test_label_grid_matches_pairwise_overlap() -> None:
+    rng = random.Random(0)
+    grid = LabelGrid(padding=4)
+    placed: list[list[float]] = []
+    for _ in range(500):
+        x, y = rng.uniform(-50, 1300), rng.uniform(-50, 750)
+        rect = [x, y, x + rng.uniform(5, 40), y + 20]
+        expected = any(
+            ImageObservationProcessor.rectangles_overlap(rect, other, 4)
+            for other in placed
+        )
+        assert grid.overlaps(rect) == expected
+        grid.add(rect)
+        placed.append(rect)
+
+
+def test_draw_bounding_boxes() -> None:
+    processor = ImageObservationProcessor(
+        "image_som", {"width": 1280, "height": 720}
+    )
+    processor.browser_config = make_browser_info()["config"]
+    bboxes = {
+        "ID": [1, 2, 3, 4, 5],
+        "Element": ["A", "P", "BUTTON", "IMG", "A"],
+        # Top, Right, Bottom, Left, Width, Height
+        "Bounds": [
+            [110, 110, 130, 10, 100, 20],
+            [140, 210, 160, 10, 200, 20],
+            [140, 400, 170, 300, 100, 30],
+            [200, 104, 204, 100, 4, 4],
+            [1000, 110, 1020, 10, 100, 20],  # below the viewport
+        ],
+        "Alt": ["", "", "", "logo", ""],
+        "Class": ["", "", "", "", ""],
+        "Id": ["", "", "", "", ""],
+        "TextContent": ["  Home\n", "N/A", "Buy", "", "Far"],
+        "Interactable": [True, False, True, True, True],
+    }
+    screenshot = Image.new("RGB", (1280, 720), "white")
+    img, id2center, content_str = processor.draw_bounding_boxes(
+        bboxes,
+        screenshot,
+        viewport_size=processor.viewport_size,
+        bbox_color="red",
+    )
+    assert id2center == {
+        "1": (60.0, 20.0, 100.0, 20.0),
+        "2": (350.0, 55.0, 100.0, 30.0),
+        "3": (102.0, 102.0, 4.0, 4.0),
+    }
+    # the tiny image is numbered but neither drawn nor listed
+    assert content_str == "[1] [A] [Home]\n[2] [BUTTON] [Buy]"
+    assert img.size == screenshot.size and img != screenshot
@@ -290,3 +290,25 @@ def test_click_open_new_tab(
     )
     assert "heading 'Example Domain'" in obs["text"]
     assert "www.example.com" in info['page'].url
+
+
+def test_reuse_browser_across_resets() -> None:
+    env = ScriptBrowserEnv(
+        observation_type="accessibility_tree", reuse_browser=True
+    )
+    env.reset()
+    browser = env.browser
+    first_context = env.context
+    env.reset()
+    # same Chromium process, fresh context
+    assert env.browser is browser
+    assert env.context is not first_context
+    assert browser.contexts == [env.context]
+
+    # a crashed browser is relaunched on the next reset
+    browser.close()
+    obs, _ = env.reset()
+    assert env.browser is not browser
+    assert env.browser.is_connected()
+    assert "RootWebArea" in obs["text"]
+    env.close()
@@ -94,6 +94,8 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         save_trace_enabled: bool = False,
         sleep_after_execution: float = 0.0,
         captioning_fn=None,
+        bounds_mode: str = "client_rect",
+        reuse_browser: bool = False,
     ):
         # TODO: make Space[Action] = ActionSpace
         self.action_space = get_action_space()  # type: ignore[assignment]
@@ -104,6 +106,11 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         self.viewport_size = viewport_size
         self.save_trace_enabled = save_trace_enabled
         self.sleep_after_execution = sleep_after_execution
+        # keep one Playwright driver and Chromium process across resets and
+        # only open a fresh browser context per episode
+        self.reuse_browser = reuse_browser
+        self.browser_launched = False
+        self.setup_time = 0.0
 
         match observation_type:
             case "html" | "accessibility_tree" | "accessibility_tree_with_captioner":
@@ -130,19 +137,56 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             self.current_viewport_only,
             self.viewport_size,
             captioning_fn,
+            bounds_mode,
         )
 
         self.observation_space = (
             self.observation_handler.get_observation_space()
         )
 
-    @beartype
-    def setup(self, config_file: Path | None = None) -> None:
+    def launch_browser(self) -> None:
+        """Start Playwright and Chromium. With `reuse_browser`, the running
+        browser is kept and only relaunched after it crashed."""
+        if self.reuse_browser and self.browser_launched:
+            if self.browser.is_connected():
+                return
+            print("Browser disconnected, relaunching.")
+            try:
+                self.browser = self.playwright.chromium.launch(
+                    headless=self.headless, slow_mo=self.slow_mo
+                )
+                return
+            except Exception:
+                # the Playwright driver went down with the browser
+                self.stop_browser()
+
         self.context_manager = sync_playwright()
         self.playwright = self.context_manager.__enter__()
         self.browser = self.playwright.chromium.launch(
             headless=self.headless, slow_mo=self.slow_mo
         )
+        self.browser_launched = True
+
+    def stop_browser(self) -> None:
+        if not self.browser_launched:
+            return
+        try:
+            self.context_manager.__exit__()
+        except Exception:
+            # e.g., the browser or the driver has already crashed
+            pass
+        self.browser_launched = False
+
+    def close_context(self) -> None:
+        try:
+            self.context.close()
+        except Exception:
+            # the context is gone together with a crashed browser
+            pass
+
+    @beartype
+    def setup(self, config_file: Path | None = None) -> None:
+        self.launch_browser()
 
         if config_file:
             with open(config_file, "r") as f:
@@ -238,7 +282,12 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         """
         super().reset(seed=seed, options=options)
         if self.reset_finished:
-            self.context_manager.__exit__()
+            if self.reuse_browser:
+                self.close_context()
+            else:
+                self.stop_browser()
+
+        start_time = time.perf_counter()
 
         if options is not None and "config_file" in options:
             config_file = Path(options["config_file"])
@@ -249,6 +298,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         else:
             self.setup()
         self.reset_finished = True
+        self.setup_time = time.perf_counter() - start_time
 
         self.page.wait_for_timeout(int(self.sleep_after_execution * 1000))
 
@@ -268,7 +318,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
 
     def close(self) -> None:
         if self.reset_finished:
-            self.context_manager.__exit__()
+            self.stop_browser()
 
     def step(
         self, action: Action
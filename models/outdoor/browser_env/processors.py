@@ -1,16 +1,17 @@
+import functools
 import json
+import math
 import pkgutil
 import re
 from collections import defaultdict
 from dataclasses import dataclass
-from io import BytesIO, StringIO
+from io import BytesIO
 from typing import Any, Optional, TypedDict, Union
 from urllib.parse import urljoin, urlparse
 
 import matplotlib.pyplot as plt
 import numpy as np
 import numpy.typing as npt
-import pandas as pd
 import playwright
 import requests
 from gymnasium import spaces
@@ -30,7 +31,6 @@ from browser_env.constants import (
 
 from .utils import (
     AccessibilityTree,
-    AccessibilityTreeNode,
     BrowserConfig,
     BrowserInfo,
     DOMNode,
@@ -50,6 +50,111 @@ def remove_unicode(input_string):
     return cleaned_string
 
 
+SNAPSHOT_PARAMS = {
+    "computedStyles": [],
+    "includeDOMRects": True,
+    "includePaintOrder": True,
+}
+
+# window config of the page, read in a single round trip
+BROWSER_CONFIG_SCRIPT = """() => ({
+    win_upper_bound: window.pageYOffset,
+    win_left_bound: window.pageXOffset,
+    win_width: window.screen.width,
+    win_height: window.screen.height,
+    device_pixel_ratio: window.devicePixelRatio,
+})"""
+
+
+def fetch_browser_info(
+    page: Page, viewport_size: ViewportSize, with_dom_tree: bool = True
+) -> BrowserInfo:
+    """Fetch the DOM snapshot and the window config of the page, the
+    snapshot is None if `with_dom_tree` is False"""
+    tree = None
+    if with_dom_tree:
+        # extract domtree
+        client = page.context.new_cdp_session(page)
+        tree = client.send("DOMSnapshot.captureSnapshot", SNAPSHOT_PARAMS)
+        client.detach()
+
+        # calibrate the bounds, in some cases, the bounds are scaled somehow
+        bounds = tree["documents"][0]["layout"]["bounds"]
+        b = bounds[0]
+        n = b[2] / viewport_size["width"]
+        bounds = [[x / n for x in bound] for bound in bounds]
+        tree["documents"][0]["layout"]["bounds"] = bounds
+        # add union bound placeholder
+        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
+
+    # extract browser info
+    window = page.evaluate(BROWSER_CONFIG_SCRIPT)
+    win_upper_bound = window["win_upper_bound"]
+    win_left_bound = window["win_left_bound"]
+    win_width = window["win_width"]
+    win_height = window["win_height"]
+    win_right_bound = win_left_bound + win_width
+    win_lower_bound = win_upper_bound + win_height
+    device_pixel_ratio = window["device_pixel_ratio"]
+    assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
+
+    config: BrowserConfig = {
+        "win_upper_bound": win_upper_bound,
+        "win_left_bound": win_left_bound,
+        "win_width": win_width,
+        "win_height": win_height,
+        "win_right_bound": win_right_bound,
+        "win_lower_bound": win_lower_bound,
+        "device_pixel_ratio": device_pixel_ratio,
+    }
+
+    # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
+    info: BrowserInfo = {"DOMTree": tree, "config": config}
+
+    return info
+
+
+class BrowserInfoCache:
+    """Browser info of the current step, shared by the processors of an
+    `ObservationHandler` so that the page is probed once per step.
+
+    Outside of a step (`start_step` ... `end_step`) every fetch goes to the
+    page. An entry without the DOM snapshot is refetched when a processor
+    asks for the snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.active = False
+        self.page: Page | None = None
+        self.info: BrowserInfo | None = None
+
+    def start_step(self) -> None:
+        self.active = True
+        self.page = None
+        self.info = None
+
+    def end_step(self) -> None:
+        self.active = False
+        self.page = None
+        self.info = None
+
+    def fetch(
+        self, page: Page, viewport_size: ViewportSize, with_dom_tree: bool
+    ) -> BrowserInfo:
+        if (
+            self.active
+            and self.info is not None
+            and self.page is page
+            and (self.info["DOMTree"] is not None or not with_dom_tree)
+        ):
+            return self.info
+        info = fetch_browser_info(page, viewport_size, with_dom_tree)
+        if self.active:
+            self.page = page
+            self.info = info
+        return info
+
+
 class ObservationProcessor:
     def process(self, page: Page) -> Observation:
         raise NotImplementedError
@@ -87,10 +192,18 @@ class TextObervationProcessor(ObservationProcessor):
         current_viewport_only: bool,
         viewport_size: ViewportSize,
         captioning_fn=None,
+        bounds_mode: str = "client_rect",
     ):
         self.observation_type = observation_type
         self.current_viewport_only = current_viewport_only
         self.viewport_size = viewport_size
+        # "client_rect": query getBoundingClientRect per node over CDP
+        # "snapshot": reuse the layout bounds of the DOM snapshot
+        if bounds_mode not in ["client_rect", "snapshot"]:
+            raise ValueError(f"Invalid bounds mode: {bounds_mode}")
+        self.bounds_mode = bounds_mode
+        # shared with the other processors by `ObservationHandler`
+        self.browser_info_cache: BrowserInfoCache | None = None
         self.observation_tag = "text"
         self.meta_data = (
             create_empty_metadata()
@@ -104,55 +217,28 @@ class TextObervationProcessor(ObservationProcessor):
             # Cache captions.
             self.url2caption = {}
 
+    @property
+    def needs_dom_tree(self) -> bool:
+        """Whether the observation is built from the DOM snapshot"""
+        if self.observation_type == "html":
+            return True
+        if self.observation_type in [
+            "accessibility_tree",
+            "accessibility_tree_with_captioner",
+        ]:
+            return self.bounds_mode == "snapshot"
+        return False
+
     def fetch_browser_info(
         self,
         page: Page,
+        with_dom_tree: bool = True,
     ) -> BrowserInfo:
-        # extract domtree
-        client = page.context.new_cdp_session(page)
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
-        )
-        client.detach()
-
-        # calibrate the bounds, in some cases, the bounds are scaled somehow
-        bounds = tree["documents"][0]["layout"]["bounds"]
-        b = bounds[0]
-        n = b[2] / self.viewport_size["width"]
-        bounds = [[x / n for x in bound] for bound in bounds]
-        tree["documents"][0]["layout"]["bounds"] = bounds
-        # add union bound placeholder
-        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
-
-        # extract browser info
-        win_upper_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
-        win_right_bound = win_left_bound + win_width
-        win_lower_bound = win_upper_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
-        assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
-
-        config: BrowserConfig = {
-            "win_upper_bound": win_upper_bound,
-            "win_left_bound": win_left_bound,
-            "win_width": win_width,
-            "win_height": win_height,
-            "win_right_bound": win_right_bound,
-            "win_lower_bound": win_lower_bound,
-            "device_pixel_ratio": device_pixel_ratio,
-        }
-
-        # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
-        info: BrowserInfo = {"DOMTree": tree, "config": config}
-
-        return info
+        if self.browser_info_cache is not None:
+            return self.browser_info_cache.fetch(
+                page, self.viewport_size, with_dom_tree
+            )
+        return fetch_browser_info(page, self.viewport_size, with_dom_tree)
     
     @staticmethod
     def get_bounding_client_rect(
@@ -187,6 +273,51 @@ class TextObervationProcessor(ObservationProcessor):
         except Exception as e:
             return {"result": {"subtype": "error"}}
 
+    @staticmethod
+    def get_snapshot_bounds_array(info: BrowserInfo) -> npt.NDArray[np.float64]:
+        """Batched alternative to `get_bounding_client_rect`.
+
+        Join the layout arrays of the DOM snapshot to the node indices and
+        return an (n_nodes, 4) array with the same viewport-relative
+        [x, y, width, height] that getBoundingClientRect would return.
+        Rows are NaN for nodes that getBoundingClientRect cannot handle
+        (document, comments, doctype) and zero for nodes without a layout
+        object (e.g., display: none).
+        """
+        document = info["DOMTree"]["documents"][0]
+        layout = document["layout"]
+        config = info["config"]
+
+        # only elements (1) and text nodes (3) have client rects
+        node_types = np.asarray(document["nodes"]["nodeType"])
+        has_rect = (node_types == 1) | (node_types == 3)
+        node_bounds = np.full((len(node_types), 4), np.nan)
+        node_bounds[has_rect] = 0.0
+
+        layout_node_index = np.asarray(layout["nodeIndex"], dtype=np.int64)
+        layout_bounds = np.asarray(layout["bounds"], dtype=np.float64).reshape(
+            -1, 4
+        )
+        keep = has_rect[layout_node_index]
+        layout_node_index = layout_node_index[keep]
+        layout_bounds = layout_bounds[keep]
+        # the snapshot bounds are absolute, client rects are relative to the viewport
+        layout_bounds[:, 0] -= config["win_left_bound"]
+        layout_bounds[:, 1] -= config["win_upper_bound"]
+        node_bounds[layout_node_index] = layout_bounds
+        return node_bounds
+
+    @staticmethod
+    def get_snapshot_bounds(info: BrowserInfo) -> dict[int, list[float] | None]:
+        """`get_snapshot_bounds_array` keyed by backend node id, None for
+        nodes without a client rect"""
+        backend_node_ids = info["DOMTree"]["documents"][0]["nodes"]["backendNodeId"]
+        node_bounds = TextObervationProcessor.get_snapshot_bounds_array(info)
+        return {
+            backend_node_id: None if math.isnan(bound[0]) else bound
+            for backend_node_id, bound in zip(backend_node_ids, node_bounds.tolist())
+        }
+
     @staticmethod
     def get_element_in_viewport_ratio(
         elem_left_bound: float,
@@ -218,6 +349,68 @@ class TextObervationProcessor(ObservationProcessor):
         ratio = overlap_width * overlap_height / width * height
         return ratio
 
+    @staticmethod
+    def get_in_viewport_mask(
+        bounds: npt.NDArray[np.float64],
+        config: BrowserConfig,
+    ) -> npt.NDArray[np.bool_]:
+        """Vectorized viewport check over an (n, 4) array of [x, y, width, height].
+
+        A row is kept if it is visible (non-zero size) and its
+        `get_element_in_viewport_ratio` reaches IN_VIEWPORT_RATIO_THRESHOLD.
+        NaN rows (no bound) are never kept.
+        """
+        x, y, width, height = bounds.T
+        overlap_width = np.maximum(
+            0, np.minimum(x + width, config["win_width"]) - np.maximum(x, 0)
+        )
+        overlap_height = np.maximum(
+            0, np.minimum(y + height, config["win_height"]) - np.maximum(y, 0)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # same formula as get_element_in_viewport_ratio
+            ratio = overlap_width * overlap_height / width * height
+        visible = (width != 0) & (height != 0)
+        return visible & (ratio >= IN_VIEWPORT_RATIO_THRESHOLD)
+
+    @staticmethod
+    def prune_tree(
+        tree: list[dict[str, Any]],
+        keep: npt.NDArray[np.bool_],
+    ) -> list[dict[str, Any]]:
+        """Remove the nodes that are not kept from a DOM or accessibility tree.
+
+        The children of a removed node are spliced into its closest kept
+        ancestor at the position of the removed node, so the output order is
+        unchanged. Every kept parent rebuilds its childIds once, which makes
+        the pass linear in the number of nodes even on very wide nodes.
+        """
+        nodeid_to_cursor = {node["nodeId"]: cursor for cursor, node in enumerate(tree)}
+
+        def splice_children(child_ids: list[str]) -> list[str]:
+            # depth-first expansion of the removed children, in order
+            kept_child_ids = []
+            stack = child_ids[::-1]
+            while stack:
+                child_id = stack.pop()
+                child_cursor = nodeid_to_cursor.get(child_id)
+                if child_cursor is None or keep[child_cursor]:
+                    kept_child_ids.append(child_id)
+                else:
+                    stack.extend(tree[child_cursor]["childIds"][::-1])
+            return kept_child_ids
+
+        pruned_tree = []
+        for node, keep_node in zip(tree, keep):
+            if not keep_node:
+                continue
+            node["childIds"] = splice_children(node["childIds"])
+            for child_id in node["childIds"]:
+                if child_id in nodeid_to_cursor:
+                    tree[nodeid_to_cursor[child_id]]["parentId"] = node["nodeId"]
+            pruned_tree.append(node)
+        return pruned_tree
+
     def fetch_page_html(
         self,
         info: BrowserInfo,
@@ -233,7 +426,18 @@ class TextObervationProcessor(ObservationProcessor):
         # make a dom tree that is easier to navigate
         dom_tree: DOMTree = []
         graph = defaultdict(list)
-        client = page.context.new_cdp_session(page)
+        if self.bounds_mode == "snapshot":
+            # no CDP call per node, the bounds come from the snapshot layout
+            node_bounds = self.get_snapshot_bounds_array(info)
+            # the root is always inside the viewport
+            is_root = np.asarray(nodes["parentIndex"]) == -1
+            node_bounds[is_root] = [0.0, 0.0, 10.0, 10.0]
+            union_bounds = [
+                None if math.isnan(bound[0]) else bound
+                for bound in node_bounds.tolist()
+            ]
+        else:
+            client = page.context.new_cdp_session(page)
         for node_idx in range(len(nodes["nodeName"])):
             cur_node: DOMNode = {
                 "nodeId": "",
@@ -283,6 +487,8 @@ class TextObervationProcessor(ObservationProcessor):
             # get the bound
             if cur_node["parentId"] == "-1":
                 cur_node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
+            elif self.bounds_mode == "snapshot":
+                cur_node["union_bound"] = union_bounds[node_idx]
             else:
                 response = self.get_bounding_client_rect(
                     client, cur_node["backendNodeId"]
@@ -298,64 +504,21 @@ class TextObervationProcessor(ObservationProcessor):
 
             dom_tree.append(cur_node)
 
-        client.detach()
+        if self.bounds_mode != "snapshot":
+            client.detach()
         # add parent children index to the node
         for parent_id, child_ids in graph.items():
             dom_tree[int(parent_id)]["childIds"] = child_ids
 
         # remove the nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: DOMNode) -> None:
-                # update the node information in the accessibility tree
-                node_id = node["nodeId"]
-                parent_id = node["parentId"]
-                child_ids = node["childIds"]
-
-                # update the children of the parent node
-                assert dom_tree[int(parent_id)]["parentId"] != "[REMOVED]"
-                # remove the nodeid from parent
-                index = dom_tree[int(parent_id)]["childIds"].index(node_id)
-                dom_tree[int(parent_id)]["childIds"].pop(index)
-
-                # Insert children_nodeids in the same location
-                for child_id in child_ids:
-                    dom_tree[int(parent_id)]["childIds"].insert(index, child_id)
-                    index += 1
-
-                # update children node's parent
-                for child_id in child_ids:
-                    dom_tree[int(child_id)]["parentId"] = parent_id
-                # mark as removed
-                dom_tree[int(node_id)]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for cursor, node in enumerate(dom_tree):
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0.0 or height == 0.0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            dom_tree = [
-                node for node in dom_tree if node.get("parentId", "-1") != "[REMOVED]"
-            ]
+            if self.bounds_mode != "snapshot":
+                node_bounds = np.array(
+                    [node["union_bound"] or [np.nan] * 4 for node in dom_tree],
+                    dtype=np.float64,
+                ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(node_bounds, info["config"])
+            dom_tree = self.prune_tree(dom_tree, in_viewport)
 
         return dom_tree
 
@@ -366,8 +529,9 @@ class TextObervationProcessor(ObservationProcessor):
         obs_nodes_info = {}
         nodeid_to_cursor = {node["nodeId"]: idx for idx, node in enumerate(dom_tree)}
 
-        def dfs(node_cursor: int, depth: int) -> str:
-            tree_str = ""
+        lines: list[str] = []
+
+        def dfs(node_cursor: int, depth: int) -> None:
             node = dom_tree[node_cursor]
             indent = "\t" * depth
             valid_node = True
@@ -384,7 +548,7 @@ class TextObervationProcessor(ObservationProcessor):
                         "union_bound": node["union_bound"],
                         "text": node_str,
                     }
-                    tree_str += f"{indent}{node_str}\n"
+                    lines.append(f"{indent}{node_str}\n")
 
             except Exception as e:
                 valid_node = False
@@ -392,12 +556,10 @@ class TextObervationProcessor(ObservationProcessor):
             for child_ids in node["childIds"]:
                 child_cursor = nodeid_to_cursor[child_ids]
                 child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(child_cursor, child_depth)
-                tree_str += child_str
-
-            return tree_str
+                dfs(child_cursor, child_depth)
 
-        html = dfs(0, 0)
+        dfs(0, 0)
+        html = "".join(lines)
         return html, obs_nodes_info
 
     def fetch_page_accessibility_tree(
@@ -420,9 +582,10 @@ class TextObervationProcessor(ObservationProcessor):
                 seen_ids.add(node["nodeId"])
         accessibility_tree = _accessibility_tree
 
-        nodeid_to_cursor = {}
-        for cursor, node in enumerate(accessibility_tree):
-            nodeid_to_cursor[node["nodeId"]] = cursor
+        if self.bounds_mode == "snapshot":
+            snapshot_bounds = self.get_snapshot_bounds(info)
+
+        for node in accessibility_tree:
             # usually because the node is not visible etc
             if "backendDOMNodeId" not in node:
                 node["union_bound"] = None
@@ -431,6 +594,10 @@ class TextObervationProcessor(ObservationProcessor):
             if node["role"]["value"] == "RootWebArea":
                 # always inside the viewport
                 node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
+            elif self.bounds_mode == "snapshot":
+                node["union_bound"] = snapshot_bounds.get(
+                    node["backendDOMNodeId"]
+                )
             else:
                 response = self.get_bounding_client_rect(
                     client,
@@ -448,64 +615,12 @@ class TextObervationProcessor(ObservationProcessor):
         client.detach()
         # filter nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: AccessibilityTreeNode) -> None:
-                # update the node information in the accessibility tree
-                nodeid = node["nodeId"]
-                node_cursor = nodeid_to_cursor[nodeid]
-                parent_nodeid = node["parentId"]
-                children_nodeids = node["childIds"]
-                parent_cursor = nodeid_to_cursor[parent_nodeid]
-                # update the children of the parent node
-                assert (
-                    accessibility_tree[parent_cursor].get("parentId", "Root")
-                    is not None
-                )
-                # remove the nodeid from parent's childIds
-                index = accessibility_tree[parent_cursor]["childIds"].index(nodeid)
-                accessibility_tree[parent_cursor]["childIds"].pop(index)
-                # Insert children_nodeids in the same location
-                for child_nodeid in children_nodeids:
-                    accessibility_tree[parent_cursor]["childIds"].insert(
-                        index, child_nodeid
-                    )
-                    index += 1
-                # update children node's parent
-                for child_nodeid in children_nodeids:
-                    child_cursor = nodeid_to_cursor[child_nodeid]
-                    accessibility_tree[child_cursor]["parentId"] = parent_nodeid
-                # mark as removed
-                accessibility_tree[node_cursor]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for node in accessibility_tree:
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0 or height == 0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            accessibility_tree = [
-                node
-                for node in accessibility_tree
-                if node.get("parentId", "Root") != "[REMOVED]"
-            ]
+            node_bounds = np.array(
+                [node["union_bound"] or [np.nan] * 4 for node in accessibility_tree],
+                dtype=np.float64,
+            ).reshape(-1, 4)
+            in_viewport = self.get_in_viewport_mask(node_bounds, info["config"])
+            accessibility_tree = self.prune_tree(accessibility_tree, in_viewport)
 
         return accessibility_tree
 
@@ -737,10 +852,10 @@ class TextObervationProcessor(ObservationProcessor):
             tab_title_str = " | ".join([f"Tab {idx}" for idx in range(len(open_tabs))])
 
         try:
-            browser_info = self.fetch_browser_info(page)
+            browser_info = self.fetch_browser_info(page, self.needs_dom_tree)
         except Exception:
             page.wait_for_load_state("load", timeout=500)
-            browser_info = self.fetch_browser_info(page)
+            browser_info = self.fetch_browser_info(page, self.needs_dom_tree)
 
         if self.observation_type == "html":
             dom_tree = self.fetch_page_html(
@@ -795,6 +910,90 @@ class TextObervationProcessor(ObservationProcessor):
         )
 
 
+# pandas.read_csv used to parse these values of the SoM payload as missing,
+# keep dropping them so that the SoM prompts do not change
+SOM_NA_VALUES = frozenset(
+    [
+        "",
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "-nan",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "None",
+        "n/a",
+        "nan",
+        "null",
+    ]
+)
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """Load a TTF font once per process"""
+    return ImageFont.truetype(font_path, font_size)
+
+
+def get_som_text(element: str, alt: str, text_content: str) -> str:
+    """Text of a SoM element in the prompt, the alt text of images and the
+    text content"""
+    content = ""
+    # Add image alt-text to the text representation.
+    if element == "IMG" and alt not in SOM_NA_VALUES:
+        content += alt
+    # Add HTML textContent (if any) to the text representation.
+    if text_content not in SOM_NA_VALUES:
+        # Limit to 200 characters to avoid having too much text
+        content += text_content.strip().replace("\n", "").replace("\t", "")[:200]
+    return content
+
+
+class LabelGrid:
+    """Uniform grid over the placed SoM labels.
+
+    A label is stored in every cell that a new label has to cover to
+    overlap with it, so an overlap test only compares the labels of the
+    cells under the new label instead of every label placed so far.
+    """
+
+    def __init__(self, padding: float, cell_size: float = 64.0) -> None:
+        self.padding = padding
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[list[float]]] = defaultdict(list)
+
+    def cell_range(self, low: float, high: float) -> range:
+        return range(
+            math.floor(low / self.cell_size), math.floor(high / self.cell_size) + 1
+        )
+
+    def add(self, rect: list[float]) -> None:
+        # the overlap test shrinks the placed label by the padding
+        x1, x2 = sorted([rect[0] + self.padding, rect[2] - self.padding])
+        y1, y2 = sorted([rect[1] + self.padding, rect[3] - self.padding])
+        for i in self.cell_range(x1, x2):
+            for j in self.cell_range(y1, y2):
+                self.cells[i, j].append(rect)
+
+    def overlaps(self, rect: list[float]) -> bool:
+        for i in self.cell_range(rect[0], rect[2]):
+            for j in self.cell_range(rect[1], rect[3]):
+                for other in self.cells.get((i, j), []):
+                    if ImageObservationProcessor.rectangles_overlap(
+                        rect, other, self.padding
+                    ):
+                        return True
+        return False
+
+
 class ImageObservationProcessor(ObservationProcessor):
     def __init__(
         self,
@@ -804,10 +1003,13 @@ class ImageObservationProcessor(ObservationProcessor):
         self.observation_type = observation_type
         self.observation_tag = "image"
         self.viewport_size = viewport_size
+        # shared with the other processors by `ObservationHandler`
+        self.browser_info_cache: BrowserInfoCache | None = None
         self.meta_data = create_empty_metadata()
 
-    def get_page_bboxes(self, page: Page) -> list[list[float]]:
-        """JavaScript code to return bounding boxes and other metadata from HTML elements."""
+    def get_page_bboxes(self, page: Page) -> dict[str, list[Any]]:
+        """Return bounding boxes and other metadata from HTML elements, one
+        list per column"""
         js_script = """
         (() => {
             const interactableSelectors = [
@@ -827,43 +1029,46 @@ class ImageObservationProcessor(ObservationProcessor):
             const elements = document.querySelectorAll(combinedSelectors.join(', '));
 
             const pixelRatio = window.devicePixelRatio;
-            let csvContent = "ID,Element,Top,Right,Bottom,Left,Width,Height,Alt,Class,Id,TextContent,Interactable\\n";
+            const bboxes = {
+                ID: [], Element: [], Bounds: [], Alt: [], Class: [], Id: [], TextContent: [], Interactable: []
+            };
             let counter = 1;
 
             elements.forEach(element => {
                 const rect = element.getBoundingClientRect();
                 if (rect.width === 0 || rect.height === 0) return;
-                let altText = element.getAttribute('alt') || '';
-                altText = altText.replace(/"/g, ''); // Escape double quotes in alt text
-                const classList = element.className || '';
-                const id = element.id || '';
-                let textContent = element.textContent || '';
-                textContent = textContent.replace(/"/g, ''); // Escape double quotes in textContent
+                // double quotes were dropped by the former CSV payload, keep the text as is
+                const altText = (element.getAttribute('alt') || '').replace(/"/g, '');
+                const textContent = (element.textContent || '').replace(/"/g, '');
 
                 // Determine if the element is interactable
                 const isInteractable = interactableSelectors.some(selector => element.matches(selector));
 
-                const dataString = [
-                    counter, element.tagName, (rect.top + window.scrollY) * pixelRatio,
-                    (rect.right + window.scrollX) * pixelRatio, (rect.bottom + window.scrollY) * pixelRatio,
-                    (rect.left + window.scrollX) * pixelRatio, rect.width * pixelRatio, rect.height * pixelRatio,
-                    altText, classList, id, textContent, isInteractable
-                ].map(value => `"${value}"`).join(",");
-
-                csvContent += dataString + "\\n";
+                bboxes.ID.push(counter);
+                bboxes.Element.push(element.tagName);
+                // Top, Right, Bottom, Left, Width, Height
+                bboxes.Bounds.push([
+                    (rect.top + window.scrollY) * pixelRatio, (rect.right + window.scrollX) * pixelRatio,
+                    (rect.bottom + window.scrollY) * pixelRatio, (rect.left + window.scrollX) * pixelRatio,
+                    rect.width * pixelRatio, rect.height * pixelRatio
+                ]);
+                bboxes.Alt.push(altText);
+                bboxes.Class.push(String(element.className || ''));
+                bboxes.Id.push(element.id || '');
+                bboxes.TextContent.push(textContent);
+                bboxes.Interactable.push(isInteractable);
                 counter++;
             });
 
-            return csvContent;
+            // a single string is cheaper to transfer than a nested object
+            return JSON.stringify(bboxes);
         })();
         """
-        # Save the bbox as a CSV
-        csv_content = page.evaluate(js_script)
-        return csv_content
+        return json.loads(page.evaluate(js_script))
 
     def draw_bounding_boxes(
         self,
-        data_string,
+        bboxes,
         screenshot_img,
         viewport_size=None,
         add_ids=True,
@@ -875,26 +1080,40 @@ class ImageObservationProcessor(ObservationProcessor):
         plot_ids=None,
     ):
         """
+        bboxes: The columns returned by `get_page_bboxes`.
         min_width and min_height: Minimum dimensions of the bounding box to be plotted.
         """
-        # Read CSV data
-        df = pd.read_csv(StringIO(data_string), delimiter=",", quotechar='"')
-        df["Area"] = df["Width"] * df["Height"]
+        bounds = np.asarray(bboxes["Bounds"], dtype=np.float64).reshape(-1, 6)
+        top, right, bottom, left, width, height = bounds.T
         # Remove bounding boxes that are clipped.
         b_x, b_y = (
             self.browser_config["win_left_bound"],
             self.browser_config["win_upper_bound"],
         )
+        keep = np.ones(len(bounds), dtype=bool)
         if viewport_size is not None:
-            df = df[
-                (df["Bottom"] - b_y >= 0)
-                & (df["Top"] - b_y <= viewport_size["height"])
-                & (df["Right"] - b_x >= 0)
-                & (df["Left"] - b_x <= viewport_size["width"])
-            ]
+            keep = (
+                (bottom - b_y >= 0)
+                & (top - b_y <= viewport_size["height"])
+                & (right - b_x >= 0)
+                & (left - b_x <= viewport_size["width"])
+            )
             viewport_area = viewport_size["width"] * viewport_size["height"]
             # Filter out bounding boxes that too large (more than 80% of the viewport)
-            df = df[df["Area"] <= 0.8 * viewport_area]
+            keep &= width * height <= 0.8 * viewport_area
+        rows = np.flatnonzero(keep)
+
+        interactable = np.asarray(bboxes["Interactable"], dtype=bool)[rows]
+        # the labelled boxes are numbered in page order
+        labelled = interactable.copy()
+        if plot_ids is not None:
+            labelled &= np.array(
+                [bboxes["ID"][row] in plot_ids for row in rows], dtype=bool
+            )
+        left, right = left[rows] - b_x, right[rows] - b_x
+        top, bottom = top[rows] - b_y, bottom[rows] - b_y
+        width, height = width[rows], height[rows]
+        drawn = labelled & (width >= min_width) & (height >= min_height)
 
         # Open the screenshot image
         img = screenshot_img.copy()
@@ -903,188 +1122,143 @@ class ImageObservationProcessor(ObservationProcessor):
         # Load a TTF font with a larger size
         font_path = "media/SourceCodePro-SemiBold.ttf"
         font_size, padding = 16, 2
-        font = ImageFont.truetype(font_path, font_size)
+        font = load_font(font_path, font_size)
+
+        if add_ids:
+            unique_ids = np.cumsum(labelled)
+            text_width = np.array(
+                [
+                    draw.textlength(str(unique_id), font=font) if is_drawn else 0.0
+                    for unique_id, is_drawn in zip(unique_ids, drawn)
+                ]
+            )
+            text_height = font_size  # Assume the text is one line
+            # Calculate the possible text positions, in the order they are tried
+            right_label = right - font_size - 2 * padding
+            text_x = np.stack(
+                [
+                    left - font_size,  # Top-left corner
+                    left,  # A little to the right of the top-left corner
+                    right,  # Top-right corner
+                    right_label,  # A little to the left of the top-right corner
+                    left - font_size,  # Bottom-left corner
+                    left,  # A little to the right of the bottom-left corner
+                    right_label,  # A little to the left of the bottom-right corner
+                    left,  # A little to the right of the bottom-left corner
+                    right_label,  # A little to the left of the bottom-right corner
+                ],
+                axis=1,
+            )
+            text_y = np.stack([top - font_size] * 4 + [bottom] * 5, axis=1)
+            text_rectangles = np.stack(
+                [
+                    text_x - padding,
+                    text_y - padding,
+                    text_x + text_width[:, None] + padding,
+                    text_y + text_height + padding,
+                ],
+                axis=2,
+            )
+            if viewport_size is not None:
+                # Check if the text rectangles are within the viewport
+                in_viewport = (
+                    (text_rectangles[..., 0] >= 0)
+                    & (text_rectangles[..., 1] >= 0)
+                    & (text_rectangles[..., 2] <= viewport_size["width"])
+                    & (text_rectangles[..., 3] <= viewport_size["height"])
+                )
 
         # Create a color cycle using one of the categorical color palettes in matplotlib
         color_cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
-        bbox_id2visid = {}
-        bbox_id2desc = {}
         index = 0
         id2center = {}
-        existing_text_rectangles = []
+        existing_text_rectangles = LabelGrid(padding * 2)
         text_to_draw = []
         # Provide [id] textContent inputs to the model as text.
         text_content_elements = []
         text_content_text = set()  # Store text of interactable elements
+        element_count = defaultdict(int)  # count of each element string
 
-        # Iterate through each row in the CSV and draw bounding boxes
-        for _, row in df.iterrows():
-            if not row["Interactable"]:
-                content = ""
-                # Add image alt-text to the text representation.
-                if row["Element"] == "IMG" and pd.notna(row["Alt"]):
-                    content += row["Alt"]
-                # Add HTML textContent (if any) to the text representation.
-                if pd.notna(row["TextContent"]):
-                    content += (
-                        row["TextContent"].strip().replace("\n", "").replace("\t", "")
-                    )[
-                        :200
-                    ]  # Limit to 200 characters to avoid having too much text
-
+        for i, row in enumerate(rows.tolist()):
+            content = get_som_text(
+                bboxes["Element"][row], bboxes["Alt"][row], bboxes["TextContent"][row]
+            )
+            if not interactable[i]:
                 # Check if the text is a CSS selector
                 if content and not (content.startswith(".") and "{" in content):
                     # Add elements which are not interactable as StaticText
                     if content not in text_content_text:
-                        text_content_elements.append(f"[] [StaticText] [{content}]")
+                        element = f"[] [StaticText] [{content}]"
+                        text_content_elements.append(element)
+                        element_count[element.strip()] += 1
                         text_content_text.add(content)
                 continue
 
-            if (plot_ids is not None) and (row["ID"] not in plot_ids):
+            if not labelled[i]:
                 continue
 
             unique_id = str(index + 1)
-            bbox_id2visid[row["ID"]] = (
-                unique_id  # map the bounding box ID to the unique character ID
-            )
-            top, right, bottom, left, width, height = (
-                row["Top"],
-                row["Right"],
-                row["Bottom"],
-                row["Left"],
-                row["Width"],
-                row["Height"],
-            )
-            left, right, top, bottom = left - b_x, right - b_x, top - b_y, bottom - b_y
             id2center[unique_id] = (
-                (left + right) / 2,
-                (bottom + top) / 2,
-                width,
-                height,
+                float((left[i] + right[i]) / 2),
+                float((bottom[i] + top[i]) / 2),
+                float(width[i]),
+                float(height[i]),
             )
 
-            if width >= min_width and height >= min_height:
+            if drawn[i]:
                 # Get the next color in the cycle
                 color = bbox_color or color_cycle[index % len(color_cycle)]
                 draw.rectangle(
                     [
-                        left - bbox_padding,
-                        top - bbox_padding,
-                        right + bbox_padding,
-                        bottom + bbox_padding,
+                        left[i] - bbox_padding,
+                        top[i] - bbox_padding,
+                        right[i] + bbox_padding,
+                        bottom[i] + bbox_padding,
                     ],
                     outline=color,
                     width=bbox_border,
                 )
-                bbox_id2desc[row["ID"]] = color
 
                 # Draw the text on top of the rectangle
                 if add_ids:
-                    # Calculate list of possible text positions
-                    text_positions = [
-                        (left - font_size, top - font_size),  # Top-left corner
-                        (
-                            left,
-                            top - font_size,
-                        ),  # A little to the right of the top-left corner
-                        (right, top - font_size),  # Top-right corner
-                        (
-                            right - font_size - 2 * padding,
-                            top - font_size,
-                        ),  # A little to the left of the top-right corner
-                        (left - font_size, bottom),  # Bottom-left corner
-                        (
-                            left,
-                            bottom,
-                        ),  # A little to the right of the bottom-left corner
-                        (
-                            right - font_size - 2 * padding,
-                            bottom,
-                        ),  # A little to the left of the bottom-right corner
-                        (
-                            left,
-                            bottom,
-                        ),  # A little to the right of the bottom-left corner
-                        (
-                            right - font_size - 2 * padding,
-                            bottom,
-                        ),  # A little to the left of the bottom-right corner
-                    ]
-                    text_width = draw.textlength(unique_id, font=font)
-                    text_height = font_size  # Assume the text is one line
-
                     if viewport_size is not None:
-                        for text_position in text_positions:
-                            new_text_rectangle = [
-                                text_position[0] - padding,
-                                text_position[1] - padding,
-                                text_position[0] + text_width + padding,
-                                text_position[1] + text_height + padding,
-                            ]
-
-                            # Check if the new text rectangle is within the viewport
-                            if (
-                                new_text_rectangle[0] >= 0
-                                and new_text_rectangle[1] >= 0
-                                and new_text_rectangle[2] <= viewport_size["width"]
-                                and new_text_rectangle[3] <= viewport_size["height"]
+                        # take the first position in the viewport that does not
+                        # overlap with a placed label, else the last position
+                        for k in range(text_rectangles.shape[1]):
+                            new_text_rectangle = text_rectangles[i, k].tolist()
+                            if in_viewport[
+                                i, k
+                            ] and not existing_text_rectangles.overlaps(
+                                new_text_rectangle
                             ):
-                                # If the rectangle is within the viewport, check for overlaps
-                                overlaps = False
-                                for existing_rectangle in existing_text_rectangles:
-                                    if self.rectangles_overlap(
-                                        new_text_rectangle,
-                                        existing_rectangle,
-                                        padding * 2,
-                                    ):
-                                        overlaps = True
-                                        break
-
-                                if not overlaps:
-                                    break
-                            else:
-                                # If the rectangle is outside the viewport, try the next position
-                                continue
+                                break
+                        text_position = (text_x[i, k], text_y[i, k])
                     else:
                         # If none of the corners work, move the text rectangle by a fixed amount
-                        text_position = (
-                            text_positions[0][0] + padding,
-                            text_positions[0][1],
-                        )
+                        text_position = (text_x[i, 0] + padding, text_y[i, 0])
                         new_text_rectangle = [
                             text_position[0] - padding,
                             text_position[1] - padding,
-                            text_position[0] + text_width + padding,
+                            text_position[0] + text_width[i] + padding,
                             text_position[1] + text_height + padding,
                         ]
 
-                    existing_text_rectangles.append(new_text_rectangle)
+                    existing_text_rectangles.add(new_text_rectangle)
                     text_to_draw.append(
                         (new_text_rectangle, text_position, unique_id, color)
                     )
 
-                    content = ""
-                    if row["Element"] == "IMG" and pd.notna(row["Alt"]):
-                        content += row["Alt"]
-                    if pd.notna(row["TextContent"]):
-                        content += (
-                            row["TextContent"]
-                            .strip()
-                            .replace("\n", "")
-                            .replace("\t", "")
-                        )[
-                            :200
-                        ]  # Limit to 200 characters
-                    text_content_elements.append(
-                        f"[{unique_id}] [{row['Element']}] [{content}]"
-                    )
-                    if content in text_content_text:
+                    element = f"[{unique_id}] [{bboxes['Element'][row]}] [{content}]"
+                    text_content_elements.append(element)
+                    element_count[element.strip()] += 1
+                    if content in text_content_text and element_count[content]:
                         # Remove text_content_elements with content
                         text_content_elements = [
                             element
                             for element in text_content_elements
                             if element.strip() != content
                         ]
+                        element_count[content] = 0
                     text_content_text.add(content)
 
             index += 1
@@ -1097,7 +1271,8 @@ class ImageObservationProcessor(ObservationProcessor):
         content_str = "\n".join(text_content_elements)
         return img, id2center, content_str
 
-    def rectangles_overlap(self, rect1, rect2, padding):
+    @staticmethod
+    def rectangles_overlap(rect1, rect2, padding):
         """
         Check if two rectangles overlap.
         Each rectangle is represented as a list [x1, y1, x2, y2].
@@ -1156,50 +1331,12 @@ class ImageObservationProcessor(ObservationProcessor):
             return screenshot, ""
 
     def fetch_browser_info(self, page: Page) -> BrowserInfo:
-        client = page.context.new_cdp_session(page)
-        # extract domtree
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
-        )
-        client.detach()
-        # calibrate the bounds, in some cases, the bounds are scaled somehow
-        bounds = tree["documents"][0]["layout"]["bounds"]
-        b = bounds[0]
-        n = b[2] / self.viewport_size["width"]
-        bounds = [[x / n for x in bound] for bound in bounds]
-        tree["documents"][0]["layout"]["bounds"] = bounds
-        # add union bound placeholder
-        tree["documents"][0]["layout"]["unionBounds"] = [None for _ in bounds]
-
-        # extract browser info
-        win_upper_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
-        win_right_bound = win_left_bound + win_width
-        win_lower_bound = win_upper_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
-        assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
-
-        config: BrowserConfig = {
-            "win_upper_bound": win_upper_bound,
-            "win_left_bound": win_left_bound,
-            "win_width": win_width,
-            "win_height": win_height,
-            "win_right_bound": win_right_bound,
-            "win_lower_bound": win_lower_bound,
-            "device_pixel_ratio": device_pixel_ratio,
-        }
-
-        # assert len(tree['documents']) == 1, "More than one document in the DOM tree"
-        info: BrowserInfo = {"DOMTree": tree, "config": config}
-
-        return info
+        # only the window config is used, skip the DOM snapshot
+        if self.browser_info_cache is not None:
+            return self.browser_info_cache.fetch(
+                page, self.viewport_size, with_dom_tree=False
+            )
+        return fetch_browser_info(page, self.viewport_size, with_dom_tree=False)
 
     def get_element_center(self, element_id: str) -> tuple[float, float]:
         if not self.observation_type == "image_som":
@@ -1226,6 +1363,7 @@ class ObservationHandler:
         current_viewport_only: bool,
         viewport_size: ViewportSize,
         captioning_fn=None,
+        bounds_mode: str = "client_rect",
     ) -> None:
         self.main_observation_type = main_observation_type
         self.text_processor = TextObervationProcessor(
@@ -1233,11 +1371,16 @@ class ObservationHandler:
             current_viewport_only,
             viewport_size,
             captioning_fn,
+            bounds_mode,
         )
         self.image_processor = ImageObservationProcessor(
             image_observation_type, viewport_size
         )
         self.viewport_size = viewport_size
+        # both processors probe the same page in a step
+        self.browser_info_cache = BrowserInfoCache()
+        self.text_processor.browser_info_cache = self.browser_info_cache
+        self.image_processor.browser_info_cache = self.browser_info_cache
 
     def get_observation_space(self) -> spaces.Dict:
         text_space = spaces.Text(
@@ -1263,8 +1406,12 @@ class ObservationHandler:
         return spaces.Dict({"text": text_space, "image": image_space})
 
     def get_observation(self, page: Page) -> dict[str, Observation]:
-        text_obs = self.text_processor.process(page)
-        image_obs, content_str = self.image_processor.process(page)
+        self.browser_info_cache.start_step()
+        try:
+            text_obs = self.text_processor.process(page)
+            image_obs, content_str = self.image_processor.process(page)
+        finally:
+            self.browser_info_cache.end_step()
         if content_str != "":
             text_obs = content_str
         return {"text": text_obs, "image": image_obs}
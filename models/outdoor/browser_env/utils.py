@@ -91,7 +91,7 @@ class BrowserConfig(TypedDict):
 
 
 class BrowserInfo(TypedDict):
-    DOMTree: dict[str, Any]
+    DOMTree: dict[str, Any] | None  # None if the snapshot is skipped
     config: BrowserConfig
 
 
@@ -1,2 +1,8 @@
 from .task_construction import construct_navi_task
-from .task_env import NaviEnvConfig, NaviMap, NaviEnv
\ No newline at end of file
+from .task_env import NaviEnvConfig, NaviMap, NaviEnv
+from .street_view_store import StreetViewStore
+from .compiled_graph import CompiledGraph
+from .path_service import PathService
+from .spatial_index import PanoIndex
+from .ocr_cache import OCRCache
+from .map_render import OSMGraphCache, MapRenderer
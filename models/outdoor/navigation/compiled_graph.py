@@ -0,0 +1,212 @@
+import math
+import heapq
+from collections import deque
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000  # same as `utils.haversine`
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Vectorized `utils.haversine`, the great-circle distance in meters between arrays of points"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def parse_node_key(key):
+    """
+    Coordinates of a "<latitude>-<longitude>" node key, e.g., "40.7784-73.9551".
+    The longitude is negative (western hemisphere) as in the collected environments, NaN if the key cannot be parsed.
+    """
+    sep_index = key.find("-", 1)
+    try:
+        return float(key[:sep_index]), -float(key[sep_index + 1:])
+    except ValueError:
+        return math.nan, math.nan
+
+
+class CompiledGraph:
+    """
+    A navigation graph `{key: {"lat", "lng", "links": {neighbor_key: {"heading", "text", ...}}}}` compiled into arrays.
+
+    Nodes get integer ids in the order of their sorted keys, so that ties in the shortest path searches are broken
+    as with the keys. The links of node `i` are the edges `indptr[i]:indptr[i + 1]`, in the order of the links dict,
+    with the neighbor in `indices` and the precomputed length (haversine, meters) and heading of the edge.
+    Link targets missing from the graph are nodes without links (`in_graph` is False) and coordinates parsed from
+    their key.
+    """
+
+    ARRAYS = ["keys", "lat", "lng", "in_graph", "indptr", "indices", "edge_length", "edge_heading", "edge_text"]
+
+    def __init__(self, keys, lat, lng, in_graph, indptr, indices, edge_length, edge_heading, edge_text):
+        self.keys = [str(key) for key in keys]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.in_graph = np.asarray(in_graph, dtype=bool)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.edge_length = np.asarray(edge_length, dtype=np.float64)
+        self.edge_heading = np.asarray(edge_heading, dtype=np.float64)
+        self.edge_text = [str(text) for text in edge_text]
+        # plain lists for the scalar accesses of the search loops
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._edge_length = self.edge_length.tolist()
+        self._edge_heading = self.edge_heading.tolist()
+        self._in_graph = self.in_graph.tolist()
+
+    @classmethod
+    def from_graph(cls, graph):
+        keys = set(graph)
+        for node_meta in graph.values():
+            keys.update(node_meta["links"])
+        keys = sorted(keys)
+        index = {key: i for i, key in enumerate(keys)}
+
+        lat = np.empty(len(keys))
+        lng = np.empty(len(keys))
+        in_graph = np.zeros(len(keys), dtype=bool)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        indices, edge_heading, edge_text = [], [], []
+        for i, key in enumerate(keys):
+            if key in graph:
+                node_meta = graph[key]
+                lat[i], lng[i] = node_meta["lat"], node_meta["lng"]
+                in_graph[i] = True
+                for link_key, link_meta in node_meta["links"].items():
+                    indices.append(index[link_key])
+                    edge_heading.append(link_meta["heading"])
+                    edge_text.append(link_meta.get("text", ""))
+            else:
+                lat[i], lng[i] = parse_node_key(key)
+            indptr[i + 1] = len(indices)
+
+        indices = np.asarray(indices, dtype=np.int64)
+        sources = np.repeat(np.arange(len(keys)), np.diff(indptr))
+        edge_length = haversine_np(lat[sources], lng[sources], lat[indices], lng[indices])
+        return cls(keys, lat, lng, in_graph, indptr, indices, edge_length, edge_heading, edge_text)
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays["keys"] = np.asarray(self.keys, dtype=str)
+        arrays["edge_text"] = np.asarray(self.edge_text, dtype=str)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*[data[name] for name in cls.ARRAYS])
+
+    @classmethod
+    def load_or_compile(cls, graph, path):
+        """Load the compiled graph from `path` (.npz), or compile and save it if the file is missing or stale"""
+        try:
+            compiled_graph = cls.load(path)
+            if set(graph) <= set(compiled_graph.index) and int(compiled_graph.in_graph.sum()) == len(graph):
+                return compiled_graph
+        except (OSError, KeyError, ValueError):
+            pass
+        compiled_graph = cls.from_graph(graph)
+        compiled_graph.save(path)
+        return compiled_graph
+
+    def __len__(self):
+        return len(self.keys)
+
+    def edge_range(self, node):
+        return range(self._indptr[node], self._indptr[node + 1])
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def get_coord(self, key):
+        """lat/lng of a node, parsed from the key if it is not part of the graph"""
+        node = self.index.get(key)
+        if node is None:
+            return parse_node_key(key)
+        return float(self.lat[node]), float(self.lng[node])
+
+    def get_links(self, key):
+        """(neighbor key, length, heading, text) of every link of a node"""
+        return [
+            (self.keys[self._indices[edge]], self._edge_length[edge], self._edge_heading[edge], self.edge_text[edge])
+            for edge in self.edge_range(self.index[key])
+        ]
+
+    def get_path_keys(self, path):
+        return [self.keys[node] for node in path]
+
+    def dijkstra(self, start, target=None):
+        """
+        Dijkstra by edge length from the node id `start`.
+
+        Parameters:
+            target: node id, the search stops once its distance is final. All reachable nodes are expanded if None.
+        Returns:
+            distances: list of the distances by node id, inf if not reached
+            predecessors: dict of the previous node id on the shortest path of every reached node
+        """
+        indptr, indices, edge_length, in_graph = self._indptr, self._indices, self._edge_length, self._in_graph
+
+        distances = [math.inf] * len(self.keys)
+        distances[start] = 0
+        predecessors = {}
+        queue = [(0, start)]
+
+        while queue:
+            current_distance, current_node = heapq.heappop(queue)
+            if current_node == target:
+                break
+            if current_distance > distances[current_node]:
+                continue
+            for edge in range(indptr[current_node], indptr[current_node + 1]):
+                neighbor = indices[edge]
+                if not in_graph[neighbor]:
+                    continue
+                distance_through_current = current_distance + edge_length[edge]
+                if distance_through_current < distances[neighbor]:
+                    distances[neighbor] = distance_through_current
+                    predecessors[neighbor] = current_node
+                    heapq.heappush(queue, (distance_through_current, neighbor))
+
+        return distances, predecessors
+
+    def get_path(self, predecessors, start, target):
+        """Node keys of the path from `start` to `target` node ids along `predecessors`, None if unreachable"""
+        if target != start and target not in predecessors:
+            return None
+        path = [target]
+        while path[-1] != start:
+            path.append(predecessors[path[-1]])
+        return self.get_path_keys(path[::-1])
+
+    def dijkstra_shortest_path(self, start, target):
+        """Shortest path by edge length between two keys, see `utils.dijkstra_shortest_path`"""
+        start = self.index[start]
+        target = self.index[target]
+        _, predecessors = self.dijkstra(start, target)
+        return self.get_path(predecessors, start, target)
+
+    def bfs_shortest_path(self, start, target):
+        """Shortest path by number of edges between two keys, None if unreachable"""
+        start = self.index[start]
+        target = self.index[target]
+        indptr, indices, in_graph = self._indptr, self._indices, self._in_graph
+
+        parents = {start: start}
+        queue = deque([start])
+        while queue and target not in parents:
+            current_node = queue.popleft()
+            if not in_graph[current_node]:
+                continue
+            for edge in range(indptr[current_node], indptr[current_node + 1]):
+                neighbor = indices[edge]
+                if neighbor not in parents:
+                    parents[neighbor] = current_node
+                    queue.append(neighbor)
+
+        return self.get_path(parents, start, target)
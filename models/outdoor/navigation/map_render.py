@@ -0,0 +1,134 @@
+import io
+import os
+import math
+import threading
+
+import osmnx as ox
+import matplotlib.pyplot as plt
+from PIL import Image, ImageDraw
+
+# same as ox.utils_geo.bbox_from_point
+EARTH_RADIUS_M = 6_371_009
+
+
+def get_bbox(latitude, longitude, dist):
+    """(north, south, east, west) of the square of half side `dist` meters around a point"""
+    delta_lat = (dist / EARTH_RADIUS_M) / math.pi * 180
+    delta_lng = delta_lat / math.cos(math.radians(latitude))
+    return latitude + delta_lat, latitude - delta_lat, longitude + delta_lng, longitude - delta_lng
+
+
+class OSMGraphCache:
+    """
+    On-disk cache of the OSMnx graphs downloaded with `ox.graph_from_point`, keyed by network type and
+    bounding box (rounded to 1e-5 degrees, about 1m), as GraphML files in `cache_dir`.
+    Loaded graphs are also kept in memory, `get_graph` returns a copy that the caller may modify.
+    """
+
+    def __init__(self, cache_dir="navigation/data/osm_graphs"):
+        self.cache_dir = cache_dir
+        self.graphs = {}
+        self.lock = threading.Lock()
+        self.stats = {"memory_hit": 0, "disk_hit": 0, "miss": 0}
+
+    @staticmethod
+    def get_key(bbox, network_type):
+        return f"{network_type}_" + "_".join(f"{value:.5f}" for value in bbox)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.graphml")
+
+    def get_graph(self, latitude, longitude, dist, network_type="all"):
+        key = self.get_key(get_bbox(latitude, longitude, dist), network_type)
+        with self.lock:
+            if key in self.graphs:
+                self.stats["memory_hit"] += 1
+                return self.graphs[key].copy()
+
+        path = self.get_path(key)
+        if os.path.exists(path):
+            graph = ox.load_graphml(path)
+            stat = "disk_hit"
+        else:
+            graph = ox.graph_from_point((latitude, longitude), dist=dist, network_type=network_type)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            ox.save_graphml(graph, tmp_path)
+            os.replace(tmp_path, path)
+            stat = "miss"
+
+        with self.lock:
+            self.stats[stat] += 1
+            self.graphs[key] = graph
+        return graph.copy()
+
+
+class MapRenderer:
+    """
+    Map of an episode: the OSM streets with the shortest path (blue) and the target (green),
+    and the current position of the agent (red).
+
+    The base map is rasterized with `ox.plot_graph` once; every frame then only draws the marker
+    of the current position on a copy of it, at the pixel the figure transform maps it to.
+    """
+
+    def __init__(self, osm_graph, path_coordinates, target_coordinates, figsize=(6, 6), node_size=15):
+        self.osm_graph = osm_graph
+        self.path_coordinates = path_coordinates
+        self.target_coordinates = target_coordinates
+        self.figsize = figsize
+        self.node_size = node_size
+        self.base_image = None
+        self.transform = None
+        self.marker_radius = None
+
+    def get_marked_graph(self, current_coordinates=None):
+        """Copy of the OSM graph with the markers as nodes and their colors, as plotted by `NaviEnv.render`"""
+        graph = self.osm_graph.copy()
+        colors = {}
+        target_lat, target_lon = self.target_coordinates
+        graph.add_node(-2, x=target_lon, y=target_lat)
+        colors[-2] = "green"
+        for i, (lat, lon) in enumerate(self.path_coordinates):
+            graph.add_node(-3-i, x=lon, y=lat)
+            colors[-3-i] = "blue"
+        if current_coordinates is not None:
+            cur_lat, cur_lon = current_coordinates
+            graph.add_node(-1, x=cur_lon, y=cur_lat)
+            colors[-1] = "red"
+        return graph, [colors.get(node, "white") for node in graph.nodes()]
+
+    @staticmethod
+    def figure_to_image(fig):
+        with io.BytesIO() as buf:
+            fig.savefig(buf, format='png')
+            buf.seek(0)
+            return Image.open(buf).convert('RGB')
+
+    def plot(self, current_coordinates=None):
+        """Rasterize the whole map with matplotlib, the marker included if given"""
+        graph, node_colors = self.get_marked_graph(current_coordinates)
+        fig, ax = ox.plot_graph(graph, node_color=node_colors, node_size=self.node_size, figsize=self.figsize,
+                                show=False)
+        fig.tight_layout(pad=0)
+        # lng/lat to pixels of the saved image, origin at the top left
+        fig.canvas.draw()
+        to_display = ax.transData.transform
+        height = fig.canvas.get_width_height()[1]
+        self.transform = lambda lon, lat: (to_display((lon, lat))[0], height - to_display((lon, lat))[1])
+        # node_size is the marker area in points^2
+        self.marker_radius = math.sqrt(self.node_size) / 2 * fig.dpi / 72
+        image = self.figure_to_image(fig)
+        plt.close(fig)
+        return image
+
+    def render(self, current_coordinates):
+        """The map with the agent at `current_coordinates` (lat, lon)"""
+        if self.base_image is None:
+            self.base_image = self.plot()
+        image = self.base_image.copy()
+        cur_lat, cur_lon = current_coordinates
+        x, y = self.transform(cur_lon, cur_lat)
+        r = self.marker_radius
+        ImageDraw.Draw(image).ellipse([x - r, y - r, x + r, y + r], fill="red")
+        return image
@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import threading
+
+
+def hash_image(image_path):
+    """SHA-256 of the image file content"""
+    sha256 = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class OCRCache:
+    """
+    Persistent cache of the directions read from map screenshots, keyed by the image content hash and the model.
+
+    Every entry holds the OCR text, the parsed directions and the token usage of the OCR call, appended to the
+    JSONL file `cache_path` and shared by all runs, so repeated sweeps over the same screenshots skip the OCR calls.
+    """
+
+    def __init__(self, cache_path="navigation/data/ocr_cache.jsonl"):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.image_hashes = {}
+        self.stats = {"hit": 0, "miss": 0}
+        self.load_cache()
+
+    @staticmethod
+    def get_key(image_hash, model_name):
+        return f"{model_name}:{image_hash}"
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        with open(self.cache_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted run
+                    continue
+                self.entries[self.get_key(record["image_hash"], record["model_name"])] = record
+
+    def get_image_hash(self, image_path):
+        # keyed on the file state, so a screenshot overwritten in place is hashed again
+        stat = os.stat(image_path)
+        file_key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        if file_key not in self.image_hashes:
+            self.image_hashes[file_key] = hash_image(image_path)
+        return self.image_hashes[file_key]
+
+    def get(self, image_path, model_name):
+        """Cached entry {"text", "directions", "usage", ...} of a screenshot, None on a miss"""
+        key = self.get_key(self.get_image_hash(image_path), model_name)
+        with self.lock:
+            record = self.entries.get(key)
+            self.stats["hit" if record is not None else "miss"] += 1
+        return record
+
+    def put(self, image_path, model_name, text, directions, usage=None):
+        record = {
+            "image_hash": self.get_image_hash(image_path),
+            "model_name": model_name,
+            "image_path": image_path,
+            "text": text,
+            "directions": directions,
+            "usage": usage,
+        }
+        with self.lock:
+            self.entries[self.get_key(record["image_hash"], model_name)] = record
+            if self.cache_path is not None:
+                os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+                with open(self.cache_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def get_hit_rate(self):
+        total = self.stats["hit"] + self.stats["miss"]
+        return self.stats["hit"] / total if total else 0.0
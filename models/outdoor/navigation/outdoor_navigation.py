@@ -17,10 +17,15 @@ import re
 import os
 import math
 import logging
+from contextlib import nullcontext
 from tqdm import tqdm
 from pathlib import Path
 from prompt.outdoor_navigation import SYSTEM_MSG
-from models.outdoor.navigation.utils import calculate_cost, load_environments, compute_heading, get_initial_heading, add_task_ids, haversine, angular_diff, merge_json
+from models.outdoor.navigation.utils import calculate_cost, load_environments, compute_heading, get_initial_heading, haversine
+from models.outdoor.navigation.compiled_graph import CompiledGraph
+from models.outdoor.navigation.runner import RateLimiter, ClientPool, JsonlResultStream, run_environments
+from models.outdoor.navigation.ocr_cache import OCRCache
+from models.outdoor.navigation.scoring import score_neighbors, replay_heuristic
 
 logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -78,12 +83,15 @@ def fetch_streetview_images(lat, lng, google_api_key):
         time.sleep(0.1)
     return images
 
-def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  action_prompt='', is_ocr=False, image_path=None):
+def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  action_prompt='', is_ocr=False, image_path=None, vlm_client=None):
     """
     Send multimodal prompt (images + text + distance) to VLM and return chosen neighbor ID.
     Or unimodal text-only prompt.
     Or OCR processing.
+    The request is sent with `vlm_client`, e.g., a client of a `ClientPool`, or the module-level client if None.
     """
+    if vlm_client is None:
+        vlm_client = client
     if is_ocr:
         if 'gpt' or 'internvl' or 'qwen' in args.model_name:
             # Read image bytes
@@ -109,7 +117,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
                         },
                     ],
                 }
-            response = client.chat.completions.create(
+            response = vlm_client.chat.completions.create(
                 model=args.model_name,
                 messages=[system_msg, user_msg],
                 max_tokens=args.max_tokens,
@@ -133,7 +141,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
             # https://ai.google.dev/gemini-api/docs/image-understanding#multiple-images
             image_input = Image.open(image_path)
             text_input = "Please extract all the navigation directions text from the provided map screenshot. Return only the plain textual directions."
-            response = client.models.generate_content(
+            response = vlm_client.models.generate_content(
                 model=args.model_name,
                 contents=[image_input, text_input],
                 config=types.GenerateContentConfig(
@@ -163,7 +171,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
             user_content_all = [{"type": "text", "text": prompt_text + action_prompt + "\nChoose next node. Reply with exactly one node ID (lat-lng string) on a single line, with no additional commentary"}] + attachments
             user_msg = {"role": "user", "content": user_content_all}
 
-            response = client.chat.completions.create(
+            response = vlm_client.chat.completions.create(
                 model=args.model_name,
                 messages=[system_msg, user_msg],
                 # attachments=attachments
@@ -186,7 +194,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
             # https://ai.google.dev/gemini-api/docs/image-understanding#multiple-images
             image_input = Image.open("/path/to/organ.png") # TODO: replace with actual image input
             text_input = prompt_text + action_prompt + "\nChoose next node. Reply with exactly one node ID (lat-lng string) on a single line, with no additional commentary"
-            response = client.models.generate_content(
+            response = vlm_client.models.generate_content(
                 model=args.model_name,
                 contents=[image_input, text_input],
                 config=types.GenerateContentConfig(
@@ -209,7 +217,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
             # https://www.alibabacloud.com/help/zh/model-studio/use-qwen-by-calling-api
             system_msg = {"role": "system", "content": SYSTEM_MSG}
             user_msg = {"role": "user", "content": prompt_text + action_prompt + "\nChoose next node. Reply with exactly one node ID (lat-lng string) on a single line, with no additional commentary"}
-            response = client.chat.completions.create(
+            response = vlm_client.chat.completions.create(
                 model=args.model_name, # internvl2.5-latest, qwen-vl-plus
                 messages=[system_msg, user_msg],
                 max_tokens=args.max_tokens,
@@ -230,7 +238,7 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
             return choice, usage
         elif 'gemini' in args.model_name:
             # https://ai.google.dev/gemini-api/docs/text-generation#system-instructions
-                response = client.models.generate_content(
+                response = vlm_client.models.generate_content(
                     model=args.model_name,
                     contents=[prompt_text + action_prompt + "\nChoose next node. Reply with exactly one node ID (lat-lng string) on a single line, with no additional commentary"],
                     config=types.GenerateContentConfig(
@@ -246,11 +254,82 @@ def call_vlm_agent(args: argparse.Namespace, observations='', prompt_text='',  a
         else:
             raise ValueError(f"Unsupported model: {args.model_name}")
 
+def create_client(args: argparse.Namespace):
+    """Create the API client of `args.model_name`, the API keys in the environment take precedence over the arguments"""
+    if "gpt" in args.model_name:
+        if os.getenv('OPENAI_API_KEY'):
+            return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        else:
+            return OpenAI(api_key=args.openai_api_key)
+    elif "gemini" in args.model_name:
+        if os.getenv('GEMINI_API_KEY'):
+            return genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+        else:
+            return genai.Client(api_key=args.gemini_api_key)
+    elif "qwen" in args.model_name: # dashscope_api_key
+        if os.getenv('DASHSCOPE_API_KEY'):
+            return OpenAI(
+                api_key=os.getenv('DASHSCOPE_API_KEY'),
+                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            )
+        else:
+            return OpenAI(
+                api_key=args.dashscope_api_key,
+                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            )
+    elif "internvl" in args.model_name:
+        if os.getenv('INTERNVL_API_KEY'):
+            return OpenAI(
+                api_key=os.getenv('INTERNVL_API_KEY'),
+                base_url="https://chat.intern-ai.org.cn/api/v1/",
+            )
+        else:
+            return OpenAI(
+                api_key=args.internvl_api_key,
+                base_url="https://chat.intern-ai.org.cn/api/v1/",
+            )
+    else:
+        raise ValueError(f"Unsupported model: {args.model_name}")
+
+def get_token_counts(usage):
+    """(prompt, completion, total) token counts of an OpenAI-compatible or Gemini usage, or of a usage dict"""
+    if usage is None:
+        return 0, 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("total_tokens", 0)
+    if hasattr(usage, "prompt_token_count"):
+        return usage.prompt_token_count or 0, usage.candidates_token_count or 0, usage.total_token_count or 0
+    return usage.prompt_tokens, usage.completion_tokens, usage.total_tokens
+
+def get_directions(args: argparse.Namespace, image_path: str, ocr_cache: OCRCache = None):
+    """
+    OCR the directions of a map screenshot and parse them, see `call_vlm_agent` and `parse_directions`.
+    With `ocr_cache`, a screenshot already read by the same model is not sent again.
+
+    Returns:
+        str: directions text
+        list: parsed directions
+        tuple: (prompt, completion, total) tokens of the OCR call, zeros on a cache hit
+    """
+    if ocr_cache is not None:
+        record = ocr_cache.get(image_path, args.model_name)
+        if record is not None:
+            return record["text"], record["directions"], (0, 0, 0)
+
+    directions_text, ocr_usage = call_vlm_agent(args, is_ocr=True, image_path=image_path)
+    parsed_directions = parse_directions(directions_text)
+    ocr_tokens = get_token_counts(ocr_usage)
+    if ocr_cache is not None:
+        ocr_cache.put(image_path, args.model_name, directions_text, parsed_directions, list(ocr_tokens))
+    return directions_text, parsed_directions, ocr_tokens
+
 def navigate_environment(args: argparse.Namespace,
                          idx: int, # ! NOTE Should use herustic way to debug and see if the performance is 100% correct
                          env: dict,
                          parsed_directions: list,
-                         initial_heading: float) -> dict:
+                         initial_heading: float,
+                         compiled_graph: CompiledGraph = None,
+                         client_pool: ClientPool = None) -> dict:
     """
     Navigate through a single environment according to parsed textual directions.
     
@@ -258,6 +337,8 @@ def navigate_environment(args: argparse.Namespace,
         env (dict): environment with keys "source", "target", "graph"
         parsed_directions (list): list of {"action": str, "distance": float} steps
         initial_heading (float): initial bearing in degrees from true north
+        compiled_graph (CompiledGraph): env["graph"] compiled, with the edge lengths precomputed; compiled here if None
+        client_pool (ClientPool): clients shared with the other environments run concurrently; the module-level client if None
 
     Returns:
         dict: {
@@ -271,16 +352,15 @@ def navigate_environment(args: argparse.Namespace,
     src_key = env["source"] # 40.778445295771355-73.95519516710091
     tgt_key = env["target"] # 40.777989547618326-73.95411775294352
 
-    # parse lat/lng from "lat-lng" keys
-    def parse_coord(key):
-        lat_str, lng_str = key.split('-')
-        return float(lat_str), -float(lng_str) # longitude is negative in the graph since it is in the western hemisphere
+    if compiled_graph is None:
+        compiled_graph = CompiledGraph.from_graph(graph)
 
     curr = src_key # 40.778445295771355-73.95519516710091
-    tlat, tlng = parse_coord(tgt_key)
+    tlat, tlng = compiled_graph.get_coord(tgt_key)
     # tlng = -tlng  # longitude is negative in the graph since it is in the western hemisphere
     visited = []
     trajectory = []  # Initialize trajectory list
+    token_usage = None  # usage of the last VLM call
 
     dir_idx = 0
     remaining = parsed_directions[0]["distance"]
@@ -296,7 +376,8 @@ def navigate_environment(args: argparse.Namespace,
         # check arrival
         if curr == tgt_key: # 40.777989547618326-73.95411775294352
             return {"reached": True, "final_node": curr,
-                    "final_distance_to_target": 0.0, "visited": visited}
+                    "final_distance_to_target": 0.0, "visited": visited,
+                    "token_usage": token_usage}, trajectory
         
         # loop detection
         if len(visited) >= 2 and curr == visited[-2]:
@@ -307,21 +388,19 @@ def navigate_environment(args: argparse.Namespace,
         node = graph[curr]
         lat, lng = node["lat"], node["lng"] # correctly lat/lng from the graph node
 
-        # build neighbor info
-        neighbors = []
-        for nb_key, meta in node["links"].items():
-            nb_lat, nb_lng = parse_coord(nb_key)
-            dist = haversine(lat, lng, nb_lat, nb_lng)
-            # relative heading from current agent heading
-            nb_heading = meta["heading"]
-            rel = (nb_heading - heading + 360) % 360
-            neighbors.append({
-                "key": nb_key,
+        # build neighbor info, distances and relative headings from current agent heading of all links in one batch
+        scores = score_neighbors(compiled_graph, [compiled_graph.index[curr]], [heading])
+        neighbors = [
+            {
+                "key": compiled_graph.keys[compiled_graph.indices[edge]],
                 "abs_heading": nb_heading,
                 "rel_heading": rel,
                 "dist": dist,
-                "text": meta.get("text", "")
-            })
+                "text": compiled_graph.edge_text[edge]
+            }
+            for edge, nb_heading, rel, dist in zip(scores.edges.tolist(), scores.abs_heading.tolist(),
+                                                   scores.rel_heading.tolist(), scores.distance.tolist())
+        ]
 
         # decide desired relative angle by current action
         # action = parsed_directions[dir_idx]["action"].lower()
@@ -333,8 +412,7 @@ def navigate_environment(args: argparse.Namespace,
         #     target_rel = 0.0
         target_rel = 0.0
         # select neighbor minimizing angular difference
-        best = min(neighbors,
-                   key=lambda nb: angular_diff(nb["rel_heading"], target_rel))
+        best = neighbors[int(scores.best(target_rel)[0] - scores.edges[0])]
         
         # optionally fetch visuals and save, should be done when generating the environment, here just for debugging
         observations = []
@@ -389,15 +467,16 @@ def navigate_environment(args: argparse.Namespace,
                 f"- {nb['key']} | abs_heading={nb['abs_heading']:.1f}° "
                 f"rel_heading={nb['rel_heading']:.1f}° dist={nb['dist']:.1f}m\n"
             )
-        if args.multimodal: # Need to revise prompt for multimodal VLM
-            choice, token_usage = call_vlm_agent(
-                args, observations, prompt_text, action_prompt, 
-                # {nb["key"]: {"heading": nb["abs_heading"], "text": nb["text"]} for nb in neighbors},
-                # tgt_key, abs(remaining)
-            )
-        else:
-            # text-only VLM call
-            choice, token_usage = call_vlm_agent(args, prompt_text=prompt_text, action_prompt=action_prompt)
+        with client_pool.client() if client_pool is not None else nullcontext() as vlm_client:
+            if args.multimodal: # Need to revise prompt for multimodal VLM
+                choice, token_usage = call_vlm_agent(
+                    args, observations, prompt_text, action_prompt, vlm_client=vlm_client,
+                    # {nb["key"]: {"heading": nb["abs_heading"], "text": nb["text"]} for nb in neighbors},
+                    # tgt_key, abs(remaining)
+                )
+            else:
+                # text-only VLM call
+                choice, token_usage = call_vlm_agent(args, prompt_text=prompt_text, action_prompt=action_prompt, vlm_client=vlm_client)
 
         # validate and move
         if choice in graph[curr]["links"] and choice not in visited:
@@ -409,7 +488,7 @@ def navigate_environment(args: argparse.Namespace,
             break
 
     # compute final distance to target
-    flat, flng = parse_coord(curr)
+    flat, flng = compiled_graph.get_coord(curr)
     final_dist = haversine(flat, flng, tlat, tlng)
     output_dict = {
         "reached": False,
@@ -491,6 +570,33 @@ if __name__ == "__main__":
         action="store_true",
         help="If set, save fetched StreetView images to disk"
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=4,
+        help="Number of environments navigated concurrently, sharing a pool of as many clients"
+    )
+    parser.add_argument(
+        "--max_requests_per_minute",
+        type=int,
+        default=0,
+        help="Rate limit of the VLM requests over all workers, 0 for no limit"
+    )
+    parser.add_argument(
+        "--ocr_cache_path",
+        default="navigation/data/ocr_cache.jsonl",
+        help="JSONL cache of the OCR directions by screenshot hash and model, empty to always run the OCR"
+    )
+    parser.add_argument(
+        "--heuristic_replay",
+        action="store_true",
+        help="If set, follow the directions with the heuristic policy in all environments at once instead of the VLM"
+    )
+    parser.add_argument(
+        "--results_file",
+        default="res_nav.jsonl",
+        help="JSONL file in res_folder where the results are appended; environments already in it are skipped"
+    )
 
     # LLM and VLM Params
     parser.add_argument('--model_name', type=str, default='gpt-4o-mini-2024-07-18')  # Example: 'gpt-4o-mini', gemini-2.0-flash, 
@@ -530,48 +636,18 @@ if __name__ == "__main__":
         model_price = "internvl2.5-latest"
 
     # Model initialization
-    if "gpt" in args.model_name:
-        if os.getenv('OPENAI_API_KEY'):
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        else:
-            client = OpenAI(api_key=args.openai_api_key)
-    elif "gemini" in args.model_name:
-        if os.getenv('GEMINI_API_KEY'):
-            client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-        else:
-            client = genai.Client(api_key=args.gemini_api_key)
-    elif "qwen" in args.model_name: # dashscope_api_key
-        if os.getenv('DASHSCOPE_API_KEY'):
-            client = OpenAI(
-                api_key=os.getenv('DASHSCOPE_API_KEY'),
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            )
-        else:
-            client = OpenAI(
-                api_key=args.dashscope_api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            )
-    elif "internvl" in args.model_name:
-        if os.getenv('INTERNVL_API_KEY'):
-            client = OpenAI(
-                api_key=os.getenv('INTERNVL_API_KEY'),
-                base_url="https://chat.intern-ai.org.cn/api/v1/",
-            )
-        else:
-            client = OpenAI(
-                api_key=args.internvl_api_key,
-                base_url="https://chat.intern-ai.org.cn/api/v1/",
-            )
+    client = create_client(args)
 
     # Path
     map_screenshot_path = args.map_screenshot_path # "/home/ruis/code/embodied/tasks/navigation/data_collection/map_screenshot.jpg"  # OpenStreetMap screenshot with highlighted path
     environments_path = args.environments_path # '/home/ruis/code/embodied/tasks/navigation/data_collection/navi_env/navi_env_0.json'
     res_folder = args.res_folder
-    res_traj_folder = os.path.join(res_folder, 'res_traj')
     envs = load_environments(environments_path) # simply load the json file
-    directions_text, ocr_usage = call_vlm_agent(args, is_ocr=True, image_path=map_screenshot_path) # Checked, OCR works well, NOTE ocr_usage should be taken into account
-    parsed_directions = parse_directions(directions_text) # parse the directions text
-    import pdb; pdb.set_trace()
+    ocr_cache = OCRCache(args.ocr_cache_path) if args.ocr_cache_path else None
+    directions_text, parsed_directions, ocr_tokens = get_directions(args, map_screenshot_path, ocr_cache) # Checked, OCR works well, NOTE ocr_tokens should be taken into account
+    if ocr_cache is not None:
+        logger.info(f"OCR cache: hits={ocr_cache.stats['hit']}, misses={ocr_cache.stats['miss']}, "
+                    f"hit_rate={ocr_cache.get_hit_rate():.2f}, entries={len(ocr_cache.entries)}")
     print("************************")
     print(parsed_directions)
     print("************************")
@@ -579,50 +655,61 @@ if __name__ == "__main__":
     if type(envs) is not list:
         envs = [envs]
 
-    for idx, env in enumerate(tqdm(envs,desc="Navigating Environments")):
-        # import pdb; pdb.set_trace()
-        logger.info(f"[Env {idx}] source={env['source']} → target={env['target']}")
-        print(f"\n=== Environment {idx}: {env['source']} → {env['target']} ===")
-        output_dict, trajectory = navigate_environment(args, idx, env, parsed_directions, initial_heading)
-        print(f"Final node: {output_dict['final_node']}, "
-              f"Distance to target: {output_dict['final_distance_to_target']:.1f}m, "
-              f"Visited nodes: {len(output_dict['visited'])}, "
-              f"Token Usage: {output_dict['token_usage']}")
-        # Log final result and token usage
-        # Calculate cost
-        token_usage = output_dict.get("token_usage", {})
-        if 'gpt' or 'internvl' or 'qwen' in args.model:
-            prompt_tokens = token_usage.prompt_tokens
-            completion_tokens = token_usage.completion_tokens
+    result_stream = JsonlResultStream(os.path.join(res_folder, args.results_file))
+    if args.heuristic_replay:
+        # heuristic baseline without VLM calls, all pending environments advance together
+        pending = [(idx, env) for idx, env in enumerate(envs) if not result_stream.is_completed(idx, env)]
+        results = replay_heuristic([env for _, env in pending], parsed_directions, initial_heading, args.max_steps)
+        for (idx, env), result in zip(pending, results):
+            result_stream.append({"env_idx": idx, "source": env["source"], "target": env["target"], **result})
+        logger.info(f"Heuristic replay of {len(pending)} environments, "
+                    f"reached={sum(result['reached'] for result in results)}")
+    else:
+        rate_limiter = RateLimiter(args.max_requests_per_minute)
+        client_pool = ClientPool(lambda: create_client(args), args.num_workers, rate_limiter)
+        progress = tqdm(total=len(envs), desc="Navigating Environments")
+
+        def navigate(idx, env):
+            logger.info(f"[Env {idx}] source={env['source']} → target={env['target']}")
+            compiled_graph = CompiledGraph.from_graph(env["graph"])
+            output_dict, trajectory = navigate_environment(args, idx, env, parsed_directions, initial_heading,
+                                                           compiled_graph, client_pool)
+            # Calculate cost
+            prompt_tokens, completion_tokens, total_tokens = get_token_counts(output_dict.get("token_usage"))
             total_cost = calculate_cost(model_price, prompt_tokens, completion_tokens)
             logger.info(f"[Env {idx}] reached={output_dict['reached']}, final_node={output_dict['final_node']}, "
                         f"final_dist={output_dict['final_distance_to_target']:.1f}m, "
                         f"visited={len(output_dict['visited'])}, "
-                        f"completion_tokens={token_usage.completion_tokens}, "
-                        f"prompt_tokens={token_usage.prompt_tokens}, "
-                        f"total_tokens={token_usage.total_tokens}, "
-                        f"total_cost={total_cost}")
-        elif 'gemini' in args.model:
-            candidates_token_count = token_usage.candidates_token_count
-            prompt_token_count = token_usage.prompt_token_count
-            total_token_count = token_usage.total_token_count
-            total_cost = calculate_cost(model_price, prompt_token_count, candidates_token_count)
-            logger.info(f"[Env {idx}] reached={output_dict['reached']}, final_node={output_dict['final_node']}, "
-                        f"final_dist={output_dict['final_distance_to_target']:.1f}m, "
-                        f"visited={len(output_dict['visited'])}, "
-                        f"candidates_token_count={token_usage.candidates_token_count}, "
-                        f"prompt_token_count={token_usage.prompt_token_count}, "
-                        f"total_token_count={token_usage.total_token_count}, "
+                        f"completion_tokens={completion_tokens}, "
+                        f"prompt_tokens={prompt_tokens}, "
+                        f"total_tokens={total_tokens}, "
                         f"total_cost={total_cost}")
+            progress.update()
+            return {
+                "env_idx": idx,
+                "source": env["source"],
+                "target": env["target"],
+                "reached": output_dict["reached"],
+                "final_node": output_dict["final_node"],
+                "final_distance_to_target": output_dict["final_distance_to_target"],
+                "visited": output_dict["visited"],
+                "token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                "total_tokens": total_tokens},
+                "total_cost": total_cost,
+                "coordinates": trajectory,
+            }
 
-        # Prepare output structure
-        res_traj = {"coordinates": trajectory}
-        res_traj_path = f"/home/ruis/code/embodied/tasks/navigation/results/res_traj_shopping/res_traj_{idx}.json"
-        with open(res_traj_path, "w") as f:
-            json.dump(res_traj, f, indent=4)  # Write trajectory to JSON file
-        print(f"Trajectory saved to {res_traj_path}")
-        # print(f"Navigation {'SUCCESS' if success else 'FAILURE'} for environment {idx}")
-        # merge json files
-        merge_json(res_traj_folder, res_folder) # merge all res_traj files into one
-        # add task ids
-        add_task_ids(os.path.join(res_folder, "res_traj_merge_shopping.json"), os.path.join(res_folder, "res_traj_idx_merge_shopping.json"))
\ No newline at end of file
+        progress.update(sum(result_stream.is_completed(idx, env) for idx, env in enumerate(envs)))
+        run_environments(envs, navigate, result_stream, num_workers=args.num_workers)
+        progress.close()
+        logger.info(f"Rate limiter waited {rate_limiter.waited:.1f}s in total")
+
+    # Trajectories of all finished environments by index, merged once at the end
+    records = result_stream.read_all()
+    res_trajs = [None] * (max(record["env_idx"] for record in records) + 1) if records else []
+    for record in records:
+        res_trajs[record["env_idx"]] = {"coordinates": record["coordinates"], "task_id": record["env_idx"]}
+    res_traj_merge_path = os.path.join(res_folder, "res_traj_idx_merge_shopping.json")
+    with open(res_traj_merge_path, "w", encoding="utf-8") as f:
+        json.dump(res_trajs, f, ensure_ascii=False, indent=4)
+    print(f"Trajectories saved to {res_traj_merge_path}")
@@ -0,0 +1,249 @@
+import os
+import json
+import math
+import asyncio
+
+import aiohttp
+
+from tasks.navigation.utils import get_nearest_road_from_api, get_pano_id
+
+TILE_API_URL = "https://tile.googleapis.com"
+
+# same as ox.distance.great_circle_vec
+EARTH_RADIUS_M = 6_371_009
+
+
+def great_circle_distance(lat1, lng1, lat2, lng2):
+    y1, y2 = math.radians(lat1), math.radians(lat2)
+    dy = y2 - y1
+    dx = math.radians(lng2) - math.radians(lng1)
+    h = math.sin(dy / 2) ** 2 + math.cos(y1) * math.cos(y2) * math.sin(dx / 2) ** 2
+    return 2 * math.asin(math.sqrt(min(1.0, h))) * EARTH_RADIUS_M
+
+
+class TransientError(Exception):
+    """A request that still failed after all retries, e.g., rate limiting or a server error"""
+
+
+class PanoCrawler:
+    """
+    Breadth-first crawler of the Street View panorama graph, see `get_panograph_around_location`.
+
+    A BFS level is crawled at once: the metadata of all links of the level is requested concurrently
+    over a pooled client, at most `max_concurrency` requests at a time, and the responses are then
+    merged in the same order as a sequential BFS, so the graph does not depend on timing.
+
+    The metadata is cached by the Google pano id in the JSONL file `cache_path`, shared by all crawls.
+    After every level the graph and the frontier are written to `checkpoint_path`, and a crawl of the
+    same location resumes from there, e.g., after a `TransientError`.
+    """
+
+    def __init__(self, api_key, distance_threshold=50.0, max_concurrency=16, max_retries=3,
+                 cache_path="navigation/data/pano_meta_cache.jsonl", checkpoint_path=None, base_url=TILE_API_URL):
+        self.api_key = api_key
+        self.distance_threshold = distance_threshold
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.cache_path = cache_path
+        self.checkpoint_path = checkpoint_path
+        self.base_url = base_url
+        self.meta_cache = {}
+        self.stats = {"requests": 0, "cache_hit": 0, "retries": 0}
+        self.load_cache()
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        with open(self.cache_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted crawl
+                    continue
+                self.meta_cache[record["panoId"]] = record["meta"]
+
+    def save_to_cache(self, pano_id, meta):
+        self.meta_cache[pano_id] = meta
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "a") as f:
+            f.write(json.dumps({"panoId": pano_id, "meta": meta}) + "\n")
+
+    async def request(self, session, semaphore, method, path, **kwargs):
+        """JSON response, None on a client error, retries rate limiting, server and connection errors"""
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.stats["retries"] += 1
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            try:
+                async with semaphore:
+                    self.stats["requests"] += 1
+                    async with session.request(method, url, **kwargs) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        text = await response.text()
+            except aiohttp.ClientError as e:
+                error = repr(e)
+                continue
+            error = f"{response.status} {text}"
+            if response.status != 429 and response.status < 500:
+                print("Error fetching panorama metadata:", error)
+                return None
+        raise TransientError(f"{method} {path} failed after {self.max_retries} retries: {error}")
+
+    async def get_session_token(self, session, semaphore):
+        response = await self.request(
+            session, semaphore, "POST", "/v1/createSession",
+            params={"key": self.api_key},
+            json={"mapType": "streetview", "language": "en-US", "region": "US"},
+        )
+        return None if response is None else response["session"]
+
+    async def get_pano_meta(self, session, semaphore, session_token, latitude, longitude, radius=50):
+        return await self.request(
+            session, semaphore, "GET", "/v1/streetview/metadata",
+            params={"session": session_token, "key": self.api_key, "lat": latitude, "lng": longitude, "radius": radius},
+        )
+
+    async def get_pano_meta_from_id(self, session, semaphore, session_token, pano_id):
+        if pano_id in self.meta_cache:
+            self.stats["cache_hit"] += 1
+            return self.meta_cache[pano_id]
+        meta = await self.request(
+            session, semaphore, "GET", "/v1/streetview/metadata",
+            params={"session": session_token, "key": self.api_key, "panoId": pano_id},
+        )
+        if meta is not None:
+            self.save_to_cache(pano_id, meta)
+        return meta
+
+    def load_checkpoint(self, latitude, longitude):
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint["location"] != [latitude, longitude] or checkpoint["distance_threshold"] != self.distance_threshold:
+            print(f"Ignoring the checkpoint {self.checkpoint_path} of another crawl")
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, latitude, longitude, root_meta, pano_graph, visited, frontier):
+        if self.checkpoint_path is None:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        checkpoint = {
+            "location": [latitude, longitude],
+            "distance_threshold": self.distance_threshold,
+            "root_meta": root_meta,
+            "graph": pano_graph,
+            "visited": sorted(visited),
+            "frontier": frontier,
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def get_root_meta(self, session, semaphore, session_token, latitude, longitude):
+        meta = await self.get_pano_meta(session, semaphore, session_token, latitude, longitude)
+        if meta is None:
+            return None
+
+        if "links" not in meta:
+            latitude, longitude = await asyncio.to_thread(get_nearest_road_from_api, self.api_key, latitude, longitude)
+            meta = await self.get_pano_meta(session, semaphore, session_token, latitude, longitude)
+        return meta
+
+    async def crawl(self, latitude, longitude):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            session_token = await self.get_session_token(session, semaphore)
+            if session_token is None:
+                return None
+
+            checkpoint = self.load_checkpoint(latitude, longitude)
+            if checkpoint is not None:
+                meta = checkpoint["root_meta"]
+                pano_graph = checkpoint["graph"]
+                visited = set(checkpoint["visited"])
+                frontier = checkpoint["frontier"]
+            else:
+                meta = await self.get_root_meta(session, semaphore, session_token, latitude, longitude)
+                if meta is None:
+                    return None
+                pano_graph = {
+                    get_pano_id(meta): {
+                        "google_pano_id": meta["panoId"],
+                        "lat": meta["lat"],
+                        "lng": meta["lng"],
+                        "links": {},
+                    }
+                }
+                visited = set()
+                frontier = [meta]
+
+            # distance to the root by pano id, computed once per panorama
+            root_distances = {}
+
+            while frontier:
+                current_metas = []
+                for current_meta in frontier:
+                    current_id = get_pano_id(current_meta)
+                    if current_id in visited:
+                        continue
+                    visited.add(current_id)
+                    if "links" not in current_meta:
+                        print(current_meta)
+                        continue
+                    current_metas.append(current_meta)
+
+                link_pano_ids = list(dict.fromkeys(
+                    link["panoId"] for current_meta in current_metas for link in current_meta["links"]
+                ))
+                link_metas = await asyncio.gather(*[
+                    self.get_pano_meta_from_id(session, semaphore, session_token, pano_id)
+                    for pano_id in link_pano_ids
+                ])
+                link_metas = dict(zip(link_pano_ids, link_metas))
+
+                next_frontier = []
+                for current_meta in current_metas:
+                    current_id = get_pano_id(current_meta)
+                    for link in current_meta["links"]:
+                        pano_meta = link_metas[link["panoId"]]
+                        if pano_meta is None:
+                            continue
+
+                        pano_id = get_pano_id(pano_meta)
+                        if pano_id not in root_distances:
+                            root_distances[pano_id] = great_circle_distance(
+                                meta["lat"], meta["lng"], pano_meta["lat"], pano_meta["lng"]
+                            )
+                        if root_distances[pano_id] > self.distance_threshold:
+                            continue
+
+                        if pano_id not in pano_graph[current_id]["links"]:
+                            pano_graph[current_id]["links"][pano_id] = {
+                                "google_pano_id": pano_meta["panoId"],
+                                "heading": link["heading"],
+                                "text": link["text"],
+                                "elevaionAboveEgm96": link["elevationAboveEgm96"]
+                            }
+
+                        if pano_id not in pano_graph:
+                            next_frontier.append(pano_meta)
+                            pano_graph[pano_id] = {
+                                "google_pano_id": pano_meta["panoId"],
+                                "lat": pano_meta["lat"],
+                                "lng": pano_meta["lng"],
+                                "links": {},
+                            }
+
+                frontier = next_frontier
+                self.save_checkpoint(latitude, longitude, meta, pano_graph, visited, frontier)
+
+        return pano_graph
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from .compiled_graph import CompiledGraph, haversine_np
+
+
+class DistanceIndex:
+    """
+    Distances from one source to the other nodes of the graph, sorted for threshold queries.
+
+    `node_ids` holds the graph nodes (source excluded, unreachable nodes dropped) in increasing order of
+    `sorted_distances`.
+    """
+
+    def __init__(self, distances, candidates):
+        node_ids = np.flatnonzero(candidates & np.isfinite(distances))
+        order = np.argsort(distances[node_ids], kind="stable")
+        self.distances = distances
+        self.node_ids = node_ids[order]
+        self.sorted_distances = distances[self.node_ids]
+
+    def above(self, distance):
+        """Node ids strictly farther than `distance`, closest first"""
+        return self.node_ids[np.searchsorted(self.sorted_distances, distance, side="right"):]
+
+    def within(self, distance):
+        """Node ids at most `distance` away, closest first"""
+        return self.node_ids[:np.searchsorted(self.sorted_distances, distance, side="right")]
+
+
+class PathService:
+    """
+    Shortest paths and distance queries from many sources over one navigation graph.
+
+    A source is expanded once by a one-to-all Dijkstra; its distances, predecessors and sorted
+    distance index are kept for the `cache_size` most recently used sources, so generating many
+    tasks from the same sources does not re-run the search. Straight-line (haversine) distances
+    from a source are computed for the whole graph at once and cached the same way.
+
+    Parameters:
+        graph: navigation graph, either the dict of the environment or a `CompiledGraph` of it.
+        cache_size: number of sources whose search results are kept.
+    """
+
+    METRICS = ["path", "haversine"]
+
+    def __init__(self, graph, cache_size=64):
+        self.compiled_graph = graph if isinstance(graph, CompiledGraph) else CompiledGraph.from_graph(graph)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.stats = {"hit": 0, "miss": 0}
+
+    def get_cached(self, key, compute):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats["hit"] += 1
+            return self.cache[key]
+        self.stats["miss"] += 1
+        value = compute()
+        self.cache[key] = value
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+    def get_search(self, source):
+        """(distances, predecessors) of the one-to-all Dijkstra from the `source` key"""
+        graph = self.compiled_graph
+
+        def search():
+            distances, predecessors = graph.dijkstra(graph.index[source])
+            return np.asarray(distances, dtype=np.float64), predecessors
+
+        return self.get_cached(("search", source), search)
+
+    def get_distance_index(self, source, metric="path"):
+        """
+        Sorted distances from the `source` key to the other graph nodes.
+
+        Parameters:
+            metric: "path" for the shortest path length along the graph, "haversine" for the straight-line distance.
+                    The source needs to be a graph node for "path"; for "haversine" any "lat-lng" key works.
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {self.METRICS}")
+        graph = self.compiled_graph
+
+        def build_index():
+            if metric == "path":
+                distances = self.get_search(source)[0]
+            else:
+                source_lat, source_lng = graph.get_coord(source)
+                distances = haversine_np(source_lat, source_lng, graph.lat, graph.lng)
+            candidates = graph.in_graph.copy()
+            if source in graph.index:
+                candidates[graph.index[source]] = False
+            return DistanceIndex(distances, candidates)
+
+        return self.get_cached((metric, source), build_index)
+
+    def get_distances(self, source):
+        """Shortest path length from the `source` key to every node id, inf if unreachable"""
+        return self.get_search(source)[0]
+
+    def get_distance(self, source, target):
+        return float(self.get_distances(source)[self.compiled_graph.index[target]])
+
+    def get_path(self, source, target):
+        """Same as `utils.dijkstra_shortest_path`, from the cached search of the source"""
+        graph = self.compiled_graph
+        predecessors = self.get_search(source)[1]
+        return graph.get_path(predecessors, graph.index[source], graph.index[target])
+
+    def get_nodes_above_distance(self, source, distance, metric="path"):
+        """Keys of the graph nodes farther than `distance` meters from the source, closest first"""
+        return self.compiled_graph.get_path_keys(self.get_distance_index(source, metric).above(distance).tolist())
+
+    def get_nodes_within_distance(self, source, distance, metric="path"):
+        """Keys of the graph nodes at most `distance` meters from the source, closest first"""
+        return self.compiled_graph.get_path_keys(self.get_distance_index(source, metric).within(distance).tolist())
+
+    def get_farthest_node(self, source, metric="path"):
+        """Key of the graph node farthest from the source, None if no other node is reachable"""
+        node_ids = self.get_distance_index(source, metric).node_ids
+        if len(node_ids) == 0:
+            return None
+        return self.compiled_graph.keys[node_ids[-1]]
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: at most `rate` acquisitions per `period` seconds, with bursts up to `rate`.
+    A `rate` <= 0 disables the limit.
+    """
+
+    def __init__(self, rate, period=60.0):
+        self.rate = rate
+        self.period = period
+        self.lock = threading.Lock()
+        self.tokens = float(max(rate, 0))
+        self.updated = time.monotonic()
+        self.waited = 0.0
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.period / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+class ClientPool:
+    """
+    API clients shared by the navigation workers.
+    A client is checked out for one request at a time, after waiting for the rate limiter.
+    """
+
+    def __init__(self, create_client, size, rate_limiter=None):
+        self.clients = queue.Queue()
+        for _ in range(size):
+            self.clients.put(create_client())
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(0)
+
+    @contextmanager
+    def client(self):
+        self.rate_limiter.acquire()
+        client = self.clients.get()
+        try:
+            yield client
+        finally:
+            self.clients.put(client)
+
+
+class JsonlResultStream:
+    """
+    Navigation results appended to a single JSONL file, one line per environment.
+    The environments already in the file are skipped on restart, identified by their index, source and target.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed = set()
+        for record in self.read_all():
+            self.completed.add(self.get_key(record["env_idx"], record))
+
+    @staticmethod
+    def get_key(idx, env):
+        return f"{idx}:{env['source']}:{env['target']}"
+
+    def is_completed(self, idx, env):
+        return self.get_key(idx, env) in self.completed
+
+    def read_all(self):
+        """The records in the file, sorted by environment index"""
+        if not os.path.exists(self.path):
+            return []
+        records = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted run, the environment is run again
+                    continue
+                records[record["env_idx"]] = record
+        return [records[idx] for idx in sorted(records)]
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a+b") as f:
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # terminate a line cut short by an interrupted run
+                        line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed.add(self.get_key(record["env_idx"], record))
+
+
+def run_environments(envs, navigate, result_stream, num_workers=4):
+    """
+    Navigate the environments that are not in `result_stream` yet, `num_workers` at a time.
+
+    Parameters:
+        envs (list): environments with keys "source", "target", "graph"
+        navigate (callable): navigate(idx, env) -> record (dict) with at least "env_idx", "source", "target"
+        result_stream (JsonlResultStream): where the records are appended as the environments finish
+    Returns:
+        dict: number of environments "completed", "skipped" and "failed" in this run
+    """
+    pending = [(idx, env) for idx, env in enumerate(envs) if not result_stream.is_completed(idx, env)]
+    stats = {"completed": 0, "skipped": len(envs) - len(pending), "failed": 0}
+    if stats["skipped"]:
+        logger.info(f"Skipping {stats['skipped']} environments already in {result_stream.path}")
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(navigate, idx, env): idx for idx, env in pending}
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                record = future.result()
+            except Exception:
+                # not recorded, so the environment is retried on the next run
+                logger.exception(f"[Env {idx}] navigation failed")
+                stats["failed"] += 1
+                continue
+            result_stream.append(record)
+            stats["completed"] += 1
+
+    logger.info(f"Finished {stats['completed']} environments, {stats['failed']} failed, {stats['skipped']} skipped")
+    return stats
@@ -0,0 +1,269 @@
+import numpy as np
+
+from .compiled_graph import CompiledGraph, haversine_np
+
+DEFAULT_HEADINGS = np.array([0.0, 90.0, 180.0, 270.0])
+
+# relative heading the heuristic policy aims for after each action
+ACTION_TARGET_HEADINGS = {"left": 270.0, "right": 90.0, "straight": 0.0}
+
+
+def angular_diff_np(a, b):
+    """Vectorized `utils.angular_diff`, the minimal difference between angles in degrees"""
+    return np.abs((np.asarray(a) - b + 180) % 360 - 180)
+
+
+def heading_diff_np(head1, head2):
+    """Vectorized `utils.get_heading_diff`"""
+    diff = np.asarray(head1) - head2
+    return np.minimum(np.minimum(np.abs(diff), np.abs(diff + 360)), np.abs(diff - 360))
+
+
+def segment_argmin(values, counts):
+    """
+    Index of the first minimum of every segment of `values`, the segments being consecutive runs of `counts`.
+    Segments must not be empty.
+    """
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    segment_min = np.minimum.reduceat(values, offsets)
+    is_min = values == np.repeat(segment_min, counts)
+    segment_ids = np.repeat(np.arange(len(counts)), counts)
+    # positions of the minima, the first one of every segment is kept
+    positions = np.flatnonzero(is_min)
+    _, first = np.unique(segment_ids[positions], return_index=True)
+    return positions[first]
+
+
+class NeighborScores:
+    """
+    Distances and headings of the links of a batch of agent states, one entry per (state, link).
+
+    Attributes:
+        edges: edge ids of the links in the CSR arrays, grouped by state in the order of the links
+        states: index of the state of every edge
+        counts: number of links of every state
+        distance: edge lengths in meters
+        abs_heading: absolute headings of the links
+        rel_heading: headings relative to the agent heading of the state, in [0, 360)
+    """
+
+    def __init__(self, indptr, edge_length, edge_heading, nodes, headings):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = indptr[nodes]
+        self.counts = indptr[nodes + 1] - starts
+        total = int(self.counts.sum())
+        self.states = np.repeat(np.arange(len(nodes)), self.counts)
+        segment_offsets = np.cumsum(self.counts) - self.counts
+        self.edges = np.arange(total) - np.repeat(segment_offsets, self.counts) + np.repeat(starts, self.counts)
+        self.distance = edge_length[self.edges]
+        self.abs_heading = edge_heading[self.edges]
+        self.rel_heading = (self.abs_heading - np.asarray(headings, dtype=np.float64)[self.states] + 360) % 360
+
+    def angular_diff(self, target_rel):
+        """Angular difference of every link to the relative heading `target_rel` (scalar or one per state)"""
+        target_rel = np.asarray(target_rel, dtype=np.float64)
+        if target_rel.ndim > 0:
+            target_rel = target_rel[self.states]
+        return angular_diff_np(self.rel_heading, target_rel)
+
+    def best(self, target_rel=0.0):
+        """
+        Edge id of the link closest to `target_rel` for every state, the first one on ties as with `min`.
+        -1 for the states without links.
+        """
+        best = np.full(len(self.counts), -1, dtype=np.int64)
+        has_links = self.counts > 0
+        if has_links.any():
+            diff = self.angular_diff(target_rel)
+            best[has_links] = self.edges[segment_argmin(diff, self.counts[has_links])]
+        return best
+
+
+def score_neighbors(compiled_graph, nodes, headings):
+    """Score the links of the states (node ids, agent headings) of `compiled_graph` in one batch"""
+    return NeighborScores(compiled_graph.indptr, compiled_graph.edge_length, compiled_graph.edge_heading,
+                          nodes, headings)
+
+
+def fill_observation_headings(link_headings, cur_heading):
+    """
+    The four ego-centric observation headings of a node, see `NaviMap.get_observation_headings`.
+
+    The link headings relative to `cur_heading` are sorted, and while there are fewer than four,
+    the default heading (0, 90, 180, 270) inside the widest gap that is farthest from both of its ends is added.
+    """
+    headings = np.sort((np.asarray(link_headings, dtype=np.float64) - cur_heading) % 360.0)
+    max_min_diff_head = None
+
+    while len(headings) < 4:
+        gaps = (np.roll(headings, -1) - headings) % 360.0
+        # first widest gap
+        max_diff_head = int(np.argmax(gaps))
+        start, end = headings[max_diff_head], headings[(max_diff_head + 1) % len(headings)]
+        if max_diff_head == len(headings) - 1:
+            is_in_gap = (start < DEFAULT_HEADINGS) | (DEFAULT_HEADINGS < headings[0])
+        else:
+            is_in_gap = (start < DEFAULT_HEADINGS) & (DEFAULT_HEADINGS < end)
+        min_diff = np.minimum(heading_diff_np(DEFAULT_HEADINGS, start), heading_diff_np(DEFAULT_HEADINGS, end))
+        min_diff = np.where(is_in_gap, min_diff, 0.0)
+        if min_diff.max() > 0.0:
+            max_min_diff_head = int(np.argmax(min_diff))
+        if max_min_diff_head is None:
+            raise ValueError(f"No default heading fits between the headings {headings.tolist()}")
+        headings = np.sort(np.append(headings, DEFAULT_HEADINGS[max_min_diff_head]))
+
+    headings = headings.tolist()
+    assert len(headings) == 4, f"The number of headings should be 4, get {headings} with length {len(headings)}"
+    assert headings[0] < headings[1] < headings[2] < headings[3], f"The headings should be in ascending order and not equal to each other but get {headings}"
+
+    # Some post processing to make sure the headings are in a disrable order
+    diff_0 = min(abs(headings[0]), abs(headings[0] + 360), abs(headings[0] - 360))
+    diff_3 = min(abs(headings[3]), abs(headings[3] + 360), abs(headings[3] - 360))
+    if diff_0 > diff_3:
+        headings = [headings[3]] + headings[:3]
+    return headings
+
+
+def stack_graphs(compiled_graphs):
+    """
+    Concatenate compiled graphs into one set of CSR arrays with disjoint node ids.
+
+    Returns:
+        dict of the stacked "lat", "lng", "indptr", "indices", "edge_length", "edge_heading" arrays
+        and the first node id of every graph in "node_offsets"
+    """
+    node_counts = np.array([len(graph) for graph in compiled_graphs], dtype=np.int64)
+    edge_counts = np.array([len(graph.indices) for graph in compiled_graphs], dtype=np.int64)
+    node_offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.int64)
+    edge_offsets = np.concatenate([[0], np.cumsum(edge_counts)[:-1]]).astype(np.int64)
+    return {
+        "lat": np.concatenate([graph.lat for graph in compiled_graphs]),
+        "lng": np.concatenate([graph.lng for graph in compiled_graphs]),
+        "indptr": np.concatenate(
+            [graph.indptr[:-1] + offset for graph, offset in zip(compiled_graphs, edge_offsets)]
+            + [[int(edge_counts.sum())]]
+        ).astype(np.int64),
+        "indices": np.concatenate(
+            [graph.indices + offset for graph, offset in zip(compiled_graphs, node_offsets)]
+        ).astype(np.int64),
+        "edge_length": np.concatenate([graph.edge_length for graph in compiled_graphs]),
+        "edge_heading": np.concatenate([graph.edge_heading for graph in compiled_graphs]),
+        "node_offsets": node_offsets,
+    }
+
+
+def replay_heuristic(envs, parsed_directions, initial_heading, max_steps=80, compiled_graphs=None):
+    """
+    Follow parsed directions with the heuristic policy in many environments at once.
+
+    The bookkeeping is that of `navigate_environment`: the remaining distance of the current direction shrinks by
+    the length of the straightest link, and once it would grow, the next direction starts. The agent then takes
+    the link closest to the relative heading of that direction (left 270, right 90, straight 0), or the straightest
+    link otherwise, and stops on the target, when stepping back and forth, at a visited node, at a dead end or
+    after the last direction. All environments advance together, one batched step at a time.
+
+    Parameters:
+        envs (list): environments with keys "source", "target", "graph"
+        parsed_directions (list): {"action", "distance"} steps, shared by all environments,
+            or one such list per environment
+        initial_heading (float): initial heading, or one per environment
+        compiled_graphs (list): CompiledGraph of every environment, compiled here if None
+    Returns:
+        list: per environment, the output dict of `navigate_environment` (without token usage)
+              with the trajectory under "coordinates"
+    """
+    num_envs = len(envs)
+    if num_envs == 0:
+        return []
+    if compiled_graphs is None:
+        compiled_graphs = [CompiledGraph.from_graph(env["graph"]) for env in envs]
+    if parsed_directions and isinstance(parsed_directions[0], dict):
+        parsed_directions = [parsed_directions] * num_envs
+    stacked = stack_graphs(compiled_graphs)
+    indptr, indices = stacked["indptr"], stacked["indices"]
+    edge_length, edge_heading = stacked["edge_length"], stacked["edge_heading"]
+
+    # directions as padded (env, direction) arrays
+    num_directions = np.array([len(directions) for directions in parsed_directions], dtype=np.int64)
+    direction_distance = np.zeros((num_envs, max(int(num_directions.max()), 1)))
+    direction_target = np.zeros_like(direction_distance)
+    for i, directions in enumerate(parsed_directions):
+        for j, direction in enumerate(directions):
+            direction_distance[i, j] = direction["distance"]
+            direction_target[i, j] = ACTION_TARGET_HEADINGS.get(direction["action"], 0.0)
+
+    env_ids = np.arange(num_envs)
+    offsets = stacked["node_offsets"]
+    curr = np.array([graph.index[env["source"]] for graph, env in zip(compiled_graphs, envs)]) + offsets
+    target = np.array([graph.index[env["target"]] for graph, env in zip(compiled_graphs, envs)]) + offsets
+    heading = np.broadcast_to(np.asarray(initial_heading, dtype=np.float64), (num_envs,)).copy()
+    dir_idx = np.zeros(num_envs, dtype=np.int64)
+    remaining = direction_distance[:, 0].copy()
+    # visited[-1] and visited[-2] of every environment, -1 if none
+    last = np.full(num_envs, -1, dtype=np.int64)
+    before_last = np.full(num_envs, -1, dtype=np.int64)
+    is_visited = np.zeros(len(stacked["lat"]), dtype=bool)
+    visited_steps = np.full((max_steps, num_envs), -1, dtype=np.int64)
+    trajectory = np.full((max_steps, num_envs), -1, dtype=np.int64)
+    reached = np.zeros(num_envs, dtype=bool)
+    active = num_directions > 0
+
+    for step in range(max_steps):
+        if not active.any():
+            break
+        trajectory[step, active] = curr[active]
+
+        # check arrival and loop
+        reached |= active & (curr == target)
+        active &= ~reached & (curr != before_last)
+        if not active.any():
+            break
+        a = env_ids[active]
+        visited_steps[step, a] = curr[a]
+        is_visited[curr[a]] = True
+        before_last[a], last[a] = last[a], curr[a]
+
+        scores = NeighborScores(indptr, edge_length, edge_heading, curr[a], heading[a])
+        straightest = scores.best(0.0)
+        dead_end = straightest < 0
+        if dead_end.any():
+            active[a[dead_end]] = False
+            a, straightest = a[~dead_end], straightest[~dead_end]
+            if len(a) == 0:
+                continue
+            scores = NeighborScores(indptr, edge_length, edge_heading, curr[a], heading[a])
+
+        # subtract traveled distance, advance to the next direction once the remaining distance grows
+        prev_remaining = remaining[a]
+        remaining[a] = prev_remaining - edge_length[straightest]
+        take_action = np.abs(remaining[a]) > np.abs(prev_remaining)
+        dir_idx[a] += take_action
+        finished = dir_idx[a] >= num_directions[a]
+        take_action &= ~finished
+        active[a[finished]] = False
+        remaining[a[take_action]] = direction_distance[a[take_action], dir_idx[a[take_action]]]
+        target_rel = np.where(take_action, direction_target[a, np.minimum(dir_idx[a], direction_distance.shape[1] - 1)], 0.0)
+
+        choice = scores.best(target_rel)
+        # no revisits
+        moves = ~finished & ~is_visited[indices[choice]]
+        active[a[~finished & ~moves]] = False
+        curr[a[moves]] = indices[choice[moves]]
+        heading[a[moves]] = edge_heading[choice[moves]]
+
+    final_distance = haversine_np(stacked["lat"][curr], stacked["lng"][curr],
+                                  stacked["lat"][target], stacked["lng"][target])
+    final_distance[reached] = 0.0
+
+    results = []
+    for i, graph in enumerate(compiled_graphs):
+        path = trajectory[:, i][trajectory[:, i] >= 0] - offsets[i]
+        visited = visited_steps[:, i][visited_steps[:, i] >= 0] - offsets[i]
+        results.append({
+            "reached": bool(reached[i]),
+            "final_node": graph.keys[curr[i] - offsets[i]],
+            "final_distance_to_target": float(final_distance[i]),
+            "visited": graph.get_path_keys(visited.tolist()),
+            "coordinates": [{"lat": float(graph.lat[node]), "lng": float(graph.lng[node])} for node in path.tolist()],
+        })
+    return results
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# same as ox.distance.great_circle_vec
+EARTH_RADIUS_M = 6_371_009
+
+
+def to_unit_vectors(lat, lng):
+    """Points on the unit sphere, where the chord length is monotonic in the great-circle distance"""
+    phi, lam = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lng, dtype=np.float64))
+    return np.stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=-1)
+
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.asarray(chord) / 2))
+
+
+def meters_to_chord(distance):
+    return 2 * np.sin(min(distance / EARTH_RADIUS_M, np.pi) / 2)
+
+
+def get_index_path(env_path, suffix="pano_index"):
+    """Path of the index stored next to an environment JSON, e.g., navi_env_0.json -> navi_env_0.pano_index.npz"""
+    return f"{os.path.splitext(env_path)[0]}.{suffix}.npz"
+
+
+class PanoIndex:
+    """
+    KD-tree over the panoramas of a navigation graph for nearest-pano lookups.
+
+    The panoramas are indexed as 3D points on the unit sphere, so the nearest points of the tree are the nearest
+    by great-circle distance. Distances are returned in meters as with `ox.distance.great_circle_vec`.
+    The keys and coordinates are saved next to the environment JSON (.npz) and the tree is rebuilt on load.
+    """
+
+    def __init__(self, keys, lat, lng):
+        self.keys = list(keys)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.tree = cKDTree(to_unit_vectors(self.lat, self.lng)) if self.keys else None
+
+    @classmethod
+    def from_graph(cls, graph):
+        keys = list(graph)
+        return cls(keys, [graph[key]["lat"] for key in keys], [graph[key]["lng"] for key in keys])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def matches(self, graph):
+        return len(graph) == len(self.keys) and all(key in graph for key in self.keys)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, keys=np.asarray(self.keys, dtype=str), lat=self.lat, lng=self.lng)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["keys"].tolist(), data["lat"], data["lng"])
+
+    @classmethod
+    def load_or_build(cls, graph, path):
+        """Load the index of `graph` from `path` (.npz), or build and save it if the file is missing or stale"""
+        try:
+            index = cls.load(path)
+            if index.matches(graph):
+                return index
+        except (OSError, KeyError, ValueError):
+            pass
+        index = cls.from_graph(graph)
+        index.save(path)
+        return index
+
+    def query(self, latitude, longitude, k=1):
+        """The `k` panoramas nearest to a location, as a list of (key, distance in meters), nearest first"""
+        if self.tree is None:
+            return []
+        k = min(k, len(self.keys))
+        chords, positions = self.tree.query(to_unit_vectors(latitude, longitude), k=k)
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        return [(self.keys[i], float(d)) for i, d in zip(positions, chord_to_meters(chords))]
+
+    def query_radius(self, latitude, longitude, radius):
+        """The panoramas within `radius` meters of a location, as a list of (key, distance in meters), nearest first"""
+        if self.tree is None:
+            return []
+        point = to_unit_vectors(latitude, longitude)
+        positions = np.asarray(self.tree.query_ball_point(point, meters_to_chord(radius)), dtype=np.int64)
+        distances = chord_to_meters(np.linalg.norm(self.tree.data[positions] - point, axis=-1))
+        order = np.argsort(distances, kind="stable")
+        return [(self.keys[positions[i]], float(distances[i])) for i in order]
+
+    def nearest(self, latitude, longitude):
+        """Key of the panorama nearest to a location, None if the graph is empty"""
+        result = self.query(latitude, longitude, k=1)
+        return result[0][0] if result else None
@@ -0,0 +1,236 @@
+import os
+import mmap
+import fcntl
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+from tasks.navigation.utils import fetch_street_view
+
+# one record per stored image in index.bin, appended after its bytes are in images.bin
+INDEX_DTYPE = np.dtype([("lat", "<i8"), ("lng", "<i8"), ("heading", "<i4"), ("offset", "<i8"), ("length", "<i4")])
+
+
+def quantize_view(lat, lng, heading):
+    """Index key of a view: lat/lng in 1e-7 degrees (about 1cm), heading in 1e-2 degrees"""
+    return round(lat * 1e7), round(lng * 1e7), round(heading * 100) % 36000
+
+
+class StreetViewStore:
+    """
+    Packed cache of Street View images for one camera setting (pitch, fov, size).
+
+    The JPEG bytes of all views are appended to a single memory-mapped `images.bin` and located
+    through `index.bin`, keyed on the quantized lat/lng/heading. Writes take a file lock, so several
+    processes can share a store; a process reloads the index tail before it fetches a missing view.
+    Decoded images are kept in an in-process LRU. Missing views are looked up in the legacy
+    one-file-per-view cache of `get_street_view_from_api` before calling the API, so an existing
+    cache directory is migrated on the fly (or at once with `pack_directory`).
+    """
+
+    def __init__(self, root="navigation/data/street_view_store", pitch=0, fov=120, size="600x400",
+                 lru_size=256, max_workers=4, legacy_dir="navigation/data/street_views", api_key=None):
+        self.pitch = pitch
+        self.fov = fov
+        self.size = size
+        self.store_dir = os.path.join(root, f"{pitch}_{fov}_{size}")
+        self.legacy_dir = legacy_dir
+        self.api_key = api_key
+        self.lru_size = lru_size
+        self.max_workers = max_workers
+
+        self.lock = threading.Lock()
+        self.index = {}
+        self.index_records = 0
+        self.data_file = None
+        self.index_file = None
+        self.data_map = None
+        self.images = OrderedDict()
+        self.session = None
+        self.executor = None
+
+        # memory: decoded image in the LRU, store: read from images.bin,
+        # legacy: imported from the legacy cache, miss: downloaded from the API
+        self.stats = {"memory_hit": 0, "store_hit": 0, "legacy_hit": 0, "miss": 0, "error": 0}
+
+    def open(self):
+        if self.data_file is not None:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.data_file = open(os.path.join(self.store_dir, "images.bin"), "a+b")
+        self.index_file = open(os.path.join(self.store_dir, "index.bin"), "a+b")
+        self.reload_index()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.data_map is not None:
+            self.data_map.close()
+            self.data_map = None
+        for f in [self.data_file, self.index_file]:
+            if f is not None:
+                f.close()
+        self.data_file = None
+        self.index_file = None
+
+    def __len__(self):
+        self.open()
+        return len(self.index)
+
+    def reload_index(self):
+        """Read the index records appended since the last reload, e.g., by another process"""
+        self.index_file.seek(self.index_records * INDEX_DTYPE.itemsize)
+        # a partially written record at the end is read on the next reload
+        count = (os.fstat(self.index_file.fileno()).st_size // INDEX_DTYPE.itemsize) - self.index_records
+        if count <= 0:
+            return
+        records = np.frombuffer(self.index_file.read(count * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        for lat, lng, heading, offset, length in records.tolist():
+            self.index[(lat, lng, heading)] = (offset, length)
+        self.index_records += count
+
+    def read_bytes(self, offset, length):
+        if self.data_map is None or offset + length > len(self.data_map):
+            # the data file has grown since it was mapped
+            if self.data_map is not None:
+                self.data_map.close()
+            self.data_map = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.data_map[offset:offset + length]
+
+    def put(self, lat, lng, heading, data):
+        key = quantize_view(lat, lng, heading)
+        with self.lock:
+            self.open()
+            fcntl.flock(self.index_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self.data_file.seek(0, os.SEEK_END)
+                offset = self.data_file.tell()
+                self.data_file.write(data)
+                self.data_file.flush()
+                record = np.array([key + (offset, len(data))], dtype=INDEX_DTYPE)
+                self.index_file.seek(0, os.SEEK_END)
+                self.index_file.write(record.tobytes())
+                self.index_file.flush()
+                # pick up the records of other processes together with our own
+                self.reload_index()
+            finally:
+                fcntl.flock(self.index_file.fileno(), fcntl.LOCK_UN)
+
+    def lookup(self, lat, lng, heading):
+        """Decoded image from the LRU or the store, None if the view is not stored"""
+        key = quantize_view(lat, lng, heading)
+        with self.lock:
+            self.open()
+            if key in self.images:
+                self.images.move_to_end(key)
+                self.stats["memory_hit"] += 1
+                return self.images[key]
+            if key not in self.index:
+                self.reload_index()
+            if key not in self.index:
+                return None
+            data = self.read_bytes(*self.index[key])
+            self.stats["store_hit"] += 1
+        return self.remember(key, data)
+
+    def remember(self, key, data):
+        image = Image.open(BytesIO(data))
+        image.load()
+        with self.lock:
+            self.images[key] = image
+            self.images.move_to_end(key)
+            while len(self.images) > self.lru_size:
+                self.images.popitem(last=False)
+        return image
+
+    def legacy_path(self, location, heading):
+        return os.path.join(self.legacy_dir, f"{location}_{heading}_{self.pitch}_{self.fov}_{self.size}.jpg")
+
+    def fetch(self, lat, lng, heading):
+        """Bytes of a view that is not in the store, from the legacy cache or the API"""
+        location = f"{lat},{lng}"
+        if self.legacy_dir is not None:
+            legacy_path = self.legacy_path(location, heading)
+            if os.path.exists(legacy_path):
+                with open(legacy_path, "rb") as f:
+                    return f.read(), True
+
+        if self.session is None:
+            self.session = requests.Session()
+        api_key = self.api_key or os.getenv("GOOGLE_API_KEY")
+        data = fetch_street_view(api_key, location, heading=heading, pitch=self.pitch, fov=self.fov,
+                                 size=self.size, session=self.session)
+        return data, False
+
+    def fetch_and_store(self, lat, lng, heading):
+        data, is_legacy = self.fetch(lat, lng, heading)
+        with self.lock:
+            if data is None:
+                self.stats["error"] += 1
+            else:
+                self.stats["legacy_hit" if is_legacy else "miss"] += 1
+        if data is None:
+            return None, False
+        self.put(lat, lng, heading, data)
+        return self.remember(quantize_view(lat, lng, heading), data), is_legacy
+
+    def get(self, lat, lng, heading):
+        """
+        Get the Street View image of a view, see `get_street_view_from_api`.
+
+        Returns:
+            Image object if successful, None otherwise.
+            True/False if the image is cached.
+        """
+        image = self.lookup(lat, lng, heading)
+        if image is not None:
+            return image, True
+        return self.fetch_and_store(lat, lng, heading)
+
+    def get_many(self, lat, lng, headings):
+        """Same as `get` for several headings of a location, the missing views are fetched concurrently"""
+        results = [None] * len(headings)
+        missing = []
+        for i, heading in enumerate(headings):
+            image = self.lookup(lat, lng, heading)
+            if image is None:
+                missing.append(i)
+            else:
+                results[i] = (image, True)
+
+        if len(missing) == 1:
+            results[missing[0]] = self.fetch_and_store(lat, lng, headings[missing[0]])
+        elif missing:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            futures = [self.executor.submit(self.fetch_and_store, lat, lng, headings[i]) for i in missing]
+            for i, future in zip(missing, futures):
+                results[i] = future.result()
+        return results
+
+    def pack_directory(self, cache_dir):
+        """Import the `{lat},{lng}_{heading}_{pitch}_{fov}_{size}.jpg` files of a legacy cache directory"""
+        self.open()
+        imported = 0
+        suffix = f"_{self.pitch}_{self.fov}_{self.size}.jpg"
+        for file_name in os.listdir(cache_dir):
+            if not file_name.endswith(suffix):
+                continue
+            try:
+                location, heading = file_name[:-len(suffix)].rsplit("_", 1)
+                lat, lng = (float(x) for x in location.split(","))
+                heading = float(heading)
+            except ValueError:
+                continue
+            if quantize_view(lat, lng, heading) in self.index:
+                continue
+            with open(os.path.join(cache_dir, file_name), "rb") as f:
+                self.put(lat, lng, heading, f.read())
+            imported += 1
+        return imported
@@ -17,7 +17,8 @@ import re
 from tqdm import tqdm
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from models.outdoor.navigation.utils import get_pano_meta, get_session_token, get_pano_meta_from_id, calculate_cost, add_task_ids, read_json_file, merge_json, haversine, dijkstra_shortest_path
+from models.outdoor.navigation.utils import get_pano_meta, get_session_token, get_pano_meta_from_id, calculate_cost, add_task_ids, read_json_file, merge_json, haversine
+from models.outdoor.navigation.path_service import PathService
 from models.outdoor.navigation.task_construction import construct_navi_task # construct the env
 from models.outdoor.navigation.target_gen.generator import DataGenerator # generate the endpoints
 
@@ -48,36 +49,18 @@ def parse_coordinate(coord_str):
 # This function takes an input distance (in meters), the graph (as a dictionary),
 # and the source coordinate (as a string). It randomly selects and returns a node (by its key)
 # from the graph whose distance from the source is greater than the given distance.
-def get_random_node_above_distance(distance_threshold, graph, source):
-    # Parse the source coordinate string into latitude and longitude.
-    source_lat, source_lng = parse_coordinate(source)
-
-    # Initialize a list to hold nodes that are beyond the threshold distance.
-    valid_nodes = []
-    max_distance: float = -1.0       # Track the largest distance seen so far.
-    farthest_node: str | None = None # Node corresponding to max_distance.
-
-    # Iterate through all nodes in the graph.
-    for node in graph:
-        if node == source:           # Skip the source itself.
-            continue
-        # Parse the node coordinate from the node key.
-        node_lat, node_lng = parse_coordinate(node)
-        # Calculate the distance from the source to the current node.
-        d = haversine(source_lat, source_lng, node_lat, node_lng)
-        # Check if the distance is greater than the threshold and skip the source itself.
-        if d > distance_threshold:
-            valid_nodes.append(node)
-
-        # Update farthest node found so far.
-        if d > max_distance:
-            max_distance = d
-            farthest_node = node
+# Pass a PathService of the graph to reuse the straight-line distance index of the source across calls.
+def get_random_node_above_distance(distance_threshold, graph, source, path_service=None):
+    if path_service is None:
+        path_service = PathService(graph)
+
+    # Nodes beyond the threshold distance (straight line), from the sorted distance index of the source.
+    valid_nodes = path_service.get_nodes_above_distance(source, distance_threshold, metric="haversine")
 
     # If no nodes are found that satisfy the condition, print the error message.
-    if not valid_nodes: # Potential Problem: if no node, there will be an error in the following lines.
+    if not valid_nodes:
         print("Distance is too large, please try a smaller distance.")
-        return farthest_node # revise the potential problem above
+        return path_service.get_farthest_node(source, metric="haversine")
     else:
         # Randomly select one node from the valid nodes.
         start_point = random.choice(valid_nodes)
@@ -364,8 +347,11 @@ def auto_generate(args, task_id, logger):
     # Define a distance threshold in meters (for example, 30 meters).
     distance_input = float(args.threshold)
 
+    # Distances and shortest paths over the graph, compiled once for both steps below.
+    path_service = PathService(graph_data)
+
     # Get a random node that is farther than the specified distance from the source.
-    result = get_random_node_above_distance(distance_input, graph_data, source_coord)
+    result = get_random_node_above_distance(distance_input, graph_data, source_coord, path_service)
 
     # If a valid node is found, print the result (the parsed coordinate tuple).
     if result:
@@ -401,7 +387,7 @@ def auto_generate(args, task_id, logger):
     # Step 5: Find the shortest path using Dijkstra's algorithm
 
     # Find the shortest path using Dijkstra's algorithm.
-    shortest_path = dijkstra_shortest_path(graph_data, start, target)
+    shortest_path = path_service.get_path(start, target)
     if shortest_path is None:
         print("No path found from start to target.")
     else:
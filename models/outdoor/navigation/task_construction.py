@@ -4,10 +4,17 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import osmnx as ox
 import json
 from tasks.navigation.utils import get_panograph_around_location
+from tasks.navigation.spatial_index import PanoIndex, get_index_path
 import argparse
 
-def get_closest_node_from_graph_json(graph_json, target_location):
+def get_closest_node_from_graph_json(graph_json, target_location, pano_index=None):
+    """
+    Key of the panorama in the graph closest to `target_location` (lat, lon).
+    With the `PanoIndex` of the graph, the lookup is a KD-tree query instead of a scan over all nodes.
+    """
     target_lat, target_lon = target_location
+    if pano_index is not None:
+        return pano_index.nearest(target_lat, target_lon)
     closest_node = None
     closest_distance = float("inf")
     for node_id, node_meta in graph_json.items():
@@ -30,17 +37,29 @@ def construct_surrounding_graph_from_paronama(
     print(f"Distance between source and target is {distance} meters")
     return get_panograph_around_location(source_lat, source_lon, API_KEY, distance_threshold=distance * coefficient)
 
+def load_graph_json(path):
+    """Panorama graph of a saved task JSON (under "graph") or of a graph JSON"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["graph"] if "graph" in data else data
+
 def construct_navi_task(
     source_location = (34.0694767, -118.4443319), # Engneering VI
     target_location = (34.0703956, -118.4442832), # Ackerman Union
     dump_path = "navigation/data/navi_task.json",
     coefficient = 1.0,
+    graph_path = None,
 ):
-    # sample a subgraph from G based on the source and target locations
-    pano_graph_json = construct_surrounding_graph_from_paronama(source_location, target_location, coefficient)
-
-    source_node_id = get_closest_node_from_graph_json(pano_graph_json, source_location)
-    target_node_id = get_closest_node_from_graph_json(pano_graph_json, target_location)
+    if graph_path is not None:
+        # reuse the graph of a saved task, with its index loaded from next to it instead of rebuilt for every task
+        pano_graph_json = load_graph_json(graph_path)
+        pano_index = PanoIndex.load_or_build(pano_graph_json, get_index_path(graph_path))
+    else:
+        # sample a subgraph from G based on the source and target locations
+        pano_graph_json = construct_surrounding_graph_from_paronama(source_location, target_location, coefficient)
+        pano_index = PanoIndex.from_graph(pano_graph_json)
+    source_node_id = get_closest_node_from_graph_json(pano_graph_json, source_location, pano_index)
+    target_node_id = get_closest_node_from_graph_json(pano_graph_json, target_location, pano_index)
 
     task_json = {
         "source": source_node_id,
@@ -55,6 +74,8 @@ def construct_navi_task(
 
     with open(dump_path, "w") as f:
         json.dump(task_json, f, indent=4)
+    # the index is kept next to the task JSON, for later tasks on the same graph (see `graph_path`)
+    pano_index.save(get_index_path(dump_path))
     
     print(f"Navigation task has been successfully saved to {dump_path}")
 
@@ -76,6 +97,7 @@ def parse_args():
     parser.add_argument('--target_location', type=parse_coordinates, default=(34.0703956, -118.4442832)) # Ackerman Union
     parser.add_argument('--coefficient', type=str, default='1.0')
     parser.add_argument('--dump_path', type=str, default='tasks/navigation/data/navi_task.json')
+    parser.add_argument('--graph_path', type=str, default=None, help='saved task JSON whose graph is reused instead of crawling a new one')
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -84,4 +106,4 @@ if __name__ == "__main__":
     source_location = args.source_location
     target_location = args.target_location
     coefficient = float(args.coefficient)
-    construct_navi_task(source_location, target_location, dump_path, coefficient)
+    construct_navi_task(source_location, target_location, dump_path, coefficient, args.graph_path)
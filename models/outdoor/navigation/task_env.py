@@ -1,30 +1,41 @@
-import os
-import io
 import gym
 import json
 import osmnx as ox
-import matplotlib.pyplot as plt
 from PIL import Image
 import numpy as np
-from tasks.navigation.utils import get_street_view_from_api, get_heading_diff
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tasks.navigation.utils import get_heading_diff
+from tasks.navigation.street_view_store import StreetViewStore, quantize_view
+from tasks.navigation.compiled_graph import CompiledGraph
+from tasks.navigation.scoring import fill_observation_headings
+from tasks.navigation.map_render import OSMGraphCache, MapRenderer
 
 class NaviEnvConfig:
     
-    def __init__(self, task_path, max_steps=50):
+    def __init__(self, task_path, max_steps=50, prefetch_hops=1):
         self.task_path = task_path
         self.max_steps = max_steps
+        # prefetch the observations reachable within this many actions, 0 to disable
+        self.prefetch_hops = prefetch_hops
 
 
 class NaviMap:
     
-    def __init__(self, graph):
+    def __init__(self, graph, street_view_store=None):
         self.graph = graph
+        self.street_view_store = street_view_store if street_view_store is not None else StreetViewStore(fov=120)
+        # integer node ids and CSR adjacency for the path searches, compiled on first use
+        self.compiled_graph = None
         self.cache_hit = 0
         self.cache_miss = 0
         self.cur_heading = 0.0
     
     def get_cache_stats(self):
         return self.cache_hit, self.cache_miss
+
+    def get_store_stats(self):
+        return dict(self.street_view_store.stats)
     
     def get_coordinates(self, node_id):
         if node_id not in self.graph:
@@ -38,92 +49,38 @@ class NaviMap:
             max_degree = max(max_degree, len(node_meta["links"]))
         return max_degree
     
+    def get_compiled_graph(self):
+        if self.compiled_graph is None:
+            self.compiled_graph = CompiledGraph.from_graph(self.graph)
+        return self.compiled_graph
+
     def get_shortest_path(self, source_node, target_node):
 
         if source_node not in self.graph or target_node not in self.graph:
             return None
         
         # using BFS to find the shortest path in interns of edge number
-        visited = set()
-        queue = [source_node]
-        parent_map = {}
-
-        while queue:
-            cur_node = queue.pop(0)
-            if cur_node == target_node:
-                break
-            visited.add(cur_node)
-            for link_node in self.graph[cur_node]["links"]:
-                if link_node not in visited:
-                    queue.append(link_node)
-                    parent_map[link_node] = cur_node
-        
-        if target_node not in parent_map:
-            return None
-        
-        path = [target_node]
-        while path[-1] != source_node:
-            path.append(parent_map[path[-1]])
-        
-        return path[::-1]
+        return self.get_compiled_graph().bfs_shortest_path(source_node, target_node)
     
-    def get_observation_headings(self, node_meta):
+    def get_observation_headings(self, node_meta, cur_heading=None):
         """ 
         Return four different ego-centric headings.
         We will return headings to the linked nodes in a clockwise (right-to-left) order relative to current ego heading.
         When the links are less than 4, we will insert the gap with default headings [0, 90, 180, 270]
+        The ego heading is `cur_heading` if given, otherwise the current heading of the agent.
         """
+        if cur_heading is None:
+            cur_heading = self.cur_heading
 
-        default_headings = [0, 90, 180, 270]
+        link_headings = [link_meta["heading"] for link_meta in node_meta["links"].values()]
+        return fill_observation_headings(link_headings, cur_heading)
 
-        headings = []
-        for _, link_meta in node_meta["links"].items():
-            ego_heading = (link_meta["heading"] - self.cur_heading) % 360.0
-            headings.append(ego_heading)
-        
-        # sort the headings
-        headings.sort()
-        
-        # If the headings are less than 4, insert the gap with default headings
-        # We would like the inserted default heading to be in the gap with the maximum angle difference with currently added headings
-        while len(headings) < 4:
-            
-            max_diff = 0.0
-            max_diff_head = 0
-            for i in range(len(headings)):
-                diff = (headings[(i+1)%len(headings)] - headings[i])%360.0
-                if diff > max_diff:
-                    max_diff = diff
-                    max_diff_head = i
-            
-            max_min_diff = 0.0
-            for i in range(4):
-                
-                if max_diff_head == len(headings) - 1:
-                    is_in_gap = headings[max_diff_head] < default_headings[i] or default_headings[i] < headings[0]
-                else:
-                    is_in_gap = headings[max_diff_head] < default_headings[i] < headings[max_diff_head+1]
-                
-                if is_in_gap:
-                    
-                    min_diff = min(get_heading_diff(default_headings[i], headings[max_diff_head]), get_heading_diff(default_headings[i], headings[(max_diff_head+1)%len(headings)]))
-                    if min_diff > max_min_diff:
-                        max_min_diff = min_diff
-                        max_min_diff_head = i
-                         
-            headings.append(default_headings[max_min_diff_head])
-            headings.sort()
-        
-        assert len(headings) == 4, f"The number of headings should be 4, get {headings} with length {len(headings)}"
-        assert headings[0] < headings[1] < headings[2] < headings[3], f"The headings should be in ascending order and not equal to each other but get {headings}"
-
-        # Some post processing to make sure the headings are in a disrable order
-        diff_0 = min(abs(headings[0]), abs(headings[0] + 360), abs(headings[0] - 360))
-        diff_3 = min(abs(headings[3]), abs(headings[3] + 360), abs(headings[3] - 360))
-        if diff_0 > diff_3:
-            headings = [headings[3]] + headings[:3]
-        
-        return headings
+    def get_absolute_headings(self, node_meta, cur_heading=None):
+        """The observation headings rotated to absolute headings"""
+        if cur_heading is None:
+            cur_heading = self.cur_heading
+        headings = self.get_observation_headings(node_meta, cur_heading)
+        return [(heading + cur_heading) % 360 for heading in headings]
 
     def get_observation(self, node_id):
         if node_id not in self.graph:
@@ -136,15 +93,10 @@ class NaviMap:
         
         street_views = []
 
-        headings = self.get_observation_headings(node_meta)
-
-        # rotate headings to absolute headings
-        headings = [(heading + self.cur_heading) % 360 for heading in headings]
+        headings = self.get_absolute_headings(node_meta)
 
-        for heading in headings:
-            location=f"{lat},{lng}"
-            api_key = os.getenv("GOOGLE_API_KEY")
-            street_view, is_cache = get_street_view_from_api(api_key, location, heading=heading, fov=120)
+        # the missing headings are fetched concurrently
+        for street_view, is_cache in self.street_view_store.get_many(lat, lng, headings):
             if is_cache:
                 self.cache_hit += 1
             else:
@@ -160,11 +112,17 @@ class NaviMap:
         """
         if node_id not in self.graph:
             return node_id
-        
+
+        next_node, self.cur_heading = self.get_next_state(node_id, self.cur_heading, action)
+        return next_node
+
+    def get_next_state(self, node_id, cur_heading, action):
+        """The node and heading of the agent after an action, without moving it, see `move`"""
+        if node_id not in self.graph:
+            return node_id, cur_heading
+
         node_meta = self.graph[node_id]
-        headings = self.get_observation_headings(node_meta)
-        for i in range(4):
-            headings[i] = (headings[i] + self.cur_heading) % 360
+        headings = self.get_absolute_headings(node_meta, cur_heading)
 
         action_nodes = [node_id, node_id, node_id, node_id]
         for link_node, link_meta in node_meta["links"].items():
@@ -178,13 +136,133 @@ class NaviMap:
             assert min_head_diff == 0.0, f"heading should be in observation headings for linked ndoes, but get minimum head difference {min_head_diff}"
             action_nodes[min_head_id] = link_node
         
-        self.cur_heading = headings[action]
-        return action_nodes[action]
-        
+        return action_nodes[action], headings[action]
+
+
+class ObservationPrefetcher:
+    """
+    Warms the Street View store with the observations the agent can reach within `hops` actions,
+    while the agent decides on the next action.
+
+    A state is a node together with the heading of the agent, since the heading decides which views
+    are observed. The stats count the observed views that had been prefetched (hits) and the views
+    the prefetcher downloaded that have not been observed (wasted fetches).
+    """
+
+    def __init__(self, navi_map, hops=1, max_workers=2):
+        self.map = navi_map
+        self.hops = hops
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.prefetched_views = set()
+        self.fetched_views = set()
+        self.observed_views = set()
+        self.observed = 0
+        self.hits = 0
+
+    @staticmethod
+    def get_state_key(node_id, cur_heading):
+        return node_id, round(cur_heading * 100) % 36000
+
+    def get_views(self, node_id, cur_heading):
+        node_meta = self.map.graph[node_id]
+        headings = self.map.get_absolute_headings(node_meta, cur_heading)
+        return node_meta["lat"], node_meta["lng"], headings
+
+    def get_reachable_states(self, node_id, cur_heading):
+        """States within `hops` actions in breadth-first order, without the current one"""
+        start = self.get_state_key(node_id, cur_heading)
+        seen = {start}
+        states = []
+        frontier = [(node_id, cur_heading)]
+        for _ in range(self.hops):
+            next_frontier = []
+            for state in frontier:
+                for action in range(4):
+                    try:
+                        next_state = self.map.get_next_state(*state, action)
+                    except AssertionError:
+                        # the env would fail on this move as well
+                        continue
+                    key = self.get_state_key(*next_state)
+                    if key not in seen:
+                        seen.add(key)
+                        states.append(next_state)
+                        next_frontier.append(next_state)
+            frontier = next_frontier
+        return states
+
+    def fetch(self, node_id, cur_heading):
+        lat, lng, headings = self.get_views(node_id, cur_heading)
+        results = self.map.street_view_store.get_many(lat, lng, headings)
+        with self.lock:
+            for heading, (_, is_cache) in zip(headings, results):
+                view = quantize_view(lat, lng, heading)
+                self.prefetched_views.add(view)
+                if not is_cache:
+                    self.fetched_views.add(view)
+
+    def prefetch(self, node_id, cur_heading):
+        """Drop the queued states of the previous step and queue the ones reachable from here"""
+        if node_id not in self.map.graph:
+            return
+        states = self.get_reachable_states(node_id, cur_heading)
+        keys = {self.get_state_key(*state) for state in states}
+        for key, future in list(self.futures.items()):
+            if key not in keys and (future.cancel() or future.done()):
+                del self.futures[key]
+        for state in states:
+            key = self.get_state_key(*state)
+            if key not in self.futures and state[0] in self.map.graph:
+                self.futures[key] = self.executor.submit(self.fetch, *state)
+
+    def wait(self, node_id, cur_heading):
+        """Wait for a running prefetch of the state, so that its views are not downloaded twice"""
+        future = self.futures.pop(self.get_state_key(node_id, cur_heading), None)
+        if future is not None and not future.cancel():
+            try:
+                future.result()
+            except Exception as e:
+                print("Error prefetching Street View images:", e)
+
+    def record_observation(self, node_id, cur_heading):
+        if node_id not in self.map.graph:
+            return
+        lat, lng, headings = self.get_views(node_id, cur_heading)
+        with self.lock:
+            for heading in headings:
+                view = quantize_view(lat, lng, heading)
+                self.observed += 1
+                self.hits += view in self.prefetched_views
+                self.observed_views.add(view)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "prefetch_hit": self.hits,
+                "prefetch_hit_rate": self.hits / self.observed if self.observed else 0.0,
+                "prefetch_wasted_fetches": len(self.fetched_views - self.observed_views),
+            }
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.executor.shutdown()
+
 
 class NaviEnv(gym.Env):
     
-    def __init__(self, config: NaviEnvConfig, visualize_map=False):
+    def __init__(self, config: NaviEnvConfig, visualize_map=False, render_mode="composite", osm_graph_cache=None):
+        """
+        Parameters:
+            visualize_map (bool): render the OSM map of the episode next to the observations
+            render_mode (str): "composite" rasterizes the map once and draws the current position on it at every step,
+                "replot" plots the whole map at every step
+            osm_graph_cache (OSMGraphCache): where the OSM graphs are downloaded to and loaded from
+        """
+        assert render_mode in ("composite", "replot"), f"Unknown render mode {render_mode}"
         self.config = config
         with open(config.task_path, "r") as f:
             task_json = json.load(f)
@@ -192,29 +270,45 @@ class NaviEnv(gym.Env):
         self.target_node = task_json["target"]
         self.map = NaviMap(task_json["graph"])
         self.viualize_map = visualize_map
+        self.render_mode = render_mode
+        self.prefetcher = None
+        if config.prefetch_hops > 0:
+            self.prefetcher = ObservationPrefetcher(self.map, hops=config.prefetch_hops)
 
+        # the OSM graph is loaded on the first render
+        self.osm_graph = None
+        self.map_renderer = None
         if visualize_map:
-            source_lat, source_lon = self.map.get_coordinates(self.source_node)
-            target_lat, target_lon = self.map.get_coordinates(self.target_node)
-            distance = ox.distance.great_circle_vec(source_lat, source_lon, target_lat, target_lon)
-            self.osm_graph = ox.graph_from_point((source_lat, source_lon), dist=distance * 2.5, network_type="all")
-            self.osm_graph.add_node(-2, x=target_lon, y=target_lat)
+            self.osm_graph_cache = osm_graph_cache if osm_graph_cache is not None else OSMGraphCache()
             self.shortest_path = self.map.get_shortest_path(self.source_node, self.target_node)
-            self.shortest_path_index = []
             assert self.shortest_path is not None, "No path found between source and target, the task is not solvable"
             assert self.map.get_max_degree() <= 4, "The map is too complex because one node has more than 4 edges, the agent may not be able to handle it"
 
-            for i, node in enumerate(self.shortest_path[:-1]):
-                lat, lon = self.map.get_coordinates(node)
-                self.osm_graph.add_node(-3-i, x=lon, y=lat)
-                self.shortest_path_index.append(-3-i)
-                
-        
         self.reset()
 
+    def get_map_renderer(self):
+        if self.map_renderer is None:
+            source_lat, source_lon = self.map.get_coordinates(self.source_node)
+            target_lat, target_lon = self.map.get_coordinates(self.target_node)
+            distance = ox.distance.great_circle_vec(source_lat, source_lon, target_lat, target_lon)
+            self.osm_graph = self.osm_graph_cache.get_graph(source_lat, source_lon, distance * 2.5, network_type="all")
+            path_coordinates = [self.map.get_coordinates(node) for node in self.shortest_path[:-1]]
+            self.map_renderer = MapRenderer(self.osm_graph, path_coordinates, (target_lat, target_lon))
+        return self.map_renderer
+
     def reset(self):
         self.current_location = self.source_node
-        return self.map.get_observation(self.source_node)
+        return self.observe()
+
+    def observe(self):
+        """Observation of the current location, then prefetch the next ones while the agent thinks"""
+        if self.prefetcher is not None:
+            self.prefetcher.wait(self.current_location, self.map.cur_heading)
+            self.prefetcher.record_observation(self.current_location, self.map.cur_heading)
+        obs = self.map.get_observation(self.current_location)
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(self.current_location, self.map.cur_heading)
+        return obs
 
     def step(self, action):
         next_location = self.map.move(self.current_location, action)
@@ -234,8 +328,17 @@ class NaviEnv(gym.Env):
         self.current_location = next_location
         info["obs_cache_hit"], info["obs_cache_miss"] = self.map.get_cache_stats()
         info["obs_cache_hit_rate"] = info["obs_cache_hit"] / (info["obs_cache_hit"] + info["obs_cache_miss"])
-        
-        return self.map.get_observation(self.current_location), reward, done, info
+        info["obs_store_stats"] = self.map.get_store_stats()
+
+        obs = self.observe()
+        if self.prefetcher is not None:
+            info.update(self.prefetcher.get_stats())
+
+        return obs, reward, done, info
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
     
     def render(self, obs):
 
@@ -250,29 +353,12 @@ class NaviEnv(gym.Env):
             return Image.fromarray(concat_array)
         
         if self.viualize_map:
-            cur_lat, cur_lon = self.map.get_coordinates(self.current_location)
-            if self.osm_graph.has_node(-1):
-                self.osm_graph.remove_node(-1)
-            
-            self.osm_graph.add_node(-1, x=cur_lon, y=cur_lat)
-            node_colors = ['white' for _ in self.osm_graph.nodes()]
-            for i, node in enumerate(self.osm_graph.nodes()):
-                if node == -1:
-                    node_colors[i] = "red" 
-                elif node == -2:
-                    node_colors[i] = "green"
-                elif node in self.shortest_path_index:
-                    node_colors[i] = 'blue'
-
-            fig, _ = ox.plot_graph(self.osm_graph, node_color=node_colors, figsize=(6,6), show=False)
-
-            # Convert fig to PIL image
-            with io.BytesIO() as buf:
-                fig.tight_layout(pad=0)
-                fig.savefig(buf, format='png')
-                buf.seek(0)
-                img = Image.open(buf).convert('RGB')
-            plt.close(fig)
+            current_coordinates = self.map.get_coordinates(self.current_location)
+            map_renderer = self.get_map_renderer()
+            if self.render_mode == "composite":
+                img = map_renderer.render(current_coordinates)
+            else:
+                img = map_renderer.plot(current_coordinates)
 
             return concat_images([obs[0], obs[1], obs[2], obs[3], img])
         
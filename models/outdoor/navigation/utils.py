@@ -1,9 +1,9 @@
 import requests
 import os
+import asyncio
 import json
 import math
 import re
-import heapq
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
@@ -12,6 +12,8 @@ import osmnx as ox
 from shapely.geometry import Point
 from shapely.ops import nearest_points
 
+from .compiled_graph import CompiledGraph
+
 def get_heading_diff(head1, head2):
     return min(abs(head1 - head2), abs(head1 - head2 + 360), abs(head1 - head2 - 360))
 
@@ -40,6 +42,22 @@ def get_street_view_from_api(api_key:str, location:str, heading=0, pitch=0, fov=
     if os.path.exists(cache_path):
         return Image.open(cache_path), True
     
+    content = fetch_street_view(api_key, location, heading=heading, pitch=pitch, fov=fov, size=size)
+    if content is None:
+        return None, False
+
+    # Load image from response content
+    image = Image.open(BytesIO(content))
+    image.save(cache_path)
+    return image, False
+
+def fetch_street_view(api_key:str, location:str, heading=0, pitch=0, fov=90, size="600x400", session=None):
+    """
+    Download a Google Street View image without caching it, see `get_street_view_from_api`.
+
+    Returns:
+        The JPEG bytes if successful, None otherwise.
+    """
     base_url = "https://maps.googleapis.com/maps/api/streetview"
     params = {
         "size": size,
@@ -49,17 +67,14 @@ def get_street_view_from_api(api_key:str, location:str, heading=0, pitch=0, fov=
         "fov": fov,
         "key": api_key
     }
-    
-    response = requests.get(base_url, params=params)
-    
+
+    response = (session or requests).get(base_url, params=params)
+
     if response.status_code == 200:
-        # Load image from response content
-        image = Image.open(BytesIO(response.content))
-        image.save(cache_path)
-        return image, False
+        return response.content
     else:
         print("Error fetching Street View image:", response.status_code, response.text)
-        return None, False
+        return None
 
 def get_nearest_road_from_api(api_key, latitude, longitude):
     """
@@ -156,76 +171,22 @@ def get_pano_id(meta):
 def get_meta_distance(meta_a, meta_b):
     return ox.distance.great_circle_vec(meta_a["lat"], meta_a["lng"], meta_b["lat"], meta_b["lng"])
 
-def get_panograph_around_location(latitute, longitude, api_key:str, distance_threshold:float=50.0):
-    session_token = get_session_token(api_key)
-    if session_token is None:
-        return None
-
-    meta = get_pano_meta(latitute, longitude, api_key, session_token)
-    if meta is None:
-        return None
-    
-    if "links" not in meta:
-        
-        latitute, longitude = get_nearest_road_from_api(api_key, latitute, longitude)
-        meta = get_pano_meta(latitute, longitude, api_key, session_token)
-        if meta is None:
-            return None
-    
-    # Constructing a graph of panoramas with metadata using breadth-first search
-    source_node_id = get_pano_id(meta)
-    pano_graph = {
-        source_node_id: {
-            "google_pano_id": meta["panoId"],
-            "lat": meta["lat"],
-            "lng": meta["lng"],
-            "links": {},
-        }
-    }
-    visited = set()
-    queue = [meta]
-
-    while queue:
-        current_meta = queue.pop(0)
-        current_id = get_pano_id(current_meta)
-        if current_id in visited:
-            continue
-
-        visited.add(current_id)
-
-        if "links" not in current_meta:
-            print(current_meta)
-            continue
-
-        for link in current_meta["links"]:
-            pano_meta = get_pano_meta_from_id(link['panoId'], api_key, session_token)
-
-            if pano_meta is None:
-                continue
-
-            if get_meta_distance(meta, pano_meta) > distance_threshold:
-                continue
-
-            pano_id = get_pano_id(pano_meta)
-
-            if pano_id not in pano_graph[current_id]["links"]:
-                pano_graph[current_id]["links"][pano_id] = {
-                    "google_pano_id": pano_meta["panoId"],
-                    "heading": link["heading"],
-                    "text": link["text"],
-                    "elevaionAboveEgm96": link["elevationAboveEgm96"]
-                }
+def get_panograph_around_location(latitute, longitude, api_key:str, distance_threshold:float=50.0,
+                                  max_concurrency:int=16, cache_path="navigation/data/pano_meta_cache.jsonl", checkpoint_path=None):
+    """
+    Construct a graph of panoramas with metadata around a location, see `PanoCrawler`.
 
-            if pano_id not in pano_graph:
-                queue.append(pano_meta)
-                pano_graph[pano_id] = {
-                    "google_pano_id": pano_meta["panoId"],
-                    "lat": pano_meta["lat"],
-                    "lng": pano_meta["lng"],
-                    "links": {},
-                }
+    Parameters:
+        max_concurrency (int): The maximum number of metadata requests in flight.
+        cache_path (str): The JSONL file caching the panorama metadata by pano id, None to disable.
+        checkpoint_path (str): The file to save the crawl after every BFS level and to resume from.
+    """
+    # imported here since the crawler uses the helpers above
+    from tasks.navigation.pano_crawler import PanoCrawler
 
-    return pano_graph
+    crawler = PanoCrawler(api_key, distance_threshold=distance_threshold, max_concurrency=max_concurrency,
+                          cache_path=cache_path, checkpoint_path=checkpoint_path)
+    return asyncio.run(crawler.crawl(latitute, longitude))
 
 ###### Outdoor Navigation ######
 
@@ -358,62 +319,17 @@ def angular_diff(a: float, b: float) -> float:
 
 # Dijkstra algorithm to compute the shortest path between start and target nodes in the graph.
 def dijkstra_shortest_path(graph, start, target):
-    # distances: store the minimum distance to each node; initialize start node distance to 0
-    distances = {node: math.inf for node in graph}
-    distances[start] = 0
-
-    # predecessor: to reconstruct the shortest path
-    predecessors = {}
-
-    # priority queue (min-heap): stores tuples of (distance, node_key)
-    queue = [(0, start)]
-
-    while queue:
-        current_distance, current_node = heapq.heappop(queue)
-
-        # If the current node is the target, we can stop early
-        if current_node == target:
-            break
-
-        # If we found a longer distance in the queue than the best known, skip it
-        if current_distance > distances[current_node]:
-            continue
-
-        # Iterate over all neighbors of the current node
-        # The neighbors are found in the "links" dictionary for the current node
-        for neighbor in graph[current_node]["links"]:
-            # Get the geographic coordinates for the current node and the neighbor
-            curr_lat = graph[current_node]["lat"]
-            curr_lng = graph[current_node]["lng"]
-            # Ensure neighbor exists in the graph
-            if neighbor not in graph:
-                continue
-            neighbor_lat = graph[neighbor]["lat"]
-            neighbor_lng = graph[neighbor]["lng"]
-
-            # Compute the distance between the current node and the neighbor
-            weight = haversine(curr_lat, curr_lng, neighbor_lat, neighbor_lng)
-            distance_through_current = current_distance + weight
-
-            # If a shorter path to the neighbor is found, update its distance and predecessor
-            if distance_through_current < distances[neighbor]:
-                distances[neighbor] = distance_through_current
-                predecessors[neighbor] = current_node
-                heapq.heappush(queue, (distance_through_current, neighbor))
-
-    # If the target is unreachable, return None
-    if distances[target] == math.inf:
-        return None
-
-    # Reconstruct the path by following predecessors from target to start
-    path = []
-    node = target
-    while node != start:
-        path.append(node)
-        node = predecessors[node]
-    path.append(start)
-    path.reverse()  # reverse the path to get it from start to target
-    return path
+    """
+    Parameters:
+        graph: navigation graph, either the dict of the environment or a `CompiledGraph` of it.
+               A dict is compiled on every call, compile it once to search the same graph repeatedly.
+        start, target: node keys.
+    Returns:
+        list of node keys from start to target, None if the target is unreachable.
+    """
+    if not isinstance(graph, CompiledGraph):
+        graph = CompiledGraph.from_graph(graph)
+    return graph.dijkstra_shortest_path(start, target)
 
 def read_json_file(file_path):
     """
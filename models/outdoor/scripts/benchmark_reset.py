@@ -0,0 +1,79 @@
+"""Benchmark the per-episode startup time of `ScriptBrowserEnv.reset` with
+and without the persistent browser (`reuse_browser`).
+
+Without config files every reset opens a blank page, which isolates the
+Chromium and context startup cost.
+
+Example:
+
+    python scripts/benchmark_reset.py --resets 20
+    python scripts/benchmark_reset.py --config_files "config_files/ewa_outdoor/test_map/*.json"
+"""
+
+import argparse
+import glob
+import statistics
+
+from browser_env import ScriptBrowserEnv
+
+
+def config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--config_files",
+        type=str,
+        default="",
+        help="Glob of task config files, reset with a blank page if empty",
+    )
+    parser.add_argument("--resets", type=int, default=10)
+    parser.add_argument(
+        "--observation_type",
+        choices=["accessibility_tree", "html", "image"],
+        default="accessibility_tree",
+    )
+    return parser.parse_args()
+
+
+def time_resets(
+    reuse_browser: bool, config_files: list[str], args: argparse.Namespace
+) -> list[float]:
+    env = ScriptBrowserEnv(
+        headless=True,
+        observation_type=args.observation_type,
+        reuse_browser=reuse_browser,
+    )
+    setup_times = []
+    for i in range(args.resets):
+        if config_files:
+            config_file = config_files[i % len(config_files)]
+            env.reset(options={"config_file": config_file})
+        else:
+            env.reset()
+        setup_times.append(env.setup_time)
+    env.close()
+    return setup_times
+
+
+def main() -> None:
+    args = config()
+    config_files = sorted(glob.glob(args.config_files))
+
+    results = {}
+    for reuse_browser in [False, True]:
+        setup_times = time_resets(reuse_browser, config_files, args)
+        results[reuse_browser] = setup_times
+        # the first reset of the pool still launches the browser
+        print(
+            f"reuse_browser={reuse_browser}: "
+            f"first={setup_times[0] * 1000:.0f}ms "
+            f"median={statistics.median(setup_times) * 1000:.0f}ms "
+            f"mean={statistics.mean(setup_times) * 1000:.0f}ms"
+        )
+    speedup = statistics.median(results[False]) / statistics.median(
+        results[True]
+    )
+    print(f"Median per-reset startup speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Implementations replaced by the compiled graph and the batched scoring, as references for the equivalence tests"""
+import heapq
+import math
+from typing import Any
+
+from tasks.navigation.utils import get_heading_diff, haversine
+
+
+def dict_dijkstra_shortest_path(graph: dict[str, Any], start: str, target: str) -> list[str] | None:
+    """`utils.dijkstra_shortest_path` before the compiled graph"""
+    distances = {node: math.inf for node in graph}
+    distances[start] = 0
+    predecessors = {}
+    queue = [(0, start)]
+
+    while queue:
+        current_distance, current_node = heapq.heappop(queue)
+        if current_node == target:
+            break
+        if current_distance > distances[current_node]:
+            continue
+        for neighbor in graph[current_node]["links"]:
+            curr_lat = graph[current_node]["lat"]
+            curr_lng = graph[current_node]["lng"]
+            if neighbor not in graph:
+                continue
+            neighbor_lat = graph[neighbor]["lat"]
+            neighbor_lng = graph[neighbor]["lng"]
+            weight = haversine(curr_lat, curr_lng, neighbor_lat, neighbor_lng)
+            distance_through_current = current_distance + weight
+            if distance_through_current < distances[neighbor]:
+                distances[neighbor] = distance_through_current
+                predecessors[neighbor] = current_node
+                heapq.heappush(queue, (distance_through_current, neighbor))
+
+    if distances[target] == math.inf:
+        return None
+    path = []
+    node = target
+    while node != start:
+        path.append(node)
+        node = predecessors[node]
+    path.append(start)
+    path.reverse()
+    return path
+
+
+def parse_coordinate(coord_str: str) -> tuple[float, float]:
+    """`target_gen.auto_generator.parse_coordinate`"""
+    if coord_str[0] == '-':
+        sep_index = coord_str.find('-', 1)
+    else:
+        sep_index = coord_str.find('-')
+    lat = float(coord_str[:sep_index])
+    lng = -float(coord_str[sep_index + 1:])
+    return lat, lng
+
+
+def nodes_above_distance(distance_threshold: float, graph: dict[str, Any], source: str) -> tuple[list[str], str | None]:
+    """Candidates and fallback of `get_random_node_above_distance` before the path service"""
+    source_lat, source_lng = parse_coordinate(source)
+    valid_nodes = []
+    max_distance = -1.0
+    farthest_node = None
+    for node in graph:
+        if node == source:
+            continue
+        node_lat, node_lng = parse_coordinate(node)
+        d = haversine(source_lat, source_lng, node_lat, node_lng)
+        if d > distance_threshold:
+            valid_nodes.append(node)
+        if d > max_distance:
+            max_distance = d
+            farthest_node = node
+    return valid_nodes, farthest_node
+
+
+def loop_observation_headings(link_headings: list[float], cur_heading: float) -> list[float]:
+    """`NaviMap.get_observation_headings` before the batched scoring"""
+    default_headings = [0, 90, 180, 270]
+
+    headings = []
+    for heading in link_headings:
+        ego_heading = (heading - cur_heading) % 360.0
+        headings.append(ego_heading)
+    headings.sort()
+
+    while len(headings) < 4:
+        max_diff = 0.0
+        max_diff_head = 0
+        for i in range(len(headings)):
+            diff = (headings[(i+1)%len(headings)] - headings[i])%360.0
+            if diff > max_diff:
+                max_diff = diff
+                max_diff_head = i
+
+        max_min_diff = 0.0
+        for i in range(4):
+            if max_diff_head == len(headings) - 1:
+                is_in_gap = headings[max_diff_head] < default_headings[i] or default_headings[i] < headings[0]
+            else:
+                is_in_gap = headings[max_diff_head] < default_headings[i] < headings[max_diff_head+1]
+
+            if is_in_gap:
+                min_diff = min(get_heading_diff(default_headings[i], headings[max_diff_head]), get_heading_diff(default_headings[i], headings[(max_diff_head+1)%len(headings)]))
+                if min_diff > max_min_diff:
+                    max_min_diff = min_diff
+                    max_min_diff_head = i
+
+        headings.append(default_headings[max_min_diff_head])
+        headings.sort()
+
+    assert len(headings) == 4, f"The number of headings should be 4, get {headings} with length {len(headings)}"
+    assert headings[0] < headings[1] < headings[2] < headings[3], f"The headings should be in ascending order and not equal to each other but get {headings}"
+
+    diff_0 = min(abs(headings[0]), abs(headings[0] + 360), abs(headings[0] - 360))
+    diff_3 = min(abs(headings[3]), abs(headings[3] + 360), abs(headings[3] - 360))
+    if diff_0 > diff_3:
+        headings = [headings[3]] + headings[:3]
+
+    return headings
@@ -0,0 +1,75 @@
+"""Random navigation graphs in the format of the collected environments, for the equivalence tests"""
+import math
+import random
+from typing import Any
+
+
+def make_key(lat: float, lng: float) -> str:
+    """"<latitude>-<longitude>" key of a western hemisphere node, parsed back to the same floats"""
+    return f"{lat!r}-{-lng!r}"
+
+
+def bearing(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlambda = math.radians(lng2 - lng1)
+    x = math.sin(dlambda) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+def make_random_graph(
+    rng: random.Random,
+    num_nodes: int = 40,
+    num_neighbors: int = 3,
+    one_way: float = 0.0,
+    num_outside_links: int = 0,
+) -> dict[str, Any]:
+    """
+    Nodes around Central Park, each linked to its nearest nodes with the bearing as heading.
+
+    `one_way` is the share of links without a reverse link; `num_outside_links` links point to nodes
+    missing from the graph, as links at the border of a collected environment do.
+    """
+    points = set()
+    while len(points) < num_nodes:
+        points.add((round(40.77 + rng.uniform(0, 0.004), 7), round(-73.96 + rng.uniform(0, 0.004), 7)))
+    points = sorted(points)
+    graph = {make_key(lat, lng): {"lat": lat, "lng": lng, "links": {}} for lat, lng in points}
+
+    def link(a: tuple[float, float], b: tuple[float, float]) -> None:
+        graph[make_key(*a)]["links"][make_key(*b)] = {"heading": bearing(*a, *b), "text": "Fifth Ave"}
+
+    for a in points:
+        nearest = sorted((p for p in points if p != a), key=lambda p: (p[0] - a[0]) ** 2 + (p[1] - a[1]) ** 2)
+        for b in nearest[:num_neighbors]:
+            link(a, b)
+            if rng.random() >= one_way:
+                link(b, a)
+    for _ in range(num_outside_links):
+        a = rng.choice(points)
+        link(a, (round(a[0] + 0.01, 7), a[1]))
+
+    # links in a random order, the order of the links dict is kept by the compiled graph
+    for node_meta in graph.values():
+        items = list(node_meta["links"].items())
+        rng.shuffle(items)
+        node_meta["links"] = dict(items)
+    return graph
+
+
+def make_grid_graph(size: int = 5, step: float = 0.0005) -> dict[str, Any]:
+    """
+    Grid of streets centered on the equator, where the blocks of rows mirrored across it have the same
+    length to the last bit. The middle row only has cross streets, so going around it north or south ties exactly.
+    """
+    center = (size - 1) / 2
+    points = [(round((i - center) * step, 7), round(-73.96 + j * step, 7)) for i in range(size) for j in range(size)]
+    graph = {make_key(lat, lng): {"lat": lat, "lng": lng, "links": {}} for lat, lng in points}
+    for i in range(size):
+        for j in range(size):
+            a = points[i * size + j]
+            for di, dj in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+                if 0 <= i + di < size and 0 <= j + dj < size and not (i == center and di == 0):
+                    b = points[(i + di) * size + j + dj]
+                    graph[make_key(*a)]["links"][make_key(*b)] = {"heading": bearing(*a, *b), "text": ""}
+    return graph
@@ -0,0 +1,76 @@
+import random
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from legacy_navigation import dict_dijkstra_shortest_path
+from random_graphs import make_grid_graph, make_random_graph
+from tasks.navigation.compiled_graph import CompiledGraph
+from tasks.navigation.utils import dijkstra_shortest_path
+
+
+def fewest_edges(graph: dict[str, Any], start: str, target: str) -> int | None:
+    """Number of edges of the shortest path by edge count, by a plain BFS over the graph dict"""
+    depth = {start: 0}
+    frontier = [start]
+    while frontier and target not in depth:
+        next_frontier = []
+        for node in frontier:
+            for neighbor in graph[node]["links"]:
+                if neighbor in graph and neighbor not in depth:
+                    depth[neighbor] = depth[node] + 1
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return depth.get(target)
+
+
+def is_path(graph: dict[str, Any], path: list[str], start: str, target: str) -> bool:
+    return path[0] == start and path[-1] == target and all(b in graph[a]["links"] for a, b in zip(path, path[1:]))
+
+
+def make_graphs() -> list[dict[str, Any]]:
+    rng = random.Random(0)
+    graphs = [make_grid_graph()]
+    for _ in range(10):
+        graphs.append(make_random_graph(rng, num_nodes=rng.randint(5, 40), num_neighbors=rng.randint(1, 4),
+                                        one_way=0.3, num_outside_links=3))
+    return graphs
+
+
+@pytest.mark.parametrize("graph", make_graphs())
+def test_dijkstra_matches_dict_implementation(graph: dict[str, Any]) -> None:
+    compiled_graph = CompiledGraph.from_graph(graph)
+    nodes = sorted(graph)
+    for start in nodes:
+        for target in nodes:
+            expected = dict_dijkstra_shortest_path(graph, start, target)
+            assert compiled_graph.dijkstra_shortest_path(start, target) == expected
+    # the dict is compiled on the fly
+    assert dijkstra_shortest_path(graph, nodes[0], nodes[-1]) == dict_dijkstra_shortest_path(graph, nodes[0], nodes[-1])
+
+
+@pytest.mark.parametrize("graph", make_graphs())
+def test_bfs_returns_fewest_edges_path(graph: dict[str, Any]) -> None:
+    compiled_graph = CompiledGraph.from_graph(graph)
+    nodes = sorted(graph)
+    for start in nodes:
+        for target in nodes:
+            path = compiled_graph.bfs_shortest_path(start, target)
+            num_edges = fewest_edges(graph, start, target)
+            if num_edges is None:
+                assert path is None
+            else:
+                assert is_path(graph, path, start, target)
+                assert len(path) - 1 == num_edges
+
+
+def test_save_and_load(tmp_path: Path) -> None:
+    graph = make_random_graph(random.Random(1), num_outside_links=2)
+    compiled_graph = CompiledGraph.from_graph(graph)
+    compiled_graph.save(str(tmp_path / "graph.npz"))
+    loaded = CompiledGraph.load_or_compile(graph, str(tmp_path / "graph.npz"))
+    start, target = sorted(graph)[0], sorted(graph)[-1]
+    assert loaded.keys == compiled_graph.keys
+    assert loaded.edge_text == compiled_graph.edge_text
+    assert loaded.dijkstra_shortest_path(start, target) == compiled_graph.dijkstra_shortest_path(start, target)
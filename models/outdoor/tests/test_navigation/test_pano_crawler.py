@@ -0,0 +1,143 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from tasks.navigation.pano_crawler import PanoCrawler, TransientError
+from tasks.navigation.utils import get_pano_id
+
+
+def make_meta(index: int) -> dict[str, Any]:
+    """Recorded metadata of a street with a panorama every ~11m"""
+    links = []
+    for neighbor, heading in [(index - 1, 180.0), (index + 1, 0.0)]:
+        if 0 <= neighbor < 5:
+            links.append(
+                {
+                    "panoId": f"p{neighbor}",
+                    "heading": heading,
+                    "text": "Westwood Plaza",
+                    "elevationAboveEgm96": 100.0,
+                }
+            )
+    return {
+        "panoId": f"p{index}",
+        "lat": 34.0 + index * 1e-4,
+        "lng": -118.0,
+        "links": links,
+    }
+
+
+METAS = {f"p{i}": make_meta(i) for i in range(5)}
+
+
+class StubServer:
+    """Replays the recorded metadata like the Street View tile API"""
+
+    def __init__(self) -> None:
+        self.requests: list[str | None] = []
+        self.failing_pano_ids: set[str] = set()
+        self.app = web.Application()
+        self.app.router.add_post("/v1/createSession", self.create_session)
+        self.app.router.add_get("/v1/streetview/metadata", self.metadata)
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        return web.json_response({"session": "token"})
+
+    async def metadata(self, request: web.Request) -> web.Response:
+        pano_id = request.query.get("panoId")
+        self.requests.append(pano_id)
+        if pano_id is None:
+            # lookup by location
+            return web.json_response(METAS["p0"])
+        if pano_id in self.failing_pano_ids:
+            return web.Response(status=503, text="unavailable")
+        if pano_id not in METAS:
+            return web.Response(status=404, text="not found")
+        return web.json_response(METAS[pano_id])
+
+
+def crawl(stub: StubServer, crawler: PanoCrawler) -> dict[str, Any] | None:
+    async def run() -> dict[str, Any] | None:
+        server = TestServer(stub.app)
+        await server.start_server()
+        try:
+            crawler.base_url = str(server.make_url("")).rstrip("/")
+            return await crawler.crawl(34.0, -118.0)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def expected_graph() -> dict[str, Any]:
+    # p3 is ~33m away from the root, beyond the 25m threshold
+    ids = [get_pano_id(METAS[f"p{i}"]) for i in range(4)]
+    graph = {}
+    for i in range(3):
+        graph[ids[i]] = {
+            "google_pano_id": f"p{i}",
+            "lat": METAS[f"p{i}"]["lat"],
+            "lng": -118.0,
+            "links": {},
+        }
+        for link in METAS[f"p{i}"]["links"]:
+            j = int(link["panoId"][1:])
+            if j < 3:
+                graph[ids[i]]["links"][ids[j]] = {
+                    "google_pano_id": f"p{j}",
+                    "heading": link["heading"],
+                    "text": "Westwood Plaza",
+                    "elevaionAboveEgm96": 100.0,
+                }
+    return graph
+
+
+def test_crawl(tmp_path: Path) -> None:
+    stub = StubServer()
+    crawler = PanoCrawler(
+        "key", distance_threshold=25.0, cache_path=str(tmp_path / "cache.jsonl")
+    )
+    assert crawl(stub, crawler) == expected_graph()
+    # every pano id is requested once even though it is linked twice
+    pano_ids = [pano_id for pano_id in stub.requests if pano_id is not None]
+    assert sorted(pano_ids) == ["p0", "p1", "p2", "p3"]
+
+
+def test_crawl_reuses_metadata_cache(tmp_path: Path) -> None:
+    cache_path = str(tmp_path / "cache.jsonl")
+    crawl(StubServer(), PanoCrawler("key", 25.0, cache_path=cache_path))
+
+    stub = StubServer()
+    crawler = PanoCrawler("key", 25.0, cache_path=cache_path)
+    assert crawl(stub, crawler) == expected_graph()
+    # only the root is looked up by location
+    assert stub.requests == [None]
+    assert crawler.stats["cache_hit"] == 5
+
+
+def test_crawl_resumes_from_checkpoint(tmp_path: Path) -> None:
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    stub = StubServer()
+    stub.failing_pano_ids = {"p2"}
+    crawler = PanoCrawler(
+        "key",
+        25.0,
+        max_retries=0,
+        cache_path=None,
+        checkpoint_path=checkpoint_path,
+    )
+    with pytest.raises(TransientError):
+        crawl(stub, crawler)
+    assert Path(checkpoint_path).exists()
+
+    stub = StubServer()
+    crawler = PanoCrawler(
+        "key", 25.0, cache_path=None, checkpoint_path=checkpoint_path
+    )
+    assert crawl(stub, crawler) == expected_graph()
+    # the crawl continues from the frontier instead of the root
+    assert None not in stub.requests
@@ -0,0 +1,71 @@
+import random
+from typing import Any
+
+import pytest
+
+from legacy_navigation import dict_dijkstra_shortest_path, nodes_above_distance
+from random_graphs import make_grid_graph, make_random_graph
+from tasks.navigation.path_service import PathService
+from tasks.navigation.utils import haversine
+
+
+def make_graphs() -> list[dict[str, Any]]:
+    rng = random.Random(2)
+    graphs = [make_grid_graph()]
+    for _ in range(6):
+        graphs.append(make_random_graph(rng, num_nodes=rng.randint(5, 40), num_neighbors=rng.randint(1, 4),
+                                        one_way=0.3, num_outside_links=3))
+    return graphs
+
+
+def path_length(graph: dict[str, Any], path: list[str]) -> float:
+    return sum(haversine(graph[a]["lat"], graph[a]["lng"], graph[b]["lat"], graph[b]["lng"]) for a, b in zip(path, path[1:]))
+
+
+@pytest.mark.parametrize("graph", make_graphs())
+def test_paths_match_dict_dijkstra(graph: dict[str, Any]) -> None:
+    service = PathService(graph, cache_size=4)
+    nodes = sorted(graph)
+    for start in nodes:
+        for target in nodes:
+            expected = dict_dijkstra_shortest_path(graph, start, target)
+            assert service.get_path(start, target) == expected
+            if expected is None:
+                assert service.get_distance(start, target) == float("inf")
+            else:
+                assert service.get_distance(start, target) == pytest.approx(path_length(graph, expected))
+
+
+@pytest.mark.parametrize("graph", make_graphs())
+def test_threshold_queries_match_loops(graph: dict[str, Any]) -> None:
+    service = PathService(graph)
+    for source in sorted(graph)[:10]:
+        for threshold in [0.0, 50.0, 120.0, 1e6]:
+            valid_nodes, farthest_node = nodes_above_distance(threshold, graph, source)
+            above = service.get_nodes_above_distance(source, threshold, metric="haversine")
+            assert sorted(above) == sorted(valid_nodes)
+            if farthest_node is not None:
+                assert service.get_farthest_node(source, metric="haversine") == farthest_node
+
+            reachable = {
+                node: path_length(graph, path) for node in graph if node != source
+                for path in [dict_dijkstra_shortest_path(graph, source, node)] if path is not None
+            }
+            within = service.get_nodes_within_distance(source, threshold, metric="path")
+            assert sorted(within) == sorted(node for node, d in reachable.items() if d <= threshold)
+
+
+def test_sources_are_searched_once() -> None:
+    graph = make_random_graph(random.Random(3))
+    service = PathService(graph, cache_size=2)
+    a, b, c = sorted(graph)[:3]
+    for _ in range(3):
+        service.get_path(a, c)
+        service.get_nodes_above_distance(a, 100.0)
+    # one search and one distance index of the source, the index is built from the cached search
+    assert service.stats == {"hit": 5, "miss": 2}
+    # least recently used source is evicted
+    service.get_path(b, c)
+    service.get_path(c, a)
+    service.get_path(a, c)
+    assert service.stats["miss"] == 5
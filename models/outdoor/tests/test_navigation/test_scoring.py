@@ -0,0 +1,119 @@
+import argparse
+import random
+from typing import Any
+
+import numpy as np
+import pytest
+
+from legacy_navigation import loop_observation_headings
+from random_graphs import make_random_graph
+from tasks.navigation.compiled_graph import CompiledGraph
+from tasks.navigation.scoring import fill_observation_headings, replay_heuristic, score_neighbors
+from tasks.navigation.utils import angular_diff
+
+
+def observation_headings(fill: Any, link_headings: list[float], cur_heading: float) -> Any:
+    """The headings, or the type of the error raised"""
+    try:
+        return fill(link_headings, cur_heading)
+    except Exception as e:
+        return type(e)
+
+
+def random_link_headings(rng: random.Random) -> list[float]:
+    num_links = rng.randint(1, 4)
+    if rng.random() < 0.3:
+        # links along the default headings and repeated headings, where the gaps are degenerate
+        return [float(rng.choice([0, 45, 90, 135, 180, 270])) for _ in range(num_links)]
+    return [rng.uniform(0, 360) for _ in range(num_links)]
+
+
+def test_observation_headings_match_loop() -> None:
+    rng = random.Random(0)
+    for _ in range(5000):
+        link_headings = random_link_headings(rng)
+        cur_heading = rng.choice([0.0, 90.0, rng.uniform(0, 360)])
+        expected = observation_headings(loop_observation_headings, link_headings, cur_heading)
+        result = observation_headings(fill_observation_headings, link_headings, cur_heading)
+        if isinstance(expected, list):
+            assert result == expected, (link_headings, cur_heading)
+        else:
+            # the loop fails on the same link sets, with an unbound variable or its assertions
+            assert not isinstance(result, list), (link_headings, cur_heading)
+
+
+def test_best_is_first_minimum_as_with_min() -> None:
+    rng = random.Random(1)
+    graph = make_random_graph(rng, num_nodes=30, num_neighbors=4)
+    compiled_graph = CompiledGraph.from_graph(graph)
+    nodes = sorted(graph)
+    headings = [rng.choice([0.0, 90.0, rng.uniform(0, 360)]) for _ in nodes]
+    scores = score_neighbors(compiled_graph, [compiled_graph.index[node] for node in nodes], headings)
+    for target_rel in [0.0, 90.0, 270.0]:
+        best = scores.best(target_rel)
+        for node, heading, edge in zip(nodes, headings, best.tolist()):
+            links = list(graph[node]["links"].items())
+            expected = min(links, key=lambda link: angular_diff((link[1]["heading"] - heading + 360) % 360, target_rel))
+            assert compiled_graph.keys[compiled_graph.indices[edge]] == expected[0]
+
+
+class HeuristicChooser:
+    """
+    Stands in for `call_vlm_agent` in `navigate_environment`: takes the link closest to the relative heading
+    of the action (left 270, right 90, otherwise straight), the first one on ties, as the old `min` did.
+    """
+
+    def __init__(self, graph: dict[str, Any], initial_heading: float) -> None:
+        self.graph = graph
+        self.heading = initial_heading
+
+    def __call__(self, args: argparse.Namespace, observations: Any = "", prompt_text: str = "",
+                 action_prompt: str = "", **kwargs: Any) -> tuple[str, None]:
+        curr = prompt_text.split("\n")[0].removeprefix("Current node: ")
+        if "turn left" in action_prompt:
+            target_rel = 270.0
+        elif "turn right" in action_prompt:
+            target_rel = 90.0
+        else:
+            target_rel = 0.0
+        links = self.graph[curr]["links"]
+        choice = min(links, key=lambda key: angular_diff((links[key]["heading"] - self.heading + 360) % 360, target_rel))
+        self.heading = links[choice]["heading"]
+        return choice, None
+
+
+def make_envs(rng: random.Random, num_envs: int) -> list[dict[str, Any]]:
+    envs = []
+    for _ in range(num_envs):
+        graph = make_random_graph(rng, num_nodes=rng.randint(10, 40), num_neighbors=rng.randint(2, 4), one_way=0.2)
+        source, target = rng.sample(sorted(graph), 2)
+        envs.append({"source": source, "target": target, "graph": graph})
+    return envs
+
+
+def make_directions(rng: random.Random) -> list[dict[str, Any]]:
+    # turns after the first direction, navigate_environment has no prompt for a later "straight"
+    return [{"action": "straight", "distance": rng.uniform(20, 150)}] + [
+        {"action": rng.choice(["left", "right"]), "distance": rng.uniform(20, 150)} for _ in range(rng.randint(0, 4))
+    ]
+
+
+def test_replay_matches_navigate_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    outdoor_navigation = pytest.importorskip("models.outdoor.navigation.outdoor_navigation")
+    rng = random.Random(2)
+    envs = make_envs(rng, 40)
+    parsed_directions = [make_directions(rng) for _ in envs]
+    initial_headings = [rng.uniform(0, 360) for _ in envs]
+    args = argparse.Namespace(max_steps=30, multimodal=False)
+
+    results = replay_heuristic(envs, parsed_directions, np.array(initial_headings), max_steps=args.max_steps)
+
+    for idx, (env, directions, initial_heading, result) in enumerate(zip(envs, parsed_directions, initial_headings, results)):
+        monkeypatch.setattr(outdoor_navigation, "call_vlm_agent", HeuristicChooser(env["graph"], initial_heading))
+        output_dict, trajectory = outdoor_navigation.navigate_environment(args, idx, env, directions, initial_heading)
+        assert result["reached"] == output_dict["reached"]
+        assert result["final_node"] == output_dict["final_node"]
+        assert result["visited"] == output_dict["visited"]
+        assert result["final_distance_to_target"] == pytest.approx(output_dict["final_distance_to_target"])
+        assert result["coordinates"] == trajectory
+    assert 0 < sum(result["reached"] for result in results) < len(envs)
@@ -0,0 +1,105 @@
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+import pytest
+from PIL import Image
+
+import tasks.navigation.street_view_store as street_view_store
+from tasks.navigation.street_view_store import StreetViewStore, quantize_view
+
+
+def make_jpeg(value: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (60, 40), (value, 0, 0)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class FakeStreetView:
+    """Stands in for `fetch_street_view`, with a red channel encoding the heading"""
+
+    def __init__(self, delay: float = 0.1) -> None:
+        self.delay = delay
+        self.requests: list[tuple[str, float]] = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, api_key: str, location: str, heading: float = 0, **kwargs: Any) -> bytes:
+        with self.lock:
+            self.requests.append((location, heading))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return make_jpeg(int(heading) % 256)
+
+
+@pytest.fixture
+def fake_api(monkeypatch: pytest.MonkeyPatch) -> FakeStreetView:
+    fake = FakeStreetView()
+    monkeypatch.setattr(street_view_store, "fetch_street_view", fake)
+    return fake
+
+
+def red(image: Image.Image) -> int:
+    return image.convert("RGB").getpixel((0, 0))[0]
+
+
+def test_quantize_view() -> None:
+    assert quantize_view(34.07, -118.44, 90.0) == (340700000, -1184400000, 9000)
+    # same key within the quantization step, headings wrap around
+    assert quantize_view(34.07 + 1e-9, -118.44, 450.0) == quantize_view(34.07, -118.44, 90.0)
+    assert quantize_view(34.07 + 1e-6, -118.44, 90.0) != quantize_view(34.07, -118.44, 90.0)
+
+
+def test_get_many_fetches_concurrently_and_packs(tmp_path: Path, fake_api: FakeStreetView) -> None:
+    store = StreetViewStore(root=str(tmp_path / "store"), size="60x40", legacy_dir=None, api_key="key")
+    headings = [0, 90, 180, 270]
+
+    results = store.get_many(34.07, -118.44, headings)
+
+    assert [cached for _, cached in results] == [False] * 4
+    assert all(abs(red(image) - heading % 256) < 8 for (image, _), heading in zip(results, headings))
+    assert fake_api.max_active > 1
+    assert store.stats["miss"] == 4
+    store.close()
+
+    # a new process reads the packed files, without calling the API
+    reopened = StreetViewStore(root=str(tmp_path / "store"), size="60x40", legacy_dir=None, api_key="key")
+    assert len(reopened) == 4
+    image, cached = reopened.get(34.07, -118.44, 180)
+    assert cached and abs(red(image) - 180) < 8
+    assert reopened.get(34.07, -118.44, 180)[1]
+    assert reopened.stats["store_hit"] == 1 and reopened.stats["memory_hit"] == 1
+    assert len(fake_api.requests) == 4
+    reopened.close()
+
+
+def test_legacy_directory_is_imported(tmp_path: Path, fake_api: FakeStreetView) -> None:
+    legacy_dir = tmp_path / "street_views"
+    legacy_dir.mkdir()
+    for heading in [0, 90]:
+        (legacy_dir / f"34.07,-118.44_{heading}_0_120_60x40.jpg").write_bytes(make_jpeg(200 + heading // 10))
+    # other camera settings and unrelated files are skipped
+    (legacy_dir / "34.07,-118.44_0_0_90_60x40.jpg").write_bytes(make_jpeg(0))
+    (legacy_dir / "notes.txt").write_text("")
+
+    store = StreetViewStore(root=str(tmp_path / "store"), size="60x40", legacy_dir=str(legacy_dir), api_key="key")
+    assert store.pack_directory(str(legacy_dir)) == 2
+    assert store.pack_directory(str(legacy_dir)) == 0
+    image, cached = store.get(34.07, -118.44, 90)
+    assert cached and abs(red(image) - 209) < 8
+    store.close()
+
+    # a missing view is read from the legacy directory before calling the API
+    (legacy_dir / "34.07,-118.44_180_0_120_60x40.jpg").write_bytes(make_jpeg(100))
+    store = StreetViewStore(root=str(tmp_path / "store"), size="60x40", legacy_dir=str(legacy_dir), api_key="key")
+    image, cached = store.get(34.07, -118.44, 180)
+    assert cached and abs(red(image) - 100) < 8
+    assert store.stats["legacy_hit"] == 1
+    assert fake_api.requests == []
+    store.close()